@@ -0,0 +1,157 @@
+import gzip
+import zipfile
+from xml.parsers import expat
+
+
+class AggregateReportRow:
+    '''
+    One <record> of a DMARC aggregate (rua) report along with the report details it belongs to.
+    '''
+    __slots__ = (
+        "org_name", "report_id", "begin_date", "end_date", "domain", "policy_p", "source_ip", "count",
+        "disposition", "dkim", "spf", "header_from", "dkim_domain", "dkim_result", "spf_domain", "spf_result"
+    )
+
+    # Column names used when writing rows, in the same order as to_row().
+    fields = list(__slots__)
+
+    def __init__(self):
+        for field in AggregateReportRow.__slots__:
+            setattr(self, field, "")
+        self.begin_date = 0
+        self.end_date = 0
+        self.count = 0
+
+    def to_row(self):
+        return [getattr(self, field) for field in AggregateReportRow.__slots__]
+
+
+class AggregateReportParser:
+    '''
+    Streams the records out of DMARC aggregate reports (RFC 7489 appendix C) in .xml, .xml.gz, or .zip
+    form. Reports are parsed with expat as a stream, so memory use does not grow with the size of the
+    report.
+    '''
+
+    @staticmethod
+    def open_report_files(file_name):
+        '''
+        Opens a report file, looking inside compressed files.
+        :param file_name: Path of a .xml, .gz, or .zip report.
+        :return: Generator of binary file objects, one per XML report in the file.
+        '''
+        lower_file_name = file_name.lower()
+        if lower_file_name.endswith(".zip"):
+            with zipfile.ZipFile(file_name) as archive:
+                for member in archive.infolist():
+                    if member.filename.lower().endswith(".xml"):
+                        with archive.open(member) as report_file:
+                            yield report_file
+        elif lower_file_name.endswith(".gz"):
+            with gzip.open(file_name, "rb") as report_file:
+                yield report_file
+        else:
+            with open(file_name, "rb") as report_file:
+                yield report_file
+
+    @staticmethod
+    def read_file(file_name):
+        '''
+        Reads every record in a report file.
+        :param file_name: Path of a .xml, .gz, or .zip report.
+        :return: Generator of AggregateReportRow objects.
+        '''
+        for report_file in AggregateReportParser.open_report_files(file_name):
+            yield from AggregateReportParser.read_report(report_file)
+
+    # Element path below the root -> AggregateReportRow field it fills in.
+    field_paths = {
+        "report_metadata/org_name": "org_name",
+        "report_metadata/report_id": "report_id",
+        "report_metadata/date_range/begin": "begin_date",
+        "report_metadata/date_range/end": "end_date",
+        "policy_published/domain": "domain",
+        "policy_published/p": "policy_p",
+        "record/row/source_ip": "source_ip",
+        "record/row/count": "count",
+        "record/row/policy_evaluated/disposition": "disposition",
+        "record/row/policy_evaluated/dkim": "dkim",
+        "record/row/policy_evaluated/spf": "spf",
+        "record/identifiers/header_from": "header_from",
+        "record/auth_results/dkim/domain": "dkim_domain",
+        "record/auth_results/dkim/result": "dkim_result",
+        "record/auth_results/spf/domain": "spf_domain",
+        "record/auth_results/spf/result": "spf_result",
+    }
+    integer_fields = ("begin_date", "end_date", "count")
+    lower_case_fields = ("domain", "header_from", "dkim_domain", "spf_domain")
+    # Fields filled in from the report header and copied to every row.
+    report_fields = ("org_name", "report_id", "begin_date", "end_date", "domain", "policy_p")
+    read_size = 1 << 20
+
+    @staticmethod
+    def read_report(report_file):
+        '''
+        Reads the records of one XML report. The file is fed to expat in fixed-size blocks and the rows
+        finished in each block are yielded before the next block is read, so nothing but the current
+        block and its rows is held in memory.
+        Only the first DKIM and SPF auth_results entries of a record are kept, which is what almost every
+        receiver sends.
+        :param report_file: Binary file object of the XML.
+        :return: Generator of AggregateReportRow objects.
+        '''
+        field_paths = AggregateReportParser.field_paths
+        integer_fields = AggregateReportParser.integer_fields
+        lower_case_fields = AggregateReportParser.lower_case_fields
+        report_fields = AggregateReportParser.report_fields
+        report = AggregateReportRow()
+        finished_rows = []
+        # Path of the current element below the root, one entry per open element. The root's path is ''.
+        path = []
+        text_parts = []
+        state = {"row": report}
+
+        def start_element(name, attributes):
+            if "}" in name:
+                name = name.rpartition("}")[2]
+            if not path:
+                path.append("")
+            elif 1 == len(path):
+                path.append(name)
+                if "record" == name:
+                    row = AggregateReportRow()
+                    for field in report_fields:
+                        setattr(row, field, getattr(report, field))
+                    state["row"] = row
+            else:
+                path.append(path[-1] + "/" + name)
+            text_parts.clear()
+
+        def end_element(name):
+            element_path = path.pop()
+            field = field_paths.get(element_path)
+            if field is not None:
+                row = state["row"]
+                text = "".join(text_parts).strip()
+                if field in integer_fields:
+                    setattr(row, field, int(text) if text.isdigit() else 0)
+                elif "" == getattr(row, field):
+                    setattr(row, field, text.lower() if field in lower_case_fields else text)
+            elif "record" == element_path:
+                finished_rows.append(state["row"])
+                state["row"] = report
+            text_parts.clear()
+
+        parser = expat.ParserCreate(namespace_separator="}")
+        parser.buffer_text = True
+        parser.StartElementHandler = start_element
+        parser.EndElementHandler = end_element
+        parser.CharacterDataHandler = text_parts.append
+        while True:
+            block = report_file.read(AggregateReportParser.read_size)
+            parser.Parse(block, not block)
+            if finished_rows:
+                yield from finished_rows
+                finished_rows.clear()
+            if not block:
+                break
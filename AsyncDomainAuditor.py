@@ -0,0 +1,209 @@
+import asyncio
+import sys
+from DmarcParser import DmarcParser
+from DomainRecordHandler import DomainRecordHandler
+
+try:
+    import dns.asyncresolver
+    import dns.exception
+    import dns.resolver
+except ModuleNotFoundError:
+    print("Error: The 'dnspython' library could not be found. Please install and try again.")
+    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+
+
+class DomainAuditResult:
+    '''
+    The DMARC, SPF, and existence data gathered for a single domain by a bulk audit.
+    '''
+
+    # Column names used when writing results as rows.
+    fields = [
+        "domain", "exists", "dmarc_p", "dmarc_sp", "dmarc_pct", "dmarc_rua", "dmarc_ruf",
+        "dmarc_record", "spf_record", "error"
+    ]
+
+    def __init__(self, domain_name):
+        self.domain_name = domain_name
+        self.exists = "unknown"
+        self.dmarc_record_value = ""
+        self.dmarc_record = None
+        # Every TXT value at '_dmarc', or None if the lookup failed.
+        self.dmarc_txt_records = None
+        self.spf_record_value = ""
+        self.error = ""
+
+    def to_row(self):
+        '''
+        Converts the result to a list of strings in the same order as 'fields'.
+        :return: List of column values.
+        '''
+        p = sp = pct = rua = ruf = ""
+        if self.dmarc_record is not None:
+            p = self.dmarc_record.p
+            sp = self.dmarc_record.sp
+            pct = self.dmarc_record.pct
+            rua = " ".join(self.dmarc_record.rua)
+            ruf = " ".join(self.dmarc_record.ruf)
+        return [
+            self.domain_name, self.exists, p, sp, pct, rua, ruf,
+            self.dmarc_record_value, self.spf_record_value, self.error
+        ]
+
+
+class AsyncDomainAuditor:
+    '''
+    Looks up the '_dmarc' and SPF records for many domains concurrently using dns.asyncresolver.
+    '''
+
+    def __init__(self, max_in_flight=200, timeout=5.0, resolver=None, dns_cache=None):
+        '''
+        :param max_in_flight: Maximum number of DNS queries allowed to be outstanding at once.
+        :param timeout: Seconds to wait for each query before giving up on it.
+        :param resolver: Optional dns.asyncresolver.Resolver to use instead of the system default.
+        :param dns_cache: Optional DnsCache. The cache shared by DomainRecordHandler is used if not given.
+        '''
+        self.max_in_flight = max_in_flight
+        if dns_cache is None:
+            dns_cache = DomainRecordHandler.dns_cache
+        self.dns_cache = dns_cache
+        if resolver is None:
+            resolver = dns.asyncresolver.Resolver()
+            resolver.lifetime = timeout
+        self.resolver = resolver
+        self.query_limit = None
+
+    async def get_txt_records(self, host_name):
+        '''
+        Queries the TXT records for a host name.
+        :param host_name: Host name to query.
+        :return: Tuple of the rcode text ('NOERROR', 'NXDOMAIN', 'SERVFAIL', or 'TIMEOUT') and the list of
+            TXT record values with each record's strings joined together.
+        '''
+        answer = self.dns_cache.get(host_name, "TXT")
+        if answer is None:
+            async with self.query_limit:
+                try:
+                    answer = await self.dns_cache.query_async(host_name, "TXT", self.resolver)
+                except dns.resolver.NoNameservers:
+                    return "SERVFAIL", []
+                except dns.exception.Timeout:
+                    return "TIMEOUT", []
+        return answer.rcode, [DmarcParser.join_txt_strings(record) for record in answer.records]
+
+    async def audit_domain(self, domain_name):
+        '''
+        Gathers the DMARC record, SPF record, and existence of a domain. Existence is taken from the apex
+        TXT query, so no separate lookup is needed for it.
+        :param domain_name: Domain to audit.
+        :return: DomainAuditResult for the domain.
+        '''
+        result = DomainAuditResult(domain_name)
+        (dmarc_rcode, dmarc_records), (apex_rcode, apex_records) = await asyncio.gather(
+            self.get_txt_records("_dmarc." + domain_name),
+            self.get_txt_records(domain_name)
+        )
+
+        errors = []
+        if "NOERROR" == apex_rcode:
+            result.exists = "yes"
+        elif "NXDOMAIN" == apex_rcode:
+            result.exists = "no"
+        else:
+            errors.append("apex " + apex_rcode)
+        if dmarc_rcode not in ("NOERROR", "NXDOMAIN"):
+            errors.append("_dmarc " + dmarc_rcode)
+        else:
+            result.dmarc_txt_records = dmarc_records
+
+        dmarc_records = [record for record in dmarc_records if DmarcParser.is_dmarc_record(record)]
+        if dmarc_records:
+            result.dmarc_record_value = dmarc_records[0]
+            result.dmarc_record = DomainRecordHandler.parse_dmarc_record(dmarc_records[0])
+            if len(dmarc_records) > 1:
+                errors.append("multiple DMARC records")
+        spf_records = [record for record in apex_records if record.startswith("v=spf1")]
+        if spf_records:
+            result.spf_record_value = spf_records[0]
+            if len(spf_records) > 1:
+                errors.append("multiple SPF records")
+        result.error = "; ".join(errors)
+        return result
+
+    def audit_domains(self, domain_names):
+        '''
+        Audits an iterable of domain names, yielding each result as soon as its lookups finish. Domain
+        names are pulled from the iterable only as workers become free, so very long inputs are not
+        held in memory.
+        :param domain_names: Iterable of domain names.
+        :return: Asynchronous generator of DomainAuditResult objects in completion order.
+        '''
+        self.query_limit = asyncio.Semaphore(self.max_in_flight)
+        # Each domain needs two queries, so half as many workers keeps the semaphore saturated.
+        worker_count = max(1, self.max_in_flight // 2)
+        return AsyncDomainAuditor.run_workers(domain_names, worker_count, self.audit_domain,
+                                              AsyncDomainAuditor.get_error_result)
+
+    @staticmethod
+    def get_error_result(domain_name, error):
+        result = DomainAuditResult(domain_name)
+        result.error = type(error).__name__ + ": " + str(error)
+        return result
+
+    @staticmethod
+    async def run_workers(items, worker_count, process_item, get_error_result):
+        '''
+        Runs a coroutine on every item of an iterable with a fixed number of workers, the way every bulk mode
+        spreads its domains over its lookups. Items are pulled from the iterable only as workers become free.
+        :param items: Iterable of items, such as domain names.
+        :param worker_count: Number of items processed at once.
+        :param process_item: Coroutine function taking one item and returning its result.
+        :param get_error_result: Function taking an item and the exception process_item() raised for it, and
+            returning the result given for the item instead.
+        :return: Asynchronous generator of results in completion order.
+        :raises: Any exception raised while iterating over the items, once the items taken before it are done.
+        '''
+        # Marks the end of the items for a worker, and the end of a worker's results.
+        end_marker = object()
+        pending_items = asyncio.Queue(maxsize=worker_count * 2)
+        # Bounded too, so workers wait for a slow consumer instead of piling up results.
+        finished_results = asyncio.Queue(maxsize=worker_count * 2)
+        feed_errors = []
+
+        async def feed_items():
+            try:
+                for item in items:
+                    await pending_items.put(item)
+            except Exception as error:
+                # The workers still have to be told to stop, or the results would be waited for forever.
+                feed_errors.append(error)
+            for _ in range(worker_count):
+                await pending_items.put(end_marker)
+
+        async def worker():
+            while True:
+                item = await pending_items.get()
+                if item is end_marker:
+                    break
+                try:
+                    result = await process_item(item)
+                except Exception as error:
+                    result = get_error_result(item, error)
+                await finished_results.put(result)
+            await finished_results.put(end_marker)
+
+        tasks = [asyncio.create_task(feed_items())]
+        tasks.extend(asyncio.create_task(worker()) for _ in range(worker_count))
+        try:
+            running_workers = worker_count
+            while running_workers:
+                result = await finished_results.get()
+                if result is end_marker:
+                    running_workers -= 1
+                else:
+                    yield result
+            if feed_errors:
+                raise feed_errors[0]
+        finally:
+            for task in tasks:
+                task.cancel()
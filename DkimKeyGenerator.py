@@ -0,0 +1,220 @@
+import base64
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def import_cryptography():
+    '''
+    Imports the key generation parts of the cryptography library, which is only needed when keys are made.
+    :return: Tuple of the serialization, rsa, and ed25519 modules.
+    '''
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+    except ModuleNotFoundError:
+        print("Error: The 'cryptography' library could not be found. Please install and try again.")
+        sys.exit("If using 'pip', this command may help 'sudo pip3 install cryptography'.")
+    return serialization, rsa, ed25519
+
+
+def generate_key_pairs(key_type, key_size, count):
+    '''
+    Makes DKIM key pairs. Runs in a worker process.
+    :param key_type: 'rsa' or 'ed25519'.
+    :param key_size: RSA modulus size in bits. Not used for Ed25519.
+    :param count: Number of key pairs to make.
+    :return: Tuple of a list of (private key PEM bytes, base64 public key) tuples and the CPU seconds used.
+    '''
+    serialization, rsa, ed25519 = import_cryptography()
+    start_time = time.process_time()
+    key_pairs = []
+    for _ in range(count):
+        if "ed25519" == key_type:
+            private_key = ed25519.Ed25519PrivateKey.generate()
+            # RFC 8463 publishes the bare 32 byte key.
+            public_key = private_key.public_key().public_bytes(
+                serialization.Encoding.Raw, serialization.PublicFormat.Raw
+            )
+        else:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+            # RFC 6376 publishes the DER SubjectPublicKeyInfo.
+            public_key = private_key.public_key().public_bytes(
+                serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+            )
+        private_key_pem = private_key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+        )
+        key_pairs.append((private_key_pem, base64.b64encode(public_key).decode("ascii")))
+    return key_pairs, time.process_time() - start_time
+
+
+class DkimKey:
+    '''
+    A DKIM key pair made by DkimKeyGenerator. The private key is only kept in its file.
+    '''
+    __slots__ = ("domain_name", "selector", "key_type", "public_key", "private_key_path")
+
+    def __init__(self, domain_name, selector, key_type, public_key, private_key_path):
+        self.domain_name = domain_name
+        self.selector = selector
+        self.key_type = key_type
+        self.public_key = public_key
+        self.private_key_path = private_key_path
+
+
+class DkimKeyGenerator:
+    '''
+    Makes DKIM key pairs for many domains across a process pool, since RSA key generation is slow and
+    CPU bound. Private keys are written to '<key directory>/<domain>/<selector>.private', readable only by
+    the owner, and the public keys are returned for the DKIM records.
+    '''
+
+    key_types = ("rsa", "ed25519")
+    rsa_key_sizes = (2048, 3072, 4096)
+    # Keys made by each task. Ed25519 keys take microseconds, so they are made in batches to make the cost
+    # of passing tasks to the workers worth it.
+    keys_per_task = {"rsa": 1, "ed25519": 200}
+
+    def __init__(self, key_directory, key_type="rsa", key_size=2048, workers=None):
+        '''
+        :param key_directory: Directory the private keys are written under.
+        :param key_type: 'rsa' or 'ed25519'.
+        :param key_size: RSA modulus size in bits.
+        :param workers: Number of worker processes. Defaults to the number of CPUs.
+        :raises ValueError: If the key type or size is not supported.
+        '''
+        if key_type not in DkimKeyGenerator.key_types:
+            raise ValueError("DKIM key type must be rsa or ed25519.")
+        if "rsa" == key_type and key_size not in DkimKeyGenerator.rsa_key_sizes:
+            raise ValueError("RSA DKIM keys must be 2048, 3072, or 4096 bits.")
+        self.key_directory = key_directory
+        self.key_type = key_type
+        self.key_size = key_size
+        self.workers = workers or os.cpu_count() or 1
+        self.key_count = 0
+        self.elapsed_time = 0.0
+        # CPU seconds the workers spent making keys.
+        self.cpu_time = 0.0
+
+    @staticmethod
+    def get_default_selector():
+        '''
+        :return: Selector used when none is given, named for the current month so each rotation gets a new
+            one, for example 'dkim202401'.
+        '''
+        return time.strftime("dkim%Y%m")
+
+    @staticmethod
+    def check_key_name(domain_name, selector):
+        '''
+        Makes sure a domain name and selector can only name a file inside the key directory.
+        :raises ValueError: If either could name a file elsewhere.
+        '''
+        for name in (domain_name, selector):
+            if name in ("", ".", "..") or "/" in name or os.sep in name:
+                raise ValueError("'" + name + "' cannot be used in a private key file name.")
+
+    def write_private_key(self, domain_name, selector, private_key_pem):
+        '''
+        Writes a private key file that only its owner can read.
+        :return: Path of the file.
+        '''
+        domain_directory = os.path.join(self.key_directory, domain_name)
+        os.makedirs(domain_directory, mode=0o700, exist_ok=True)
+        private_key_path = os.path.join(domain_directory, selector + ".private")
+        file_descriptor = os.open(private_key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with open(file_descriptor, "wb") as private_key_file:
+            private_key_file.write(private_key_pem)
+        return private_key_path
+
+    def generate_key(self, domain_name, selector):
+        '''
+        Makes one key pair in this process, for when starting a pool is not worth it.
+        :param domain_name: Domain name.
+        :param selector: Selector of the key.
+        :return: DkimKey.
+        '''
+        DkimKeyGenerator.check_key_name(domain_name, selector)
+        start_time = time.perf_counter()
+        key_pairs, cpu_time = generate_key_pairs(self.key_type, self.key_size, 1)
+        private_key_pem, public_key = key_pairs[0]
+        private_key_path = self.write_private_key(domain_name, selector, private_key_pem)
+        self.key_count += 1
+        self.cpu_time += cpu_time
+        self.elapsed_time += time.perf_counter() - start_time
+        return DkimKey(domain_name, selector, self.key_type, public_key, private_key_path)
+
+    def generate_keys(self, items, get_key_name):
+        '''
+        Makes a key pair for each item that needs one, keeping the workers busy while results are returned
+        in the order of the items. Only a few tasks per worker are queued, so items are read as they are
+        needed.
+        :param items: Iterable of anything, for example the settings of each domain.
+        :param get_key_name: Function returning the (domain name, selector) tuple of an item, or None if the
+            item needs no key.
+        :return: Generator of (item, DkimKey or None) tuples.
+        '''
+        keys_per_task = DkimKeyGenerator.keys_per_task[self.key_type]
+        start_time = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            # Each entry is the list of (item, key name) tuples of a task and the future making their keys.
+            running_tasks = deque()
+            task_items = []
+            task_key_count = 0
+            for item in items:
+                key_name = get_key_name(item)
+                task_items.append((item, key_name))
+                if key_name is not None:
+                    DkimKeyGenerator.check_key_name(*key_name)
+                    task_key_count += 1
+                if keys_per_task == task_key_count:
+                    running_tasks.append((task_items, executor.submit(
+                        generate_key_pairs, self.key_type, self.key_size, task_key_count
+                    )))
+                    task_items = []
+                    task_key_count = 0
+                    while len(running_tasks) > self.workers * 2:
+                        yield from self.finish_task(*running_tasks.popleft())
+            if task_items:
+                running_tasks.append((task_items, executor.submit(
+                    generate_key_pairs, self.key_type, self.key_size, task_key_count
+                )))
+            while running_tasks:
+                yield from self.finish_task(*running_tasks.popleft())
+        self.elapsed_time += time.perf_counter() - start_time
+
+    def finish_task(self, task_items, future):
+        '''
+        Waits for a task, writes its private keys, and pairs its keys with its items.
+        :return: Generator of (item, DkimKey or None) tuples.
+        '''
+        key_pairs, cpu_time = future.result()
+        self.cpu_time += cpu_time
+        key_pairs = iter(key_pairs)
+        for item, key_name in task_items:
+            if key_name is None:
+                yield item, None
+                continue
+            domain_name, selector = key_name
+            private_key_pem, public_key = next(key_pairs)
+            private_key_path = self.write_private_key(domain_name, selector, private_key_pem)
+            self.key_count += 1
+            yield item, DkimKey(domain_name, selector, self.key_type, public_key, private_key_path)
+
+    def get_summary(self):
+        '''
+        :return: Text giving the number of keys made and how fast, overall and per CPU second.
+        '''
+        keys_per_second = self.key_count / self.elapsed_time if self.elapsed_time else 0.0
+        keys_per_cpu_second = self.key_count / self.cpu_time if self.cpu_time else 0.0
+        return (
+            "Generated " + str(self.key_count) + " " + self.key_type +
+            ("-" + str(self.key_size) if "rsa" == self.key_type else "") + " keys in " +
+            format(self.elapsed_time, ".1f") + " seconds with " + str(self.workers) +
+            (" worker: " if 1 == self.workers else " workers: ") +
+            format(keys_per_second, ".1f") + " keys per second, " + format(keys_per_cpu_second, ".1f") +
+            " per core."
+        )
@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import binascii
+from AsyncDomainAuditor import AsyncDomainAuditor
+
+
+class DkimKeyInfo:
+    '''
+    A DKIM key found at '<selector>._domainkey.<domain>', or the outcome for a domain where none was found.
+    status is 'found', 'revoked' (an empty p= tag), 'invalid' (a key that cannot be decoded), 'none' when no
+    selector tried has a key, or 'unknown' when lookups failed. key_size is in bits, 0 when not known.
+    '''
+    __slots__ = ("domain_name", "selector", "status", "key_type", "key_size")
+
+    fields = list(__slots__)
+
+    def __init__(self, domain_name, selector, status, key_type="", key_size=0):
+        self.domain_name = domain_name
+        self.selector = selector
+        self.status = status
+        self.key_type = key_type
+        self.key_size = key_size
+
+    def to_row(self):
+        return [getattr(self, field) for field in DkimKeyInfo.__slots__]
+
+
+class DkimSelectorDiscovery:
+    '''
+    Finds the DKIM keys of many domains whose selectors are not known by trying a list of common selectors.
+    '_domainkey.<domain>' is looked up first. An NXDOMAIN answer there means no name exists below it
+    (RFC 8020), so the selector lookups of that domain are skipped, which saves nearly all queries for the
+    many domains without DKIM. A NOERROR answer, usually an empty non-terminal, means something may exist and
+    every selector is tried. All answers go through the shared DnsCache, so negative answers are reused for
+    as long as the zone allows.
+    '''
+
+    # Selectors used by common mail services and software.
+    default_selectors = [
+        "default", "selector1", "selector2", "google", "k1", "k2", "k3", "s1", "s2", "s1024", "s2048", "dkim",
+        "dkim1", "dkim2", "mail", "smtp", "email", "key1", "key2", "mta", "sig1", "pm", "cm", "mandrill",
+        "mailjet", "mxvault", "everlytickey1", "everlytickey2", "zendesk1", "zendesk2", "protonmail",
+        "protonmail2", "protonmail3", "fm1", "fm2", "fm3", "20161025", "20210112", "20230601",
+    ]
+
+    def __init__(self, selectors=None, max_in_flight=200, auditor=None, trust_parent_nxdomain=True):
+        '''
+        :param selectors: List of selectors to try. default_selectors is used if not given.
+        :param max_in_flight: Maximum number of DNS queries in flight.
+        :param auditor: Optional AsyncDomainAuditor whose resolver and cache are used for the lookups.
+        :param trust_parent_nxdomain: False to try every selector even when '_domainkey' does not exist, for
+            zones whose servers wrongly answer NXDOMAIN for empty non-terminals.
+        '''
+        self.selectors = list(selectors or DkimSelectorDiscovery.default_selectors)
+        self.max_in_flight = max_in_flight
+        self.auditor = auditor or AsyncDomainAuditor(max_in_flight=max_in_flight)
+        self.trust_parent_nxdomain = trust_parent_nxdomain
+        self.probe_count = 0
+        self.skipped_probe_count = 0
+
+    @staticmethod
+    def get_tags(record):
+        '''
+        :param record: DKIM record with its strings joined.
+        :return: Dictionary of lower case tag name -> value, with the white space removed from p.
+        '''
+        tags = {}
+        for tag in record.split(";"):
+            name, separator, value = tag.partition("=")
+            if "" != separator:
+                tags[name.strip().lower()] = value.strip()
+        if "p" in tags:
+            tags["p"] = "".join(tags["p"].split())
+        return tags
+
+    @staticmethod
+    def read_der_element(data, offset):
+        '''
+        Reads the header of one DER element.
+        :param data: DER bytes.
+        :param offset: Position of the element.
+        :return: Tuple of the tag, the position of its content, and the position after it.
+        :raises ValueError: If the element runs past the end of the data.
+        '''
+        tag = data[offset]
+        length = data[offset + 1]
+        offset += 2
+        if length & 0x80:
+            length_size = length & 0x7f
+            length = int.from_bytes(data[offset:offset + length_size], "big")
+            offset += length_size
+        if offset + length > len(data):
+            raise ValueError("DER element is longer than the data.")
+        return tag, offset, offset + length
+
+    @staticmethod
+    def get_rsa_key_size(key_bytes):
+        '''
+        :param key_bytes: RSA public key, as a SubjectPublicKeyInfo or as a bare RSAPublicKey, in DER.
+        :return: Size of the modulus in bits.
+        :raises ValueError: If the key cannot be read.
+        '''
+        read_der_element = DkimSelectorDiscovery.read_der_element
+        try:
+            tag, content, _ = read_der_element(key_bytes, 0)
+            tag, first, first_end = read_der_element(key_bytes, content)
+            if 0x30 == tag:
+                # SubjectPublicKeyInfo: the RSAPublicKey is in the bit string after the algorithm, behind a
+                # byte counting unused bits.
+                tag, bit_string, _ = read_der_element(key_bytes, first_end)
+                if 0x03 != tag:
+                    raise ValueError("No public key bit string.")
+                tag, content, _ = read_der_element(key_bytes, bit_string + 1)
+                tag, first, first_end = read_der_element(key_bytes, content)
+            if 0x02 != tag:
+                raise ValueError("No RSA modulus.")
+        except IndexError:
+            raise ValueError("RSA key is cut short.")
+        return int.from_bytes(key_bytes[first:first_end], "big").bit_length()
+
+    @staticmethod
+    def get_key_info(domain_name, selector, record):
+        '''
+        :param domain_name: Domain name.
+        :param selector: Selector the record was found at.
+        :param record: DKIM record with its strings joined.
+        :return: DkimKeyInfo, or None if the record has no p= tag and so is not a DKIM key.
+        '''
+        tags = DkimSelectorDiscovery.get_tags(record)
+        if "p" not in tags:
+            return None
+        key_type = tags.get("k", "rsa").lower()
+        if "" == tags["p"]:
+            return DkimKeyInfo(domain_name, selector, "revoked", key_type)
+        try:
+            key_bytes = base64.b64decode(tags["p"], validate=True)
+            if "ed25519" == key_type:
+                if 32 != len(key_bytes):
+                    raise ValueError("Ed25519 keys are 32 bytes.")
+                key_size = 256
+            else:
+                key_size = DkimSelectorDiscovery.get_rsa_key_size(key_bytes)
+        except (binascii.Error, ValueError):
+            return DkimKeyInfo(domain_name, selector, "invalid", key_type)
+        return DkimKeyInfo(domain_name, selector, "found", key_type, key_size)
+
+    async def probe_selector(self, domain_name, selector):
+        '''
+        :return: Tuple of the rcode text and the list of DkimKeyInfo objects found at the selector.
+        '''
+        self.probe_count += 1
+        rcode, records = await self.auditor.get_txt_records(selector + "._domainkey." + domain_name)
+        key_infos = [DkimSelectorDiscovery.get_key_info(domain_name, selector, record) for record in records]
+        return rcode, [key_info for key_info in key_infos if key_info is not None]
+
+    async def discover_domain(self, domain_name):
+        '''
+        Tries every selector on one domain, unless '_domainkey' shows that nothing exists there.
+        :param domain_name: Domain name.
+        :return: List of DkimKeyInfo objects, one per key found, or a single one with a 'none' or 'unknown'
+            status and no selector.
+        '''
+        domain_name = domain_name.lower().rstrip(".")
+        parent_rcode, _ = await self.auditor.get_txt_records("_domainkey." + domain_name)
+        if "NXDOMAIN" == parent_rcode and self.trust_parent_nxdomain:
+            self.skipped_probe_count += len(self.selectors)
+            return [DkimKeyInfo(domain_name, "", "none")]
+        probes = await asyncio.gather(*[self.probe_selector(domain_name, selector) for selector in self.selectors])
+        key_infos = [key_info for _, selector_key_infos in probes for key_info in selector_key_infos]
+        if key_infos:
+            return key_infos
+        if all(rcode in ("NOERROR", "NXDOMAIN") for rcode, _ in probes):
+            return [DkimKeyInfo(domain_name, "", "none")]
+        return [DkimKeyInfo(domain_name, "", "unknown")]
+
+    def discover_domains(self, domain_names):
+        '''
+        Discovers the DKIM keys of many domains, several domains at once. Domain names are pulled from the
+        iterable only as workers become free.
+        :param domain_names: Iterable of domain names.
+        :return: Asynchronous generator of lists of DkimKeyInfo objects, one list per domain, in completion
+            order.
+        '''
+        # The lookups share the auditor's query limit, which audit_domains() would otherwise create.
+        self.auditor.query_limit = asyncio.Semaphore(self.max_in_flight)
+        # Most domains need only the '_domainkey' lookup, so allow as many domains as queries.
+        worker_count = max(1, self.max_in_flight)
+        return AsyncDomainAuditor.run_workers(domain_names, worker_count, self.discover_domain,
+                                              DkimSelectorDiscovery.get_error_result)
+
+    @staticmethod
+    def get_error_result(domain_name, error):
+        return [DkimKeyInfo(domain_name, "", "unknown")]
@@ -0,0 +1,406 @@
+import re
+from DmarcParser import DmarcParser
+
+
+class DmarcLintFinding:
+    '''
+    One problem found in a domain's DMARC record. severity is 'error' for anything RFC 7489 does not allow,
+    which receivers may ignore or treat as no record, 'warning' for allowed values that are likely mistakes,
+    and 'info' for things worth knowing. tag is the DMARC tag the finding is about, '' for the whole record.
+    '''
+    __slots__ = ("domain_name", "code", "severity", "tag", "message")
+
+    fields = list(__slots__)
+
+    def __init__(self, domain_name, code, severity, tag, message):
+        self.domain_name = domain_name
+        self.code = code
+        self.severity = severity
+        self.tag = tag
+        self.message = message
+
+    def to_row(self):
+        return [getattr(self, field) for field in DmarcLintFinding.__slots__]
+
+
+class DmarcLintRule:
+    '''
+    A registered check. scope is 'txt' for checks of every TXT record at '_dmarc', called with the list of
+    TXT values and the list of those that are DMARC records, 'record' for checks of the DMARC record as a
+    whole, called with its value and DmarcParseResult, or a tag name for checks of that tag's value. check
+    returns a message for the problem found, or None.
+    '''
+    __slots__ = ("code", "severity", "scope", "description", "check")
+
+    def __init__(self, code, severity, scope, description, check):
+        self.code = code
+        self.severity = severity
+        self.scope = scope
+        self.description = description
+        self.check = check
+
+
+class DmarcLinter:
+    '''
+    Checks DMARC records against RFC 7489 using the rules in the registry. The rules wanted are sorted by scope
+    once when the linter is made. Tag values repeat a great deal across domains ('p=none', 'adkim=r'), so the
+    findings of each tag value are worked out once and reused, which keeps linting about as fast as parsing.
+    '''
+
+    severity_levels = {"info": 0, "warning": 1, "error": 2}
+    # Code -> DmarcLintRule for every registered rule, in the order registered.
+    rules = {}
+    # Number of distinct values of one tag whose findings are kept. rua and ruf values are mostly unique.
+    tag_cache_size = 100000
+
+    def __init__(self, min_severity="info", disabled_codes=()):
+        '''
+        :param min_severity: Lowest severity reported, 'info', 'warning', or 'error'.
+        :param disabled_codes: Codes of rules not to run.
+        :raises ValueError: If the severity or a code is not known.
+        '''
+        if min_severity not in DmarcLinter.severity_levels:
+            raise ValueError("Unknown severity '" + min_severity + "'.")
+        for code in disabled_codes:
+            if code not in DmarcLinter.rules:
+                raise ValueError("Unknown lint rule '" + code + "'.")
+        min_level = DmarcLinter.severity_levels[min_severity]
+        self.txt_rules = []
+        self.record_rules = []
+        # Tag name -> rules checking it.
+        self.tag_rules = {}
+        for rule in DmarcLinter.rules.values():
+            if rule.code in disabled_codes or DmarcLinter.severity_levels[rule.severity] < min_level:
+                continue
+            if "txt" == rule.scope:
+                self.txt_rules.append(rule)
+            elif "record" == rule.scope:
+                self.record_rules.append(rule)
+            else:
+                self.tag_rules.setdefault(rule.scope, []).append(rule)
+        # Tag name -> {tag value -> list of (rule, message) tuples}.
+        self.tag_caches = {tag_name: {} for tag_name in self.tag_rules}
+        self.record_count = 0
+        self.finding_count = 0
+
+    @staticmethod
+    def register(code, severity, scope, description):
+        '''
+        Decorator adding a check function to the registry.
+        :param code: Unique code reported with each finding, such as 'DMARC021'.
+        :param severity: 'info', 'warning', or 'error'.
+        :param scope: 'txt', 'record', or a tag name. See DmarcLintRule.
+        :param description: One line description of the rule.
+        :raises ValueError: If the code is already registered or the severity is not known.
+        '''
+        if code in DmarcLinter.rules:
+            raise ValueError("Lint rule '" + code + "' is already registered.")
+        if severity not in DmarcLinter.severity_levels:
+            raise ValueError("Unknown severity '" + severity + "'.")
+
+        def add_rule(check):
+            DmarcLinter.rules[code] = DmarcLintRule(code, severity, scope, description, check)
+            return check
+
+        return add_rule
+
+    def get_tag_problems(self, tag_name, tag_value):
+        '''
+        :param tag_name: Tag name.
+        :param tag_value: Tag value, or one entry of a list valued tag.
+        :return: List of (rule, message) tuples, from the cache when the value has been seen.
+        '''
+        cache = self.tag_caches[tag_name]
+        problems = cache.get(tag_value)
+        if problems is None:
+            problems = []
+            for rule in self.tag_rules[tag_name]:
+                message = rule.check(tag_value)
+                if message is not None:
+                    problems.append((rule, message))
+            if len(cache) < DmarcLinter.tag_cache_size:
+                cache[tag_value] = problems
+        return problems
+
+    def lint_record(self, domain_name, record_value):
+        '''
+        Checks one DMARC record.
+        :param domain_name: Domain the record belongs to, copied into the findings.
+        :param record_value: Joined TXT value starting with 'v=DMARC1'.
+        :return: List of DmarcLintFinding objects.
+        '''
+        self.record_count += 1
+        parse_result = DmarcParser.parse(record_value)
+        findings = []
+        for rule in self.record_rules:
+            message = rule.check(record_value, parse_result)
+            if message is not None:
+                findings.append(DmarcLintFinding(domain_name, rule.code, rule.severity, "", message))
+        dmarc_record = parse_result.dmarc_record
+        tag_caches = self.tag_caches
+        for tag_name in parse_result.tag_names:
+            cache = tag_caches.get(tag_name)
+            if cache is None:
+                continue
+            tag_value = getattr(dmarc_record, tag_name)
+            for entry in (tag_value,) if str is type(tag_value) else tag_value:
+                # The cache is read here rather than through get_tag_problems(), since nearly every value is
+                # in it and has no problems.
+                problems = cache.get(entry)
+                if problems is None:
+                    # Empty entries, as left by a trailing comma, are skipped.
+                    if "" == entry:
+                        continue
+                    problems = self.get_tag_problems(tag_name, entry)
+                for rule, message in problems:
+                    findings.append(DmarcLintFinding(domain_name, rule.code, rule.severity, tag_name, message))
+        self.finding_count += len(findings)
+        return findings
+
+    def lint_txt_records(self, domain_name, txt_values):
+        '''
+        Checks everything published at '_dmarc.<domain>'. The DMARC record itself is only checked when there
+        is exactly one, since receivers ignore them all otherwise.
+        :param domain_name: Domain name.
+        :param txt_values: List of the TXT values at '_dmarc.<domain>', each with its strings joined.
+        :return: List of DmarcLintFinding objects.
+        '''
+        findings = []
+        dmarc_values = [txt_value for txt_value in txt_values if DmarcParser.is_dmarc_record(txt_value)]
+        for rule in self.txt_rules:
+            message = rule.check(txt_values, dmarc_values)
+            if message is not None:
+                findings.append(DmarcLintFinding(domain_name, rule.code, rule.severity, "", message))
+        self.finding_count += len(findings)
+        if 1 == len(dmarc_values):
+            findings.extend(self.lint_record(domain_name, dmarc_values[0]))
+        return findings
+
+    def lint_domains(self, domain_txt_values):
+        '''
+        Checks the records of many domains.
+        :param domain_txt_values: Iterable of (domain name, list of TXT values at '_dmarc') tuples.
+        :return: Generator of DmarcLintFinding objects.
+        '''
+        lint_txt_records = self.lint_txt_records
+        for domain_name, txt_values in domain_txt_values:
+            yield from lint_txt_records(domain_name, txt_values)
+
+
+# Rules of the TXT records at '_dmarc'.
+
+misplaced_version_pattern = re.compile(r"(^|;)\s*v\s*=\s*DMARC1\s*(;|$)", re.IGNORECASE)
+
+
+@DmarcLinter.register("DMARC001", "warning", "txt", "No DMARC record is published.")
+def check_record_published(txt_values, dmarc_values):
+    if not dmarc_values and not any(misplaced_version_pattern.search(txt_value) for txt_value in txt_values):
+        return "No DMARC record is published, so receivers apply no policy."
+    return None
+
+
+@DmarcLinter.register("DMARC002", "error", "txt", "'v=DMARC1' is not the first tag.")
+def check_version_first(txt_values, dmarc_values):
+    if len(dmarc_values) == len(txt_values):
+        return None
+    for txt_value in txt_values:
+        if txt_value not in dmarc_values and misplaced_version_pattern.search(txt_value):
+            return "'" + txt_value + "' is ignored because it does not start with exactly 'v=DMARC1'."
+    return None
+
+
+@DmarcLinter.register("DMARC003", "error", "txt", "More than one DMARC record is published.")
+def check_single_record(txt_values, dmarc_values):
+    if len(dmarc_values) > 1:
+        return str(len(dmarc_values)) + " DMARC records are published, so receivers ignore all of them."
+    return None
+
+
+# Rules of the record as a whole.
+
+@DmarcLinter.register("DMARC010", "error", "record", "The required p tag is missing.")
+def check_policy_present(record_value, parse_result):
+    if "" == parse_result.dmarc_record.p:
+        return "The p tag is missing. Receivers treat the record as 'p=none' at best."
+    return None
+
+
+@DmarcLinter.register("DMARC011", "warning", "record", "p is not the second tag.")
+def check_policy_second(record_value, parse_result):
+    tags = record_value.split(";", 2)
+    if "" != parse_result.dmarc_record.p and (len(tags) < 2 or "p" != tags[1].partition("=")[0].strip()):
+        return "RFC 7489 puts p straight after v, and some receivers reject the record otherwise."
+    return None
+
+
+@DmarcLinter.register("DMARC012", "warning", "record", "A tag is given more than once.")
+def check_duplicate_tags(record_value, parse_result):
+    if parse_result.duplicate_tags:
+        return "Repeated tags are ignored after the first: " + ", ".join(parse_result.duplicate_tags) + "."
+    return None
+
+
+@DmarcLinter.register("DMARC013", "warning", "record", "The record has tags RFC 7489 does not define.")
+def check_unknown_tags(record_value, parse_result):
+    if parse_result.unknown_tags:
+        return "Unknown tags are ignored, check for typos: " + ", ".join(parse_result.unknown_tags) + "."
+    return None
+
+
+@DmarcLinter.register("DMARC014", "warning", "record", "No aggregate reports are requested.")
+def check_aggregate_reports(record_value, parse_result):
+    if not any(uri.strip() for uri in parse_result.dmarc_record.rua):
+        return "There is no rua tag, so no aggregate reports are sent to show who sends mail for the domain."
+    return None
+
+
+policy_strengths = {"none": 0, "quarantine": 1, "reject": 2}
+
+
+@DmarcLinter.register("DMARC015", "warning", "record", "sp is weaker than p.")
+def check_subdomain_policy(record_value, parse_result):
+    dmarc_record = parse_result.dmarc_record
+    policy_strength = policy_strengths.get(dmarc_record.p.lower())
+    subdomain_policy_strength = policy_strengths.get(dmarc_record.sp.lower())
+    if policy_strength is not None and subdomain_policy_strength is not None and \
+            subdomain_policy_strength < policy_strength:
+        return "Subdomains get '" + dmarc_record.sp + "', which is weaker than '" + dmarc_record.p + "'."
+    return None
+
+
+@DmarcLinter.register("DMARC016", "info", "record", "fo is given without ruf.")
+def check_failure_options(record_value, parse_result):
+    if "" != parse_result.dmarc_record.fo and "" == parse_result.dmarc_record.ruf:
+        return "fo only affects failure reports, which are not requested since there is no ruf tag."
+    return None
+
+
+# Rules of single tag values. fo, rua, and ruf are checked one entry at a time.
+
+@DmarcLinter.register("DMARC020", "error", "p", "p is not none, quarantine, or reject.")
+def check_policy_value(tag_value):
+    if tag_value.lower() not in policy_strengths:
+        return "'" + tag_value + "' is not a policy. Use none, quarantine, or reject."
+    return None
+
+
+@DmarcLinter.register("DMARC021", "info", "p", "p=none only monitors.")
+def check_monitoring_policy(tag_value):
+    if "none" == tag_value.lower():
+        return "The policy only monitors; mail failing DMARC is still delivered."
+    return None
+
+
+@DmarcLinter.register("DMARC022", "error", "sp", "sp is not none, quarantine, or reject.")
+def check_subdomain_policy_value(tag_value):
+    if tag_value.lower() not in policy_strengths:
+        return "'" + tag_value + "' is not a policy. Use none, quarantine, or reject."
+    return None
+
+
+@DmarcLinter.register("DMARC023", "error", "adkim", "adkim is not r or s.")
+def check_dkim_alignment(tag_value):
+    if tag_value.lower() not in ("r", "s"):
+        return "'" + tag_value + "' is not an alignment mode. Use r or s."
+    return None
+
+
+@DmarcLinter.register("DMARC024", "error", "aspf", "aspf is not r or s.")
+def check_spf_alignment(tag_value):
+    if tag_value.lower() not in ("r", "s"):
+        return "'" + tag_value + "' is not an alignment mode. Use r or s."
+    return None
+
+
+@DmarcLinter.register("DMARC025", "error", "pct", "pct is not a whole number from 0 to 100.")
+def check_percentage(tag_value):
+    if not tag_value.isdigit() or int(tag_value) > 100:
+        return "'" + tag_value + "' is not a whole number from 0 to 100."
+    return None
+
+
+@DmarcLinter.register("DMARC026", "info", "pct", "pct is below 100.")
+def check_partial_percentage(tag_value):
+    if tag_value.isdigit() and int(tag_value) < 100:
+        return "The policy is only applied to " + tag_value + "% of failing mail."
+    return None
+
+
+@DmarcLinter.register("DMARC027", "error", "ri", "ri is not a whole number of seconds.")
+def check_report_interval(tag_value):
+    if not tag_value.isdigit():
+        return "'" + tag_value + "' is not a whole number of seconds."
+    return None
+
+
+@DmarcLinter.register("DMARC028", "error", "fo", "fo has options other than 0, 1, d, and s.")
+def check_failure_option_value(tag_value):
+    if tag_value.lower() not in ("0", "1", "d", "s"):
+        return "'" + tag_value + "' is not a failure reporting option. Use 0, 1, d, or s, separated by ':'."
+    return None
+
+
+@DmarcLinter.register("DMARC029", "error", "rf", "rf is not afrf.")
+def check_report_format(tag_value):
+    unknown_formats = [report_format for report_format in tag_value.split(":") if "afrf" != report_format.strip()]
+    if unknown_formats:
+        return "'" + tag_value + "' is not a known failure report format. Use afrf."
+    return None
+
+
+size_limit_pattern = re.compile(r"\d+[kmgtKMGT]?")
+
+
+# Rules shared by rua and ruf. Nearly every entry is a plain 'mailto:' URI, which is let through without
+# splitting it.
+
+def check_report_uri_scheme(uri):
+    if uri.startswith("mailto:"):
+        return None
+    if "" == DmarcParser.split_report_uri(uri)[0]:
+        return "'" + uri + "' is not a URI. Email addresses must be written as 'mailto:" + uri + "'."
+    return None
+
+
+def check_report_uri_mailto(uri):
+    if uri.startswith("mailto:"):
+        return None
+    if DmarcParser.split_report_uri(uri)[0] not in ("", "mailto"):
+        return "'" + uri + "' is not a mailto URI; most receivers only send reports by email."
+    return None
+
+
+def check_report_uri_address(uri):
+    if uri.startswith("mailto:") and "!" not in uri:
+        address = uri[7:]
+    else:
+        scheme, address, _ = DmarcParser.split_report_uri(uri)
+        if "mailto" != scheme:
+            return None
+    local_part, _, host_name = address.rpartition("@")
+    if "" == local_part or "" == host_name:
+        return "'" + uri + "' is not a valid email address."
+    return None
+
+
+def check_report_uri_size(uri):
+    if "!" not in uri:
+        return None
+    size_limit = DmarcParser.split_report_uri(uri)[2]
+    if not size_limit_pattern.fullmatch(size_limit):
+        return "'" + uri + "' has a size limit that is not a number with an optional k, m, g, or t."
+    return None
+
+
+DmarcLinter.register("DMARC030", "error", "rua", "An rua entry has no URI scheme.")(check_report_uri_scheme)
+DmarcLinter.register("DMARC031", "warning", "rua", "An rua entry is not a mailto URI.")(check_report_uri_mailto)
+DmarcLinter.register("DMARC032", "error", "rua", "An rua mailto URI has no valid email address.")(
+    check_report_uri_address
+)
+DmarcLinter.register("DMARC033", "error", "rua", "An rua size limit is not valid.")(check_report_uri_size)
+DmarcLinter.register("DMARC040", "error", "ruf", "A ruf entry has no URI scheme.")(check_report_uri_scheme)
+DmarcLinter.register("DMARC041", "warning", "ruf", "A ruf entry is not a mailto URI.")(check_report_uri_mailto)
+DmarcLinter.register("DMARC042", "error", "ruf", "A ruf mailto URI has no valid email address.")(
+    check_report_uri_address
+)
+DmarcLinter.register("DMARC043", "error", "ruf", "A ruf size limit is not valid.")(check_report_uri_size)
@@ -0,0 +1,163 @@
+import re
+from DmarcRecord import DmarcRecord
+
+
+class DmarcParseResult:
+    '''
+    The DmarcRecord built from a TXT value along with anything odd found while parsing it.
+    '''
+    __slots__ = ("dmarc_record", "duplicate_tags", "unknown_tags", "tag_names")
+
+    def __init__(self, dmarc_record, duplicate_tags, unknown_tags, tag_names=()):
+        self.dmarc_record = dmarc_record
+        self.duplicate_tags = duplicate_tags
+        self.unknown_tags = unknown_tags
+        # Known tags found in the record, in the order they appear.
+        self.tag_names = tag_names
+
+
+class DmarcParser:
+    '''
+    Single pass DMARC tag parser. Each tag is looked up once in a dispatch table instead of being compared
+    against every known tag name.
+    '''
+
+    # Tag name -> separator used to split the value into a list, or None to keep it as a string.
+    tag_table = {
+        "v": None,
+        "p": None,
+        "sp": None,
+        "adkim": None,
+        "aspf": None,
+        "pct": None,
+        "ri": None,
+        "fo": ":",
+        "rf": None,
+        "rua": ",",
+        "ruf": ",",
+        "np": None,
+        "psd": None,
+    }
+
+    quoted_string_pattern = re.compile(r'"([^"\\]*)"')
+    escape_pattern = re.compile(r'\\(\d{3}|.)', re.DOTALL)
+    uri_scheme_pattern = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*")
+
+    @staticmethod
+    def join_txt_strings(txt_value):
+        '''
+        Joins the strings making up one TXT record. Long records are published as several strings which
+        must be joined with nothing between them.
+        :param txt_value: Either the record in presentation format ('"v=DMARC1; " "p=none"'), an unquoted
+            string, bytes, or a list of the record's strings as str or bytes.
+        :return: The joined value as a string.
+        '''
+        if isinstance(txt_value, bytes):
+            return txt_value.decode("utf-8", "replace")
+        if not isinstance(txt_value, str):
+            return "".join(
+                chunk.decode("utf-8", "replace") if isinstance(chunk, bytes) else chunk for chunk in txt_value
+            )
+        if not txt_value.startswith('"'):
+            return txt_value
+        if "\\" not in txt_value:
+            return "".join(DmarcParser.quoted_string_pattern.findall(txt_value))
+        return DmarcParser.join_escaped_strings(txt_value)
+
+    @staticmethod
+    def join_escaped_strings(txt_value):
+        '''
+        Slow path of join_txt_strings() for presentation format containing backslash escapes.
+        :param txt_value: Record in presentation format.
+        :return: The joined value as a string.
+        '''
+        chunks = []
+        in_string = False
+        chunk_start = 0
+        position = 0
+        while position < len(txt_value):
+            character = txt_value[position]
+            if '"' == character:
+                if in_string:
+                    chunks.append(txt_value[chunk_start:position])
+                else:
+                    chunk_start = position + 1
+                in_string = not in_string
+            elif "\\" == character and in_string:
+                position += 1
+            position += 1
+        escaped_value = "".join(chunks)
+        raw_value = bytearray()
+        last_end = 0
+        for match in DmarcParser.escape_pattern.finditer(escaped_value):
+            raw_value += escaped_value[last_end:match.start()].encode("utf-8")
+            escape = match.group(1)
+            if escape.isdigit():
+                raw_value.append(int(escape) & 0xFF)
+            else:
+                raw_value += escape.encode("utf-8")
+            last_end = match.end()
+        raw_value += escaped_value[last_end:].encode("utf-8")
+        return raw_value.decode("utf-8", "replace")
+
+    @staticmethod
+    def parse(txt_value):
+        '''
+        Parses a DMARC TXT record.
+        :param txt_value: Record value in any form accepted by join_txt_strings().
+        :return: DmarcParseResult. Only the first occurrence of a repeated tag is used.
+        '''
+        dmarc_record = DmarcRecord()
+        duplicate_tags = []
+        unknown_tags = []
+        # Used as an ordered set.
+        seen_tags = {}
+        tag_table = DmarcParser.tag_table
+        for dmarc_tag in DmarcParser.join_txt_strings(txt_value).split(";"):
+            tag_name, has_value, tag_value = dmarc_tag.partition("=")
+            tag_name = tag_name.strip()
+            if not has_value:
+                if "" != tag_name:
+                    unknown_tags.append(tag_name)
+                continue
+            if tag_name not in tag_table:
+                unknown_tags.append(tag_name)
+                continue
+            if tag_name in seen_tags:
+                duplicate_tags.append(tag_name)
+                continue
+            seen_tags[tag_name] = None
+            separator = tag_table[tag_name]
+            tag_value = tag_value.strip()
+            if separator is None:
+                setattr(dmarc_record, tag_name, tag_value)
+            else:
+                setattr(dmarc_record, tag_name, [item.strip() for item in tag_value.split(separator)])
+        return DmarcParseResult(dmarc_record, duplicate_tags, unknown_tags, seen_tags)
+
+    @staticmethod
+    def split_report_uri(uri):
+        '''
+        Splits one rua or ruf entry, such as 'mailto:reports@example.com!10m'.
+        :param uri: Report URI.
+        :return: Tuple of the lower case scheme ('' if the entry has none), the rest of the URI, and the size
+            limit ('' if none is given).
+        '''
+        uri = uri.strip()
+        size_limit = ""
+        if "!" in uri:
+            uri, _, size_limit = uri.rpartition("!")
+        scheme, separator, address = uri.partition(":")
+        if "" == separator or not DmarcParser.uri_scheme_pattern.fullmatch(scheme):
+            return "", uri, size_limit.strip()
+        return scheme.lower(), address.strip(), size_limit.strip()
+
+    @staticmethod
+    def is_dmarc_record(txt_value):
+        '''
+        Checks whether a joined TXT value is a DMARC record, meaning it starts with the 'v=DMARC1' tag.
+        :param txt_value: Joined TXT value.
+        :return: True if the value is a DMARC record.
+        '''
+        version_tag = txt_value.split(";", 1)[0].replace(" ", "").replace("\t", "")
+        return "v=DMARC1" == version_tag
@@ -0,0 +1,269 @@
+import asyncio
+from collections import OrderedDict
+from AsyncDomainAuditor import AsyncDomainAuditor
+from DmarcParser import DmarcParser
+from PublicSuffixList import PublicSuffixList
+
+
+class DmarcPolicyResult:
+    '''
+    The DMARC policy receivers apply to mail from one domain, and the record it comes from.
+    status is 'found', 'none' when no record applies, or 'unknown' when a lookup failed. policy_tag is the tag
+    the policy was taken from: 'p' for the domain's own record, or 'sp' (or 'np' for a domain that does not
+    exist) for a record further up, falling back to 'p' when those are not set. subdomain_policy is the
+    policy names below the domain get when they have no record of their own, from the sp or p tag of the
+    record they fall back to.
+    '''
+    __slots__ = (
+        "domain_name", "status", "policy", "policy_tag", "subdomain_policy", "record_domain", "record_value"
+    )
+
+    fields = list(__slots__)
+
+    def __init__(self, domain_name, status, policy="", policy_tag="", subdomain_policy="", record_domain="",
+                 record_value=""):
+        self.domain_name = domain_name
+        self.status = status
+        self.policy = policy
+        self.policy_tag = policy_tag
+        self.subdomain_policy = subdomain_policy
+        self.record_domain = record_domain
+        self.record_value = record_value
+
+    def to_row(self):
+        return [getattr(self, field) for field in DmarcPolicyResult.__slots__]
+
+
+class DmarcPolicyDiscovery:
+    '''
+    Finds the effective DMARC policy of any name, including subdomains without a record of their own.
+    With method 'rfc7489' the name's '_dmarc' record is looked up and, if there is none, the record of its
+    organizational domain (RFC 7489 section 6.6.3). With method 'tree-walk' the names above it are tried one
+    at a time up to the top level domain, jumping straight to seven labels for longer names, as in the
+    DMARCbis DNS tree walk. Either way the first single DMARC record found gives the policy.
+
+    The lookups of names above the one asked about are shared: each is made once, however many names
+    below it are looked up, so half a million subdomains under a few thousand parents need a few thousand
+    parent lookups. Names looked up together wait for the same query. A lookup that fails is made again for
+    the next name that needs it.
+    '''
+
+    methods = ("rfc7489", "tree-walk")
+    policies = ("none", "quarantine", "reject")
+    # Names with more labels than this start the tree walk at this many labels.
+    tree_walk_max_labels = 7
+
+    def __init__(self, method="rfc7489", max_in_flight=200, auditor=None, public_suffix_list=None,
+                 max_shared_names=100000):
+        '''
+        :param method: 'rfc7489' or 'tree-walk'.
+        :param max_in_flight: Maximum number of DNS queries in flight.
+        :param auditor: Optional AsyncDomainAuditor whose resolver and cache are used for the lookups.
+        :param public_suffix_list: Optional PublicSuffixList used to find organizational domains.
+        :param max_shared_names: Number of names above those asked about whose records are kept. The least
+            recently used are dropped first.
+        :raises ValueError: If the method is not known.
+        '''
+        if method not in DmarcPolicyDiscovery.methods:
+            raise ValueError("method must be 'rfc7489' or 'tree-walk'")
+        self.method = method
+        self.max_in_flight = max_in_flight
+        self.auditor = auditor or AsyncDomainAuditor(max_in_flight=max_in_flight)
+        self.public_suffix_list = public_suffix_list or PublicSuffixList.get_default()
+        self.max_shared_names = max_shared_names
+        # Domain name above the ones asked about -> the task looking up its DMARC records while it runs, then
+        # the tuple it returned. Least recently used first.
+        self.shared_lookups = OrderedDict()
+        self.lookup_count = 0
+        self.shared_hit_count = 0
+
+    def get_candidate_names(self, domain_name):
+        '''
+        :param domain_name: Lower case domain name without a trailing dot.
+        :return: List of the names whose '_dmarc' records are tried, in order, starting with the name itself.
+        '''
+        if "rfc7489" == self.method:
+            organizational_domain = self.public_suffix_list.get_organizational_domain(domain_name)
+            if organizational_domain == domain_name:
+                return [domain_name]
+            return [domain_name, organizational_domain]
+        labels = domain_name.split(".")
+        candidate_names = [domain_name]
+        label_count = min(len(labels) - 1, DmarcPolicyDiscovery.tree_walk_max_labels)
+        while label_count > 0:
+            candidate_names.append(".".join(labels[-label_count:]))
+            label_count -= 1
+        return candidate_names
+
+    async def lookup_dmarc_records(self, domain_name):
+        '''
+        :param domain_name: Domain name.
+        :return: Tuple of the rcode text and the list of TXT values at '_dmarc.<domain>' that are DMARC
+            records.
+        '''
+        self.lookup_count += 1
+        rcode, txt_values = await self.auditor.get_txt_records("_dmarc." + domain_name)
+        return rcode, [txt_value for txt_value in txt_values if DmarcParser.is_dmarc_record(txt_value)]
+
+    async def lookup_shared_dmarc_records(self, domain_name):
+        '''
+        Same as lookup_dmarc_records() for a name above the one asked about, looked up only once. Failed
+        lookups, and lookups that raised, are not kept, so the next name below asks again.
+        '''
+        shared_lookups = self.shared_lookups
+        lookup = shared_lookups.get(domain_name)
+        if type(lookup) is tuple:
+            self.shared_hit_count += 1
+            shared_lookups.move_to_end(domain_name)
+            return lookup
+        if lookup is None:
+            lookup = asyncio.ensure_future(self.lookup_dmarc_records(domain_name))
+            shared_lookups[domain_name] = lookup
+            if len(shared_lookups) > self.max_shared_names:
+                shared_lookups.popitem(last=False)
+        else:
+            self.shared_hit_count += 1
+        try:
+            result = await asyncio.shield(lookup)
+        except Exception:
+            if shared_lookups.get(domain_name) is lookup:
+                del shared_lookups[domain_name]
+            raise
+        if shared_lookups.get(domain_name) is lookup:
+            if result[0] in ("NOERROR", "NXDOMAIN"):
+                shared_lookups[domain_name] = result
+            else:
+                del shared_lookups[domain_name]
+        return result
+
+    async def get_domain_exists(self, domain_name):
+        '''
+        :return: True or False, or None if the lookup failed.
+        '''
+        rcode, _ = await self.auditor.get_txt_records(domain_name)
+        if rcode not in ("NOERROR", "NXDOMAIN"):
+            return None
+        return "NOERROR" == rcode
+
+    @staticmethod
+    def get_policy(dmarc_record, tag_names):
+        '''
+        :param dmarc_record: DmarcRecord.
+        :param tag_names: Tags to try in order, such as ('sp', 'p').
+        :return: Tuple of the first valid policy among the tags and the tag it came from, or ('', '') if none
+            of them is valid.
+        '''
+        for tag_name in tag_names:
+            policy = getattr(dmarc_record, tag_name).lower()
+            if policy in DmarcPolicyDiscovery.policies:
+                return policy, tag_name
+        return "", ""
+
+    @staticmethod
+    def parse_policy_record(record_value):
+        '''
+        :param record_value: DMARC record.
+        :return: DmarcRecord, or None if the record has no valid p tag and so gives no policy. A record without
+            a valid p that asks for aggregate reports is read as p=none (RFC 7489 section 6.6.3).
+        '''
+        dmarc_record = DmarcParser.parse(record_value).dmarc_record
+        if dmarc_record.p.lower() not in DmarcPolicyDiscovery.policies:
+            if not dmarc_record.rua:
+                return None
+            dmarc_record.p = "none"
+        return dmarc_record
+
+    async def get_rfc7489_subdomain_policy(self, organizational_domain):
+        '''
+        Under RFC 7489 names below a subdomain without records of their own go straight to the
+        organizational domain, whatever the subdomain's own record says.
+        :return: The policy the organizational domain's record gives its subdomains, or '' if there is none or
+            it could not be looked up.
+        '''
+        _, dmarc_values = await self.lookup_shared_dmarc_records(organizational_domain)
+        if 1 != len(dmarc_values):
+            return ""
+        dmarc_record = DmarcPolicyDiscovery.parse_policy_record(dmarc_values[0])
+        if dmarc_record is None:
+            return ""
+        return DmarcPolicyDiscovery.get_policy(dmarc_record, ("sp", "p"))[0]
+
+    async def discover(self, domain_name):
+        '''
+        Finds the effective DMARC policy of one name.
+        :param domain_name: Domain name.
+        :return: DmarcPolicyResult.
+        '''
+        if self.auditor.query_limit is None:
+            self.auditor.query_limit = asyncio.Semaphore(self.max_in_flight)
+        domain_name = domain_name.lower().rstrip(".")
+        leaf_rcode = ""
+        candidate_names = self.get_candidate_names(domain_name)
+        for candidate_name in candidate_names:
+            if candidate_name == domain_name:
+                rcode, dmarc_values = await self.lookup_dmarc_records(candidate_name)
+                leaf_rcode = rcode
+            else:
+                rcode, dmarc_values = await self.lookup_shared_dmarc_records(candidate_name)
+            if rcode not in ("NOERROR", "NXDOMAIN"):
+                # Whether a record exists here is not known, so neither is which record applies.
+                return DmarcPolicyResult(domain_name, "unknown", record_domain=candidate_name)
+            if 1 == len(dmarc_values):
+                break
+            if dmarc_values and "rfc7489" == self.method:
+                # RFC 7489 stops at a name with several records, so no policy applies.
+                return DmarcPolicyResult(domain_name, "none", record_domain=candidate_name)
+        else:
+            return DmarcPolicyResult(domain_name, "none")
+
+        record_value = dmarc_values[0]
+        dmarc_record = DmarcPolicyDiscovery.parse_policy_record(record_value)
+        if dmarc_record is None:
+            return DmarcPolicyResult(domain_name, "none", record_domain=candidate_name, record_value=record_value)
+        subdomain_policy, _ = DmarcPolicyDiscovery.get_policy(dmarc_record, ("sp", "p"))
+        if candidate_name == domain_name:
+            policy, policy_tag = DmarcPolicyDiscovery.get_policy(dmarc_record, ("p",))
+            if "rfc7489" == self.method and len(candidate_names) > 1:
+                subdomain_policy = await self.get_rfc7489_subdomain_policy(candidate_names[-1])
+        else:
+            tag_names = ("sp", "p")
+            if "tree-walk" == self.method and dmarc_record.np.lower() in DmarcPolicyDiscovery.policies:
+                # A NOERROR answer at '_dmarc' below the name shows the name exists, so only an NXDOMAIN one
+                # needs another lookup.
+                domain_exists = True if "NOERROR" == leaf_rcode else await self.get_domain_exists(domain_name)
+                if domain_exists is None:
+                    return DmarcPolicyResult(domain_name, "unknown", record_domain=candidate_name,
+                                             record_value=record_value)
+                if not domain_exists:
+                    tag_names = ("np", "sp", "p")
+            policy, policy_tag = DmarcPolicyDiscovery.get_policy(dmarc_record, tag_names)
+        return DmarcPolicyResult(domain_name, "found", policy, policy_tag, subdomain_policy, candidate_name,
+                                 record_value)
+
+    def get_summary(self):
+        '''
+        :return: Text giving the number of '_dmarc' names looked up and how many more lookups of names above
+            those asked about were shared with other names.
+        '''
+        return (
+            str(self.lookup_count) + " '_dmarc' names looked up. " + str(self.shared_hit_count) +
+            " more lookups of parent domains were shared with other names."
+        )
+
+    def discover_domains(self, domain_names):
+        '''
+        Finds the effective DMARC policies of many names, several names at once. Names are pulled from the
+        iterable only as workers become free.
+        :param domain_names: Iterable of domain names.
+        :return: Asynchronous generator of DmarcPolicyResult objects, in completion order.
+        '''
+        # The lookups share the auditor's query limit, which audit_domains() would otherwise create.
+        self.auditor.query_limit = asyncio.Semaphore(self.max_in_flight)
+        # Most names need only their own lookup once the names above them are known.
+        worker_count = max(1, self.max_in_flight)
+        return AsyncDomainAuditor.run_workers(domain_names, worker_count, self.discover,
+                                              DmarcPolicyDiscovery.get_error_result)
+
+    @staticmethod
+    def get_error_result(domain_name, error):
+        return DmarcPolicyResult(domain_name, "unknown")
@@ -1,5 +1,8 @@
 class DmarcRecord:
-    def __init__(self, v='DMARC1', p='', sp='', adkim='', aspf='', pct='', ri='', fo='', rf='', rua='', ruf=''):
+    __slots__ = ("v", "p", "sp", "adkim", "aspf", "pct", "ri", "fo", "rf", "rua", "ruf", "np", "psd")
+
+    def __init__(self, v='DMARC1', p='', sp='', adkim='', aspf='', pct='', ri='', fo='', rf='', rua='', ruf='', np='',
+                 psd=''):
         self.v = v
         self.p = p
         self.sp = sp
@@ -11,3 +14,6 @@ class DmarcRecord:
         self.rf = rf
         self.rua = rua
         self.ruf = ruf
+        # Non-existent subdomain policy (RFC 9091) and public suffix domain flag, both from DMARCbis.
+        self.np = np
+        self.psd = psd
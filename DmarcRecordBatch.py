@@ -0,0 +1,213 @@
+from array import array
+from DmarcRecord import DmarcRecord
+
+
+class CodedColumn:
+    '''
+    A column of short strings stored as small integer codes. Each distinct value is kept once in 'values'.
+    '''
+    __slots__ = ("codes", "values", "value_codes")
+
+    def __init__(self, typecode, initial_values):
+        self.codes = array(typecode)
+        self.values = list(initial_values)
+        self.value_codes = {value: code for code, value in enumerate(self.values)}
+
+    def get_code(self, value):
+        code = self.value_codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.value_codes[value] = code
+        return code
+
+    def append(self, value):
+        code = self.get_code(value)
+        try:
+            self.codes.append(code)
+        except OverflowError:
+            # More distinct values than the code type holds. Widen the codes and carry on.
+            self.codes = array("I" if "H" == self.codes.typecode else "H", self.codes)
+            self.append(value)
+
+    def get(self, index):
+        return self.values[self.codes[index]]
+
+
+class UriListColumn:
+    '''
+    A column of URI lists. Every URI is an index into a string table shared with the other URI columns of
+    the batch, and each row is a slice of one flat array given by 'offsets'.
+    '''
+    __slots__ = ("uri_indexes", "offsets", "uri_table")
+
+    def __init__(self, uri_table):
+        self.uri_indexes = array("I")
+        self.offsets = array("I", [0])
+        self.uri_table = uri_table
+
+    def append(self, uris):
+        if uris:
+            get_code = self.uri_table.get_code
+            self.uri_indexes.extend(get_code(uri) for uri in uris)
+        self.offsets.append(len(self.uri_indexes))
+
+    def get(self, index):
+        start = self.offsets[index]
+        end = self.offsets[index + 1]
+        if start == end:
+            return ''
+        values = self.uri_table.values
+        return [values[uri_index] for uri_index in self.uri_indexes[start:end]]
+
+
+class DmarcRecordView:
+    '''
+    Read-only DmarcRecord interface to one row of a DmarcRecordBatch. No per-record data is copied until
+    an attribute is read.
+    '''
+    __slots__ = ("batch", "index")
+
+    def __init__(self, batch, index):
+        self.batch = batch
+        self.index = index
+
+    v = property(lambda self: self.batch.v.get(self.index))
+    p = property(lambda self: self.batch.p.get(self.index))
+    sp = property(lambda self: self.batch.sp.get(self.index))
+    adkim = property(lambda self: self.batch.adkim.get(self.index))
+    aspf = property(lambda self: self.batch.aspf.get(self.index))
+    pct = property(lambda self: self.batch.get_pct(self.index))
+    ri = property(lambda self: self.batch.ri.get(self.index))
+    fo = property(lambda self: self.batch.get_fo(self.index))
+    rf = property(lambda self: self.batch.rf.get(self.index))
+    rua = property(lambda self: self.batch.rua.get(self.index))
+    ruf = property(lambda self: self.batch.ruf.get(self.index))
+    np = property(lambda self: self.batch.np.get(self.index))
+    psd = property(lambda self: self.batch.psd.get(self.index))
+
+    def to_record(self):
+        '''
+        Copies the row into a standalone DmarcRecord.
+        :return: DmarcRecord.
+        '''
+        return DmarcRecord(self.v, self.p, self.sp, self.adkim, self.aspf, self.pct, self.ri, self.fo, self.rf,
+                           self.rua, self.ruf, self.np, self.psd)
+
+
+class DmarcRecordBatch:
+    '''
+    Column oriented storage for many DmarcRecords.
+    Policies, alignment modes, and psd flags are stored as one byte codes, pct as one byte, other tags as codes
+    into a per-column table of distinct values, and rua/ruf URIs as indexes into one shared string table.
+    '''
+
+    policy_values = ['', 'none', 'quarantine', 'reject']
+    alignment_values = ['', 'r', 's']
+    psd_values = ['', 'y', 'n', 'u']
+    # pct codes above 100 that are not percentages.
+    pct_unset = 255
+    pct_irregular = 254
+
+    def __init__(self):
+        self.v = CodedColumn("B", ['DMARC1'])
+        self.p = CodedColumn("B", DmarcRecordBatch.policy_values)
+        self.sp = CodedColumn("B", DmarcRecordBatch.policy_values)
+        self.adkim = CodedColumn("B", DmarcRecordBatch.alignment_values)
+        self.aspf = CodedColumn("B", DmarcRecordBatch.alignment_values)
+        self.pct = array("B")
+        # Row index -> original text for pct values that are not a whole number from 0 to 100.
+        self.irregular_pct = {}
+        self.ri = CodedColumn("H", [''])
+        self.fo = CodedColumn("H", [''])
+        self.rf = CodedColumn("H", [''])
+        self.uri_table = CodedColumn("I", [])
+        self.rua = UriListColumn(self.uri_table)
+        self.ruf = UriListColumn(self.uri_table)
+        self.np = CodedColumn("B", DmarcRecordBatch.policy_values)
+        self.psd = CodedColumn("B", DmarcRecordBatch.psd_values)
+
+    @staticmethod
+    def from_records(dmarc_records):
+        '''
+        Builds a batch from an iterable of DmarcRecords, such as parser output.
+        :param dmarc_records: Iterable of DmarcRecord objects.
+        :return: DmarcRecordBatch.
+        '''
+        batch = DmarcRecordBatch()
+        batch.extend(dmarc_records)
+        return batch
+
+    def extend(self, dmarc_records):
+        '''
+        Appends many records. Column append methods are looked up once rather than once per record.
+        :param dmarc_records: Iterable of DmarcRecord objects.
+        :return: None.
+        '''
+        append_v = self.v.append
+        append_p = self.p.append
+        append_sp = self.sp.append
+        append_adkim = self.adkim.append
+        append_aspf = self.aspf.append
+        append_ri = self.ri.append
+        append_fo = self.fo.append
+        append_rf = self.rf.append
+        append_rua = self.rua.append
+        append_ruf = self.ruf.append
+        append_np = self.np.append
+        append_psd = self.psd.append
+        append_pct = self.append_pct
+        for dmarc_record in dmarc_records:
+            append_v(dmarc_record.v)
+            append_p(dmarc_record.p)
+            append_sp(dmarc_record.sp)
+            append_adkim(dmarc_record.adkim)
+            append_aspf(dmarc_record.aspf)
+            append_pct(dmarc_record.pct)
+            append_ri(dmarc_record.ri)
+            append_fo(":".join(dmarc_record.fo) if isinstance(dmarc_record.fo, list) else dmarc_record.fo)
+            append_rf(dmarc_record.rf)
+            append_rua(dmarc_record.rua)
+            append_ruf(dmarc_record.ruf)
+            append_np(dmarc_record.np)
+            append_psd(dmarc_record.psd)
+
+    def append(self, dmarc_record):
+        self.extend((dmarc_record,))
+
+    def append_pct(self, pct):
+        if '' == pct:
+            self.pct.append(DmarcRecordBatch.pct_unset)
+        elif pct.isascii() and pct.isdigit() and int(pct) <= 100 and str(int(pct)) == pct:
+            self.pct.append(int(pct))
+        else:
+            self.irregular_pct[len(self.pct)] = pct
+            self.pct.append(DmarcRecordBatch.pct_irregular)
+
+    def get_pct(self, index):
+        pct = self.pct[index]
+        if DmarcRecordBatch.pct_unset == pct:
+            return ''
+        if DmarcRecordBatch.pct_irregular == pct:
+            return self.irregular_pct[index]
+        return str(pct)
+
+    def get_fo(self, index):
+        fo = self.fo.get(index)
+        if '' == fo:
+            return ''
+        return fo.split(":")
+
+    def __len__(self):
+        return len(self.pct)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("DmarcRecordBatch index out of range")
+        return DmarcRecordView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield DmarcRecordView(self, index)
@@ -0,0 +1,379 @@
+import atexit
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def import_dnspython():
+    '''
+    Imports dnspython the first time a query is made rather than when this module is loaded, since it is
+    slow to import and not every command looks anything up.
+    :return: The dns package, with its exception, rdatatype, and resolver modules loaded.
+    '''
+    try:
+        import dns.exception
+        import dns.rdatatype
+        import dns.resolver
+    except ModuleNotFoundError:
+        print("Error: The 'dnspython' library could not be found. Please install and try again.")
+        sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+    return dns
+
+
+class CachedAnswer:
+    '''
+    The outcome of one DNS query as kept by DnsCache.
+    rcode is 'NOERROR' or 'NXDOMAIN'. records holds each rdata in presentation format, so TXT records keep
+    their quoting and string boundaries. An empty list with 'NOERROR' means the name exists but has no
+    records of the requested type.
+    '''
+    __slots__ = ("rcode", "records", "expires")
+
+    def __init__(self, rcode, records, expires):
+        self.rcode = rcode
+        self.records = records
+        self.expires = expires
+
+
+class DnsCache:
+    '''
+    TTL-aware DNS answer cache shared by every DomainRecordHandler.
+    Positive answers are kept for their record TTL and negative answers (NXDOMAIN and no records) for the
+    SOA minimum of the zone, as described in RFC 2308. The least recently used entry is evicted once
+    max_entries is reached. When a path is given, entries are also written to a SQLite file so they survive
+    across runs until they expire. Several processes can share the file: new entries are kept in memory and
+    written together in a transaction that is only open while they are written, so a process waits on the
+    others for milliseconds at a time. A process can also read the entries of a store it does not write to,
+    such as the workers of a scan, which each write a store of their own that is merged into the shared one
+    at the end.
+    '''
+
+    # Used for negative answers that do not include an SOA record.
+    default_negative_ttl = 300
+    # Upper bound on how long anything is cached, whatever TTL the zone asks for.
+    max_ttl = 86400
+    # Number of disk writes grouped into one transaction, and the longest they are kept before being written.
+    disk_commit_interval = 500
+    disk_commit_seconds = 1.0
+    # Seconds to wait for another process writing to the on-disk store.
+    disk_timeout = 30.0
+
+    def __init__(self, max_entries=100000, path=None, shared_path=None):
+        '''
+        :param max_entries: Maximum number of answers kept in memory.
+        :param path: Optional file name of the on-disk store.
+        :param shared_path: Optional file name of another on-disk store that answers are read from but never
+            written to. Only used along with path.
+        '''
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.disk_store = None
+        self.pending_disk_writes = []
+        self.pending_disk_write_time = 0.0
+        # Number of entries not written to disk because the store stayed locked or could not be written.
+        self.failed_disk_writes = 0
+        # Optional LookupMetrics told about every lookup.
+        self.metrics = None
+        self.has_shared_store = False
+        if path is not None:
+            self.open_disk_store(path, shared_path)
+
+    def open_disk_store(self, path, shared_path=None):
+        '''
+        Opens, creating if needed, the on-disk store. Expired entries are not read, and are removed a few at a
+        time as new ones are written rather than all at once here, which would keep other processes opening
+        the store waiting.
+        :param path: File name of the SQLite database.
+        :param shared_path: Optional file name of a SQLite database that is only read from, if it exists.
+        :return: None.
+        '''
+        self.disk_store = sqlite3.connect(path, timeout=self.disk_timeout, check_same_thread=False)
+        self.disk_store.execute("PRAGMA journal_mode=WAL")
+        self.disk_store.execute("PRAGMA synchronous=NORMAL")
+        self.disk_store.execute(
+            "CREATE TABLE IF NOT EXISTS dns_answers ("
+            "name TEXT NOT NULL, rdtype TEXT NOT NULL, rcode TEXT NOT NULL, records TEXT NOT NULL, "
+            "expires REAL NOT NULL, PRIMARY KEY (name, rdtype))"
+        )
+        self.disk_store.execute("CREATE INDEX IF NOT EXISTS dns_answers_expires ON dns_answers (expires)")
+        self.disk_store.commit()
+        if shared_path is not None and os.path.exists(shared_path):
+            self.disk_store.execute("ATTACH DATABASE ? AS shared", (shared_path,))
+            self.has_shared_store = True
+        atexit.register(self.close)
+
+    def merge_disk_store(self, path):
+        '''
+        Copies the unexpired entries of another on-disk store, such as one written by a scan worker, into this
+        cache's on-disk store.
+        :param path: File name of the SQLite database to copy from.
+        :return: None.
+        '''
+        with self.lock:
+            self.write_pending_entries()
+            self.disk_store.execute("ATTACH DATABASE ? AS merged", (path,))
+            try:
+                with self.disk_store:
+                    self.disk_store.execute(
+                        "INSERT OR REPLACE INTO dns_answers "
+                        "SELECT name, rdtype, rcode, records, expires FROM merged.dns_answers WHERE expires > ?",
+                        (time.time(),)
+                    )
+            finally:
+                self.disk_store.execute("DETACH DATABASE merged")
+
+    def write_pending_entries(self):
+        '''
+        Writes the entries waiting to go to disk in one transaction, along with removing as many expired
+        entries. Must be called with the lock held.
+        :return: None.
+        '''
+        if not self.pending_disk_writes:
+            return
+        try:
+            with self.disk_store:
+                self.disk_store.executemany(
+                    "INSERT OR REPLACE INTO dns_answers VALUES (?, ?, ?, ?, ?)", self.pending_disk_writes
+                )
+                self.disk_store.execute(
+                    "DELETE FROM dns_answers WHERE rowid IN "
+                    "(SELECT rowid FROM dns_answers WHERE expires <= ? LIMIT ?)",
+                    (time.time(), len(self.pending_disk_writes))
+                )
+        except sqlite3.OperationalError:
+            # The answers are still cached in memory, and the on-disk store is only there to save lookups.
+            self.failed_disk_writes += len(self.pending_disk_writes)
+        self.pending_disk_writes.clear()
+
+    def close(self):
+        '''
+        Writes pending entries and closes the on-disk store, if one is open.
+        :return: None.
+        '''
+        with self.lock:
+            if self.disk_store is not None:
+                self.write_pending_entries()
+                self.disk_store.close()
+                self.disk_store = None
+
+    @staticmethod
+    def make_key(name, rdtype):
+        return name.lower().rstrip("."), rdtype.upper()
+
+    def get(self, name, rdtype):
+        '''
+        Returns the cached answer for a query if one exists and has not expired.
+        :param name: Query name.
+        :param rdtype: Record type as text, for example 'TXT'.
+        :return: CachedAnswer or None.
+        '''
+        key = DnsCache.make_key(name, rdtype)
+        entry = self.get_entry(key)
+        if entry is not None and self.metrics is not None:
+            self.metrics.record(key[0], key[1], entry.rcode, 0.0, 0, True, 0)
+        return entry
+
+    def get_entry(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry.expires > now:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                del self.entries[key]
+            if self.disk_store is not None:
+                if self.has_shared_store:
+                    row = self.disk_store.execute(
+                        "SELECT rcode, records, expires FROM dns_answers WHERE name = ? AND rdtype = ? UNION ALL "
+                        "SELECT rcode, records, expires FROM shared.dns_answers WHERE name = ? AND rdtype = ? "
+                        "ORDER BY expires DESC LIMIT 1", key + key
+                    ).fetchone()
+                else:
+                    row = self.disk_store.execute(
+                        "SELECT rcode, records, expires FROM dns_answers WHERE name = ? AND rdtype = ?", key
+                    ).fetchone()
+                if row is not None and row[2] > now:
+                    entry = CachedAnswer(row[0], json.loads(row[1]), row[2])
+                    self.store_in_memory(key, entry)
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+            return None
+
+    def put(self, name, rdtype, rcode, records, ttl):
+        '''
+        Adds an answer to the cache.
+        :param name: Query name.
+        :param rdtype: Record type as text.
+        :param rcode: 'NOERROR' or 'NXDOMAIN'.
+        :param records: List of rdata in presentation format.
+        :param ttl: Seconds the answer may be kept.
+        :return: The CachedAnswer stored.
+        '''
+        key = DnsCache.make_key(name, rdtype)
+        entry = CachedAnswer(rcode, records, time.time() + min(max(ttl, 0), self.max_ttl))
+        with self.lock:
+            self.store_in_memory(key, entry)
+            if self.disk_store is not None:
+                if not self.pending_disk_writes:
+                    self.pending_disk_write_time = time.monotonic()
+                self.pending_disk_writes.append(key + (rcode, json.dumps(records), entry.expires))
+                if (len(self.pending_disk_writes) >= self.disk_commit_interval or
+                        time.monotonic() - self.pending_disk_write_time >= self.disk_commit_seconds):
+                    self.write_pending_entries()
+        return entry
+
+    def store_in_memory(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Empties the in-memory cache. The on-disk store is left alone.
+        :return: None.
+        '''
+        with self.lock:
+            self.entries.clear()
+
+    @staticmethod
+    def get_negative_ttl(response):
+        '''
+        Finds how long a negative answer may be cached from the SOA record in its authority section.
+        :param response: dns.message.Message of the negative answer, or None.
+        :return: TTL in seconds.
+        '''
+        dns = import_dnspython()
+        if response is not None:
+            for rrset in response.authority:
+                if dns.rdatatype.SOA == rrset.rdtype:
+                    return min(rrset.ttl, rrset[0].minimum)
+        return DnsCache.default_negative_ttl
+
+    def store_answer(self, name, rdtype, answer):
+        records = [rdata.to_text() for rdata in answer]
+        ttl = int(answer.expiration - time.time())
+        return self.put(name, rdtype, "NOERROR", records, ttl)
+
+    def store_nxdomain(self, name, rdtype, error):
+        responses = list(error.responses().values())
+        ttl = DnsCache.get_negative_ttl(responses[-1] if responses else None)
+        return self.put(name, rdtype, "NXDOMAIN", [], ttl)
+
+    def store_no_answer(self, name, rdtype, error):
+        ttl = DnsCache.get_negative_ttl(error.response())
+        return self.put(name, rdtype, "NOERROR", [], ttl)
+
+    def store_result(self, name, rdtype, answer, error, start_time):
+        '''
+        Caches the outcome of a query sent to DNS and tells the metrics about it, if any are attached.
+        :param answer: dns.resolver.Answer, or None if the query raised an error.
+        :param error: The error raised by the resolver, or None.
+        :param start_time: time.perf_counter() value when the query was sent.
+        :return: CachedAnswer.
+        :raises: The error again if it was not NXDOMAIN or no answer. Such errors are not cached.
+        '''
+        dns = import_dnspython()
+        entry = None
+        response = None
+        retries = 0
+        if error is None:
+            entry = self.store_answer(name, rdtype, answer)
+            response = answer.response
+            rcode = "NOERROR"
+        elif isinstance(error, dns.resolver.NXDOMAIN):
+            entry = self.store_nxdomain(name, rdtype, error)
+            responses = list(error.responses().values())
+            response = responses[-1] if responses else None
+            rcode = "NXDOMAIN"
+        elif isinstance(error, dns.resolver.NoAnswer):
+            entry = self.store_no_answer(name, rdtype, error)
+            response = error.response()
+            rcode = "NOERROR"
+        elif isinstance(error, dns.resolver.NoNameservers):
+            retries = max(len(error.kwargs.get("errors") or []) - 1, 0)
+            rcode = "SERVFAIL"
+        else:
+            retries = getattr(error, "retries", 0)
+            rcode = "TIMEOUT"
+        if self.metrics is not None:
+            size = 0
+            if response is not None:
+                size = len(getattr(response, "wire", None) or b"")
+                # QueryEngine notes on each response how many times the query was sent again.
+                retries = getattr(response, "retries", retries)
+            self.metrics.record(name.lower().rstrip("."), rdtype.upper(), rcode, time.perf_counter() - start_time,
+                                retries, False, size)
+        if entry is None:
+            raise error
+        return entry
+
+    def query(self, name, rdtype="A", resolver=None):
+        '''
+        Asks DNS without looking in the cache first, and caches the answer.
+        Errors other than NXDOMAIN and no answer, such as timeouts, are raised and not cached.
+        :param name: Query name.
+        :param rdtype: Record type as text.
+        :param resolver: Optional dns.resolver.Resolver. The default resolver is used if not given.
+        :return: CachedAnswer.
+        '''
+        dns = import_dnspython()
+        if resolver is None:
+            resolver = dns.resolver.get_default_resolver()
+        start_time = time.perf_counter()
+        try:
+            answer = resolver.resolve(name, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.NoNameservers,
+                dns.exception.Timeout) as error:
+            return self.store_result(name, rdtype, None, error, start_time)
+        return self.store_result(name, rdtype, answer, None, start_time)
+
+    async def query_async(self, name, rdtype, resolver):
+        '''
+        Same as query() but using a dns.asyncresolver.Resolver or QueryEngine.
+        '''
+        dns = import_dnspython()
+        start_time = time.perf_counter()
+        try:
+            answer = await resolver.resolve(name, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.NoNameservers,
+                dns.exception.Timeout) as error:
+            return self.store_result(name, rdtype, None, error, start_time)
+        return self.store_result(name, rdtype, answer, None, start_time)
+
+    def resolve(self, name, rdtype="A", resolver=None):
+        '''
+        Looks up a query in the cache, asking DNS only when there is no unexpired answer.
+        Errors other than NXDOMAIN and no answer, such as timeouts, are raised and not cached.
+        :param name: Query name.
+        :param rdtype: Record type as text.
+        :param resolver: Optional dns.resolver.Resolver. The default resolver is used if not given.
+        :return: CachedAnswer.
+        '''
+        entry = self.get(name, rdtype)
+        if entry is not None:
+            return entry
+        return self.query(name, rdtype, resolver)
+
+    async def resolve_async(self, name, rdtype, resolver):
+        '''
+        Same as resolve() but using a dns.asyncresolver.Resolver or QueryEngine.
+        :param name: Query name.
+        :param rdtype: Record type as text.
+        :param resolver: dns.asyncresolver.Resolver or QueryEngine to use on a cache miss.
+        :return: CachedAnswer.
+        '''
+        entry = self.get(name, rdtype)
+        if entry is not None:
+            return entry
+        return await self.query_async(name, rdtype, resolver)
@@ -0,0 +1,285 @@
+import hashlib
+import math
+import mmap
+import time
+from array import array
+
+
+class DomainHashSet:
+    '''
+    Set of domain names kept as 64 bit hashes in one flat array with open addressing, which takes 16 to 32
+    bytes per domain where a set of strings takes around 100. Two different names sharing a hash is so
+    unlikely at 64 bits that it is ignored, so Python's own hash is used even though it changes between runs.
+    '''
+
+    def __init__(self, initial_size=1 << 10):
+        '''
+        :param initial_size: Number of slots to start with, a power of two. The table doubles when half full.
+        '''
+        self.table = array("Q", bytes(8 * initial_size))
+        self.mask = initial_size - 1
+        self.count = 0
+
+    def add(self, name):
+        '''
+        :param name: Domain name as bytes.
+        :return: True if the name was not in the set before.
+        '''
+        # 0 marks an empty slot, so it is never used as a hash.
+        key_hash = hash(name) & 0xffffffffffffffff or 1
+        table = self.table
+        mask = self.mask
+        index = key_hash & mask
+        slot = table[index]
+        while slot:
+            if slot == key_hash:
+                return False
+            index = (index + 1) & mask
+            slot = table[index]
+        table[index] = key_hash
+        self.count += 1
+        if self.count * 2 > mask:
+            self.grow()
+        return True
+
+    def grow(self):
+        old_table = self.table
+        self.table = array("Q", bytes(16 * len(old_table)))
+        self.mask = len(self.table) - 1
+        table = self.table
+        mask = self.mask
+        for key_hash in old_table:
+            if key_hash:
+                index = key_hash & mask
+                while table[index]:
+                    index = (index + 1) & mask
+                table[index] = key_hash
+
+
+    def get_memory_size(self):
+        return self.table.itemsize * len(self.table)
+
+
+class DomainBloomFilter:
+    '''
+    Bloom filter of domain name hashes, for inputs too large for DomainHashSet. Memory is fixed when it is made,
+    about 1.8 bytes per domain at a 0.1% error rate, but that share of unique domains is wrongly taken to be
+    duplicates and dropped.
+    '''
+
+    def __init__(self, capacity, error_rate=0.001):
+        '''
+        :param capacity: Number of unique domains expected. More can be added, at a higher error rate.
+        :param error_rate: Share of unique domains wrongly taken to be duplicates once capacity is reached.
+        :raises ValueError: If capacity or error_rate is out of range.
+        '''
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("Bloom filter capacity must be positive and its error rate between 0 and 1.")
+        self.bit_count = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+
+    def add(self, name):
+        '''
+        :param name: Domain name as bytes. The two halves of a 64 bit hash of it give every bit position
+            (double hashing). The hash is the same in every run, so the same names are wrongly dropped each
+            time.
+        :return: True if the name was not in the filter before, as far as the filter can tell.
+        '''
+        key_hash = int.from_bytes(hashlib.blake2b(name, digest_size=8).digest(), "little")
+        bits = self.bits
+        bit_count = self.bit_count
+        first_hash = key_hash & 0xffffffff
+        second_hash = (key_hash >> 32) | 1
+        is_new = False
+        for hash_number in range(self.hash_count):
+            bit = (first_hash + hash_number * second_hash) % bit_count
+            byte = bits[bit >> 3]
+            bit_mask = 1 << (bit & 7)
+            if not byte & bit_mask:
+                bits[bit >> 3] = byte | bit_mask
+                is_new = True
+        return is_new
+
+    def get_memory_size(self):
+        return len(self.bits)
+
+
+class DomainListReader:
+    '''
+    Reads the domain names of a very large list, such as a zone dump or a certificate transparency extract,
+    for the bulk modes. The file is memory mapped and split into lines a few megabytes at a time, so lines
+    are never read one by one. Each line's first field is taken as the name; it is lower cased, its
+    trailing dot and any leading '*.' are removed, and names outside ASCII are converted to their IDNA
+    ('xn--') form, which is what DNS queries need. Blank lines, lines starting with '#', and names that are
+    not valid are skipped, and repeated names are dropped.
+    The same file always gives the same names, which --scan relies on when resuming.
+    '''
+
+    chunk_size = 1 << 22
+    # Text whose presence in a chunk means its lines need more than removing trailing dots.
+    fast_path_exclusions = (b" ", b"\t", b"\r", b"#", b"*", b"..", b"\n.")
+
+    def __init__(self, path, dedupe=True, bloom_filter_capacity=0, bloom_filter_error_rate=0.001):
+        '''
+        :param path: File with one domain name per line.
+        :param dedupe: False to pass on repeated names.
+        :param bloom_filter_capacity: If given, find repeats with a DomainBloomFilter sized for this many
+            unique domains instead of a DomainHashSet.
+        :param bloom_filter_error_rate: Error rate of the Bloom filter.
+        '''
+        self.path = path
+        self.seen_domains = None
+        if dedupe:
+            if bloom_filter_capacity:
+                self.seen_domains = DomainBloomFilter(bloom_filter_capacity, bloom_filter_error_rate)
+            else:
+                self.seen_domains = DomainHashSet()
+        self.line_count = 0
+        self.unique_count = 0
+        self.duplicate_count = 0
+        self.invalid_count = 0
+        # Seconds spent reading, not counting the time taken by whatever uses the names.
+        self.elapsed_time = 0.0
+
+    def read_chunks(self):
+        '''
+        :return: Generator of byte strings of whole lines, a few megabytes each.
+        '''
+        with open(self.path, "rb") as domain_file:
+            try:
+                mapped_file = mmap.mmap(domain_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Empty files, pipes, and devices cannot be mapped.
+                chunks = iter(lambda: domain_file.read(DomainListReader.chunk_size), b"")
+                yield from DomainListReader.split_chunks(chunks)
+                return
+            with mapped_file:
+                if hasattr(mapped_file, "madvise"):
+                    mapped_file.madvise(mmap.MADV_SEQUENTIAL)
+                chunks = (
+                    mapped_file[offset:offset + DomainListReader.chunk_size]
+                    for offset in range(0, len(mapped_file), DomainListReader.chunk_size)
+                )
+                yield from DomainListReader.split_chunks(chunks)
+
+    @staticmethod
+    def split_chunks(chunks):
+        '''
+        :param chunks: Iterable of byte strings that make up a file.
+        :return: Generator of byte strings ending at a line end, joining lines that cross from one chunk to
+            the next.
+        '''
+        partial_line = b""
+        for chunk in chunks:
+            line_end = chunk.rfind(b"\n") + 1
+            if 0 == line_end:
+                partial_line += chunk
+                continue
+            yield partial_line + chunk[:line_end]
+            partial_line = chunk[line_end:]
+        if partial_line:
+            yield partial_line
+
+    @staticmethod
+    def normalize_chunk(chunk):
+        '''
+        Normalizes every line of a chunk. Most lists are plain lower case ASCII names, one per line, which is
+        checked for once over the whole chunk so their lines can be used as they are.
+        :param chunk: Byte string of whole lines.
+        :return: Tuple of the number of lines and the list of normalize_domain_name() results, without those
+            of blank and comment lines.
+        '''
+        chunk = chunk.lower()
+        lines = chunk.split(b"\n")
+        if chunk.endswith(b"\n"):
+            lines.pop()
+        line_count = len(lines)
+        if chunk.isascii() and not chunk.startswith(b".") and all(
+            text not in chunk for text in DomainListReader.fast_path_exclusions
+        ):
+            if b".\n" in chunk or chunk.endswith(b"."):
+                lines = [line.rstrip(b".") for line in lines]
+            if max(map(len, lines), default=0) <= 63:
+                return line_count, [line for line in lines if line]
+        names = [DomainListReader.normalize_domain_name(line) for line in lines]
+        return line_count, [name for name in names if name != b""]
+
+    @staticmethod
+    def normalize_domain_name(line):
+        '''
+        :param line: One line of the file as bytes.
+        :return: The normalized name as ASCII bytes, b'' for a blank or comment line, or None if the name is
+            not valid.
+        '''
+        line = line.strip()
+        if not line or 35 == line[0]:
+            return b""
+        if b" " in line or b"\t" in line:
+            line = line.split(None, 1)[0]
+        if line.isascii():
+            name = line.lower().rstrip(b".")
+        else:
+            try:
+                # The idna codec applies nameprep, which also lower cases the name.
+                name = line.decode("utf-8").rstrip(".").encode("idna")
+            except UnicodeError:
+                return None
+        if name.startswith(b"*."):
+            name = name[2:]
+        if not name or len(name) > 253 or b".." in name or name.startswith(b"."):
+            return None
+        if len(name) > 63 and any(len(label) > 63 for label in name.split(b".")):
+            return None
+        return name
+
+    def read_batches(self, batch_size=1000):
+        '''
+        :param batch_size: Number of names in each batch.
+        :return: Generator of lists of domain names, in the order they are first found in the file.
+        '''
+        normalize_chunk = DomainListReader.normalize_chunk
+        seen_domains = self.seen_domains
+        batch = []
+        start_time = time.perf_counter()
+        for chunk in self.read_chunks():
+            line_count, names = normalize_chunk(chunk)
+            self.line_count += line_count
+            for name in names:
+                if name is None:
+                    self.invalid_count += 1
+                    continue
+                if seen_domains is not None:
+                    if not seen_domains.add(name):
+                        self.duplicate_count += 1
+                        continue
+                self.unique_count += 1
+                batch.append(name.decode("ascii"))
+                if len(batch) == batch_size:
+                    self.elapsed_time += time.perf_counter() - start_time
+                    yield batch
+                    batch = []
+                    start_time = time.perf_counter()
+        self.elapsed_time += time.perf_counter() - start_time
+        if batch:
+            yield batch
+
+    def __iter__(self):
+        for batch in self.read_batches():
+            yield from batch
+
+    def get_summary(self):
+        '''
+        :return: Text giving the number of lines read, how fast, and the memory used per unique domain to
+            find repeats.
+        '''
+        lines_per_second = self.line_count / self.elapsed_time if self.elapsed_time else 0.0
+        summary = (
+            "Read " + str(self.line_count) + " lines in " + format(self.elapsed_time, ".1f") + " seconds (" +
+            format(lines_per_second, ".0f") + " lines per second): " + str(self.unique_count) + " domains, " +
+            str(self.duplicate_count) + " repeated, " + str(self.invalid_count) + " not valid."
+        )
+        if self.seen_domains is not None and self.unique_count:
+            bytes_per_domain = self.seen_domains.get_memory_size() / self.unique_count
+            summary += " " + format(bytes_per_domain, ".1f") + " bytes of memory per domain to find repeats."
+        return summary
@@ -0,0 +1,378 @@
+import heapq
+import random
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from DmarcParser import DmarcParser
+from DomainRecordHandler import DomainRecordHandler
+
+try:
+    import dns.exception
+    import dns.resolver
+except ModuleNotFoundError:
+    print("Error: The 'dnspython' library could not be found. Please install and try again.")
+    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+
+
+class MonitorEvent:
+    '''
+    One change found by DomainMonitor.
+    record is 'dmarc', 'spf', or 'dkim:<selector>'. change names what happened, for example
+    'policy_downgraded', 'rua_removed', or 'pct_lowered'. old_value and new_value are the values involved,
+    '' when there was none. DKIM keys are given as a fingerprint rather than in full.
+    '''
+    __slots__ = ("time", "domain_name", "record", "change", "old_value", "new_value")
+
+    # Column names used when writing events as rows.
+    fields = ["time", "domain", "record", "change", "old_value", "new_value"]
+
+    def __init__(self, domain_name, record, change, old_value, new_value):
+        self.time = time.time()
+        self.domain_name = domain_name
+        self.record = record
+        self.change = change
+        self.old_value = old_value
+        self.new_value = new_value
+
+    def to_row(self):
+        return [self.time, self.domain_name, self.record, self.change, self.old_value, self.new_value]
+
+    def to_dictionary(self):
+        return dict(zip(MonitorEvent.fields, self.to_row()))
+
+
+class DomainMonitor:
+    '''
+    Watches the DMARC, SPF, and optionally DKIM records of many domains for changes.
+    Every record of every domain has one entry in a priority queue ordered by when its cached answer
+    expires, so only records that may have changed are looked up again. Lookups are started no faster than
+    max_queries_per_second and each next check is moved a little past the expiry at random, which keeps
+    domains sharing a TTL from all coming due at once. Only the last value of each record is kept, so memory
+    grows with the number of domains and not with how long the monitor runs.
+    '''
+
+    # Strength of each policy, so a change can be called a downgrade or an upgrade.
+    policy_strengths = {"none": 0, "quarantine": 1, "reject": 2}
+    # Strength of each SPF 'all' qualifier.
+    spf_all_strengths = {"+": 0, "?": 1, "~": 2, "-": 3}
+
+    def __init__(self, on_event, dkim_selectors=(), max_queries_per_second=20.0, max_workers=16,
+                 min_interval=60.0, max_interval=86400.0, retry_interval=300.0, jitter=0.1):
+        '''
+        :param on_event: Function called with each MonitorEvent. Calls are never made at the same time.
+        :param dkim_selectors: DKIM selectors to watch on every domain.
+        :param max_queries_per_second: Maximum rate at which checks are started.
+        :param max_workers: Number of threads making lookups.
+        :param min_interval: Least number of seconds between checks of a record, whatever its TTL.
+        :param max_interval: Most number of seconds between checks of a record.
+        :param retry_interval: Seconds before a record whose lookup failed is tried again.
+        :param jitter: Largest fraction of the interval added at random to each next check.
+        '''
+        self.on_event = on_event
+        self.record_names = ["dmarc", "spf"] + ["dkim:" + selector for selector in dkim_selectors]
+        self.send_interval = 1.0 / max_queries_per_second
+        self.max_workers = max_workers
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.retry_interval = retry_interval
+        self.jitter = jitter
+        # Heap of (due time, domain name, record name) tuples, one per record watched.
+        self.schedule = []
+        self.condition = threading.Condition()
+        self.event_lock = threading.Lock()
+        self.next_send_time = 0.0
+        self.stopped = False
+        # (domain name, record name) -> value found by the last successful check.
+        self.last_values = {}
+        self.check_count = 0
+        self.error_count = 0
+        # Checks that raised something other than a failed lookup.
+        self.failed_check_count = 0
+        self.event_count = 0
+
+    def add_domain(self, domain_name):
+        '''
+        Starts watching a domain. Its records are checked as soon as the rate allows. The first check of each
+        record only records its value.
+        :param domain_name: Domain name.
+        :return: None.
+        '''
+        domain_name = domain_name.lower().rstrip(".")
+        now = time.time()
+        with self.condition:
+            for record_name in self.record_names:
+                heapq.heappush(self.schedule, (now, domain_name, record_name))
+            self.condition.notify()
+
+    def schedule_check(self, due_time, domain_name, record_name):
+        with self.condition:
+            heapq.heappush(self.schedule, (due_time, domain_name, record_name))
+            self.condition.notify()
+
+    def get_next_check_time(self, expires):
+        '''
+        :param expires: Time the record's answer expires from the cache.
+        :return: Time the record should next be checked.
+        '''
+        now = time.time()
+        interval = min(max(expires - now, self.min_interval), self.max_interval)
+        return now + interval + random.uniform(0.0, interval * self.jitter)
+
+    def stop(self):
+        '''
+        Makes run() return once the checks already started have finished. Can be called from any thread.
+        :return: None.
+        '''
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def get_next_check(self, end_time):
+        '''
+        Waits until a record is due and the rate allows another check.
+        :param end_time: Time to give up waiting, or None to wait until stopped.
+        :return: Tuple of the domain name and record name, or None if stopped or end_time was reached.
+        '''
+        with self.condition:
+            while True:
+                now = time.time()
+                if self.stopped or (end_time is not None and now >= end_time):
+                    return None
+                wait_until = end_time if end_time is not None else now + 3600.0
+                if self.schedule:
+                    start_time = max(self.schedule[0][0], self.next_send_time)
+                    if start_time <= now:
+                        break
+                    wait_until = min(wait_until, start_time)
+                self.condition.wait(wait_until - now)
+            _, domain_name, record_name = heapq.heappop(self.schedule)
+            self.next_send_time = max(self.next_send_time, now) + self.send_interval
+            return domain_name, record_name
+
+    def run(self, duration=None):
+        '''
+        Checks records as they come due until stop() is called or duration has passed.
+        :param duration: Optional number of seconds to run for.
+        :return: None.
+        '''
+        end_time = None if duration is None else time.time() + duration
+        # Limits how many checks wait for a thread, so a slow resolver delays the schedule rather than
+        # piling up checks in memory.
+        check_slots = threading.BoundedSemaphore(self.max_workers * 2)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="monitor")
+        try:
+            while True:
+                check = self.get_next_check(end_time)
+                if check is None:
+                    break
+                check_slots.acquire()
+                executor.submit(self.check, *check).add_done_callback(lambda _: check_slots.release())
+        finally:
+            executor.shutdown(wait=True)
+
+    def check(self, domain_name, record_name):
+        '''
+        Looks up one record, reports how it changed since the last check, and schedules the next check.
+        The next check is scheduled whatever happens, so a record is never silently dropped from the watch.
+        :param domain_name: Domain name.
+        :param record_name: 'dmarc', 'spf', or 'dkim:<selector>'.
+        :return: List of the MonitorEvent objects reported.
+        '''
+        next_check_time = time.time() + self.retry_interval
+        try:
+            try:
+                if "dmarc" == record_name:
+                    value, expires = DomainMonitor.get_dmarc_value(domain_name)
+                elif "spf" == record_name:
+                    value, expires = DomainMonitor.get_spf_value(domain_name)
+                else:
+                    value, expires = DomainMonitor.get_dkim_value(domain_name, record_name[len("dkim:"):])
+            except (dns.resolver.NoNameservers, dns.exception.Timeout):
+                # A failed lookup says nothing about the record, so keep the last value and try again later.
+                with self.event_lock:
+                    self.error_count += 1
+                return []
+            next_check_time = self.get_next_check_time(expires)
+            return self.report_changes(domain_name, record_name, value)
+        except Exception as error:
+            # For example a name too long to look up, or an error raised by on_event.
+            with self.event_lock:
+                self.failed_check_count += 1
+            print("Checking " + record_name + " of '" + domain_name + "' failed: " + type(error).__name__ + ": "
+                  + str(error), file=sys.stderr)
+            return []
+        finally:
+            self.schedule_check(next_check_time, domain_name, record_name)
+
+    def report_changes(self, domain_name, record_name, value):
+        '''
+        Records the value found by a check and reports how it changed since the last one.
+        :return: List of the MonitorEvent objects reported.
+        '''
+        key = (domain_name, record_name)
+        old_value = self.last_values.get(key)
+        self.last_values[key] = value
+        events = []
+        with self.event_lock:
+            self.check_count += 1
+        if old_value is not None and old_value != value:
+            if "dmarc" == record_name:
+                changes = DomainMonitor.get_dmarc_changes(old_value, value)
+            elif "spf" == record_name:
+                changes = DomainMonitor.get_spf_changes(old_value, value)
+            else:
+                changes = DomainMonitor.get_dkim_changes(old_value, value)
+            events = [MonitorEvent(domain_name, record_name, *change) for change in changes]
+            with self.event_lock:
+                self.event_count += len(events)
+                for event in events:
+                    self.on_event(event)
+        return events
+
+    @staticmethod
+    def get_dmarc_value(domain_name):
+        '''
+        :return: Tuple of the domain's DMARC record, or '' if it has none, and the time the answer expires.
+        '''
+        domain_record_handler = DomainRecordHandler(domain_name)
+        if domain_record_handler.dmarc_lookup_error is not None:
+            raise domain_record_handler.dmarc_lookup_error
+        return domain_record_handler.dmarc_record_value, domain_record_handler.expires
+
+    @staticmethod
+    def get_spf_value(domain_name):
+        '''
+        :return: Tuple of the domain's SPF record, or '' if it has none, and the time the answer expires.
+        '''
+        answer = DomainRecordHandler.dns_cache.resolve(domain_name, "TXT")
+        for txt_record in answer.records:
+            value = DmarcParser.join_txt_strings(txt_record)
+            if value.lower().startswith("v=spf1"):
+                return value, answer.expires
+        return "", answer.expires
+
+    @staticmethod
+    def get_dkim_value(domain_name, selector):
+        '''
+        :return: Tuple of a fingerprint of the selector's DKIM record, or '' if it has none, and the time the
+            answer expires.
+        '''
+        answer = DomainRecordHandler.dns_cache.resolve(selector + "._domainkey." + domain_name, "TXT")
+        for txt_record in answer.records:
+            value = DmarcParser.join_txt_strings(txt_record)
+            # 'v=DKIM1' is optional in DKIM records, so look for the key tag instead.
+            if "p=" in value:
+                return format(zlib.crc32(value.encode()), "08x"), answer.expires
+        return "", answer.expires
+
+    @staticmethod
+    def get_dmarc_changes(old_value, new_value):
+        '''
+        Compares two DMARC records tag by tag.
+        :param old_value: Previous record, or '' if there was none.
+        :param new_value: Current record, or '' if there is none.
+        :return: List of (change, old value, new value) tuples.
+        '''
+        if "" == old_value:
+            return [("dmarc_added", "", new_value)]
+        if "" == new_value:
+            return [("dmarc_removed", old_value, "")]
+        old_record = DomainRecordHandler.parse_dmarc_record(old_value)
+        new_record = DomainRecordHandler.parse_dmarc_record(new_value)
+        changes = []
+        strengths = DomainMonitor.policy_strengths
+        for tag, name in (("p", "policy"), ("sp", "subdomain_policy")):
+            # A missing sp takes the value of p.
+            old_policy = getattr(old_record, tag) or old_record.p
+            new_policy = getattr(new_record, tag) or new_record.p
+            old_strength = strengths.get(old_policy.lower(), 0)
+            new_strength = strengths.get(new_policy.lower(), 0)
+            if new_strength < old_strength:
+                changes.append((name + "_downgraded", old_policy, new_policy))
+            elif new_strength > old_strength:
+                changes.append((name + "_upgraded", old_policy, new_policy))
+        old_pct = DomainMonitor.get_pct(old_record.pct)
+        new_pct = DomainMonitor.get_pct(new_record.pct)
+        if new_pct < old_pct:
+            changes.append(("pct_lowered", str(old_pct), str(new_pct)))
+        elif new_pct > old_pct:
+            changes.append(("pct_raised", str(old_pct), str(new_pct)))
+        for tag in ("rua", "ruf"):
+            old_uris = getattr(old_record, tag) or []
+            new_uris = getattr(new_record, tag) or []
+            for uri in old_uris:
+                if uri not in new_uris:
+                    changes.append((tag + "_removed", uri, ""))
+            for uri in new_uris:
+                if uri not in old_uris:
+                    changes.append((tag + "_added", "", uri))
+        for tag, name in (("adkim", "dkim_alignment"), ("aspf", "spf_alignment")):
+            # Alignment is relaxed unless set to strict.
+            old_alignment = getattr(old_record, tag).lower() or "r"
+            new_alignment = getattr(new_record, tag).lower() or "r"
+            if "s" == old_alignment and "s" != new_alignment:
+                changes.append((name + "_relaxed", old_alignment, new_alignment))
+            elif "s" != old_alignment and "s" == new_alignment:
+                changes.append((name + "_tightened", old_alignment, new_alignment))
+        if not changes:
+            # Something else changed, such as fo or ri, or only the formatting.
+            changes.append(("dmarc_changed", old_value, new_value))
+        return changes
+
+    @staticmethod
+    def get_pct(pct):
+        '''
+        :param pct: pct tag value as text.
+        :return: The percentage as an integer, 100 if it is missing or not a number.
+        '''
+        try:
+            return int(pct)
+        except ValueError:
+            return 100
+
+    @staticmethod
+    def get_spf_all_qualifier(spf_record):
+        '''
+        :return: The qualifier of the record's 'all' mechanism, '+' if it has none written, or '' if the
+            record has no 'all'.
+        '''
+        for term in reversed(spf_record.lower().split()):
+            if "all" == term.lstrip("+-~?"):
+                return term[0] if term[0] in "+-~?" else "+"
+        return ""
+
+    @staticmethod
+    def get_spf_changes(old_value, new_value):
+        '''
+        :param old_value: Previous SPF record, or '' if there was none.
+        :param new_value: Current SPF record, or '' if there is none.
+        :return: List of (change, old value, new value) tuples.
+        '''
+        if "" == old_value:
+            return [("spf_added", "", new_value)]
+        if "" == new_value:
+            return [("spf_removed", old_value, "")]
+        old_qualifier = DomainMonitor.get_spf_all_qualifier(old_value)
+        new_qualifier = DomainMonitor.get_spf_all_qualifier(new_value)
+        if "" != old_qualifier and "" != new_qualifier:
+            strengths = DomainMonitor.spf_all_strengths
+            if strengths[new_qualifier] < strengths[old_qualifier]:
+                return [("spf_all_weakened", old_value, new_value)]
+            if strengths[new_qualifier] > strengths[old_qualifier]:
+                return [("spf_all_tightened", old_value, new_value)]
+        return [("spf_changed", old_value, new_value)]
+
+    @staticmethod
+    def get_dkim_changes(old_value, new_value):
+        '''
+        :param old_value: Previous key fingerprint, or '' if there was no key.
+        :param new_value: Current key fingerprint, or '' if there is no key.
+        :return: List of (change, old value, new value) tuples.
+        '''
+        if "" == old_value:
+            return [("dkim_key_added", "", new_value)]
+        if "" == new_value:
+            return [("dkim_key_removed", old_value, "")]
+        return [("dkim_key_changed", old_value, new_value)]
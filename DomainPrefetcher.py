@@ -0,0 +1,143 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait
+from DmarcParser import DmarcParser
+from DomainRecordHandler import DomainRecordHandler
+from PublicSuffixList import PublicSuffixList
+
+try:
+    import dns.exception
+    import dns.resolver
+except ModuleNotFoundError:
+    print("Error: The 'dnspython' library could not be found. Please install and try again.")
+    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+
+
+class DomainPrefetcher:
+    '''
+    Starts every DNS lookup the questions will need for a domain in background threads as soon as the
+    domain is entered. Answers go into the shared DnsCache, so DomainRecordHandler finds them there.
+    '''
+
+    # Selectors tried when looking for existing DKIM keys.
+    candidate_dkim_selectors = [
+        "default", "selector1", "selector2", "google", "k1", "k2", "s1", "s2", "dkim", "mail", "smtp"
+    ]
+    # Seconds to wait for the existence check before showing the first question.
+    existence_wait = 1.0
+
+    executor = None
+
+    def __init__(self, domain_name, dns_cache=None):
+        '''
+        :param domain_name: Domain being configured.
+        :param dns_cache: Optional DnsCache. The cache shared by DomainRecordHandler is used if not given.
+        '''
+        if dns_cache is None:
+            dns_cache = DomainRecordHandler.dns_cache
+        self.dns_cache = dns_cache
+        self.domain_name = domain_name
+        self.parent_domain_name = PublicSuffixList.get_default().get_organizational_domain(domain_name)
+        self.futures = {}
+
+    def get_queries(self):
+        '''
+        :return: List of (name, record type) tuples to look up for the domain.
+        '''
+        queries = [
+            ("_dmarc." + self.domain_name, "TXT"),
+            (self.domain_name, "TXT"),
+            (self.domain_name, "MX"),
+            (self.domain_name, "A"),
+        ]
+        if self.parent_domain_name != self.domain_name.lower().rstrip("."):
+            queries.append(("_dmarc." + self.parent_domain_name, "TXT"))
+        for selector in DomainPrefetcher.candidate_dkim_selectors:
+            queries.append((selector + "._domainkey." + self.domain_name, "TXT"))
+        return queries
+
+    def start(self):
+        '''
+        Submits all lookups to the shared thread pool.
+        :return: None.
+        '''
+        if DomainPrefetcher.executor is None:
+            DomainPrefetcher.executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="prefetch")
+        for query in self.get_queries():
+            self.futures[query] = DomainPrefetcher.executor.submit(self.dns_cache.resolve, *query)
+
+    def cancel(self):
+        '''
+        Cancels lookups that have not started, for example when the user enters a different domain.
+        :return: None.
+        '''
+        for future in self.futures.values():
+            future.cancel()
+
+    def resolve(self, name, rdtype, timeout=None):
+        '''
+        Returns the answer to a query, waiting for the background lookup if it is still running.
+        :param name: Query name.
+        :param rdtype: Record type as text.
+        :param timeout: Optional number of seconds to wait. None waits until the lookup finishes.
+        :return: CachedAnswer, or None if the lookup failed or did not finish in time.
+        '''
+        future = self.futures.get((name, rdtype))
+        try:
+            if future is None:
+                return self.dns_cache.resolve(name, rdtype)
+            wait([future], timeout=timeout)
+            if not future.done() or future.cancelled():
+                return None
+            return future.result()
+        except (dns.resolver.NoNameservers, dns.exception.Timeout):
+            return None
+
+    def get_domain_exists(self, timeout=None):
+        '''
+        :param timeout: Optional number of seconds to wait.
+        :return: True or False, or None if the answer is not known yet or the lookup failed, the same as
+            DomainRecordHandler.get_domain_exists().
+        '''
+        answer = self.resolve(self.domain_name, "A", timeout)
+        if answer is None:
+            return None
+        return bool(answer.records)
+
+    def get_txt_values(self, name, version_prefix):
+        '''
+        :return: The joined TXT values of a name that start with version_prefix, such as 'v=spf1'.
+        '''
+        answer = self.resolve(name, "TXT")
+        if answer is None:
+            return []
+        values = [DmarcParser.join_txt_strings(record) for record in answer.records]
+        return [value for value in values if value.lower().startswith(version_prefix.lower())]
+
+    def get_spf_record(self):
+        '''
+        :return: The domain's current SPF record, or '' if it has none.
+        '''
+        spf_records = self.get_txt_values(self.domain_name, "v=spf1")
+        return spf_records[0] if spf_records else ""
+
+    def get_mx_hosts(self):
+        '''
+        :return: List of the domain's mail exchanger host names in preference order.
+        '''
+        answer = self.resolve(self.domain_name, "MX")
+        if answer is None:
+            return []
+        exchanges = sorted((int(record.split()[0]), record.split()[1].rstrip(".")) for record in answer.records)
+        return [host_name for _, host_name in exchanges]
+
+    def get_found_dkim_selectors(self):
+        '''
+        :return: List of candidate selectors that have a DKIM key published.
+        '''
+        found_selectors = []
+        for selector in DomainPrefetcher.candidate_dkim_selectors:
+            # 'v=DKIM1' is optional in DKIM records, so look for the key tag instead.
+            values = self.get_txt_values(selector + "._domainkey." + self.domain_name, "")
+            if any("p=" in value for value in values):
+                found_selectors.append(selector)
+        return found_selectors
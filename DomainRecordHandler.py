@@ -1,59 +1,57 @@
-import sys
+from DmarcParser import DmarcParser
 from DmarcRecord import DmarcRecord
-
-try:
-    import dns.resolver
-except ModuleNotFoundError:
-    print("Error: The 'dnspython' library could not be found. Please install and try again.")
-    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+from DnsCache import DnsCache, import_dnspython
 
 
 class DomainRecordHandler:
+    # Answer cache shared by all handlers. Replace with DnsCache(path=...) to keep answers across runs.
+    dns_cache = DnsCache()
+
     def __init__(self, domain_name):
         self.domain_name = domain_name
         self.dmarc_record = DmarcRecord()
+        self.dmarc_record_value = ""
+        # Every TXT value at '_dmarc', for spotting extra or malformed records.
+        self.dmarc_txt_records = []
+        # The error raised if the '_dmarc' lookup failed, in which case whether a record exists is not known.
+        self.dmarc_lookup_error = None
+        # Time the DMARC answer expires from the cache, after which the record may need looking up again.
+        self.expires = 0.0
         self.set_dmarc_record(domain_name)
 
     @staticmethod
     def get_domain_exists(domain_name):
+        '''
+        :param domain_name: Domain name.
+        :return: True or False, or None if the lookup failed with SERVFAIL or a timeout, which says nothing
+            about whether the domain exists.
+        '''
+        dns = import_dnspython()
         try:
-            dns.resolver.resolve(domain_name)
-            return True
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.NoNameservers):
-            return False
+            return bool(DomainRecordHandler.dns_cache.resolve(domain_name, "A").records)
+        except (dns.resolver.NoNameservers, dns.exception.Timeout):
+            return None
 
     def set_dmarc_record(self, domain_name):
+        dns = import_dnspython()
         dmarc_host_name = "_dmarc." + domain_name
         try:
-            current_dmarc_dns_record = dns.resolver.resolve(dmarc_host_name, "TXT")
-            current_dmarc_record_value = (str(current_dmarc_dns_record[0])).strip('\"')
-            current_dmarc_tags = current_dmarc_record_value.split(";")
-            for dmarc_tag in current_dmarc_tags:
-                split_dmarc_tag = dmarc_tag.split("=")
-                if split_dmarc_tag[0].strip() == 'v':
-                    self.dmarc_record.v = split_dmarc_tag[1].strip()
-                elif split_dmarc_tag[0].strip() == 'p':
-                    self.dmarc_record.p = split_dmarc_tag[1].strip()
-                elif split_dmarc_tag[0].strip() == 'sp':
-                    self.dmarc_record.sp = split_dmarc_tag[1].strip()
-                elif split_dmarc_tag[0].strip() == 'adkim':
-                    self.dmarc_record.adkim = split_dmarc_tag[1].strip()
-                elif split_dmarc_tag[0].strip() == 'aspf':
-                    self.dmarc_record.aspf = split_dmarc_tag[1].strip()
-                elif split_dmarc_tag[0].strip() == 'pct':
-                    self.dmarc_record.pct = split_dmarc_tag[1].strip()
-                elif split_dmarc_tag[0].strip() == 'ri':
-                    self.dmarc_record.ri = split_dmarc_tag[1].strip()
-                elif split_dmarc_tag[0].strip() == 'fo':
-                    self.dmarc_record.fo = split_dmarc_tag[1].strip().split(":")
-                elif split_dmarc_tag[0].strip() == 'rf':
-                    self.dmarc_record.rf = split_dmarc_tag[1].strip()
-                elif split_dmarc_tag[0].strip() == 'rua':
-                    self.dmarc_record.rua = split_dmarc_tag[1].strip().split(",")
-                elif split_dmarc_tag[0].strip() == 'ruf':
-                    self.dmarc_record.ruf = split_dmarc_tag[1].strip().split(",")
-        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
-            pass
+            answer = DomainRecordHandler.dns_cache.resolve(dmarc_host_name, "TXT")
+        except (dns.resolver.NoNameservers, dns.exception.Timeout) as error:
+            # Not the same as having no record, so nothing is filled in and the caller can tell.
+            self.dmarc_lookup_error = error
+            return
+        self.expires = answer.expires
+        self.dmarc_txt_records = [DmarcParser.join_txt_strings(txt_record) for txt_record in answer.records]
+        for current_dmarc_record_value in self.dmarc_txt_records:
+            if DmarcParser.is_dmarc_record(current_dmarc_record_value):
+                self.dmarc_record_value = current_dmarc_record_value
+                self.dmarc_record = DomainRecordHandler.parse_dmarc_record(current_dmarc_record_value)
+                break
 
-        def get_dmarc_record():
-            return self.dmarc_record
+    def get_dmarc_record(self):
+        return self.dmarc_record
+
+    @staticmethod
+    def parse_dmarc_record(dmarc_record_value):
+        return DmarcParser.parse(dmarc_record_value).dmarc_record
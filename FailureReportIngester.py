@@ -0,0 +1,274 @@
+import hashlib
+import os
+import sqlite3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from email import message_from_bytes, policy
+from email.parser import BytesHeaderParser
+
+
+class FailureReport:
+    '''
+    The fields of one DMARC failure (ruf) report in Abuse Reporting Format (RFC 5965 and RFC 6591).
+    '''
+    __slots__ = (
+        "fingerprint", "reported_domain", "source_ip", "arrival_date", "feedback_type", "auth_failure",
+        "original_mail_from", "original_rcpt_to", "delivery_result", "dkim_domain", "spf_domain",
+        "header_from", "subject", "message_id", "source"
+    )
+
+    # Column names used when writing reports, in the same order as to_row().
+    fields = list(__slots__)
+
+    def __init__(self, values):
+        for field, value in zip(FailureReport.__slots__, values):
+            setattr(self, field, value)
+
+    def to_row(self):
+        return [getattr(self, field) for field in FailureReport.__slots__]
+
+
+def parse_failure_report(raw_message):
+    '''
+    Pulls the feedback report fields out of one email. Run in worker processes.
+    :param raw_message: The whole message as bytes.
+    :return: Tuple of FailureReport values without 'source', or None if the message is not a feedback report.
+    '''
+    message = message_from_bytes(raw_message, policy=policy.compat32)
+    feedback_fields = None
+    original_headers = None
+    for part in message.walk():
+        content_type = part.get_content_type()
+        if "message/feedback-report" == content_type:
+            payload = part.get_payload()
+            # The email package parses message/* parts into a list of sub-messages.
+            if isinstance(payload, list):
+                feedback_fields = payload[0] if payload else None
+            else:
+                feedback_fields = BytesHeaderParser().parsebytes(part.get_payload(decode=True) or b"")
+        elif content_type in ("message/rfc822", "text/rfc822-headers") and original_headers is None:
+            payload = part.get_payload()
+            if isinstance(payload, list):
+                original_headers = payload[0] if payload else None
+            else:
+                original_headers = BytesHeaderParser().parsebytes(part.get_payload(decode=True) or b"")
+    if feedback_fields is None:
+        return None
+
+    def get_field(headers, name):
+        if headers is None:
+            return ""
+        value = headers.get(name, "")
+        return " ".join(str(value).split())
+
+    reported_domain = get_field(feedback_fields, "Reported-Domain").lower()
+    source_ip = get_field(feedback_fields, "Source-IP")
+    arrival_date = get_field(feedback_fields, "Arrival-Date")
+    message_id = get_field(original_headers, "Message-ID")
+    header_from = get_field(original_headers, "From")
+    # Several receivers can report the same message, and a receiver can report it more than once.
+    # Identify it by what stays the same across those reports.
+    if "" != message_id:
+        identity = "\0".join((reported_domain, source_ip, message_id, header_from))
+    else:
+        identity = "\0".join((reported_domain, source_ip, arrival_date, header_from,
+                              get_field(original_headers, "Subject"), get_field(original_headers, "Date")))
+    fingerprint = hashlib.sha256(identity.encode("utf-8", "replace")).hexdigest()[:32]
+    return (
+        fingerprint,
+        reported_domain,
+        source_ip,
+        arrival_date,
+        get_field(feedback_fields, "Feedback-Type"),
+        get_field(feedback_fields, "Auth-Failure"),
+        get_field(feedback_fields, "Original-Mail-From"),
+        get_field(feedback_fields, "Original-Rcpt-To"),
+        get_field(feedback_fields, "Delivery-Result"),
+        get_field(feedback_fields, "DKIM-Domain").lower(),
+        get_field(feedback_fields, "SPF-DNS").lower() or get_field(feedback_fields, "SPF-Domain").lower(),
+        header_from,
+        get_field(original_headers, "Subject"),
+        message_id,
+    )
+
+
+def parse_failure_reports(raw_messages):
+    '''
+    Parses a batch of messages in a worker process. Sending batches instead of single messages keeps
+    the cost of passing work between processes low.
+    :param raw_messages: List of messages as bytes.
+    :return: List of parse_failure_report() results.
+    '''
+    return [parse_failure_report(raw_message) for raw_message in raw_messages]
+
+
+class FailureReportIngester:
+    '''
+    Streams DMARC failure reports out of mbox files and Maildir directories, parses them in a process pool,
+    and drops reports of a message already seen. A SQLite checkpoint records how far each mbox has been
+    read, which Maildir messages have been processed, and the fingerprints seen, so running again only
+    reads new mail.
+    '''
+
+    batch_size = 200
+
+    def __init__(self, checkpoint_path, workers=None):
+        '''
+        :param checkpoint_path: File name of the SQLite checkpoint. It is created if it does not exist.
+        :param workers: Number of worker processes. Defaults to the number of CPUs.
+        '''
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint = sqlite3.connect(checkpoint_path)
+        self.checkpoint.execute("PRAGMA journal_mode=WAL")
+        with self.checkpoint:
+            self.checkpoint.execute(
+                "CREATE TABLE IF NOT EXISTS mbox_positions (path TEXT PRIMARY KEY, inode INTEGER, position INTEGER)"
+            )
+            self.checkpoint.execute(
+                "CREATE TABLE IF NOT EXISTS maildir_messages (directory TEXT, name TEXT, PRIMARY KEY (directory, name))"
+            )
+            self.checkpoint.execute("CREATE TABLE IF NOT EXISTS fingerprints (fingerprint TEXT PRIMARY KEY)")
+        self.duplicate_count = 0
+
+    def close(self):
+        self.checkpoint.close()
+
+    def read_mbox(self, path):
+        '''
+        Yields the messages of an mbox file that were added since the last run, one at a time.
+        :param path: Path of the mbox file.
+        :return: Generator of (message bytes, checkpoint update) tuples. The update records the file
+            position after the message.
+        '''
+        file_status = os.stat(path)
+        row = self.checkpoint.execute(
+            "SELECT inode, position FROM mbox_positions WHERE path = ?", (path,)
+        ).fetchone()
+        position = 0
+        # Start over if the file was replaced or truncated since the last run.
+        if row is not None and row[0] == file_status.st_ino and row[1] <= file_status.st_size:
+            position = row[1]
+        with open(path, "rb") as mbox_file:
+            mbox_file.seek(position)
+            message_lines = []
+            message_end = position
+            previous_line_blank = True
+            for line in mbox_file:
+                if line.startswith(b"From ") and previous_line_blank:
+                    if message_lines:
+                        yield b"".join(message_lines), ("mbox", path, file_status.st_ino, message_end)
+                    message_lines = []
+                else:
+                    message_lines.append(line)
+                message_end += len(line)
+                previous_line_blank = line in (b"\n", b"\r\n")
+            if message_lines:
+                yield b"".join(message_lines), ("mbox", path, file_status.st_ino, message_end)
+
+    def read_maildir(self, directory):
+        '''
+        Yields the messages in the 'new' and 'cur' folders of a Maildir that have not been processed yet.
+        :param directory: Path of the Maildir.
+        :return: Generator of (message bytes, checkpoint update) tuples.
+        '''
+        for folder in ("new", "cur"):
+            folder_path = os.path.join(directory, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for entry in os.scandir(folder_path):
+                if not entry.is_file():
+                    continue
+                # The part after ':' holds flags that change when a message is read or moved to 'cur'.
+                name = entry.name.split(":")[0]
+                if self.checkpoint.execute(
+                        "SELECT 1 FROM maildir_messages WHERE directory = ? AND name = ?", (directory, name)
+                ).fetchone():
+                    continue
+                try:
+                    with open(entry.path, "rb") as message_file:
+                        raw_message = message_file.read()
+                except FileNotFoundError:
+                    # Moved by a mail client since the folder was listed. It will be found on the next run.
+                    continue
+                yield raw_message, ("maildir", directory, name, None)
+
+    def read_source(self, path):
+        if os.path.isdir(path):
+            return self.read_maildir(path)
+        return self.read_mbox(path)
+
+    def save_progress(self, updates):
+        '''
+        Records checkpoint updates. For an mbox only the furthest position matters.
+        '''
+        for kind, path, key, position in updates:
+            if "mbox" == kind:
+                self.checkpoint.execute("INSERT OR REPLACE INTO mbox_positions VALUES (?, ?, ?)", (path, key, position))
+            else:
+                self.checkpoint.execute("INSERT OR IGNORE INTO maildir_messages VALUES (?, ?)", (path, key))
+
+    def ingest(self, paths):
+        '''
+        Reads the new failure reports from mbox files and Maildir directories.
+        Batches are parsed in worker processes and their results handled in the order read. A batch's
+        fingerprints and checkpoint updates are committed only after all its reports have been handed out,
+        so reports not taken by the consumer, for example because it stopped or failed, are read again on
+        the next run.
+        :param paths: List of mbox file or Maildir directory paths.
+        :return: Generator of FailureReport objects not seen before.
+        '''
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                running_batches = deque()
+                for path in paths:
+                    batch = []
+                    updates = []
+                    for raw_message, update in self.read_source(path):
+                        batch.append(raw_message)
+                        updates.append(update)
+                        if len(batch) == FailureReportIngester.batch_size:
+                            running_batches.append((executor.submit(parse_failure_reports, batch), updates, path))
+                            batch = []
+                            updates = []
+                            # Keep a few batches per worker in flight so mail is not read far ahead.
+                            while len(running_batches) > self.workers * 2:
+                                yield from self.deliver_batch(running_batches.popleft())
+                    if batch:
+                        running_batches.append((executor.submit(parse_failure_reports, batch), updates, path))
+                while running_batches:
+                    yield from self.deliver_batch(running_batches.popleft())
+        except BaseException:
+            # Includes GeneratorExit when the consumer closes the generator early.
+            self.checkpoint.rollback()
+            raise
+
+    def deliver_batch(self, running_batch):
+        '''
+        Yields the new reports of a parsed batch, then commits its fingerprints and checkpoint updates.
+        The commit runs when the consumer asks for the next report after the batch's last one, or when the
+        generator finishes.
+        :param running_batch: Tuple of the batch's future, checkpoint updates, and source path.
+        :return: Generator of new FailureReport objects.
+        '''
+        yield from self.finish_batch(running_batch)
+        self.checkpoint.commit()
+
+    def finish_batch(self, running_batch):
+        '''
+        Waits for a parsed batch, drops duplicates, and records its fingerprints and checkpoint updates
+        in the open transaction without committing them.
+        :param running_batch: Tuple of the batch's future, checkpoint updates, and source path.
+        :return: List of new FailureReport objects.
+        '''
+        future, updates, path = running_batch
+        new_reports = []
+        for values in future.result():
+            if values is None:
+                continue
+            cursor = self.checkpoint.execute("INSERT OR IGNORE INTO fingerprints VALUES (?)", (values[0],))
+            if 0 == cursor.rowcount:
+                self.duplicate_count += 1
+                continue
+            new_reports.append(FailureReport(values + (path,)))
+        self.save_progress(updates)
+        return new_reports
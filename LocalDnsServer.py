@@ -0,0 +1,251 @@
+import asyncio
+import socket
+import sys
+import threading
+
+try:
+    import dns.exception
+    import dns.flags
+    import dns.message
+    import dns.name
+    import dns.rcode
+    import dns.rdatatype
+    import dns.rrset
+except ModuleNotFoundError:
+    print("Error: The 'dnspython' library could not be found. Please install and try again.")
+    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+
+
+class LocalDnsServer:
+    '''
+    A small authoritative DNS server run inside the current process, answering over UDP and TCP from records
+    held in memory. It stands in for real DNS so the query engine, the auditors, and the benchmarks can be
+    run without a network and with the same answers every time.
+    Names with no records of the type asked for get an empty answer if they or a name below them have
+    records, and NXDOMAIN otherwise. Names can be made slow, or never answered at all.
+    '''
+
+    soa_record = "ns.invalid. hostmaster.invalid. 1 3600 600 86400 300"
+
+    def __init__(self, address="127.0.0.1", port=0, ttl=300):
+        '''
+        :param address: Address to listen on.
+        :param port: Port to listen on for both UDP and TCP. 0 picks a free port, found in 'port' once
+            started.
+        :param ttl: TTL given to records added without one.
+        '''
+        self.address = address
+        self.port = port
+        self.ttl = ttl
+        self.records = {}
+        self.existing_names = set()
+        self.delays = {}
+        self.dropped_names = set()
+        self.query_count = 0
+        self.udp_transport = None
+        self.tcp_server = None
+        self.connection_tasks = set()
+        self.answer_tasks = set()
+        self.loop = None
+        self.thread = None
+
+    def add_record(self, name, rdtype, values, ttl=None):
+        '''
+        Adds records to the zone.
+        :param name: Owner name.
+        :param rdtype: Record type as text.
+        :param values: List of rdata in presentation format, for example ['"v=DMARC1; p=none"'].
+        :param ttl: Optional TTL.
+        :return: None.
+        '''
+        owner = dns.name.from_text(name)
+        rrset = dns.rrset.from_text_list(owner, self.ttl if ttl is None else ttl, "IN", rdtype, values)
+        self.records[(owner, rrset.rdtype)] = rrset
+        # The name and every name above it exist, so queries for other types there get an empty answer.
+        while len(owner) > 1:
+            self.existing_names.add(owner)
+            owner = owner.parent()
+
+    def set_delay(self, name, seconds):
+        '''
+        Makes the answers for a name wait before being sent.
+        '''
+        self.delays[dns.name.from_text(name)] = seconds
+
+    def drop_queries(self, name):
+        '''
+        Makes queries for a name go unanswered, as when an authoritative server is unreachable.
+        '''
+        self.dropped_names.add(dns.name.from_text(name))
+
+    def make_response(self, query):
+        '''
+        :param query: Query message.
+        :return: Tuple of the response message and the query name, or (None, None) for an unusable query.
+        '''
+        if 1 != len(query.question):
+            return None, None
+        self.query_count += 1
+        question = query.question[0]
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        rrset = self.records.get((question.name, question.rdtype))
+        if rrset is not None:
+            response.answer.append(rrset)
+        else:
+            if question.name not in self.existing_names:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            # Negative answers carry an SOA so resolvers know how long to cache them (RFC 2308).
+            zone_name = question.name.parent() if len(question.name) > 1 else question.name
+            response.authority.append(
+                dns.rrset.from_text(zone_name, self.ttl, "IN", "SOA", LocalDnsServer.soa_record)
+            )
+        return response, question.name
+
+    @staticmethod
+    def to_wire(response, max_size):
+        '''
+        :param response: Response message.
+        :param max_size: Largest response the client accepts over UDP, or None over TCP.
+        :return: The response in wire format, emptied and marked truncated if it does not fit.
+        '''
+        if max_size is None:
+            # Without a limit dnspython would apply the EDNS payload size, which only matters over UDP.
+            return response.to_wire(max_size=65535)
+        try:
+            return response.to_wire(max_size=max_size)
+        except dns.exception.TooBig:
+            response.answer.clear()
+            response.authority.clear()
+            response.flags |= dns.flags.TC
+            return response.to_wire()
+
+    def answer(self, query, send, max_size):
+        '''
+        Sends the response to a query, at once unless its name is slow or dropped.
+        :param query: Query message.
+        :param send: Function given the response in wire format.
+        :param max_size: Largest response the client accepts over UDP, or None over TCP.
+        :return: None.
+        '''
+        response, name = self.make_response(query)
+        if response is None or name in self.dropped_names:
+            return
+        delay = self.delays.get(name)
+        if delay:
+            # Kept until sent, so stop() can cancel the answers still waiting.
+            response_wire = LocalDnsServer.to_wire(response, max_size)
+            answer_task = asyncio.ensure_future(LocalDnsServer.send_later(delay, send, response_wire))
+            self.answer_tasks.add(answer_task)
+            answer_task.add_done_callback(self.answer_tasks.discard)
+        else:
+            send(LocalDnsServer.to_wire(response, max_size))
+
+    @staticmethod
+    async def send_later(delay, send, response_wire):
+        await asyncio.sleep(delay)
+        send(response_wire)
+
+    class UdpProtocol(asyncio.DatagramProtocol):
+
+        def __init__(self, server):
+            self.server = server
+            self.transport = None
+
+        def connection_made(self, transport):
+            self.transport = transport
+            transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+
+        def datagram_received(self, data, address):
+            try:
+                query = dns.message.from_wire(data)
+            except dns.exception.DNSException:
+                return
+            transport = self.transport
+
+            def send(response_wire):
+                if not transport.is_closing():
+                    transport.sendto(response_wire, address)
+
+            self.server.answer(query, send, query.payload if query.edns >= 0 else 512)
+
+    async def handle_tcp_connection(self, reader, writer):
+
+        def send(response_wire):
+            if not writer.is_closing():
+                writer.write(len(response_wire).to_bytes(2, "big") + response_wire)
+
+        connection_task = asyncio.current_task()
+        self.connection_tasks.add(connection_task)
+        try:
+            while True:
+                length = await reader.readexactly(2)
+                try:
+                    query = dns.message.from_wire(await reader.readexactly(int.from_bytes(length, "big")))
+                except dns.exception.DNSException:
+                    continue
+                # Pipelined queries are answered independently, so a slow one does not hold up the rest.
+                self.answer(query, send, None)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+            self.connection_tasks.discard(connection_task)
+
+    async def start(self):
+        '''
+        Starts listening in the running event loop.
+        :return: None.
+        '''
+        loop = asyncio.get_running_loop()
+        self.udp_transport, _ = await loop.create_datagram_endpoint(
+            lambda: LocalDnsServer.UdpProtocol(self), local_addr=(self.address, self.port)
+        )
+        self.port = self.udp_transport.get_extra_info("sockname")[1]
+        self.tcp_server = await asyncio.start_server(self.handle_tcp_connection, self.address, self.port)
+
+    def start_in_thread(self):
+        '''
+        Starts the server on an event loop of its own in a background thread, for use by code that is
+        not asynchronous.
+        :return: None.
+        '''
+        started = threading.Event()
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            self.loop.run_until_complete(self.start())
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, name="local-dns-server", daemon=True)
+        self.thread.start()
+        started.wait()
+
+    async def stop(self):
+        '''
+        Stops listening, closes open TCP connections, and cancels the slow answers not sent yet.
+        :return: None.
+        '''
+        if self.udp_transport is not None:
+            self.udp_transport.close()
+            self.udp_transport = None
+        if self.tcp_server is not None:
+            self.tcp_server.close()
+            self.tcp_server = None
+        tasks = list(self.connection_tasks) + list(self.answer_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        '''
+        Stops a server started with start_in_thread() and waits for its thread to finish.
+        :return: None.
+        '''
+        if self.thread is not None:
+            asyncio.run_coroutine_threadsafe(self.stop(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.thread = None
@@ -0,0 +1,261 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+
+class LookupEvent:
+    '''
+    One DNS lookup made through DnsCache.
+    rcode is the response code as text, or 'TIMEOUT' when no answer came. latency is in seconds and is 0 for
+    answers found in the cache. retries and size (response bytes) are 0 when they are not known, which is
+    the case for cache hits and for retries made inside the stub resolver.
+    '''
+    __slots__ = ("time", "name", "rdtype", "rcode", "latency", "retries", "cache_hit", "size")
+
+    def __init__(self, name, rdtype, rcode, latency, retries, cache_hit, size):
+        self.time = time.time()
+        self.name = name
+        self.rdtype = rdtype
+        self.rcode = rcode
+        self.latency = latency
+        self.retries = retries
+        self.cache_hit = cache_hit
+        self.size = size
+
+    def to_dictionary(self):
+        return {field: getattr(self, field) for field in LookupEvent.__slots__}
+
+
+class LookupHistogram:
+    '''
+    Counts lookups in memory, by record type, rcode, and whether the cache answered, with a latency histogram
+    of the lookups that went to DNS. Recording is a few dictionary updates, so it can stay on for very long
+    scans.
+    '''
+
+    # Upper bounds in seconds of the latency buckets. A final bucket holds everything slower.
+    bucket_bounds = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lookup_counts = {}
+        self.bucket_counts = {}
+        self.latency_sums = {}
+        self.retry_count = 0
+        self.response_bytes = 0
+
+    def record(self, event):
+        key = (event.rdtype, event.rcode, event.cache_hit)
+        with self.lock:
+            self.lookup_counts[key] = self.lookup_counts.get(key, 0) + 1
+            if not event.cache_hit:
+                bucket_counts = self.bucket_counts.get(event.rdtype)
+                if bucket_counts is None:
+                    bucket_counts = self.bucket_counts[event.rdtype] = [0] * (len(LookupHistogram.bucket_bounds) + 1)
+                bucket_counts[bisect_left(LookupHistogram.bucket_bounds, event.latency)] += 1
+                self.latency_sums[event.rdtype] = self.latency_sums.get(event.rdtype, 0.0) + event.latency
+                self.retry_count += event.retries
+                self.response_bytes += event.size
+
+    def close(self):
+        pass
+
+    def get_lookup_count(self, cache_hit=None):
+        '''
+        :param cache_hit: True or False to count only cache hits or misses. None counts both.
+        :return: Number of lookups recorded.
+        '''
+        with self.lock:
+            return sum(count for (_, _, hit), count in self.lookup_counts.items() if cache_hit in (None, hit))
+
+    def get_rcode_counts(self):
+        '''
+        :return: Dictionary of rcode text -> number of lookups that went to DNS.
+        '''
+        rcode_counts = {}
+        with self.lock:
+            for (_, rcode, cache_hit), count in self.lookup_counts.items():
+                if not cache_hit:
+                    rcode_counts[rcode] = rcode_counts.get(rcode, 0) + count
+        return rcode_counts
+
+    def get_latency_percentile(self, percentile, rdtype=None):
+        '''
+        Estimates a latency percentile of the lookups that went to DNS from the histogram.
+        :param percentile: Percentile from 0 to 100.
+        :param rdtype: Optional record type to look at. All types are combined if not given.
+        :return: Upper bound in seconds of the bucket holding the percentile, infinity if it is in the final
+            bucket, or 0.0 if nothing was recorded.
+        '''
+        with self.lock:
+            if rdtype is None:
+                bucket_lists = list(self.bucket_counts.values())
+            else:
+                bucket_lists = [self.bucket_counts[rdtype]] if rdtype in self.bucket_counts else []
+            bucket_counts = [sum(counts) for counts in zip(*bucket_lists)]
+        total = sum(bucket_counts)
+        if 0 == total:
+            return 0.0
+        target = percentile / 100.0 * total
+        running_count = 0
+        for bound, count in zip(LookupHistogram.bucket_bounds + [float("inf")], bucket_counts):
+            running_count += count
+            if running_count >= target:
+                return bound
+        return float("inf")
+
+    def get_prometheus_text(self):
+        '''
+        :return: The counts in Prometheus text exposition format.
+        '''
+        lines = [
+            "# HELP dmarc_tool_dns_lookups_total DNS lookups by record type, rcode, and cache result.",
+            "# TYPE dmarc_tool_dns_lookups_total counter",
+        ]
+        with self.lock:
+            for (rdtype, rcode, cache_hit), count in sorted(self.lookup_counts.items()):
+                lines.append('dmarc_tool_dns_lookups_total{rdtype="' + rdtype + '",rcode="' + rcode + '",cache="'
+                             + ("hit" if cache_hit else "miss") + '"} ' + str(count))
+            lines.append("# HELP dmarc_tool_dns_lookup_duration_seconds Time taken by lookups that went to DNS.")
+            lines.append("# TYPE dmarc_tool_dns_lookup_duration_seconds histogram")
+            for rdtype, bucket_counts in sorted(self.bucket_counts.items()):
+                running_count = 0
+                for bound, count in zip(LookupHistogram.bucket_bounds + ["+Inf"], bucket_counts):
+                    running_count += count
+                    lines.append('dmarc_tool_dns_lookup_duration_seconds_bucket{rdtype="' + rdtype + '",le="'
+                                 + str(bound) + '"} ' + str(running_count))
+                lines.append('dmarc_tool_dns_lookup_duration_seconds_sum{rdtype="' + rdtype + '"} '
+                             + repr(self.latency_sums[rdtype]))
+                lines.append('dmarc_tool_dns_lookup_duration_seconds_count{rdtype="' + rdtype + '"} '
+                             + str(running_count))
+            lines.append("# HELP dmarc_tool_dns_retries_total Queries sent again after a timeout or failure.")
+            lines.append("# TYPE dmarc_tool_dns_retries_total counter")
+            lines.append("dmarc_tool_dns_retries_total " + str(self.retry_count))
+            lines.append("# HELP dmarc_tool_dns_response_bytes_total Bytes of DNS responses received.")
+            lines.append("# TYPE dmarc_tool_dns_response_bytes_total counter")
+            lines.append("dmarc_tool_dns_response_bytes_total " + str(self.response_bytes))
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusFileSink(LookupHistogram):
+    '''
+    Keeps a LookupHistogram and writes it to a Prometheus text exposition file, for example for the
+    node_exporter textfile collector. The file is rewritten at most every write_interval seconds and when
+    closed, always by renaming a finished temporary file so it is never read half written. Lookups are
+    recorded from many threads, so one write runs at a time.
+    '''
+
+    def __init__(self, path, write_interval=15.0):
+        LookupHistogram.__init__(self)
+        self.path = path
+        self.write_interval = write_interval
+        self.next_write_time = time.monotonic() + write_interval
+        self.write_lock = threading.Lock()
+
+    def record(self, event):
+        LookupHistogram.record(self, event)
+        # Threads that find a write already running leave it to that thread rather than wait.
+        if time.monotonic() >= self.next_write_time and self.write_lock.acquire(blocking=False):
+            try:
+                self.write_file()
+            finally:
+                self.write_lock.release()
+
+    def write(self):
+        with self.write_lock:
+            self.write_file()
+
+    def write_file(self):
+        self.next_write_time = time.monotonic() + self.write_interval
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "w") as metrics_file:
+            metrics_file.write(self.get_prometheus_text())
+        os.replace(temporary_path, self.path)
+
+    def close(self):
+        self.write()
+
+
+class JsonLinesSink:
+    '''
+    Writes every lookup as one JSON object per line. Writes are buffered, so the file may lag behind until
+    closed.
+    '''
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, "a", buffering=1 << 16)
+
+    def record(self, event):
+        line = json.dumps(event.to_dictionary(), separators=(",", ":")) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+class LookupMetrics:
+    '''
+    Hands each lookup made through a DnsCache to a list of sinks. Any object with record(event) and close()
+    methods can be a sink. Attach it with 'dns_cache.metrics = LookupMetrics([...])'. Nothing is measured
+    while a cache has no metrics attached.
+    Metrics are recorded in the middle of lookups, so a sink that fails, for example on a full disk, is
+    counted in failed_sink_records instead of failing the lookup.
+    '''
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.lock = threading.Lock()
+        self.failed_sink_records = 0
+
+    @staticmethod
+    def from_options(prometheus_path=None, json_lines_path=None, file_name_suffix=""):
+        '''
+        Builds metrics writing to the files named. A LookupHistogram is always included.
+        :param prometheus_path: Optional Prometheus text file.
+        :param json_lines_path: Optional JSON lines file.
+        :param file_name_suffix: Text added before the file extensions, for example a worker's process ID so
+            workers do not write to the same file.
+        :return: LookupMetrics.
+        '''
+        def add_suffix(path):
+            root, extension = os.path.splitext(path)
+            return root + file_name_suffix + extension
+
+        # A PrometheusFileSink is a LookupHistogram too, so only one is kept.
+        if prometheus_path:
+            sinks = [PrometheusFileSink(add_suffix(prometheus_path))]
+        else:
+            sinks = [LookupHistogram()]
+        if json_lines_path:
+            sinks.append(JsonLinesSink(add_suffix(json_lines_path)))
+        return LookupMetrics(sinks)
+
+    def get_histogram(self):
+        '''
+        :return: The first LookupHistogram sink, or None.
+        '''
+        for sink in self.sinks:
+            if isinstance(sink, LookupHistogram):
+                return sink
+        return None
+
+    def record(self, name, rdtype, rcode, latency, retries, cache_hit, size):
+        event = LookupEvent(name, rdtype, rcode, latency, retries, cache_hit, size)
+        for sink in self.sinks:
+            try:
+                sink.record(event)
+            except Exception:
+                with self.lock:
+                    self.failed_sink_records += 1
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        if self.failed_sink_records:
+            print(str(self.failed_sink_records) + " lookups could not be recorded by a metrics sink.", file=sys.stderr)
@@ -0,0 +1,334 @@
+import asyncio
+import random
+import sys
+import time
+from collections import OrderedDict, deque
+from DomainRecordHandler import DomainRecordHandler
+from PublicSuffixList import PublicSuffixList
+
+try:
+    import dns.exception
+    import dns.resolver
+except ModuleNotFoundError:
+    print("Error: The 'dnspython' library could not be found. Please install and try again.")
+    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+
+
+class NameserverGroup:
+    '''
+    The queries going to one set of authoritative nameservers, with a concurrency limit adjusted by additive
+    increase and multiplicative decrease (AIMD), the way TCP finds the rate a network path can take. The limit
+    grows by one for every limit's worth of quick, successful queries and is cut to a fraction of itself on a
+    failure or when answers slow down, at most once per smoothed query time so a burst of failures from one
+    overload counts once. Before the first cut the limit doubles instead, so busy servers reach their
+    capacity without thousands of queries at a low limit.
+    '''
+    __slots__ = (
+        "nameservers", "limit", "error_tolerance", "in_flight", "waiters", "latency", "error_rate", "last_decrease",
+        "query_count", "failure_count", "decrease_count"
+    )
+
+    # Weight given to each new query in the smoothed latency and error rate.
+    smoothing = 0.1
+
+    def __init__(self, nameservers, limit, error_tolerance=0.0):
+        '''
+        :param nameservers: Tuple of the nameserver names the group stands for.
+        :param limit: Concurrency limit to start with.
+        :param error_tolerance: Smoothed share of failed queries a failure must push the error rate past to
+            cut the limit. 0 cuts it on every failure.
+        '''
+        self.nameservers = nameservers
+        self.limit = float(limit)
+        self.error_tolerance = error_tolerance
+        self.in_flight = 0
+        self.waiters = deque()
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.last_decrease = 0.0
+        self.query_count = 0
+        self.failure_count = 0
+        self.decrease_count = 0
+
+    async def acquire(self):
+        '''
+        Waits until the group has a free query slot and takes it. Slots are handed to waiting queries in the
+        order they started waiting.
+        :return: None.
+        '''
+        if not self.waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the query was cancelled.
+                self.release()
+            else:
+                self.waiters.remove(future)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self.wake_waiters()
+
+    def wake_waiters(self):
+        while self.waiters and self.in_flight < int(self.limit):
+            future = self.waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def record(self, latency, failed, scheduler):
+        '''
+        Adjusts the concurrency limit after a query.
+        :param latency: Seconds the query took.
+        :param failed: True if the query timed out or got SERVFAIL.
+        :param scheduler: NameserverScheduler holding the other limits and thresholds.
+        :return: None.
+        '''
+        smoothing = NameserverGroup.smoothing
+        self.query_count += 1
+        self.latency += smoothing * (latency - self.latency)
+        self.error_rate += smoothing * ((1.0 if failed else 0.0) - self.error_rate)
+        if failed:
+            self.failure_count += 1
+        if (failed and self.error_rate > self.error_tolerance) or self.latency > scheduler.slow_query_time:
+            now = time.monotonic()
+            if now - self.last_decrease >= max(self.latency, scheduler.min_decrease_interval):
+                self.limit = max(scheduler.min_limit, self.limit * scheduler.decrease_factor)
+                self.last_decrease = now
+                self.decrease_count += 1
+        elif self.error_rate < max(scheduler.max_error_rate, self.error_tolerance):
+            # Until the first cut the limit grows by one per query, doubling with every limit's worth, to find
+            # the servers' capacity quickly (TCP slow start).
+            increase = 1.0 if not self.decrease_count else 1.0 / self.limit
+            self.limit = min(scheduler.max_limit, self.limit + increase)
+            self.wake_waiters()
+
+
+class NameserverScheduler:
+    '''
+    Wraps a resolver so that bulk lookups adapt to authoritative servers that rate limit. Each query name is
+    mapped to the nameserver set of its organizational domain, found with one NS lookup per organizational
+    domain, and every query going to the same set shares a NameserverGroup whose concurrency limit follows
+    the latency and failures seen there. A large DNS provider serving thousands of the listed domains is
+    therefore slowed down as a whole, while other servers keep their full speed. Names delegated below the
+    organizational domain are grouped with it.
+
+    Queries that time out or get SERVFAIL are sent again after a randomized, exponentially growing wait. If
+    every attempt fails the last error is raised, which callers report as 'unknown' rather than as a missing
+    record. resolve() behaves like dns.asyncresolver.Resolver.resolve(), so a scheduler can be given to
+    AsyncDomainAuditor in place of the resolver it wraps.
+    '''
+
+    def __init__(self, resolver, initial_limit=10, min_limit=1, max_limit=200, decrease_factor=0.5,
+                 slow_query_time=1.0, max_error_rate=0.05, zone_lookup_error_tolerance=0.25,
+                 min_decrease_interval=0.1, retries=3,
+                 backoff_time=0.5, max_backoff_time=10.0, dns_cache=None, public_suffix_list=None,
+                 max_zones=100000, max_groups=50000):
+        '''
+        :param resolver: QueryEngine or dns.asyncresolver.Resolver the queries are sent with.
+        :param initial_limit: Concurrency limit each nameserver group starts with.
+        :param min_limit: Lowest concurrency limit of a group.
+        :param max_limit: Highest concurrency limit of a group.
+        :param decrease_factor: Fraction of the limit kept after a failure or slow down.
+        :param slow_query_time: Smoothed query time in seconds above which a group's limit is cut.
+        :param max_error_rate: Smoothed share of failed queries above which a group's limit stops growing.
+        :param zone_lookup_error_tolerance: Smoothed share of failed NS lookups under a public suffix above which
+            the limit of their group is cut, as they are for different domains and some always fail.
+        :param min_decrease_interval: Least number of seconds between two cuts of a group's limit.
+        :param retries: Number of extra attempts after a timeout or SERVFAIL.
+        :param backoff_time: Seconds waited before the first retry. Each retry waits up to twice as long.
+        :param max_backoff_time: Longest wait before a retry, in seconds.
+        :param dns_cache: Optional DnsCache for the NS lookups. The cache shared by DomainRecordHandler is used
+            if not given.
+        :param public_suffix_list: Optional PublicSuffixList used to find organizational domains.
+        :param max_zones: Number of organizational domains whose nameserver set is remembered.
+        :param max_groups: Number of nameserver groups kept before idle ones are dropped.
+        '''
+        self.resolver = resolver
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.slow_query_time = slow_query_time
+        self.max_error_rate = max_error_rate
+        self.zone_lookup_error_tolerance = zone_lookup_error_tolerance
+        self.min_decrease_interval = min_decrease_interval
+        self.retries = retries
+        self.backoff_time = backoff_time
+        self.max_backoff_time = max_backoff_time
+        if dns_cache is None:
+            dns_cache = DomainRecordHandler.dns_cache
+        self.dns_cache = dns_cache
+        self.public_suffix_list = public_suffix_list or PublicSuffixList.get_default()
+        self.max_zones = max_zones
+        self.max_groups = max_groups
+        # Organizational domain -> key of its nameserver group, least recently used first.
+        self.zone_group_keys = OrderedDict()
+        # Organizational domain -> future of the NS lookup in progress for it.
+        self.pending_zones = {}
+        # Tuple of nameserver names -> NameserverGroup.
+        self.groups = {}
+        self.group_count = 0
+        self.query_count = 0
+        self.retry_count = 0
+        self.failure_count = 0
+
+    async def get_group_key(self, domain_name):
+        '''
+        Looks up the nameservers of an organizational domain. The NS lookups of every domain under the same
+        public suffix share a group, since the suffix's servers hand out the delegations.
+        :param domain_name: Organizational domain.
+        :return: Sorted tuple of the names of its nameservers, a tuple of the domain name alone if it has none,
+            or None if they could not be looked up.
+        '''
+        answer = self.dns_cache.get(domain_name, "NS")
+        if answer is None:
+            # The domains are unrelated, so the odd one failing, as lame delegations do, is no reason to slow
+            # down the others. Only a high share of failures is.
+            group = self.get_group_by_key(
+                (self.public_suffix_list.get_public_suffix(domain_name),), self.zone_lookup_error_tolerance
+            )
+            start_time = time.perf_counter()
+            try:
+                answer = self.dns_cache.store_result(
+                    domain_name, "NS", await self.send_query(group, domain_name, "NS"), None, start_time
+                )
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as error:
+                answer = self.dns_cache.store_result(domain_name, "NS", None, error, start_time)
+            except (dns.resolver.NoNameservers, dns.exception.Timeout):
+                return None
+        if not answer.records:
+            return (domain_name,)
+        return tuple(sorted(set(record.lower().rstrip(".") for record in answer.records)))
+
+    async def get_group(self, name):
+        '''
+        :param name: Query name.
+        :return: NameserverGroup the query belongs to.
+        '''
+        domain_name = self.public_suffix_list.get_organizational_domain(str(name))
+        key = self.zone_group_keys.get(domain_name)
+        if key is None:
+            future = self.pending_zones.get(domain_name)
+            if future is None:
+                # Queries for other names in the zone wait for this lookup instead of making their own.
+                future = self.pending_zones[domain_name] = asyncio.ensure_future(self.get_group_key(domain_name))
+                try:
+                    key = await asyncio.shield(future)
+                finally:
+                    del self.pending_zones[domain_name]
+                if key is not None:
+                    self.zone_group_keys[domain_name] = key
+                    if len(self.zone_group_keys) > self.max_zones:
+                        self.zone_group_keys.popitem(last=False)
+            else:
+                key = await asyncio.shield(future)
+            if key is None:
+                # The lookup is tried again for the zone's next query, and this one goes on alone.
+                key = (domain_name,)
+        else:
+            self.zone_group_keys.move_to_end(domain_name)
+        return self.get_group_by_key(key)
+
+    def get_group_by_key(self, key, error_tolerance=0.0):
+        '''
+        :param key: Tuple of nameserver names, or of a public suffix for the group of NS lookups under it.
+        :param error_tolerance: Error tolerance of the group if it is made.
+        :return: NameserverGroup for the key, made if there is none yet.
+        '''
+        group = self.groups.get(key)
+        if group is None:
+            if len(self.groups) >= self.max_groups:
+                self.groups = {
+                    group_key: group for group_key, group in self.groups.items()
+                    if group.in_flight or group.waiters
+                }
+            group = self.groups[key] = NameserverGroup(key, self.initial_limit, error_tolerance)
+            self.group_count += 1
+        return group
+
+    def get_backoff_time(self, attempt):
+        '''
+        :param attempt: Number of the retry about to be made, starting at 1.
+        :return: Seconds to wait, between half and all of the doubled backoff time, so queries that failed
+            together are not all sent again at the same moment.
+        '''
+        backoff_time = min(self.max_backoff_time, self.backoff_time * 2 ** (attempt - 1))
+        return backoff_time * random.uniform(0.5, 1.0)
+
+    async def resolve(self, name, rdtype="A"):
+        '''
+        Looks up a name the same way as dns.asyncresolver.Resolver.resolve(), once its nameserver group has a
+        free query slot.
+        :param name: Query name.
+        :param rdtype: Record type as text.
+        :return: dns.resolver.Answer.
+        :raises dns.resolver.NXDOMAIN: If the name does not exist.
+        :raises dns.resolver.NoAnswer: If the name has no records of the type.
+        :raises dns.exception.Timeout: If every attempt timed out.
+        :raises dns.resolver.NoNameservers: If every attempt failed and the last got SERVFAIL.
+        '''
+        group = await self.get_group(name)
+        try:
+            return await self.send_query(group, name, rdtype)
+        except (dns.resolver.NoNameservers, dns.exception.Timeout):
+            self.failure_count += 1
+            raise
+
+    async def send_query(self, group, name, rdtype):
+        '''
+        Sends a query once the group has a free query slot, sending it again after a timeout or SERVFAIL.
+        :param group: NameserverGroup the query belongs to.
+        :param name: Query name.
+        :param rdtype: Record type as text.
+        :return: dns.resolver.Answer.
+        :raises: The same errors as resolve().
+        '''
+        self.query_count += 1
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retry_count += 1
+                # The slot is given up while waiting, so other queries can use it.
+                await asyncio.sleep(self.get_backoff_time(attempt))
+            await group.acquire()
+            start_time = time.perf_counter()
+            try:
+                answer = await self.resolver.resolve(name, rdtype)
+            except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+                group.record(time.perf_counter() - start_time, False, self)
+                raise
+            except (dns.resolver.NoNameservers, dns.exception.Timeout) as error:
+                group.record(time.perf_counter() - start_time, True, self)
+                last_error = error
+                continue
+            finally:
+                group.release()
+            group.record(time.perf_counter() - start_time, False, self)
+            return answer
+        raise last_error
+
+    def get_summary(self):
+        '''
+        :return: Text giving the number of nameserver groups, retries, and failed lookups, and the state of
+            the busiest groups.
+        '''
+        summary = (
+            "Sent " + str(self.query_count) + " lookups to " + str(self.group_count) + " nameserver groups: " +
+            str(self.retry_count) + " retried, " + str(self.failure_count) +
+            " failed after retrying and reported as unknown."
+        )
+        busiest_groups = sorted(self.groups.values(), key=lambda group: group.query_count, reverse=True)[:5]
+        for group in busiest_groups:
+            summary += (
+                "\n    " + ", ".join(group.nameservers[:2]) + (", ..." if len(group.nameservers) > 2 else "") +
+                ": " + str(group.query_count) + " queries, " + str(group.failure_count) + " failed, limit " +
+                format(group.limit, ".1f") + " after " + str(group.decrease_count) + " cuts, " +
+                format(group.latency * 1000, ".0f") + " ms average"
+            )
+        return summary
@@ -0,0 +1,169 @@
+import encodings.idna
+import marshal
+import os
+
+
+class PublicSuffixList:
+    '''
+    Finds public suffixes and organizational domains (RFC 7489 section 3.2) using the Public Suffix List
+    from https://publicsuffix.org/. The list is compiled into a trie of reversed labels, for example
+    'uk' -> 'co' -> end of rule, which is cached next to the list so later runs skip the compile step.
+    '''
+
+    default_list_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public_suffix_list.dat")
+    # Bump when the compiled format changes so old cache files are rebuilt.
+    cache_format_version = 1
+    # Key marking that the labels leading to a trie node form a complete rule.
+    rule_end = ""
+
+    default_list = None
+
+    def __init__(self, list_path=None, include_private=True):
+        '''
+        :param list_path: Optional path to a public_suffix_list.dat file. The bundled copy is used if not given.
+        :param include_private: If True, rules from the private domains section (for example 'github.io') are
+            used too.
+        '''
+        self.list_path = list_path or PublicSuffixList.default_list_path
+        self.include_private = include_private
+        self.trie = self.load_trie()
+
+    @staticmethod
+    def get_default():
+        '''
+        Returns a list shared by all callers, loading it the first time it is needed.
+        :return: PublicSuffixList.
+        '''
+        if PublicSuffixList.default_list is None:
+            PublicSuffixList.default_list = PublicSuffixList()
+        return PublicSuffixList.default_list
+
+    def load_trie(self):
+        '''
+        Loads the compiled trie from the cache file if it matches the list, otherwise compiles the list and
+        tries to save the result. A cache that cannot be written is not an error.
+        :return: Trie as nested dictionaries.
+        '''
+        list_status = os.stat(self.list_path)
+        signature = (PublicSuffixList.cache_format_version, list_status.st_size, list_status.st_mtime,
+                     self.include_private)
+        cache_path = self.list_path + (".trie" if self.include_private else ".icann.trie")
+        try:
+            with open(cache_path, "rb") as cache_file:
+                cached_signature, trie = marshal.load(cache_file)
+            if cached_signature == signature:
+                return trie
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+        trie = self.compile_trie()
+        try:
+            with open(cache_path + ".tmp", "wb") as cache_file:
+                marshal.dump((signature, trie), cache_file)
+            os.replace(cache_path + ".tmp", cache_path)
+        except OSError:
+            pass
+        return trie
+
+    def compile_trie(self):
+        '''
+        Reads the rules of the list into a trie. Rules with non-ASCII labels are added both as written and
+        in their punycode form so either kind of name can be looked up.
+        :return: Trie as nested dictionaries.
+        '''
+        trie = {}
+        with open(self.list_path, encoding="utf-8") as list_file:
+            for line in list_file:
+                line = line.strip()
+                if line.startswith("// ===BEGIN PRIVATE DOMAINS===") and not self.include_private:
+                    break
+                if "" == line or line.startswith("//"):
+                    continue
+                rule = line.split()[0].lower()
+                PublicSuffixList.add_rule(trie, rule)
+                if not rule.isascii():
+                    try:
+                        ascii_rule = ".".join(
+                            label if label in ("*", "") or label.isascii() else
+                            encodings.idna.ToASCII(label.lstrip("!")).decode("ascii")
+                            for label in rule.split(".")
+                        )
+                    except UnicodeError:
+                        continue
+                    if rule.startswith("!"):
+                        ascii_rule = "!" + ascii_rule.lstrip("!")
+                    PublicSuffixList.add_rule(trie, ascii_rule)
+        return trie
+
+    @staticmethod
+    def add_rule(trie, rule):
+        # Exception rules are stored on the parent node as '!label'.
+        is_exception = rule.startswith("!")
+        labels = rule.lstrip("!").split(".")[::-1]
+        if is_exception:
+            labels[-1] = "!" + labels[-1]
+        node = trie
+        for label in labels:
+            node = node.setdefault(label, {})
+        node[PublicSuffixList.rule_end] = 1
+
+    def get_public_suffix_label_count(self, reversed_labels):
+        '''
+        Finds how many of the rightmost labels of a name form its public suffix.
+        :param reversed_labels: Labels of the name, top-level domain first.
+        :return: Number of labels in the public suffix. Names with an unlisted top-level domain use the
+            implicit '*' rule, so this is at least 1.
+        '''
+        rule_end = PublicSuffixList.rule_end
+        node = self.trie
+        suffix_label_count = 1
+        for label_number, label in enumerate(reversed_labels):
+            if "!" + label in node:
+                return label_number
+            wildcard = node.get("*")
+            child = node.get(label)
+            if wildcard is not None:
+                suffix_label_count = label_number + 1
+            if child is None:
+                if wildcard is None:
+                    break
+                child = wildcard
+            elif rule_end in child:
+                suffix_label_count = label_number + 1
+            node = child
+        return suffix_label_count
+
+    def get_public_suffix(self, domain_name):
+        '''
+        :param domain_name: Domain name, in any letter case and with or without a trailing dot.
+        :return: The public suffix of the name, for example 'co.uk' for 'mail.example.co.uk'.
+        '''
+        labels = domain_name.lower().rstrip(".").split(".")
+        suffix_label_count = self.get_public_suffix_label_count(labels[::-1])
+        return ".".join(labels[-suffix_label_count:])
+
+    def get_organizational_domain(self, domain_name):
+        '''
+        :param domain_name: Domain name, in any letter case and with or without a trailing dot.
+        :return: The public suffix plus one label, for example 'example.co.uk' for 'mail.example.co.uk'.
+            A name that is itself a public suffix is returned as it is.
+        '''
+        labels = domain_name.lower().rstrip(".").split(".")
+        suffix_label_count = self.get_public_suffix_label_count(labels[::-1])
+        if suffix_label_count >= len(labels):
+            return ".".join(labels)
+        return ".".join(labels[-suffix_label_count - 1:])
+
+    def get_organizational_domains(self, domain_names):
+        '''
+        Bulk form of get_organizational_domain().
+        :param domain_names: Iterable of domain names.
+        :return: Generator of organizational domains in the same order.
+        '''
+        get_label_count = self.get_public_suffix_label_count
+        for domain_name in domain_names:
+            labels = domain_name.lower().rstrip(".").split(".")
+            suffix_label_count = get_label_count(labels[::-1])
+            if suffix_label_count >= len(labels):
+                yield ".".join(labels)
+            else:
+                yield ".".join(labels[-suffix_label_count - 1:])
@@ -0,0 +1,373 @@
+import asyncio
+import random
+import socket
+import ssl
+import sys
+
+try:
+    import dns.exception
+    import dns.flags
+    import dns.message
+    import dns.name
+    import dns.rcode
+    import dns.rdataclass
+    import dns.rdatatype
+    import dns.resolver
+except ModuleNotFoundError:
+    print("Error: The 'dnspython' library could not be found. Please install and try again.")
+    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+
+
+class QueryChannel:
+    '''
+    Base of the UDP and TCP channels to one upstream. Outstanding queries are kept by query ID, so many
+    can share the channel and responses are matched to them in whatever order they arrive. Subclasses open
+    their socket or connection in connect(timeout).
+    '''
+
+    def __init__(self):
+        self.pending_queries = {}
+        self.connecting = None
+
+    async def open(self, timeout):
+        '''
+        Opens the socket or connection if it is not open yet. Queries made while it is being opened all wait
+        on the same attempt, and are all woken together when it finishes rather than one at a time.
+        :param timeout: Seconds the attempt may take.
+        :return: None.
+        '''
+        if self.connecting is None:
+            self.connecting = asyncio.ensure_future(self.connect(timeout))
+            self.connecting.add_done_callback(self.connect_done)
+        # A query that gives up waiting does not cancel the attempt the others are waiting on.
+        await asyncio.shield(self.connecting)
+
+    def connect_done(self, connecting):
+        self.connecting = None
+        # Read the error, so it is not reported as never retrieved when every query waiting on it gave up.
+        if not connecting.cancelled():
+            connecting.exception()
+
+    def add_pending_query(self, query):
+        '''
+        Gives a query an ID not already outstanding on this channel and registers it.
+        :param query: dns.message.Message about to be sent. Its id is changed.
+        :return: Future that receives the response.
+        '''
+        query_id = random.getrandbits(16)
+        while query_id in self.pending_queries:
+            query_id = random.getrandbits(16)
+        query.id = query_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending_queries[query_id] = (future, query)
+        return future
+
+    def receive_response(self, wire):
+        '''
+        Hands a response to the query waiting for it. Responses that do not match an outstanding query,
+        or cannot be parsed, are dropped and the query keeps waiting.
+        :param wire: Response in wire format.
+        :return: None.
+        '''
+        if len(wire) < 12:
+            return
+        pending_query = self.pending_queries.get(int.from_bytes(wire[:2], "big"))
+        if pending_query is None:
+            return
+        future, query = pending_query
+        try:
+            response = dns.message.from_wire(wire)
+        except dns.exception.DNSException:
+            return
+        if not query.is_response(response):
+            return
+        del self.pending_queries[query.id]
+        if not future.done():
+            future.set_result(response)
+
+    def fail_pending_queries(self, error):
+        for future, _ in self.pending_queries.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending_queries.clear()
+
+    async def wait_for_response(self, query_id, future, timeout):
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            pending_query = self.pending_queries.get(query_id)
+            if pending_query is not None and pending_query[0] is future:
+                del self.pending_queries[query_id]
+
+
+class UdpChannel(QueryChannel, asyncio.DatagramProtocol):
+    '''
+    A connected UDP socket to one upstream. The kernel drops datagrams from any other address.
+    '''
+
+    receive_buffer_size = 1 << 20
+
+    def __init__(self, address, port):
+        QueryChannel.__init__(self)
+        self.address = address
+        self.port = port
+        self.transport = None
+
+    async def connect(self, timeout):
+        await asyncio.wait_for(asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: self, remote_addr=(self.address, self.port)
+        ), timeout)
+
+    def connection_made(self, transport):
+        self.transport = transport
+        # Many responses can arrive at once. A bigger receive buffer keeps the kernel from dropping them.
+        transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UdpChannel.receive_buffer_size)
+
+    def datagram_received(self, data, address):
+        self.receive_response(data)
+
+    def error_received(self, error):
+        # For example ICMP port unreachable. Queries waiting on the socket time out and are retried.
+        pass
+
+    def connection_lost(self, error):
+        self.transport = None
+        self.fail_pending_queries(ConnectionError("UDP socket closed"))
+
+    async def query(self, query, timeout):
+        if self.transport is None:
+            await self.open(timeout)
+        future = self.add_pending_query(query)
+        self.transport.sendto(query.to_wire())
+        return await self.wait_for_response(query.id, future, timeout)
+
+    def close(self):
+        if self.connecting is not None:
+            self.connecting.cancel()
+        if self.transport is not None:
+            self.transport.close()
+
+
+class StreamChannel(QueryChannel):
+    '''
+    A TCP or DNS over TLS (RFC 7858) connection to one upstream. Queries are written as soon as they are
+    made without waiting for earlier responses (RFC 7766 pipelining) and a single reader task hands out
+    the responses. The connection is opened on first use and again after the upstream closes it.
+    '''
+
+    def __init__(self, address, port, ssl_context=None, server_hostname=None):
+        QueryChannel.__init__(self)
+        self.address = address
+        self.port = port
+        self.ssl_context = ssl_context
+        self.server_hostname = server_hostname
+        self.writer = None
+        self.write_buffer = []
+        self.reader_task = None
+
+    async def connect(self, timeout):
+        server_hostname = self.server_hostname if self.ssl_context is not None else None
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(
+            self.address, self.port, ssl=self.ssl_context, server_hostname=server_hostname
+        ), timeout)
+        self.writer = writer
+        self.reader_task = asyncio.ensure_future(self.read_responses(reader, writer))
+
+    async def read_responses(self, reader, writer):
+        try:
+            while True:
+                length = await reader.readexactly(2)
+                self.receive_response(await reader.readexactly(int.from_bytes(length, "big")))
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, ssl.SSLError):
+            pass
+        finally:
+            if self.writer is writer:
+                self.writer = None
+            writer.close()
+            self.fail_pending_queries(ConnectionError("connection to " + self.address + " closed"))
+
+    async def query(self, query, timeout):
+        if self.writer is None:
+            await self.open(timeout)
+            if self.writer is None:
+                raise ConnectionError("connection to " + self.address + " closed")
+        future = self.add_pending_query(query)
+        wire = query.to_wire()
+        if not self.write_buffer:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.write_buffer.append(len(wire).to_bytes(2, "big") + wire)
+        return await self.wait_for_response(query.id, future, timeout)
+
+    def flush(self):
+        '''
+        Sends the queries made since the last flush in one write, so a burst of queries costs one system
+        call instead of one each.
+        '''
+        if self.writer is not None:
+            self.writer.write(b"".join(self.write_buffer))
+        self.write_buffer.clear()
+
+    def close(self):
+        if self.connecting is not None:
+            self.connecting.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+
+
+class QueryEngine:
+    '''
+    Sends many DNS queries at once over a few sockets to the configured upstream resolvers.
+    UDP queries are multiplexed over a small pool of sockets per upstream and matched to their responses by
+    query ID. Truncated UDP responses are asked again over a pooled TCP connection. With transport 'tcp' or
+    'tls' every query goes over pooled, pipelined TCP or DNS over TLS connections.
+    resolve() behaves like dns.asyncresolver.Resolver.resolve(), so an engine can be given to
+    AsyncDomainAuditor or DnsCache.resolve_async() in place of the stub resolver.
+    '''
+
+    default_ports = {"udp": 53, "tcp": 53, "tls": 853}
+
+    def __init__(self, nameservers=None, transport="udp", port=None, timeout=2.0, retries=2, udp_sockets=4,
+                 stream_connections=2, tls_server_name=None, ssl_context=None):
+        '''
+        :param nameservers: List of upstream IP addresses. The system resolvers are used if not given.
+        :param transport: 'udp' (falling back to TCP on truncation), 'tcp', or 'tls'.
+        :param port: Upstream port. Defaults to 53, or 853 for 'tls'.
+        :param timeout: Seconds to wait for each attempt.
+        :param retries: Number of extra attempts after a timeout or failure, moving to the next upstream
+            each time.
+        :param udp_sockets: Number of UDP sockets per upstream.
+        :param stream_connections: Number of TCP or TLS connections per upstream.
+        :param tls_server_name: Name the upstream's TLS certificate is checked against.
+        :param ssl_context: Optional ssl.SSLContext for 'tls'. A default, verifying context is used if not
+            given.
+        '''
+        if transport not in QueryEngine.default_ports:
+            raise ValueError("transport must be 'udp', 'tcp', or 'tls'")
+        if nameservers is None:
+            nameservers = [
+                nameserver for nameserver in dns.resolver.get_default_resolver().nameservers
+                if isinstance(nameserver, str)
+            ]
+        self.nameservers = list(nameservers)
+        self.transport = transport
+        self.port = port or QueryEngine.default_ports[transport]
+        self.timeout = timeout
+        self.retries = retries
+        self.udp_sockets = udp_sockets
+        self.stream_connections = stream_connections
+        self.tls_server_name = tls_server_name
+        if "tls" == transport and ssl_context is None:
+            ssl_context = ssl.create_default_context()
+            if tls_server_name is None:
+                ssl_context.check_hostname = False
+        self.ssl_context = ssl_context
+        self.udp_channels = {}
+        self.stream_channels = {}
+        self.next_channel = 0
+        self.next_nameserver = 0
+        self.query_count = 0
+        self.retry_count = 0
+        self.truncated_count = 0
+
+    def get_udp_channel(self, nameserver):
+        channels = self.udp_channels.get(nameserver)
+        if channels is None:
+            channels = self.udp_channels[nameserver] = [
+                UdpChannel(nameserver, self.port) for _ in range(self.udp_sockets)
+            ]
+        self.next_channel += 1
+        return channels[self.next_channel % len(channels)]
+
+    def get_stream_channel(self, nameserver):
+        '''
+        :return: The connection to an upstream with the fewest outstanding queries.
+        '''
+        channels = self.stream_channels.get(nameserver)
+        if channels is None:
+            ssl_context = self.ssl_context if "tls" == self.transport else None
+            channels = self.stream_channels[nameserver] = [
+                StreamChannel(nameserver, self.port, ssl_context, self.tls_server_name)
+                for _ in range(self.stream_connections)
+            ]
+        return min(channels, key=lambda channel: len(channel.pending_queries))
+
+    async def query(self, name, rdtype="A"):
+        '''
+        Sends one query and waits for its response.
+        :param name: Query name.
+        :param rdtype: Record type as text.
+        :return: dns.message.Message response with an rcode other than SERVFAIL or REFUSED.
+        :raises dns.exception.Timeout: If no upstream answered in time.
+        :raises dns.resolver.NoNameservers: If every upstream answered with SERVFAIL or REFUSED.
+        '''
+        query = dns.message.make_query(name, rdtype, use_edns=0, payload=1232)
+        if not self.nameservers:
+            raise dns.resolver.NoNameservers(request=query, errors=[])
+        self.query_count += 1
+        self.next_nameserver += 1
+        over_tcp = "udp" != self.transport
+        errors = []
+        timed_out = False
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retry_count += 1
+            nameserver = self.nameservers[(self.next_nameserver + attempt) % len(self.nameservers)]
+            try:
+                if "udp" == self.transport:
+                    response = await self.get_udp_channel(nameserver).query(query, self.timeout)
+                    if response.flags & dns.flags.TC:
+                        self.truncated_count += 1
+                        response = await self.get_stream_channel(nameserver).query(query, self.timeout)
+                else:
+                    response = await self.get_stream_channel(nameserver).query(query, self.timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                continue
+            except OSError as error:
+                errors.append((nameserver, over_tcp, self.port, error, None))
+                continue
+            if response.rcode() in (dns.rcode.SERVFAIL, dns.rcode.REFUSED):
+                errors.append((nameserver, over_tcp, self.port, dns.rcode.to_text(response.rcode()), response))
+                continue
+            # Read by DnsCache for its lookup metrics.
+            response.retries = attempt
+            return response
+        if timed_out or not errors:
+            error = dns.exception.Timeout(timeout=self.timeout * (self.retries + 1))
+            # Read by DnsCache for its lookup metrics.
+            error.retries = self.retries
+            raise error
+        raise dns.resolver.NoNameservers(request=query, errors=errors)
+
+    async def resolve(self, name, rdtype="A"):
+        '''
+        Looks up a name the same way as dns.asyncresolver.Resolver.resolve().
+        :param name: Query name, treated as absolute.
+        :param rdtype: Record type as text.
+        :return: dns.resolver.Answer.
+        :raises dns.resolver.NXDOMAIN: If the name does not exist.
+        :raises dns.resolver.NoAnswer: If the name has no records of the type.
+        '''
+        qname = dns.name.from_text(name) if isinstance(name, str) else name
+        rdtype = dns.rdatatype.RdataType.make(rdtype)
+        response = await self.query(qname, rdtype)
+        if dns.rcode.NXDOMAIN == response.rcode():
+            raise dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+        answer = dns.resolver.Answer(qname, rdtype, dns.rdataclass.IN, response)
+        if answer.rrset is None:
+            raise dns.resolver.NoAnswer(response=response)
+        return answer
+
+    def close(self):
+        '''
+        Closes every socket and connection.
+        :return: None.
+        '''
+        for channels in list(self.udp_channels.values()) + list(self.stream_channels.values()):
+            for channel in channels:
+                channel.close()
+        self.udp_channels.clear()
+        self.stream_channels.clear()
@@ -0,0 +1,288 @@
+import csv
+import json
+import sys
+from PublicSuffixList import PublicSuffixList
+
+
+class GeneratedRecord:
+    '''
+    One DNS record the user needs to create.
+    zone_name is the domain whose DNS holds the record and host_name is relative to it, '@' being the zone
+    itself, except for report authorization records whose host name is written out in full.
+    '''
+    __slots__ = ("kind", "zone_name", "record_type", "host_name", "value")
+
+    def __init__(self, kind, zone_name, host_name, value, record_type="TXT"):
+        self.kind = kind
+        self.zone_name = zone_name
+        self.record_type = record_type
+        self.host_name = host_name
+        self.value = value
+
+    def to_text(self):
+        '''
+        :return: The record in the form shown at the end of the questions.
+        '''
+        return (
+            self.kind + " DNS RECORD (" + self.zone_name + ")\n" +
+            "Record type: " + self.record_type + "\n" +
+            "Host name:   " + self.host_name + "\n" +
+            "Value:       " + self.value
+        )
+
+
+class RecordGenerator:
+    '''
+    Builds the DMARC, SPF, and DKIM records for a domain from explicit settings, without any DNS lookups.
+    The questions use it for one domain and generate_records() for many domains read from a spec file.
+    '''
+
+    # Settings of a domain in a spec file and the values used when they are left out.
+    default_settings = {
+        "domain": "",
+        "used_for_email": True,
+        "policy": "none",
+        "subdomain_policy": "",
+        "failure_options": "",
+        "dkim_alignment": "",
+        "spf_alignment": "",
+        "rua": "",
+        "ruf": "",
+        "spf": "",
+        "dkim_selector": "*",
+    }
+    policies = ("none", "quarantine", "reject")
+    alignments = ("", "r", "s")
+
+    @staticmethod
+    def split_domain_name(domain_name):
+        '''
+        :param domain_name: Domain name, for example 'mail.domain.co.uk'.
+        :return: Tuple of the parent (organizational) domain and the subdomain part with a leading '.', for
+            example ('domain.co.uk', '.mail'). The subdomain part is '' for a parent domain.
+        '''
+        parent_domain_name = PublicSuffixList.get_default().get_organizational_domain(domain_name)
+        normalized_domain_name = domain_name.lower().rstrip(".")
+        if normalized_domain_name != parent_domain_name:
+            return parent_domain_name, "." + normalized_domain_name[:-len(parent_domain_name) - 1]
+        return parent_domain_name, ""
+
+    @staticmethod
+    def get_dmarc_records(domain_name, parent_domain_name, subdomain_name, used_for_email=True, policy="none",
+                          subdomain_policy="", failure_options="", dkim_alignment="", spf_alignment="",
+                          aggregate_email_address="", failure_email_address=""):
+        '''
+        Builds the DMARC record of a domain, and the records the report destinations at other domains need
+        to publish to accept the reports.
+        :param domain_name: Domain the record is for.
+        :param parent_domain_name: Its parent domain, whose zone holds the record.
+        :param subdomain_name: The subdomain part with a leading '.', or '' for a parent domain.
+        :param used_for_email: False for a domain that never sends email, which gets a reject policy.
+        :param policy: Value of p.
+        :param subdomain_policy: Value of sp, or '' to leave it out.
+        :param failure_options: Value of fo, or '' to leave it out.
+        :param dkim_alignment: Value of adkim, or '' to leave it out.
+        :param spf_alignment: Value of aspf, or '' to leave it out.
+        :param aggregate_email_address: Address for rua, or '' for no aggregate reports.
+        :param failure_email_address: Address for ruf, or '' for no failure reports.
+        :return: List of GeneratedRecord objects, the domain's own record first.
+        '''
+        if used_for_email:
+            value = "v=DMARC1; p=" + policy
+            if "" != subdomain_policy:
+                value += "; sp=" + subdomain_policy
+            if "" != failure_options:
+                value += "; fo=" + failure_options
+            if "" != dkim_alignment:
+                value += "; adkim=" + dkim_alignment
+            if "" != spf_alignment:
+                value += "; aspf=" + spf_alignment
+        else:
+            value = "v=DMARC1; p=reject; sp=reject"
+            if "" != failure_options:
+                value += "; fo=" + failure_options
+        if "" != aggregate_email_address:
+            value += "; rua=mailto:" + aggregate_email_address
+        if "" != failure_email_address:
+            value += "; ruf=mailto:" + failure_email_address
+        records = [GeneratedRecord("DMARC", parent_domain_name, "_dmarc" + subdomain_name, value)]
+
+        # Reports sent to another domain need that domain's permission.
+        aggregate_email_domain = aggregate_email_address[aggregate_email_address.find("@") + 1:]
+        failure_email_domain = failure_email_address[failure_email_address.find("@") + 1:]
+        for email_domain in (aggregate_email_domain, failure_email_domain):
+            if "" != email_domain and email_domain != domain_name and email_domain not in [
+                    record.zone_name for record in records[1:]]:
+                records.append(GeneratedRecord(
+                    "DMARC", email_domain, domain_name + "._report._dmarc." + email_domain, "v=DMARC1"
+                ))
+        return records
+
+    @staticmethod
+    def get_spf_record(parent_domain_name, subdomain_name, spf_mechanisms=""):
+        '''
+        :param parent_domain_name: Parent domain, whose zone holds the record.
+        :param subdomain_name: The subdomain part with a leading '.', or '' for a parent domain.
+        :param spf_mechanisms: Mechanisms allowed to send, for example 'mx include:_spf.example.net'.
+        :return: GeneratedRecord.
+        '''
+        value = "v=spf1"
+        if "" != spf_mechanisms.strip():
+            value += " " + " ".join(spf_mechanisms.split())
+        host_name = subdomain_name[1:] if "" != subdomain_name else "@"
+        return GeneratedRecord("SPF", parent_domain_name, host_name, value + " ~all")
+
+    @staticmethod
+    def get_dkim_record(parent_domain_name, subdomain_name, dkim_selector="*", used_for_email=True, public_key="",
+                        key_type="rsa"):
+        '''
+        :param parent_domain_name: Parent domain, whose zone holds the record.
+        :param subdomain_name: The subdomain part with a leading '.', or '' for a parent domain.
+        :param dkim_selector: Selector of the key.
+        :param used_for_email: False for a domain that never sends email, which gets an empty key.
+        :param public_key: Base64 public key. A placeholder is used if not given.
+        :param key_type: 'rsa' or 'ed25519'.
+        :return: GeneratedRecord.
+        '''
+        value = "v=DKIM1; k=" + key_type + "; p="
+        if used_for_email:
+            value += public_key or "ReplaceThisTextWithYourPublicKey"
+        return GeneratedRecord("DKIM", parent_domain_name, dkim_selector + "._domainkey" + subdomain_name, value)
+
+    @staticmethod
+    def get_domain_records(settings, dkim_key=None):
+        '''
+        Builds every record of one domain from its spec settings.
+        :param settings: Dictionary of settings returned by normalize_settings().
+        :param dkim_key: Optional DkimKey whose public key goes in the DKIM record.
+        :return: List of GeneratedRecord objects.
+        '''
+        domain_name = settings["domain"]
+        parent_domain_name, subdomain_name = RecordGenerator.split_domain_name(domain_name)
+        used_for_email = settings["used_for_email"]
+        records = RecordGenerator.get_dmarc_records(
+            domain_name, parent_domain_name, subdomain_name, used_for_email, settings["policy"],
+            settings["subdomain_policy"], settings["failure_options"], settings["dkim_alignment"],
+            settings["spf_alignment"], settings["rua"], settings["ruf"]
+        )
+        records.append(RecordGenerator.get_spf_record(
+            parent_domain_name, subdomain_name, settings["spf"] if used_for_email else ""
+        ))
+        if dkim_key is None:
+            records.append(RecordGenerator.get_dkim_record(
+                parent_domain_name, subdomain_name, settings["dkim_selector"], used_for_email
+            ))
+        else:
+            records.append(RecordGenerator.get_dkim_record(
+                parent_domain_name, subdomain_name, dkim_key.selector, used_for_email, dkim_key.public_key,
+                dkim_key.key_type
+            ))
+        return records
+
+    @staticmethod
+    def normalize_settings(settings):
+        '''
+        Fills in defaults and turns spec file values, which may be text from a CSV file or lists from YAML
+        and JSON, into the forms the record functions take.
+        :param settings: Dictionary of a domain's settings.
+        :return: New dictionary of settings.
+        :raises ValueError: If a setting has a value that is not allowed.
+        '''
+        normalized_settings = dict(RecordGenerator.default_settings)
+        for key, value in settings.items():
+            if key not in normalized_settings:
+                raise ValueError("Unknown setting '" + str(key) + "'.")
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple)):
+                value = " ".join(str(item) for item in value)
+            if "used_for_email" == key:
+                if isinstance(value, str):
+                    value = value.strip().lower() not in ("no", "n", "false", "0")
+                value = bool(value)
+            else:
+                value = str(value).strip()
+            normalized_settings[key] = value
+        domain_name = normalized_settings["domain"]
+        if "" == domain_name:
+            raise ValueError("A domain has no 'domain' setting.")
+        for key in ("rua", "ruf"):
+            if normalized_settings[key].lower().startswith("mailto:"):
+                normalized_settings[key] = normalized_settings[key][len("mailto:"):]
+        if normalized_settings["policy"] not in RecordGenerator.policies:
+            raise ValueError(domain_name + ": 'policy' must be none, quarantine, or reject.")
+        if normalized_settings["subdomain_policy"] not in ("",) + RecordGenerator.policies:
+            raise ValueError(domain_name + ": 'subdomain_policy' must be none, quarantine, or reject.")
+        for key in ("dkim_alignment", "spf_alignment"):
+            if normalized_settings[key] not in RecordGenerator.alignments:
+                raise ValueError(domain_name + ": '" + key + "' must be r or s.")
+        return normalized_settings
+
+    @staticmethod
+    def read_spec(file_name):
+        '''
+        Reads the domains of a spec file. The format is taken from the file extension:
+        .csv has a header row naming the settings and one domain per row.
+        .jsonl has one JSON object per line.
+        .json, .yaml, and .yml hold a list of domains, or an object with a 'domains' list and a 'defaults'
+        object of settings shared by every domain.
+        :param file_name: Path of the spec file.
+        :return: Generator of settings dictionaries, one per domain.
+        '''
+        lower_file_name = file_name.lower()
+        with open(file_name, newline="") as spec_file:
+            if lower_file_name.endswith(".csv"):
+                for row in csv.DictReader(spec_file):
+                    yield {key: value for key, value in row.items() if key is not None and "" != value}
+                return
+            if lower_file_name.endswith(".jsonl"):
+                for line in spec_file:
+                    if "" != line.strip():
+                        yield json.loads(line)
+                return
+            if lower_file_name.endswith((".yaml", ".yml")):
+                try:
+                    import yaml
+                except ModuleNotFoundError:
+                    print("Error: The 'PyYAML' library could not be found. Please install and try again.")
+                    sys.exit("If using 'pip', this command may help 'sudo pip3 install pyyaml'.")
+                spec = yaml.safe_load(spec_file)
+            else:
+                spec = json.load(spec_file)
+        defaults = {}
+        if isinstance(spec, dict):
+            defaults = spec.get("defaults") or {}
+            spec = spec.get("domains") or []
+        for domain_settings in spec:
+            # A domain can be given as just its name.
+            if isinstance(domain_settings, str):
+                domain_settings = {"domain": domain_settings}
+            settings = dict(defaults)
+            settings.update(domain_settings)
+            yield settings
+
+    @staticmethod
+    def generate_records(domain_settings, key_generator=None):
+        '''
+        Builds the records of many domains, one domain at a time.
+        :param domain_settings: Iterable of settings dictionaries, for example from read_spec().
+        :param key_generator: Optional DkimKeyGenerator that makes a key for each domain used for email, so
+            its DKIM record has a real public key. Domains without a selector get the generator's default.
+        :return: Generator of GeneratedRecord objects.
+        :raises ValueError: If a setting has a value that is not allowed.
+        '''
+        normalized_settings = map(RecordGenerator.normalize_settings, domain_settings)
+        if key_generator is None:
+            for settings in normalized_settings:
+                yield from RecordGenerator.get_domain_records(settings)
+            return
+
+        def get_key_name(settings):
+            if not settings["used_for_email"]:
+                return None
+            if "*" == settings["dkim_selector"]:
+                settings["dkim_selector"] = key_generator.get_default_selector()
+            return settings["domain"].lower().rstrip("."), settings["dkim_selector"]
+
+        for settings, dkim_key in key_generator.generate_keys(normalized_settings, get_key_name):
+            yield from RecordGenerator.get_domain_records(settings, dkim_key)
@@ -0,0 +1,209 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+
+
+class RecordWriter(ABC):
+    '''
+    Writes GeneratedRecord objects to a file as they are made, so any number of domains can be written
+    without keeping their records in memory. Output is collected into chunks of about buffer_size
+    characters before being written. Call close() at the end to write what is left; the file itself is
+    not closed.
+    '''
+
+    # Longest character-string a TXT record can hold, in bytes (RFC 1035).
+    max_txt_string_length = 255
+    # TTL given to records in formats that have one.
+    default_ttl = 3600
+    # Names of the values written by the JSON lines and CSV formats.
+    fields = ["kind", "zone", "name", "type", "ttl", "value", "rdata"]
+    # Zone file form of each byte inside a quoted character-string.
+    txt_byte_escapes = [
+        "\\" + chr(byte) if byte in (0x22, 0x5c) else chr(byte) if 0x20 <= byte < 0x7f else "\\" + format(byte, "03d")
+        for byte in range(256)
+    ]
+
+    def __init__(self, output_file, ttl=default_ttl, buffer_size=1 << 20):
+        '''
+        :param output_file: Open text file to write to.
+        :param ttl: TTL in seconds of every record, for formats that include one.
+        :param buffer_size: Number of characters collected before they are written.
+        '''
+        self.output_file = output_file
+        self.ttl = ttl
+        self.buffer_size = buffer_size
+        self.chunks = []
+        self.buffered_size = 0
+        self.record_count = 0
+
+    @staticmethod
+    def create(format_name, output_file, ttl=default_ttl):
+        '''
+        :param format_name: 'text', 'zone', 'jsonl', or 'csv'.
+        :param output_file: Open text file to write to.
+        :param ttl: TTL in seconds of every record.
+        :return: RecordWriter for the format.
+        :raises ValueError: If the format is not known.
+        '''
+        writer_classes = {
+            "text": TextRecordWriter,
+            "zone": ZoneFileRecordWriter,
+            "jsonl": JsonLinesRecordWriter,
+            "csv": CsvRecordWriter,
+        }
+        if format_name not in writer_classes:
+            raise ValueError("Unknown output format '" + format_name + "'.")
+        return writer_classes[format_name](output_file, ttl)
+
+    def write(self, text):
+        '''
+        Adds text to the buffer, writing the buffer out once it is full.
+        :param text: Text to write.
+        :return: None.
+        '''
+        self.chunks.append(text)
+        self.buffered_size += len(text)
+        if self.buffered_size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.output_file.write("".join(self.chunks))
+            self.chunks = []
+            self.buffered_size = 0
+        self.output_file.flush()
+
+    def close(self):
+        self.flush()
+
+    @abstractmethod
+    def write_record(self, record):
+        '''
+        Writes one record. Each output format implements this, adding 1 to record_count.
+        :param record: GeneratedRecord to write.
+        :return: None.
+        '''
+
+    def write_records(self, records):
+        '''
+        Writes every record of an iterable, one at a time.
+        :param records: Iterable of GeneratedRecord objects, for example from RecordGenerator.generate_records().
+        :return: Number of records written.
+        '''
+        write_record = self.write_record
+        for record in records:
+            write_record(record)
+        return self.record_count
+
+    @staticmethod
+    def get_owner_name(record):
+        '''
+        :return: The record's fully qualified host name, with the trailing dot.
+        '''
+        if "@" == record.host_name:
+            return record.zone_name + "."
+        # Report authorization records already have their host name written out in full.
+        if record.host_name == record.zone_name or record.host_name.endswith("." + record.zone_name):
+            return record.host_name + "."
+        return record.host_name + "." + record.zone_name + "."
+
+    @staticmethod
+    def split_txt_value(value):
+        '''
+        Splits a TXT value into the character-strings it is published as. Values are split on byte counts,
+        so text outside ASCII is measured in its UTF-8 form.
+        :param value: TXT value.
+        :return: List of byte strings of at most max_txt_string_length bytes.
+        '''
+        value_bytes = value.encode("utf-8")
+        length = RecordWriter.max_txt_string_length
+        return [value_bytes[start:start + length] for start in range(0, len(value_bytes), length)] or [b""]
+
+    @staticmethod
+    def escape_txt_string(txt_string):
+        '''
+        :param txt_string: One character-string as bytes.
+        :return: The string in zone file form, in double quotes, with '"' and '\\' escaped by a backslash and
+            bytes that are not printable ASCII written as '\\DDD'.
+        '''
+        # Nearly every record is printable ASCII, which only needs quotes and backslashes escaping.
+        if txt_string.isascii():
+            text = txt_string.decode("ascii")
+            if text.isprintable():
+                return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+        escapes = RecordWriter.txt_byte_escapes
+        return '"' + "".join([escapes[byte] for byte in txt_string]) + '"'
+
+    @staticmethod
+    def get_txt_rdata(value):
+        '''
+        :param value: TXT value.
+        :return: The value as quoted character-strings separated by spaces, as used in zone files and most
+            DNS provider APIs.
+        '''
+        # Most values fit in one string and are printable ASCII, so skip the byte level work for them.
+        if len(value) <= RecordWriter.max_txt_string_length and value.isascii() and value.isprintable():
+            return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+        txt_strings = RecordWriter.split_txt_value(value)
+        return " ".join([RecordWriter.escape_txt_string(txt_string) for txt_string in txt_strings])
+
+    def get_fields(self, record):
+        '''
+        :return: List of the values written by the JSON lines and CSV formats, in the order of fields.
+        '''
+        return [
+            record.kind, record.zone_name, RecordWriter.get_owner_name(record), record.record_type, self.ttl,
+            record.value, RecordWriter.get_txt_rdata(record.value)
+        ]
+
+
+class TextRecordWriter(RecordWriter):
+    '''
+    Writes records in the form shown at the end of the questions, separated by blank lines.
+    '''
+
+    def write_record(self, record):
+        if self.record_count:
+            self.write("\n")
+        self.write(record.to_text() + "\n")
+        self.record_count += 1
+
+
+class ZoneFileRecordWriter(RecordWriter):
+    '''
+    Writes records as BIND zone file lines with fully qualified owner names, so they can be added to any zone
+    file or loaded with tools that read that format.
+    '''
+
+    def write_record(self, record):
+        self.write(
+            RecordWriter.get_owner_name(record) + "\t" + str(self.ttl) + "\tIN\t" + record.record_type + "\t" +
+            RecordWriter.get_txt_rdata(record.value) + "\n"
+        )
+        self.record_count += 1
+
+
+class JsonLinesRecordWriter(RecordWriter):
+    '''
+    Writes one JSON object per record, with the keys in RecordWriter.fields.
+    '''
+
+    def write_record(self, record):
+        self.write(json.dumps(dict(zip(RecordWriter.fields, self.get_fields(record)))) + "\n")
+        self.record_count += 1
+
+
+class CsvRecordWriter(RecordWriter):
+    '''
+    Writes one CSV row per record after a header row of RecordWriter.fields.
+    '''
+
+    def __init__(self, output_file, ttl=RecordWriter.default_ttl, buffer_size=1 << 20):
+        RecordWriter.__init__(self, output_file, ttl, buffer_size)
+        # The csv module writes through write(), so its rows go into the same buffer.
+        self.csv_writer = csv.writer(self)
+        self.csv_writer.writerow(RecordWriter.fields)
+
+    def write_record(self, record):
+        self.csv_writer.writerow(self.get_fields(record))
+        self.record_count += 1
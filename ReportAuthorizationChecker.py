@@ -0,0 +1,202 @@
+import asyncio
+from collections import OrderedDict
+from AsyncDomainAuditor import AsyncDomainAuditor
+from DmarcParser import DmarcParser
+from PublicSuffixList import PublicSuffixList
+
+
+class ReportAuthorization:
+    '''
+    One rua or ruf destination of a domain that lies outside the domain's organizational domain, and
+    whether the receiving domain has published the record that allows it (RFC 7489 section 7.1).
+    status is 'authorized', 'missing', or 'unknown' when the lookup failed.
+    '''
+    __slots__ = ("domain_name", "tag", "uri", "authorization_name", "status")
+
+    fields = list(__slots__)
+
+    def __init__(self, domain_name, tag, uri, authorization_name):
+        self.domain_name = domain_name
+        self.tag = tag
+        self.uri = uri
+        self.authorization_name = authorization_name
+        self.status = "unknown"
+
+    def to_row(self):
+        return [getattr(self, field) for field in ReportAuthorization.__slots__]
+
+
+class ReportAuthorizationChecker:
+    '''
+    Checks many domains for rua/ruf addresses at other organizational domains whose
+    '<domain>._report._dmarc.<report domain>' record is missing. Receivers drop those reports silently.
+    Every distinct authorization name is looked up once, with the lookups of all domains in flight
+    together. Lookups that fail are made again for the next domain that needs them.
+    '''
+
+    def __init__(self, max_in_flight=200, auditor=None, max_lookups=100000):
+        '''
+        :param max_in_flight: Maximum number of DNS queries in flight.
+        :param auditor: Optional AsyncDomainAuditor used to fetch the DMARC records.
+        :param max_lookups: Number of authorization names whose status is kept. The least recently used are
+            dropped first.
+        '''
+        self.auditor = auditor or AsyncDomainAuditor(max_in_flight=max_in_flight)
+        self.public_suffix_list = PublicSuffixList.get_default()
+        self.max_lookups = max_lookups
+        # Authorization name -> the task looking it up while it runs, then its status. Least recently used
+        # first.
+        self.lookups = OrderedDict()
+
+    @staticmethod
+    def get_report_domain(uri):
+        '''
+        :param uri: A rua or ruf URI, for example 'mailto:reports@example.net!10m'.
+        :return: The domain of the address, or '' if the URI is not a mailto address.
+        '''
+        scheme, address, _ = DmarcParser.split_report_uri(uri)
+        if "mailto" != scheme:
+            return ""
+        return address.rpartition("@")[2].lower().rstrip(".")
+
+    def get_authorization_name(self, domain_name, uri):
+        '''
+        :param domain_name: Domain publishing the DMARC record.
+        :param uri: A rua or ruf URI of that record.
+        :return: Name of the authorization record needed, or None if the report stays within the
+            organizational domain and nothing needs to be published.
+        '''
+        report_domain = ReportAuthorizationChecker.get_report_domain(uri)
+        if "" == report_domain:
+            return None
+        get_organizational_domain = self.public_suffix_list.get_organizational_domain
+        if get_organizational_domain(report_domain) == get_organizational_domain(domain_name):
+            return None
+        return domain_name.lower().rstrip(".") + "._report._dmarc." + report_domain
+
+    def get_authorizations(self, domain_name, dmarc_record):
+        '''
+        Lists the external report destinations of a parsed DMARC record, without duplicates.
+        :param domain_name: Domain publishing the record.
+        :param dmarc_record: DmarcRecord as parsed by DomainRecordHandler.
+        :return: List of ReportAuthorization objects with an unknown status.
+        '''
+        authorizations = []
+        seen_names = set()
+        for tag, uris in (("rua", dmarc_record.rua), ("ruf", dmarc_record.ruf)):
+            for uri in uris or []:
+                authorization_name = self.get_authorization_name(domain_name, uri)
+                if authorization_name is not None and (tag, authorization_name) not in seen_names:
+                    seen_names.add((tag, authorization_name))
+                    authorizations.append(ReportAuthorization(domain_name, tag, uri.strip(), authorization_name))
+        return authorizations
+
+    async def lookup_authorization(self, authorization_name):
+        '''
+        Looks up an authorization record. A wildcard record at the report domain is found the same way.
+        :return: 'authorized', 'missing', or 'unknown'.
+        '''
+        # Shares the auditor's query limit, so the DMARC and authorization lookups together stay within
+        # max_in_flight.
+        rcode, records = await self.auditor.get_txt_records(authorization_name)
+        if rcode not in ("NOERROR", "NXDOMAIN"):
+            return "unknown"
+        if any(DmarcParser.is_dmarc_record(record) for record in records):
+            return "authorized"
+        return "missing"
+
+    async def get_status(self, authorization_name):
+        '''
+        Same as lookup_authorization(), but each name is only queried once however many domains need it.
+        Domains that need a name at the same time wait for the same query. An 'unknown' status is not kept,
+        and neither is a lookup that raised, so the next domain needing the name queries it again.
+        '''
+        lookups = self.lookups
+        lookup = lookups.get(authorization_name)
+        if str is type(lookup):
+            lookups.move_to_end(authorization_name)
+            return lookup
+        if lookup is None:
+            lookup = asyncio.ensure_future(self.lookup_authorization(authorization_name))
+            lookups[authorization_name] = lookup
+            if len(lookups) > self.max_lookups:
+                lookups.popitem(last=False)
+        try:
+            status = await asyncio.shield(lookup)
+        except Exception:
+            if lookups.get(authorization_name) is lookup:
+                del lookups[authorization_name]
+            raise
+        if lookups.get(authorization_name) is lookup:
+            if "unknown" == status:
+                del lookups[authorization_name]
+            else:
+                lookups[authorization_name] = status
+        return status
+
+    async def check_domain(self, audit_result):
+        authorizations = []
+        if audit_result.dmarc_record is not None:
+            authorizations = self.get_authorizations(audit_result.domain_name, audit_result.dmarc_record)
+        statuses = await asyncio.gather(
+            *[self.get_status(authorization.authorization_name) for authorization in authorizations]
+        )
+        for authorization, status in zip(authorizations, statuses):
+            authorization.status = status
+        return authorizations
+
+    async def check_domains(self, domain_names):
+        '''
+        Checks the report authorizations of many domains. Checks share the auditor's query limit, and no
+        more than max_in_flight of them run at once, so the domains are audited only as fast as they can be
+        checked.
+        :param domain_names: Iterable of domain names.
+        :return: Asynchronous generator of lists of ReportAuthorization objects, one list per domain, in
+            completion order. Domains with no external report destinations give an empty list.
+        :raises: Any exception raised while reading the domain names or checking a domain.
+        '''
+        # Marks the end of the results. An exception is passed on in place of a domain's results.
+        end_marker = object()
+        finished_domains = asyncio.Queue()
+        running_checks = set()
+        check_slots = asyncio.Semaphore(self.auditor.max_in_flight)
+
+        def finish_check(check):
+            running_checks.discard(check)
+            check_slots.release()
+            if not check.cancelled():
+                finished_domains.put_nowait(check.exception() or check.result())
+
+        async def check_all_domains():
+            audit_results = self.auditor.audit_domains(domain_names)
+            audit_error = None
+            try:
+                async for audit_result in audit_results:
+                    await check_slots.acquire()
+                    running_check = asyncio.ensure_future(self.check_domain(audit_result))
+                    running_checks.add(running_check)
+                    running_check.add_done_callback(finish_check)
+            except Exception as error:
+                # Passed on once the domains already audited have been checked.
+                audit_error = error
+            finally:
+                await audit_results.aclose()
+            if running_checks:
+                await asyncio.wait(list(running_checks))
+            if audit_error is not None:
+                finished_domains.put_nowait(audit_error)
+            finished_domains.put_nowait(end_marker)
+
+        checker_task = asyncio.ensure_future(check_all_domains())
+        try:
+            while True:
+                authorizations = await finished_domains.get()
+                if authorizations is end_marker:
+                    break
+                if isinstance(authorizations, Exception):
+                    raise authorizations
+                yield authorizations
+        finally:
+            checker_task.cancel()
+            for running_check in list(running_checks):
+                running_check.cancel()
@@ -0,0 +1,273 @@
+import datetime
+import sqlite3
+from AggregateReportParser import AggregateReportParser
+from PublicSuffixList import PublicSuffixList
+
+
+class ReportStore:
+    '''
+    Keeps parsed DMARC aggregate report rows in a SQLite database (WAL mode) along with daily rollups that
+    are updated in the same transaction as each batch of rows. Queries read the rollups, so they never
+    scan the raw rows. Rows are keyed by domain_name (the header From domain) and parent_domain_name (its
+    organizational domain), the same way the rest of the tool names domains.
+    '''
+
+    schema = [
+        "CREATE TABLE IF NOT EXISTS reports ("
+        "report_key TEXT PRIMARY KEY, org_name TEXT, report_id TEXT, begin_date INTEGER, end_date INTEGER)",
+        "CREATE TABLE IF NOT EXISTS report_rows ("
+        "report_key TEXT NOT NULL, domain_name TEXT NOT NULL, parent_domain_name TEXT NOT NULL, "
+        "date TEXT NOT NULL, source_ip TEXT NOT NULL, message_count INTEGER NOT NULL, disposition TEXT, "
+        "dkim TEXT, spf TEXT, dkim_domain TEXT, dkim_result TEXT, spf_domain TEXT, spf_result TEXT)",
+        "CREATE INDEX IF NOT EXISTS report_rows_domain ON report_rows (domain_name, date)",
+        "CREATE INDEX IF NOT EXISTS report_rows_parent_domain ON report_rows (parent_domain_name, date)",
+        "CREATE INDEX IF NOT EXISTS report_rows_source_ip ON report_rows (source_ip, date)",
+        "CREATE INDEX IF NOT EXISTS report_rows_date ON report_rows (date)",
+        "CREATE INDEX IF NOT EXISTS report_rows_report_key ON report_rows (report_key)",
+        "CREATE TABLE IF NOT EXISTS daily_domain_rollups ("
+        "domain_name TEXT NOT NULL, date TEXT NOT NULL, parent_domain_name TEXT NOT NULL, "
+        "message_count INTEGER NOT NULL, failing_count INTEGER NOT NULL, dkim_pass_count INTEGER NOT NULL, "
+        "spf_pass_count INTEGER NOT NULL, quarantine_count INTEGER NOT NULL, reject_count INTEGER NOT NULL, "
+        "PRIMARY KEY (domain_name, date))",
+        "CREATE INDEX IF NOT EXISTS daily_domain_rollups_parent ON daily_domain_rollups (parent_domain_name, date)",
+        "CREATE TABLE IF NOT EXISTS daily_source_rollups ("
+        "domain_name TEXT NOT NULL, date TEXT NOT NULL, source_ip TEXT NOT NULL, "
+        "parent_domain_name TEXT NOT NULL, message_count INTEGER NOT NULL, failing_count INTEGER NOT NULL, "
+        "PRIMARY KEY (domain_name, date, source_ip))",
+        "CREATE INDEX IF NOT EXISTS daily_source_rollups_parent ON daily_source_rollups (parent_domain_name, date)",
+        "CREATE INDEX IF NOT EXISTS daily_source_rollups_source_ip ON daily_source_rollups (source_ip, date)",
+    ]
+
+    domain_rollup_upsert = (
+        "INSERT INTO daily_domain_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (domain_name, date) DO UPDATE SET "
+        "message_count = message_count + excluded.message_count, "
+        "failing_count = failing_count + excluded.failing_count, "
+        "dkim_pass_count = dkim_pass_count + excluded.dkim_pass_count, "
+        "spf_pass_count = spf_pass_count + excluded.spf_pass_count, "
+        "quarantine_count = quarantine_count + excluded.quarantine_count, "
+        "reject_count = reject_count + excluded.reject_count"
+    )
+
+    source_rollup_upsert = (
+        "INSERT INTO daily_source_rollups VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (domain_name, date, source_ip) DO UPDATE SET "
+        "message_count = message_count + excluded.message_count, "
+        "failing_count = failing_count + excluded.failing_count"
+    )
+
+    def __init__(self, path, batch_size=5000):
+        '''
+        :param path: File name of the SQLite database. It is created if it does not exist.
+        :param batch_size: Number of rows written in each transaction.
+        '''
+        self.batch_size = batch_size
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            for statement in ReportStore.schema:
+                self.connection.execute(statement)
+        self.public_suffix_list = PublicSuffixList.get_default()
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def get_date(timestamp):
+        return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime("%Y-%m-%d")
+
+    def import_report_file(self, file_name):
+        '''
+        Adds every record of a report file to the store. Reports already in the store, recognised by their
+        organization name and report ID, are skipped so the same file can be imported twice safely.
+        :param file_name: Path of a .xml, .gz, or .zip report.
+        :return: Number of rows added.
+        '''
+        return self.import_rows(AggregateReportParser.read_file(file_name))
+
+    def import_rows(self, report_rows):
+        '''
+        Adds AggregateReportRow objects to the store in batches. The rows of each report must come one after
+        another, as the parser gives them. A report is only recorded as imported in the same transaction as
+        its last row, so a report that could not be read to the end is imported again in full next time.
+        :param report_rows: Iterable of AggregateReportRow objects.
+        :return: Number of rows added.
+        '''
+        batch = []
+        # Reports whose last row is in the batch, and the report whose rows are being read.
+        finished_reports = []
+        current_report = None
+        skipped_report_keys = set()
+        known_report_keys = set()
+        added_row_count = 0
+        for row in report_rows:
+            report_key = row.org_name + "!" + row.report_id
+            if report_key in skipped_report_keys:
+                continue
+            if report_key not in known_report_keys:
+                if self.connection.execute("SELECT 1 FROM reports WHERE report_key = ?", (report_key,)).fetchone():
+                    skipped_report_keys.add(report_key)
+                    continue
+                known_report_keys.add(report_key)
+                self.remove_partial_report(report_key)
+                if current_report is not None:
+                    finished_reports.append(current_report)
+                current_report = (report_key, row.org_name, row.report_id, row.begin_date, row.end_date)
+            batch.append((report_key, row))
+            if len(batch) >= self.batch_size:
+                added_row_count += self.write_batch(batch, finished_reports)
+                batch = []
+                finished_reports = []
+        if current_report is not None:
+            finished_reports.append(current_report)
+        if batch or finished_reports:
+            added_row_count += self.write_batch(batch, finished_reports)
+        return added_row_count
+
+    def remove_partial_report(self, report_key):
+        '''
+        Removes the rows an earlier, unfinished import of a report wrote, and takes them out of the daily
+        rollups, so the report can be imported again without counting them twice.
+        :param report_key: Key of a report not recorded as imported.
+        :return: Number of rows removed.
+        '''
+        raw_rows = self.connection.execute(
+            "SELECT domain_name, parent_domain_name, date, source_ip, message_count, disposition, dkim, spf "
+            "FROM report_rows WHERE report_key = ?", (report_key,)
+        ).fetchall()
+        if not raw_rows:
+            return 0
+        domain_rollups = {}
+        source_rollups = {}
+        for domain_name, parent_domain_name, date, source_ip, count, disposition, dkim, spf in raw_rows:
+            ReportStore.add_to_rollups(domain_rollups, source_rollups, domain_name, parent_domain_name, date,
+                                       source_ip, -count, disposition, dkim, spf)
+        with self.connection:
+            self.connection.execute("DELETE FROM report_rows WHERE report_key = ?", (report_key,))
+            self.write_rollups(domain_rollups, source_rollups)
+            # Rollups that only held these rows would otherwise be left behind with nothing in them.
+            self.connection.executemany(
+                "DELETE FROM daily_domain_rollups WHERE domain_name = ? AND date = ? AND message_count = 0",
+                list(domain_rollups)
+            )
+            self.connection.executemany(
+                "DELETE FROM daily_source_rollups WHERE domain_name = ? AND date = ? AND source_ip = ? "
+                "AND message_count = 0", list(source_rollups)
+            )
+        return len(raw_rows)
+
+    @staticmethod
+    def add_to_rollups(domain_rollups, source_rollups, domain_name, parent_domain_name, date, source_ip, count,
+                       disposition, dkim, spf):
+        '''
+        Adds the message count of one report row to the daily rollups being built for a transaction.
+        :param domain_rollups: Dictionary of (domain, date) -> list of the parent domain and the counts.
+        :param source_rollups: Dictionary of (domain, date, source IP) -> list of the parent domain and the
+            counts.
+        :param count: Number of messages, negative to take a row out of the rollups.
+        :return: None.
+        '''
+        # DMARC fails when neither DKIM nor SPF passed with alignment.
+        failing_count = count if "pass" != dkim and "pass" != spf else 0
+        domain_rollup = domain_rollups.get((domain_name, date))
+        if domain_rollup is None:
+            domain_rollup = domain_rollups[(domain_name, date)] = [parent_domain_name, 0, 0, 0, 0, 0, 0]
+        domain_rollup[1] += count
+        domain_rollup[2] += failing_count
+        domain_rollup[3] += count if "pass" == dkim else 0
+        domain_rollup[4] += count if "pass" == spf else 0
+        domain_rollup[5] += count if "quarantine" == disposition else 0
+        domain_rollup[6] += count if "reject" == disposition else 0
+        source_rollup = source_rollups.get((domain_name, date, source_ip))
+        if source_rollup is None:
+            source_rollup = source_rollups[(domain_name, date, source_ip)] = [parent_domain_name, 0, 0]
+        source_rollup[1] += count
+        source_rollup[2] += failing_count
+
+    def write_rollups(self, domain_rollups, source_rollups):
+        '''
+        Adds rollups built by add_to_rollups() to the stored ones. Must be called inside a transaction.
+        :return: None.
+        '''
+        self.connection.executemany(
+            ReportStore.domain_rollup_upsert,
+            [key + tuple(values) for key, values in domain_rollups.items()]
+        )
+        self.connection.executemany(
+            ReportStore.source_rollup_upsert,
+            [key + tuple(values) for key, values in source_rollups.items()]
+        )
+
+    def write_batch(self, batch, new_reports):
+        '''
+        Writes a batch of rows and folds them into the daily rollups in one transaction.
+        :param batch: List of (report key, AggregateReportRow) tuples.
+        :param new_reports: List of report tuples whose last row is in this batch.
+        :return: Number of rows written.
+        '''
+        get_organizational_domain = self.public_suffix_list.get_organizational_domain
+        raw_rows = []
+        domain_rollups = {}
+        source_rollups = {}
+        for report_key, row in batch:
+            domain_name = row.header_from or row.domain
+            parent_domain_name = get_organizational_domain(domain_name) if domain_name else ""
+            date = ReportStore.get_date(row.begin_date)
+            raw_rows.append((
+                report_key, domain_name, parent_domain_name, date, row.source_ip, row.count, row.disposition,
+                row.dkim, row.spf, row.dkim_domain, row.dkim_result, row.spf_domain, row.spf_result
+            ))
+            ReportStore.add_to_rollups(domain_rollups, source_rollups, domain_name, parent_domain_name, date,
+                                       row.source_ip, row.count, row.disposition, row.dkim, row.spf)
+
+        with self.connection:
+            self.connection.executemany("INSERT INTO reports VALUES (?, ?, ?, ?, ?)", new_reports)
+            self.connection.executemany(
+                "INSERT INTO report_rows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", raw_rows
+            )
+            self.write_rollups(domain_rollups, source_rollups)
+        return len(raw_rows)
+
+    @staticmethod
+    def get_start_date(days):
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        return (today - datetime.timedelta(days=days - 1)).strftime("%Y-%m-%d")
+
+    @staticmethod
+    def get_domain_column(include_subdomains):
+        return "parent_domain_name" if include_subdomains else "domain_name"
+
+    def get_top_failing_sources(self, domain_name, days=7, limit=10, include_subdomains=False):
+        '''
+        Lists the source IPs with the most messages failing DMARC for a domain.
+        :param domain_name: Domain to look at.
+        :param days: Number of days back from today, including today.
+        :param limit: Maximum number of source IPs returned.
+        :param include_subdomains: If True, domain_name is treated as a parent domain and its subdomains are
+            included.
+        :return: List of (source IP, failing message count, total message count) tuples.
+        '''
+        domain_column = ReportStore.get_domain_column(include_subdomains)
+        return self.connection.execute(
+            "SELECT source_ip, SUM(failing_count) AS failing, SUM(message_count) FROM daily_source_rollups "
+            "WHERE " + domain_column + " = ? AND date >= ? GROUP BY source_ip HAVING failing > 0 "
+            "ORDER BY failing DESC LIMIT ?",
+            (domain_name.lower(), ReportStore.get_start_date(days), limit)
+        ).fetchall()
+
+    def get_daily_summary(self, domain_name, days=7, include_subdomains=False):
+        '''
+        Totals the messages reported for a domain for each day.
+        :param domain_name: Domain to look at.
+        :param days: Number of days back from today, including today.
+        :param include_subdomains: If True, domain_name is treated as a parent domain.
+        :return: List of (date, messages, failing, DKIM pass, SPF pass, quarantined, rejected) tuples.
+        '''
+        domain_column = ReportStore.get_domain_column(include_subdomains)
+        return self.connection.execute(
+            "SELECT date, SUM(message_count), SUM(failing_count), SUM(dkim_pass_count), SUM(spf_pass_count), "
+            "SUM(quarantine_count), SUM(reject_count) FROM daily_domain_rollups "
+            "WHERE " + domain_column + " = ? AND date >= ? GROUP BY date ORDER BY date",
+            (domain_name.lower(), ReportStore.get_start_date(days))
+        ).fetchall()
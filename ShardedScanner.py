@@ -0,0 +1,287 @@
+import asyncio
+import csv
+import glob
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing.util import Finalize
+from AsyncDomainAuditor import AsyncDomainAuditor, DomainAuditResult
+from DnsCache import DnsCache
+from DomainRecordHandler import DomainRecordHandler
+from LookupMetrics import LookupMetrics
+from NameserverScheduler import NameserverScheduler
+from QueryEngine import QueryEngine
+
+# Event loop and auditor kept for the life of each worker process.
+worker_event_loop = None
+worker_auditor = None
+
+
+def get_worker_cache_prefix(cache_file_name, scanner_process_id):
+    '''
+    :param cache_file_name: On-disk DNS cache shared by all workers.
+    :param scanner_process_id: Process ID of the scan that started the workers.
+    :return: Start of the file names of the workers' own on-disk DNS caches, each followed by the worker's
+        process ID.
+    '''
+    return cache_file_name + "-scan" + str(scanner_process_id) + "-worker-"
+
+
+def start_worker(max_in_flight, cache_file_name, query_engine_options, scheduler_options, metrics_options):
+    '''
+    Sets up a worker process with its own event loop, query engine, and auditor.
+    :param max_in_flight: Maximum number of DNS queries in flight in this worker.
+    :param cache_file_name: Optional on-disk DNS cache shared by all workers. Workers only read it, and write
+        new answers to a cache file of their own that the scan merges into it when done, so the shared file
+        has a single writer.
+    :param query_engine_options: Optional dictionary of QueryEngine arguments. The stub resolver is used if
+        not given.
+    :param scheduler_options: Optional dictionary of NameserverScheduler arguments. If given along with
+        query_engine_options, the worker's queries go through a NameserverScheduler of its own.
+    :param metrics_options: Optional dictionary of LookupMetrics.from_options() arguments. Each worker writes
+        files of its own, named with its process ID.
+    :return: None.
+    '''
+    global worker_event_loop
+    global worker_auditor
+    if cache_file_name:
+        worker_cache_file_name = get_worker_cache_prefix(cache_file_name, os.getppid()) + str(os.getpid())
+        DomainRecordHandler.dns_cache = DnsCache(path=worker_cache_file_name, shared_path=cache_file_name)
+        # Pool workers leave without running atexit handlers, so close the cache when multiprocessing
+        # finalizes the worker instead.
+        Finalize(None, DomainRecordHandler.dns_cache.close, exitpriority=10)
+    if metrics_options:
+        metrics = LookupMetrics.from_options(file_name_suffix="-" + str(os.getpid()), **metrics_options)
+        DomainRecordHandler.dns_cache.metrics = metrics
+        Finalize(None, metrics.close, exitpriority=10)
+    worker_event_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(worker_event_loop)
+    resolver = None
+    if query_engine_options is not None:
+        resolver = QueryEngine(**query_engine_options)
+        if scheduler_options is not None:
+            resolver = NameserverScheduler(resolver, **scheduler_options)
+    worker_auditor = AsyncDomainAuditor(max_in_flight=max_in_flight, resolver=resolver)
+
+
+def scan_shard(shard_number, domain_names, shard_file_name):
+    '''
+    Audits one shard of domains in a worker process and writes its rows to a file of its own. The file is
+    written under a temporary name and renamed when complete, so a partly written shard is never
+    mistaken for a finished one.
+    :param shard_number: Position of the shard in the input.
+    :param domain_names: List of domain names in the shard.
+    :param shard_file_name: File the shard's CSV rows are written to.
+    :return: Tuple of the shard number and the number of rows written.
+    '''
+    async def audit():
+        rows = []
+        async for result in worker_auditor.audit_domains(domain_names):
+            rows.append(result.to_row())
+        return rows
+
+    rows = worker_event_loop.run_until_complete(audit())
+    temporary_file_name = shard_file_name + ".tmp"
+    with open(temporary_file_name, "w", newline="") as shard_file:
+        csv.writer(shard_file).writerows(rows)
+    os.replace(temporary_file_name, shard_file_name)
+    return shard_number, len(rows)
+
+
+class ShardedScanner:
+    '''
+    Audits very large domain lists by splitting them into shards that are spread across a process pool,
+    each worker running its own event loop. Finished shards are recorded in a checkpoint file so a run
+    that is stopped can be started again without redoing them.
+    '''
+
+    checkpoint_file_name = "checkpoint.json"
+    results_file_name = "results.csv"
+
+    def __init__(self, output_directory, workers=None, shard_size=10000, max_in_flight=200,
+                 cache_file_name=None, query_engine_options=None, scheduler_options=None, metrics_options=None):
+        '''
+        :param output_directory: Directory for shard files, the checkpoint, and the merged results.
+        :param workers: Number of worker processes. Defaults to the number of CPUs.
+        :param shard_size: Number of domains in each shard.
+        :param max_in_flight: Maximum number of DNS queries in flight in each worker.
+        :param cache_file_name: Optional on-disk DNS cache shared by all workers.
+        :param query_engine_options: Optional dictionary of QueryEngine arguments used by every worker.
+        :param scheduler_options: Optional dictionary of NameserverScheduler arguments used by every worker.
+        :param metrics_options: Optional dictionary of LookupMetrics.from_options() arguments used by every
+            worker.
+        '''
+        self.output_directory = output_directory
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_size = shard_size
+        self.max_in_flight = max_in_flight
+        self.cache_file_name = cache_file_name
+        self.query_engine_options = query_engine_options
+        self.scheduler_options = scheduler_options
+        self.metrics_options = metrics_options
+        self.completed_shards = set()
+
+    def get_shard_file_name(self, shard_number):
+        return os.path.join(self.output_directory, "shard-" + format(shard_number, "06d") + ".csv")
+
+    @staticmethod
+    def get_input_signature(domain_file_name, domain_list_options=None):
+        '''
+        Identifies the input so a checkpoint is only reused for the same input read the same way. Options
+        such as keeping repeated names change which names land in each shard.
+        :param domain_file_name: Input file name.
+        :param domain_list_options: Optional dictionary of the DomainListReader arguments the input is read
+            with.
+        :return: Dictionary of the file's size and modification time and the reader options.
+        '''
+        file_status = os.stat(domain_file_name)
+        return {
+            "size": file_status.st_size, "mtime": file_status.st_mtime,
+            "domain_list_options": domain_list_options or {}
+        }
+
+    def load_checkpoint(self, input_signature):
+        '''
+        Reads the completed shard numbers from a previous run of the same input, read the same way, and shard
+        size.
+        :param input_signature: Signature of the current input file.
+        :return: None.
+        '''
+        checkpoint_path = os.path.join(self.output_directory, ShardedScanner.checkpoint_file_name)
+        self.completed_shards = set()
+        if not os.path.exists(checkpoint_path):
+            return
+        with open(checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint.get("input") != input_signature or checkpoint.get("shard_size") != self.shard_size:
+            print("Checkpoint is for a different input, reading options, or shard size. "
+                  "Starting from the beginning.")
+            return
+        # Only trust shards whose files are still present.
+        self.completed_shards = {
+            shard_number for shard_number in checkpoint["completed_shards"]
+            if os.path.exists(self.get_shard_file_name(shard_number))
+        }
+
+    def save_checkpoint(self, input_signature):
+        checkpoint_path = os.path.join(self.output_directory, ShardedScanner.checkpoint_file_name)
+        checkpoint = {
+            "input": input_signature,
+            "shard_size": self.shard_size,
+            "completed_shards": sorted(self.completed_shards)
+        }
+        with open(checkpoint_path + ".tmp", "w") as checkpoint_file:
+            json.dump(checkpoint, checkpoint_file)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    def read_shards(self, domain_names):
+        '''
+        Groups domain names into numbered shards.
+        :param domain_names: Iterable of domain names.
+        :return: Generator of (shard number, list of domain names) tuples.
+        '''
+        shard = []
+        shard_number = 0
+        for domain_name in domain_names:
+            shard.append(domain_name)
+            if len(shard) == self.shard_size:
+                yield shard_number, shard
+                shard = []
+                shard_number += 1
+        if shard:
+            yield shard_number, shard
+
+    def scan(self, domain_file_name, domain_names, domain_list_options=None):
+        '''
+        Audits every domain, skipping shards finished by an earlier run, then merges the shard files.
+        :param domain_file_name: Input file name, used to recognise a matching checkpoint.
+        :param domain_names: Iterable of the domain names read from the input file.
+        :param domain_list_options: Optional dictionary of the DomainListReader arguments domain_names was read
+            with, used to recognise a matching checkpoint.
+        :return: Path of the merged results file.
+        '''
+        os.makedirs(self.output_directory, exist_ok=True)
+        input_signature = ShardedScanner.get_input_signature(domain_file_name, domain_list_options)
+        self.load_checkpoint(input_signature)
+        if self.completed_shards:
+            print("Resuming. " + str(len(self.completed_shards)) + " shards were already complete.")
+
+        shard_count = 0
+        dns_cache = None
+        if self.cache_file_name:
+            # Creates the shared cache file, if needed, before the workers look for it.
+            dns_cache = DnsCache(path=self.cache_file_name)
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=start_worker,
+                                     initargs=(self.max_in_flight, self.cache_file_name, self.query_engine_options,
+                                               self.scheduler_options, self.metrics_options)) as executor:
+                running_shards = set()
+                for shard_number, shard in self.read_shards(domain_names):
+                    shard_count = shard_number + 1
+                    if shard_number in self.completed_shards:
+                        continue
+                    # Keep only a couple of shards queued per worker so the input is not read ahead into memory.
+                    while len(running_shards) >= self.workers * 2:
+                        running_shards = self.collect_finished_shards(running_shards, input_signature)
+                    running_shards.add(
+                        executor.submit(scan_shard, shard_number, shard, self.get_shard_file_name(shard_number))
+                    )
+                while running_shards:
+                    running_shards = self.collect_finished_shards(running_shards, input_signature)
+        finally:
+            if dns_cache is not None:
+                self.merge_worker_caches(dns_cache)
+                dns_cache.close()
+        return self.merge_shards(shard_count)
+
+    def merge_worker_caches(self, dns_cache):
+        '''
+        Copies the answers the workers cached into the shared on-disk cache and removes the workers' files.
+        The worker processes must have exited.
+        :param dns_cache: DnsCache of the shared on-disk cache.
+        :return: None.
+        '''
+        worker_cache_prefix = get_worker_cache_prefix(self.cache_file_name, os.getpid())
+        for worker_cache_file_name in glob.glob(glob.escape(worker_cache_prefix) + "*"):
+            if not worker_cache_file_name[len(worker_cache_prefix):].isdigit():
+                # The SQLite journal files of a worker's cache.
+                continue
+            dns_cache.merge_disk_store(worker_cache_file_name)
+            for file_name in (worker_cache_file_name, worker_cache_file_name + "-wal",
+                              worker_cache_file_name + "-shm"):
+                if os.path.exists(file_name):
+                    os.remove(file_name)
+
+    def collect_finished_shards(self, running_shards, input_signature):
+        '''
+        Waits for at least one shard to finish and records it in the checkpoint.
+        :param running_shards: Set of futures for shards still running.
+        :param input_signature: Signature of the input file, saved with the checkpoint.
+        :return: Set of futures still running.
+        '''
+        finished_shards, running_shards = wait(running_shards, return_when=FIRST_COMPLETED)
+        for finished_shard in finished_shards:
+            shard_number, row_count = finished_shard.result()
+            self.completed_shards.add(shard_number)
+            print("Shard " + str(shard_number) + " complete (" + str(row_count) + " domains).")
+        self.save_checkpoint(input_signature)
+        return running_shards
+
+    def merge_shards(self, shard_count):
+        '''
+        Joins the shard files into one results file. Shards are independent, so their rows are copied as
+        blocks in shard order.
+        :param shard_count: Number of shards in the input.
+        :return: Path of the merged results file.
+        '''
+        results_path = os.path.join(self.output_directory, ShardedScanner.results_file_name)
+        with open(results_path, "w", newline="") as results_file:
+            csv.writer(results_file).writerow(DomainAuditResult.fields)
+            for shard_number in range(shard_count):
+                with open(self.get_shard_file_name(shard_number), newline="") as shard_file:
+                    while True:
+                        block = shard_file.read(1 << 20)
+                        if not block:
+                            break
+                        results_file.write(block)
+        return results_path
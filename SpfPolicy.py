@@ -0,0 +1,249 @@
+import socket
+import weakref
+from SpfResolver import SpfResolver
+
+
+class SpfPolicy:
+    '''
+    A domain's resolved SPF tree compiled into one binary prefix trie per address family, giving the RFC 7208
+    check_host() result of any sending IP by following at most one trie node per address bit instead of
+    walking the mechanisms, includes, and redirects again. Compile once per domain, then check any number of
+    IPs against it.
+
+    Each trie node is either a result text (every address below it gets that result) or a two item list
+    holding the subtries for a 0 and a 1 bit. Results are 'pass', 'fail', 'softfail', 'neutral', 'none',
+    'permerror', and 'temperror', plus 'unknown' for addresses whose evaluation reaches a ptr, exists, or
+    macro term, which can only be evaluated per message.
+    '''
+
+    qualifier_results = {"+": "pass", "-": "fail", "~": "softfail", "?": "neutral"}
+    # Results of an included record that end evaluation of the including record as well (RFC 7208 section
+    # 5.2). 'unknown' is passed on the same way, since whether the include matches is not known.
+    include_error_results = ("permerror", "temperror", "unknown")
+    address_bits = {4: 32, 6: 128}
+
+    # SpfNode -> {lookups made before it: compiled tries} of an included or redirected record, shared by all
+    # policies, since the resolved nodes they come from are shared too. Tries are dropped along with their
+    # node, so they expire with its DNS answers and are bounded by SpfResolver.max_shared_nodes.
+    shared_tries = weakref.WeakKeyDictionary()
+
+    def __init__(self, node):
+        '''
+        :param node: SpfNode resolved by SpfResolver.
+        '''
+        self.domain_name = node.domain_name
+        self.node = node
+        self.tries = SpfPolicy.compile_node(node, 0, True)
+        self.address_cache = {}
+
+    @staticmethod
+    def normalize(children):
+        '''
+        :param children: Subtries for a 0 and a 1 bit.
+        :return: A single result if both subtries are that same result, otherwise the list.
+        '''
+        if children[0] == children[1] and str is type(children[0]):
+            return children[0]
+        return children
+
+    @staticmethod
+    def add_network(trie, network, result):
+        '''
+        Gives every address in a network the same result, replacing what the trie held for them.
+        :param trie: Trie of the network's address family.
+        :param network: ipaddress network.
+        :param result: Result text.
+        :return: New trie. The trie given is not changed, since parts of it may be shared.
+        '''
+        total_bits = SpfPolicy.address_bits[network.version]
+        network_value = int(network.network_address)
+
+        def set_prefix(subtrie, depth):
+            if depth == network.prefixlen:
+                return result
+            bit = (network_value >> (total_bits - 1 - depth)) & 1
+            children = [subtrie, subtrie] if str is type(subtrie) else list(subtrie)
+            children[bit] = set_prefix(children[bit], depth + 1)
+            return SpfPolicy.normalize(children)
+
+        return set_prefix(trie, 0)
+
+    @staticmethod
+    def add_include(included_trie, trie, result):
+        '''
+        Puts an include mechanism in front of the rest of a record. Addresses the included record passes get
+        the include's result, addresses it gives an error get that error, and the rest are decided by the
+        mechanisms after the include.
+        :param included_trie: Trie of the included record.
+        :param trie: Trie of the mechanisms after the include.
+        :param result: Result of the include's qualifier.
+        :return: New trie.
+        '''
+        if str is type(included_trie):
+            if "pass" == included_trie:
+                return result
+            if included_trie in SpfPolicy.include_error_results:
+                return included_trie
+            return trie
+        children = [trie, trie] if str is type(trie) else trie
+        return SpfPolicy.normalize([
+            SpfPolicy.add_include(included_trie[0], children[0], result),
+            SpfPolicy.add_include(included_trie[1], children[1], result),
+        ])
+
+    @staticmethod
+    def compile_node(node, lookup_count, is_top_level=False):
+        '''
+        Builds the tries of one record. Mechanisms are added last to first, so each one replaces the result of
+        the mechanisms after it for the addresses it matches, and the first match wins as in check_host().
+        :param node: Resolved SpfNode.
+        :param lookup_count: DNS lookups already made when evaluation of the record starts. Mechanisms
+            reached after the lookup limit is passed give permerror.
+        :param is_top_level: False for an include or redirect target, where a missing record is a permerror.
+        :return: Tuple of the IPv4 and IPv6 tries.
+        '''
+        if "" == node.record:
+            if node.failed_lookup_count:
+                return "temperror", "temperror"
+            return ("none", "none") if is_top_level else ("permerror", "permerror")
+        if node.is_invalid:
+            return "permerror", "permerror"
+
+        # Lookups made once each mechanism has been reached, counting the mechanism's own lookup.
+        mechanism_lookup_counts = []
+        for mechanism in node.mechanisms:
+            if mechanism.name in SpfResolver.lookup_mechanisms:
+                lookup_count += 1
+            mechanism_lookup_counts.append(lookup_count)
+            if mechanism.child is not None:
+                lookup_count += mechanism.child.lookup_count
+
+        # What happens when no mechanism matches (RFC 7208 section 6.1).
+        if "" == node.redirect_name:
+            ip4_trie = ip6_trie = "neutral"
+        elif lookup_count + 1 > SpfResolver.lookup_limit:
+            ip4_trie = ip6_trie = "permerror"
+        elif "%" in node.redirect_name:
+            ip4_trie = ip6_trie = "unknown"
+        elif node.redirect is None:
+            # The redirect target is part of a loop.
+            ip4_trie = ip6_trie = "permerror"
+        else:
+            ip4_trie, ip6_trie = SpfPolicy.compile_child(node.redirect, lookup_count + 1)
+
+        for mechanism, mechanism_lookup_count in zip(reversed(node.mechanisms), reversed(mechanism_lookup_counts)):
+            result = SpfPolicy.qualifier_results[mechanism.qualifier]
+            if mechanism_lookup_count > SpfResolver.lookup_limit:
+                ip4_trie = ip6_trie = "permerror"
+            elif "all" == mechanism.name:
+                ip4_trie = ip6_trie = result
+            elif mechanism.name in ("ptr", "exists") or "%" in mechanism.value:
+                ip4_trie = ip6_trie = "unknown"
+            elif "include" == mechanism.name:
+                if mechanism.child is None:
+                    ip4_trie = ip6_trie = "permerror"
+                else:
+                    included_ip4_trie, included_ip6_trie = SpfPolicy.compile_child(
+                        mechanism.child, mechanism_lookup_count
+                    )
+                    ip4_trie = SpfPolicy.add_include(included_ip4_trie, ip4_trie, result)
+                    ip6_trie = SpfPolicy.add_include(included_ip6_trie, ip6_trie, result)
+            elif mechanism.lookup_failed:
+                ip4_trie = ip6_trie = "temperror"
+            else:
+                for network in mechanism.networks:
+                    if 4 == network.version:
+                        ip4_trie = SpfPolicy.add_network(ip4_trie, network, result)
+                    else:
+                        ip6_trie = SpfPolicy.add_network(ip6_trie, network, result)
+        return ip4_trie, ip6_trie
+
+    @staticmethod
+    def compile_child(node, lookup_count):
+        '''
+        :return: Tuple of the IPv4 and IPv6 tries of an include or redirect target, compiled only once for
+            each number of lookups made before it.
+        '''
+        node_tries = SpfPolicy.shared_tries.get(node)
+        if node_tries is None:
+            node_tries = SpfPolicy.shared_tries[node] = {}
+        tries = node_tries.get(lookup_count)
+        if tries is None:
+            tries = node_tries[lookup_count] = SpfPolicy.compile_node(node, lookup_count)
+        return tries
+
+    @staticmethod
+    def parse_address(ip_address):
+        '''
+        :param ip_address: IPv4 or IPv6 address text.
+        :return: Tuple of the address family (4 or 6) and the address as an integer. IPv4-mapped IPv6
+            addresses are treated as IPv4 (RFC 7208 section 5).
+        :raises ValueError: If the text is not an IP address.
+        '''
+        try:
+            return 4, int.from_bytes(socket.inet_pton(socket.AF_INET, ip_address), "big")
+        except OSError:
+            pass
+        try:
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip_address.split("%")[0]), "big")
+        except OSError:
+            raise ValueError("'" + ip_address + "' is not an IP address.")
+        if 0xffff == value >> 32:
+            return 4, value & 0xffffffff
+        return 6, value
+
+    def lookup(self, version, value):
+        '''
+        :param version: Address family, 4 or 6.
+        :param value: Address as an integer.
+        :return: Result text.
+        '''
+        subtrie = self.tries[0] if 4 == version else self.tries[1]
+        shift = SpfPolicy.address_bits[version] - 1
+        while str is not type(subtrie):
+            subtrie = subtrie[(value >> shift) & 1]
+            shift -= 1
+        return subtrie
+
+    def check_host(self, ip_address):
+        '''
+        :param ip_address: Sending IP address text.
+        :return: Result text.
+        :raises ValueError: If the text is not an IP address.
+        '''
+        return self.lookup(*SpfPolicy.parse_address(ip_address.strip()))
+
+    def check_hosts(self, ip_addresses):
+        '''
+        Checks a column of sending IPs, such as the source_ip values of aggregate reports, where the same
+        address usually appears many times.
+        :param ip_addresses: Iterable of IP address texts.
+        :return: Generator of (IP address, result text) tuples. Text that is not an IP address gets
+            'invalid'.
+        '''
+        address_cache = self.address_cache
+        for ip_address in ip_addresses:
+            result = address_cache.get(ip_address)
+            if result is None:
+                try:
+                    result = self.check_host(ip_address)
+                except ValueError:
+                    result = "invalid"
+                # Caching every address would grow without limit on a large enough column.
+                if len(address_cache) < 1 << 20:
+                    address_cache[ip_address] = result
+            yield ip_address, result
+
+    def get_prefix_count(self):
+        '''
+        :return: Number of prefixes holding a result, over both tries.
+        '''
+        count = 0
+        pending = list(self.tries)
+        while pending:
+            subtrie = pending.pop()
+            if str is type(subtrie):
+                count += 1
+            else:
+                pending.extend(subtrie)
+        return count
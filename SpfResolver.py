@@ -0,0 +1,423 @@
+import ipaddress
+import sys
+import time
+from collections import OrderedDict
+from DmarcParser import DmarcParser
+from DomainRecordHandler import DomainRecordHandler
+
+try:
+    import dns.exception
+    import dns.resolver
+except ModuleNotFoundError:
+    print("Error: The 'dnspython' library could not be found. Please install and try again.")
+    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+
+
+class SpfMechanism:
+    '''
+    One term of an SPF record, for example '-ip4:192.0.2.0/24' or 'include:_spf.example.com'.
+    '''
+    __slots__ = ("qualifier", "name", "value", "cidr", "networks", "child", "lookup_failed")
+
+    def __init__(self, qualifier, name, value, cidr=""):
+        self.qualifier = qualifier
+        self.name = name
+        self.value = value
+        # CIDR lengths given straight after the name, as in 'a/24' or 'mx//64'.
+        self.cidr = cidr
+        # Resolved ipaddress networks for ip4, ip6, a, and mx.
+        self.networks = []
+        # SpfNode of the target domain for include.
+        self.child = None
+        # True when a lookup needed by an a or mx mechanism failed, so its networks may be incomplete.
+        self.lookup_failed = False
+
+    def to_text(self):
+        text = ("" if "+" == self.qualifier else self.qualifier) + self.name
+        if "" != self.value:
+            text += ":" + self.value
+        return text + self.cidr
+
+
+class SpfNode:
+    '''
+    The SPF record of one domain with everything it refers to resolved.
+    lookup_count and void_lookup_count cover the whole tree below this domain, counted the way RFC 7208
+    section 4.6.4 does when every mechanism has to be evaluated.
+    '''
+
+    def __init__(self, domain_name):
+        self.domain_name = domain_name
+        self.record = ""
+        self.mechanisms = []
+        # Target of the redirect modifier, and its SpfNode once resolved.
+        self.redirect_name = ""
+        self.redirect = None
+        self.lookup_count = 0
+        self.void_lookup_count = 0
+        self.errors = []
+        # True when the tree uses macros or mechanisms that can only be evaluated per message.
+        self.has_dynamic_terms = False
+        # True when this record itself has a syntax error or there is more than one record, which makes
+        # check_host() give permerror.
+        self.is_invalid = False
+        # Number of this node's DNS lookups that failed rather than giving an answer.
+        self.failed_lookup_count = 0
+        # Time the first of the DNS answers the tree was resolved from expires. 0 if a lookup in the tree failed.
+        self.expires = float("inf")
+
+
+class SpfResolver:
+    '''
+    Fetches a domain's SPF record and recursively resolves include, redirect, a, mx, and exists.
+    Resolved domains are kept in shared_nodes, so a provider included by thousands of domains is
+    only resolved once while its DNS answers are cached. Trees in which a lookup failed are not kept.
+    '''
+
+    lookup_limit = 10
+    void_lookup_limit = 2
+    # RFC 7208 section 4.6.4 limits the address lookups made for a single mx mechanism.
+    mx_address_limit = 10
+    lookup_mechanisms = ("include", "a", "mx", "ptr", "exists")
+
+    # Domain name -> SpfNode of the domains resolved so far, shared by all resolvers. Least recently used first.
+    shared_nodes = OrderedDict()
+    max_shared_nodes = 100000
+
+    def __init__(self, dns_cache=None):
+        '''
+        :param dns_cache: Optional DnsCache. The cache shared by DomainRecordHandler is used if not given.
+        '''
+        if dns_cache is None:
+            dns_cache = DomainRecordHandler.dns_cache
+        self.dns_cache = dns_cache
+        self.resolving = set()
+
+    def query(self, name, rdtype, node):
+        '''
+        Makes a DNS query on behalf of a node, noting any lookup failure in its errors.
+        :return: List of records in presentation format.
+        '''
+        try:
+            answer = self.dns_cache.resolve(name, rdtype)
+        except (dns.resolver.NoNameservers, dns.exception.Timeout) as error:
+            node.errors.append(rdtype + " lookup of '" + name + "' failed: " + type(error).__name__)
+            node.failed_lookup_count += 1
+            # Failures are not cached, so neither is a tree that needed one.
+            node.expires = 0.0
+            return []
+        node.expires = min(node.expires, answer.expires)
+        return answer.records
+
+    def get_spf_record(self, domain_name, node):
+        '''
+        Finds the SPF record among a domain's TXT records.
+        :return: The joined record value, or '' if there is none.
+        '''
+        spf_records = []
+        for txt_record in self.query(domain_name, "TXT", node):
+            value = DmarcParser.join_txt_strings(txt_record)
+            if "v=spf1" == value.lower() or value.lower().startswith("v=spf1 "):
+                spf_records.append(value)
+        if len(spf_records) > 1:
+            node.errors.append("'" + domain_name + "' has more than one SPF record.")
+            node.is_invalid = True
+        return spf_records[0] if spf_records else ""
+
+    def resolve(self, domain_name):
+        '''
+        Resolves the SPF tree of a domain, reusing any part of it resolved earlier whose answers have not
+        expired.
+        :param domain_name: Domain to resolve.
+        :return: SpfNode for the domain.
+        '''
+        domain_name = domain_name.lower().rstrip(".")
+        shared_nodes = SpfResolver.shared_nodes
+        node = shared_nodes.get(domain_name)
+        if node is not None:
+            if node.expires > time.time():
+                shared_nodes.move_to_end(domain_name)
+                return node
+            del shared_nodes[domain_name]
+        node = SpfNode(domain_name)
+        record = self.get_spf_record(domain_name, node)
+        if "" == record:
+            node.errors.append("'" + domain_name + "' has no SPF record.")
+        else:
+            self.resolve_record(domain_name, record, node)
+        if node.expires > time.time():
+            shared_nodes[domain_name] = node
+            if len(shared_nodes) > SpfResolver.max_shared_nodes:
+                shared_nodes.popitem(last=False)
+        return node
+
+    def resolve_record(self, domain_name, record, node=None):
+        '''
+        Resolves a given SPF record as if it were published at domain_name. Useful for checking a record
+        before it is published.
+        :param domain_name: Domain the record belongs to.
+        :param record: SPF record value starting with 'v=spf1'.
+        :param node: Optional SpfNode to fill in.
+        :return: SpfNode.
+        '''
+        if node is None:
+            node = SpfNode(domain_name)
+        node.record = record
+        terms = record.split()[1:]
+        # RFC 7208 section 6.1: redirect is ignored when the record has an 'all' mechanism.
+        has_all = any("all" == term.lstrip("+-~?").lower() for term in terms)
+        self.resolving.add(domain_name)
+        try:
+            for term in terms:
+                if has_all and term.lower().startswith("redirect="):
+                    continue
+                self.resolve_term(domain_name, term, node)
+        finally:
+            self.resolving.discard(domain_name)
+        return node
+
+    def resolve_term(self, domain_name, term, node):
+        name, separator, value = term.partition("=")
+        if "" != separator and ":" not in name and "/" not in name:
+            self.resolve_modifier(name.lower(), value, node)
+            return
+        qualifier = "+"
+        if term[0] in "+-~?":
+            qualifier = term[0]
+            term = term[1:]
+        name, _, value = term.partition(":")
+        cidr = ""
+        mechanism_name, slash, name_cidr = name.partition("/")
+        if mechanism_name.lower() in ("a", "mx") and "" != slash:
+            name = mechanism_name
+            cidr = slash + name_cidr
+        mechanism = SpfMechanism(qualifier, name.lower(), value, cidr)
+        node.mechanisms.append(mechanism)
+        failed_lookup_count = node.failed_lookup_count
+        if "%" in value:
+            node.has_dynamic_terms = True
+        if mechanism.name in SpfResolver.lookup_mechanisms:
+            node.lookup_count += 1
+
+        if "ip4" == mechanism.name or "ip6" == mechanism.name:
+            try:
+                mechanism.networks.append(ipaddress.ip_network(value, strict=False))
+            except ValueError:
+                node.errors.append("Invalid address '" + term + "'.")
+                node.is_invalid = True
+        elif "include" == mechanism.name:
+            mechanism.child = self.resolve_child(value, node)
+        elif "a" == mechanism.name or "mx" == mechanism.name:
+            target, cidr = SpfResolver.split_cidr(value or domain_name, cidr)
+            try:
+                prefix_lengths = SpfResolver.parse_cidr(cidr)
+            except ValueError:
+                node.errors.append("Invalid CIDR length in '" + term + "'.")
+                node.is_invalid = True
+                return
+            if "%" in target:
+                return
+            if "a" == mechanism.name:
+                mechanism.networks.extend(self.get_address_networks(target, prefix_lengths, node))
+            else:
+                exchanges = self.query(target, "MX", node)
+                if not exchanges:
+                    node.void_lookup_count += 1
+                for exchange in exchanges[:SpfResolver.mx_address_limit]:
+                    exchange_name = exchange.split()[-1].rstrip(".")
+                    mechanism.networks.extend(self.get_address_networks(exchange_name, prefix_lengths, node))
+            mechanism.lookup_failed = node.failed_lookup_count > failed_lookup_count
+        elif "ptr" == mechanism.name or "exists" == mechanism.name:
+            node.has_dynamic_terms = True
+        elif "all" != mechanism.name:
+            node.errors.append("Unknown mechanism '" + term + "'.")
+            node.is_invalid = True
+
+    def resolve_modifier(self, name, value, node):
+        if "redirect" == name:
+            node.redirect_name = value
+            node.lookup_count += 1
+            if "%" in value:
+                node.has_dynamic_terms = True
+                return
+            node.redirect = self.resolve_child(value, node)
+
+    def resolve_child(self, domain_name, node):
+        '''
+        Resolves an include or redirect target and adds its counts to the node.
+        :return: SpfNode of the target, or None if it could not be resolved.
+        '''
+        if "%" in domain_name:
+            node.has_dynamic_terms = True
+            return None
+        domain_name = domain_name.lower().rstrip(".")
+        if domain_name in self.resolving:
+            node.errors.append("'" + domain_name + "' is included in a loop.")
+            return None
+        child = self.resolve(domain_name)
+        if "" == child.record:
+            node.void_lookup_count += 1
+        node.lookup_count += child.lookup_count
+        node.void_lookup_count += child.void_lookup_count
+        node.has_dynamic_terms = node.has_dynamic_terms or child.has_dynamic_terms
+        node.errors.extend(child.errors)
+        node.expires = min(node.expires, child.expires)
+        return child
+
+    @staticmethod
+    def split_cidr(value, cidr):
+        '''
+        Separates a dual CIDR length ('/24//64') from the domain of an a or mx mechanism.
+        :return: Tuple of the domain and the CIDR suffix.
+        '''
+        if "/" in value:
+            slash_position = value.find("/")
+            return value[:slash_position], value[slash_position:]
+        return value, cidr
+
+    @staticmethod
+    def parse_cidr(cidr):
+        '''
+        :param cidr: CIDR suffix of an a or mx mechanism, such as '/24', '//64', or '/24//64', or ''.
+        :return: Tuple of the IPv4 and IPv6 prefix lengths, 32 and 128 when not given.
+        :raises ValueError: If a length is not a number or is too long for its address family.
+        '''
+        ip4_text, _, ip6_text = cidr.partition("//")
+        prefix_lengths = []
+        for text, max_length in ((ip4_text.lstrip("/"), 32), (ip6_text, 128)):
+            if "" == text:
+                prefix_lengths.append(max_length)
+            elif text.isdigit() and int(text) <= max_length:
+                prefix_lengths.append(int(text))
+            else:
+                raise ValueError("'" + cidr + "' is not a valid CIDR length.")
+        return tuple(prefix_lengths)
+
+    def get_address_networks(self, host_name, prefix_lengths, node):
+        '''
+        Looks up the A and AAAA records of a host and applies the mechanism's CIDR lengths.
+        :param prefix_lengths: Tuple of the IPv4 and IPv6 prefix lengths from parse_cidr().
+        :return: List of ipaddress networks.
+        '''
+        networks = []
+        for rdtype, length in (("A", prefix_lengths[0]), ("AAAA", prefix_lengths[1])):
+            for address in self.query(host_name, rdtype, node):
+                networks.append(ipaddress.ip_network(address + "/" + str(length), strict=False))
+        if not networks:
+            node.void_lookup_count += 1
+        return networks
+
+    @staticmethod
+    def get_problems(node):
+        '''
+        Lists anything about an SPF tree that causes a permerror or deserves a warning.
+        :param node: Resolved SpfNode.
+        :return: List of messages.
+        '''
+        problems = list(node.errors)
+        if node.lookup_count > SpfResolver.lookup_limit:
+            problems.append("Needs " + str(node.lookup_count) + " DNS lookups. The limit is " +
+                            str(SpfResolver.lookup_limit) + ".")
+        if node.void_lookup_count > SpfResolver.void_lookup_limit:
+            problems.append("Has " + str(node.void_lookup_count) + " void lookups. The limit is " +
+                            str(SpfResolver.void_lookup_limit) + ".")
+        return problems
+
+    @staticmethod
+    def flatten(node):
+        '''
+        Builds an equivalent SPF record that needs fewer lookups by replacing include, redirect, a, and mx
+        with the addresses they resolve to. Terms are kept in the order they are evaluated, so the first
+        match still decides the result. Terms that can only be evaluated per message (ptr, exists, and
+        macros), lookups that failed, and includes that cannot be replaced by addresses (see
+        get_pass_networks()) are kept as they are.
+        :param node: Resolved SpfNode.
+        :return: The flattened record value.
+        '''
+        terms = ["v=spf1"]
+        seen_terms = set()
+        SpfResolver.flatten_node(node, terms, seen_terms)
+        return " ".join(terms)
+
+    @staticmethod
+    def flatten_node(node, terms, seen_terms):
+        '''
+        Adds the flattened terms of a record, followed by those of its redirect target.
+        '''
+        def add_term(term):
+            if term not in seen_terms:
+                seen_terms.add(term)
+                terms.append(term)
+
+        for mechanism in node.mechanisms:
+            networks = None
+            if "include" == mechanism.name and mechanism.child is not None:
+                networks = SpfResolver.get_pass_networks(mechanism.child)
+            elif SpfResolver.is_static_address_mechanism(mechanism):
+                networks = mechanism.networks
+            if networks is None:
+                add_term(mechanism.to_text())
+            else:
+                prefix = "" if "+" == mechanism.qualifier else mechanism.qualifier
+                for network in networks:
+                    add_term(prefix + ("ip4:" if 4 == network.version else "ip6:") + SpfResolver.network_text(network))
+            if "all" == mechanism.name:
+                return
+        if node.redirect is not None and "" != node.redirect.record and not node.redirect.is_invalid:
+            # The redirect target is only evaluated when nothing above matched, which is what its terms
+            # coming last gives.
+            SpfResolver.flatten_node(node.redirect, terms, seen_terms)
+        elif "" != node.redirect_name:
+            add_term("redirect=" + node.redirect_name)
+
+    @staticmethod
+    def is_static_address_mechanism(mechanism):
+        '''
+        :return: True for an ip4, ip6, a, or mx mechanism whose addresses are all known.
+        '''
+        return (
+            mechanism.name in ("ip4", "ip6", "a", "mx") and "%" not in mechanism.value and
+            not mechanism.lookup_failed
+        )
+
+    @staticmethod
+    def get_pass_networks(node):
+        '''
+        Finds the addresses an included record passes. An include matches only when its record gives 'pass',
+        so it can be replaced by those addresses as long as the record gives nothing else but a result that
+        does not match. A record with a term that is not '+' before its 'all', '+all', an error, or a term
+        evaluated per message cannot be replaced that way.
+        :param node: Resolved SpfNode of the included record.
+        :return: List of ipaddress networks, or None if the include has to be kept.
+        '''
+        if "" == node.record or node.is_invalid:
+            return None
+        networks = []
+        for mechanism in node.mechanisms:
+            if "all" == mechanism.name:
+                return None if "+" == mechanism.qualifier else networks
+            if "+" != mechanism.qualifier:
+                return None
+            if "include" == mechanism.name and mechanism.child is not None:
+                child_networks = SpfResolver.get_pass_networks(mechanism.child)
+                if child_networks is None:
+                    return None
+                networks.extend(child_networks)
+            elif SpfResolver.is_static_address_mechanism(mechanism):
+                networks.extend(mechanism.networks)
+            else:
+                return None
+        if "" == node.redirect_name:
+            return networks
+        if node.redirect is None:
+            return None
+        redirect_networks = SpfResolver.get_pass_networks(node.redirect)
+        if redirect_networks is None:
+            return None
+        return networks + redirect_networks
+
+    @staticmethod
+    def network_text(network):
+        if network.prefixlen == network.max_prefixlen:
+            return str(network.network_address)
+        return str(network)
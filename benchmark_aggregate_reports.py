@@ -0,0 +1,122 @@
+#!/usr/bin/python
+
+# ****************************************************************************
+# Purpose:
+# Measure how many aggregate report rows per second AggregateReportParser
+# reads, and show that its memory use stays flat as reports grow.
+# ****************************************************************************
+# Notes:
+# Run with 'python3 benchmark_aggregate_reports.py [size in MB] [--gzip]'.
+# The default size is 1024 MB. The generated report is written to a
+# temporary file which is removed afterwards.
+# ****************************************************************************
+
+# Imports
+import gzip
+import os
+import resource
+import sys
+import tempfile
+import time
+from AggregateReportParser import AggregateReportParser
+
+# Declare global variables.
+default_size_mb = 1024
+
+report_header = """<?xml version="1.0" encoding="UTF-8" ?>
+<feedback>
+  <report_metadata>
+    <org_name>receiver.example</org_name>
+    <email>noreply-dmarc@receiver.example</email>
+    <report_id>benchmark-1</report_id>
+    <date_range><begin>1700000000</begin><end>1700086399</end></date_range>
+  </report_metadata>
+  <policy_published>
+    <domain>example.com</domain><adkim>r</adkim><aspf>r</aspf><p>quarantine</p><sp>none</sp><pct>100</pct>
+  </policy_published>
+"""
+
+record_template = """  <record>
+    <row>
+      <source_ip>{source_ip}</source_ip>
+      <count>{count}</count>
+      <policy_evaluated><disposition>{disposition}</disposition><dkim>{dkim}</dkim><spf>{spf}</spf></policy_evaluated>
+    </row>
+    <identifiers><header_from>example.com</header_from></identifiers>
+    <auth_results>
+      <dkim><domain>example.com</domain><selector>s1</selector><result>{dkim}</result></dkim>
+      <spf><domain>mail.example.com</domain><scope>mfrom</scope><result>{spf}</result></spf>
+    </auth_results>
+  </record>
+"""
+
+
+def write_report(report_file, size_bytes):
+    '''
+    Writes a synthetic aggregate report of about the requested size.
+    :param report_file: Binary file object to write to.
+    :param size_bytes: Approximate size of the uncompressed XML.
+    :return: Number of records written.
+    '''
+    report_file.write(report_header.encode())
+    written_bytes = len(report_header)
+    record_count = 0
+    chunk = []
+    while written_bytes < size_bytes:
+        failing = record_count % 7 == 0
+        record = record_template.format(
+            source_ip="198.51." + str(record_count // 256 % 256) + "." + str(record_count % 256),
+            count=record_count % 50 + 1,
+            disposition="quarantine" if failing else "none",
+            dkim="fail" if failing else "pass",
+            spf="fail" if record_count % 5 == 0 else "pass"
+        )
+        chunk.append(record)
+        written_bytes += len(record)
+        record_count += 1
+        if len(chunk) == 10000:
+            report_file.write("".join(chunk).encode())
+            chunk = []
+    chunk.append("</feedback>\n")
+    report_file.write("".join(chunk).encode())
+    return record_count
+
+
+def main():
+    '''
+    Generates a report, times reading it, and prints the results.
+    :return: None.
+    '''
+    arguments = [argument for argument in sys.argv[1:] if "--gzip" != argument]
+    use_gzip = "--gzip" in sys.argv
+    size_mb = int(arguments[0]) if arguments else default_size_mb
+    suffix = ".xml.gz" if use_gzip else ".xml"
+    report_descriptor, report_path = tempfile.mkstemp(suffix=suffix)
+    os.close(report_descriptor)
+    try:
+        print("Generating a " + str(size_mb) + " MB report at '" + report_path + "'.")
+        opener = gzip.open if use_gzip else open
+        with opener(report_path, "wb") as report_file:
+            record_count = write_report(report_file, size_mb * 1024 * 1024)
+        start_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_time = time.perf_counter()
+        row_count = 0
+        message_count = 0
+        for row in AggregateReportParser.read_file(report_path):
+            row_count += 1
+            message_count += row.count
+        elapsed_time = time.perf_counter() - start_time
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if row_count != record_count:
+            print("WARNING: wrote " + str(record_count) + " records but read " + str(row_count) + ".")
+        print("Read " + format(row_count, ",") + " rows (" + format(message_count, ",") + " messages) in " +
+              format(elapsed_time, ".2f") + " seconds.")
+        print("Rows per second: " + format(row_count / elapsed_time, ",.0f"))
+        print("Peak RSS: " + format(peak_rss_kb / 1024, ".1f") + " MB (" +
+              format((peak_rss_kb - start_rss_kb) / 1024, ".1f") + " MB more than before reading).")
+    finally:
+        os.remove(report_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+# ****************************************************************************
+# Purpose:
+# Measure how many DMARC records per second DmarcParser can parse.
+# ****************************************************************************
+# Notes:
+# Run with 'python3 benchmark_dmarc_parser.py [record count]'.
+# No DNS lookups are made. Records are generated in memory before timing.
+# ****************************************************************************
+
+# Imports
+import random
+import sys
+import time
+from DmarcParser import DmarcParser
+
+# Declare global variables.
+default_record_count = 200000
+
+
+def generate_records(record_count):
+    '''
+    Builds a list of synthetic DMARC TXT values in the forms seen in harvested data: joined values,
+    multi-string presentation format, and lists of byte strings.
+    :param record_count: Number of records to build.
+    :return: List of TXT values.
+    '''
+    generator = random.Random(7489)
+    records = []
+    for number in range(record_count):
+        tags = ["v=DMARC1", "p=" + generator.choice(["none", "quarantine", "reject"])]
+        if generator.random() < 0.5:
+            tags.append("sp=" + generator.choice(["none", "quarantine", "reject"]))
+        if generator.random() < 0.3:
+            tags.append("pct=" + str(generator.randint(0, 100)))
+        if generator.random() < 0.3:
+            tags.append("adkim=s; aspf=r")
+        if generator.random() < 0.2:
+            tags.append("fo=1:d")
+        tags.append("rua=mailto:dmarc" + str(number) + "@example.com,mailto:reports@example.net")
+        if generator.random() < 0.3:
+            tags.append("ruf=mailto:failures@example.com")
+        value = "; ".join(tags)
+        form = number % 3
+        if 0 == form:
+            records.append(value)
+        elif 1 == form:
+            records.append('"' + value[:20] + '" "' + value[20:] + '"')
+        else:
+            records.append([value[:20].encode(), value[20:].encode()])
+    return records
+
+
+def main():
+    '''
+    Times DmarcParser.parse() over the generated records and prints the rate.
+    :return: None.
+    '''
+    record_count = default_record_count
+    if len(sys.argv) > 1:
+        record_count = int(sys.argv[1])
+    records = generate_records(record_count)
+    parse = DmarcParser.parse
+    start_time = time.perf_counter()
+    for record in records:
+        parse(record)
+    elapsed_time = time.perf_counter() - start_time
+    print("Parsed " + str(record_count) + " records in " + format(elapsed_time, ".3f") + " seconds.")
+    print("Records per second: " + format(record_count / elapsed_time, ",.0f"))
+
+
+if __name__ == "__main__":
+    main()
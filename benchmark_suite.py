@@ -0,0 +1,370 @@
+#!/usr/bin/python
+
+# ****************************************************************************
+# Purpose:
+# Measure the speed of the DNS lookups, DMARC parsing, and record output
+# against a local DNS server, so results can be compared across commits.
+# ****************************************************************************
+# Notes:
+# Run with 'python3 benchmark_suite.py [--domains N] [--concurrency 1,16,128]
+# [--workloads handler,auditor,parse,output] [--max-error-share 0.01]
+# [--output results.json]'.
+# A DNS server is started inside this process and loaded with synthetic
+# zones, so no network is used and every run sees the same answers.
+# Results are written as JSON: operations per second, p50/p95/p99 latency,
+# errors and timeouts, and the peak resident memory of the process so far.
+# The run fails if more lookups fail than the unanswered names account for,
+# since the numbers would then measure the timeout rather than the lookups.
+# ****************************************************************************
+
+# Imports
+import argparse
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from AsyncDomainAuditor import AsyncDomainAuditor
+from DmarcParser import DmarcParser
+from DnsCache import DnsCache
+from DomainRecordHandler import DomainRecordHandler
+from LocalDnsServer import LocalDnsServer
+from QueryEngine import QueryEngine
+from benchmark_dmarc_parser import generate_records
+
+try:
+    import dns.exception
+    import dns.resolver
+    import dns.version
+except ModuleNotFoundError:
+    print("Error: The 'dnspython' library could not be found. Please install and try again.")
+    sys.exit("If using 'pip', this command may help 'sudo pip3 install dnspython'.")
+
+# Declare global variables.
+default_domain_count = 1000
+default_concurrency_levels = "1,16,128"
+default_workloads = "handler,auditor,parse,output"
+default_max_error_share = 0.01
+zone_suffix = "bench.test"
+# Seconds a lookup may take before it counts as timed out, with up to 16 operations at once. See get_lookup_timeout().
+lookup_timeout = 0.25
+# Seconds the answers for slow names are held back.
+slow_delay = 0.05
+# One entry per domain in turn, so every run has the same mix. 1 in 40 domains is slow and 1 in 40 times out.
+domain_kinds = (
+    ["valid"] * 14 + ["multi_string"] * 8 + ["invalid"] * 6 + ["nxdomain"] * 8 + ["no_dmarc"] * 2 +
+    ["slow"] + ["timeout"]
+)
+
+
+def load_zones(server, domain_count):
+    '''
+    Adds the synthetic domains to the local DNS server.
+    :param server: LocalDnsServer to load.
+    :param domain_count: Number of domains to create.
+    :return: List of the domain names, in a mix of the kinds in domain_kinds.
+    '''
+    domain_names = []
+    for number in range(domain_count):
+        kind = domain_kinds[number % len(domain_kinds)]
+        domain_name = "d" + str(number) + "-" + kind.replace("_", "-") + "." + zone_suffix
+        domain_names.append(domain_name)
+        if "nxdomain" == kind:
+            continue
+        server.add_record(domain_name, "A", ["192.0.2." + str(number % 250 + 1)])
+        server.add_record(domain_name, "TXT", ['"v=spf1 ip4:192.0.2.0/24 -all"'])
+        dmarc_host_name = "_dmarc." + domain_name
+        rua = "rua=mailto:dmarc@" + domain_name
+        if kind in ("valid", "slow", "timeout"):
+            server.add_record(dmarc_host_name, "TXT", ['"v=DMARC1; p=quarantine; pct=50; ' + rua + '"'])
+        elif "multi_string" == kind:
+            server.add_record(dmarc_host_name, "TXT", ['"v=DMARC1; p=reject; sp=none; " "adkim=s; ' + rua + '"'])
+        elif "invalid" == kind:
+            # Version tag not first, so it is not a DMARC record.
+            server.add_record(dmarc_host_name, "TXT", ['"p=reject; v=DMARC1"'])
+        if "slow" == kind:
+            server.set_delay(dmarc_host_name, slow_delay)
+        elif "timeout" == kind:
+            server.drop_queries(dmarc_host_name)
+    return domain_names
+
+
+def get_lookup_timeout(concurrency):
+    '''
+    Queries wait at the server behind the others in flight, and there are more of them the higher the
+    concurrency. A fixed timeout short enough to keep unanswered names cheap at low concurrency would time
+    out answered queries at high concurrency, so it grows in step with the concurrency above 16.
+    :param concurrency: Number of operations run at once.
+    :return: Seconds a lookup may take.
+    '''
+    return lookup_timeout * max(1.0, concurrency / 16.0)
+
+
+def get_percentile(sorted_values, percentile):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(round(percentile / 100.0 * (len(sorted_values) - 1)))]
+
+
+def make_result(workload, concurrency, latencies, error_count, elapsed_time, timeout_count=0, timeout=None):
+    '''
+    :param latencies: List of seconds each operation took.
+    :param error_count: Number of operations that failed other than by timing out.
+    :param timeout_count: Number of operations that timed out.
+    :param timeout: Seconds each lookup was allowed, for the lookup workloads.
+    :return: Dictionary of the measurements of one workload at one concurrency level.
+    '''
+    latencies = sorted(latencies)
+    return {
+        "workload": workload,
+        "concurrency": concurrency,
+        "operations": len(latencies),
+        "errors": error_count,
+        "timeouts": timeout_count,
+        "lookup_timeout": timeout,
+        "seconds": round(elapsed_time, 4),
+        "operations_per_second": round(len(latencies) / elapsed_time, 1) if elapsed_time else 0.0,
+        "latency_ms": {
+            "p50": round(get_percentile(latencies, 50) * 1000, 4),
+            "p95": round(get_percentile(latencies, 95) * 1000, 4),
+            "p99": round(get_percentile(latencies, 99) * 1000, 4),
+        },
+        # ru_maxrss is in kilobytes on Linux and covers the whole run up to this point.
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def run_handler_workload(domain_names, concurrency):
+    '''
+    Looks up each domain the way the questions do, with DomainRecordHandler, from a pool of threads.
+    Each operation is an existence check followed by reading the DMARC record of a domain that exists.
+    '''
+    DomainRecordHandler.dns_cache = DnsCache()
+    timeout = get_lookup_timeout(concurrency)
+    dns.resolver.default_resolver.lifetime = timeout
+
+    def look_up(domain_name):
+        start_time = time.perf_counter()
+        outcome = ""
+        try:
+            domain_exists = DomainRecordHandler.get_domain_exists(domain_name)
+            if domain_exists is None:
+                # The local server never answers SERVFAIL, so the existence check timed out.
+                outcome = "timeout"
+            elif domain_exists:
+                dmarc_lookup_error = DomainRecordHandler(domain_name).dmarc_lookup_error
+                if isinstance(dmarc_lookup_error, dns.exception.Timeout):
+                    outcome = "timeout"
+                elif dmarc_lookup_error is not None:
+                    outcome = "error"
+        except dns.exception.Timeout:
+            outcome = "timeout"
+        except dns.exception.DNSException:
+            outcome = "error"
+        return time.perf_counter() - start_time, outcome
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(look_up, domain_names))
+    elapsed_time = time.perf_counter() - start_time
+    return make_result("handler", concurrency, [latency for latency, _ in outcomes],
+                       sum(1 for _, outcome in outcomes if "error" == outcome), elapsed_time,
+                       sum(1 for _, outcome in outcomes if "timeout" == outcome), timeout)
+
+
+def run_auditor_workload(domain_names, concurrency, server_port):
+    '''
+    Audits the domains with AsyncDomainAuditor over QueryEngine, concurrency domains at a time.
+    '''
+    timeout = get_lookup_timeout(concurrency)
+
+    async def audit_all():
+        query_engine = QueryEngine(["127.0.0.1"], port=server_port, timeout=timeout, retries=0)
+        auditor = AsyncDomainAuditor(resolver=query_engine, dns_cache=DnsCache())
+        # audit_domains() normally creates this. Each domain needs two queries.
+        auditor.query_limit = asyncio.Semaphore(concurrency * 2)
+        pending_domains = iter(domain_names)
+        latencies = []
+        error_count = 0
+        timeout_count = 0
+
+        async def audit_worker():
+            nonlocal error_count, timeout_count
+            for domain_name in pending_domains:
+                operation_start_time = time.perf_counter()
+                result = await auditor.audit_domain(domain_name)
+                latencies.append(time.perf_counter() - operation_start_time)
+                if "TIMEOUT" in result.error:
+                    timeout_count += 1
+                elif "" != result.error:
+                    error_count += 1
+
+        start_time = time.perf_counter()
+        await asyncio.gather(*[audit_worker() for _ in range(concurrency)])
+        elapsed_time = time.perf_counter() - start_time
+        query_engine.close()
+        return make_result("auditor", concurrency, latencies, error_count, elapsed_time, timeout_count, timeout)
+
+    return asyncio.run(audit_all())
+
+
+def run_parse_workload(record_count):
+    '''
+    Parses generated DMARC records with DmarcParser, one at a time.
+    '''
+    records = generate_records(record_count)
+    parse = DmarcParser.parse
+    clock = time.perf_counter
+    latencies = []
+    start_time = clock()
+    for record in records:
+        operation_start_time = clock()
+        parse(record)
+        latencies.append(clock() - operation_start_time)
+    elapsed_time = clock() - start_time
+    return make_result("parse", 1, latencies, 0, elapsed_time)
+
+
+def load_dmarc_tool():
+    '''
+    Imports dmarc-tool.py, whose name cannot be used in an import statement.
+    :return: The module.
+    '''
+    module_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dmarc-tool.py")
+    specification = importlib.util.spec_from_file_location("dmarc_tool", module_path)
+    module = importlib.util.module_from_spec(specification)
+    specification.loader.exec_module(module)
+    return module
+
+
+def run_output_workload(domain_names):
+    '''
+    Produces the DMARC, SPF, and DKIM record output of the questions for each domain.
+    '''
+    dmarc_tool = load_dmarc_tool()
+    clock = time.perf_counter
+    latencies = []
+    output = io.StringIO()
+    start_time = clock()
+    with redirect_stdout(output):
+        for domain_name in domain_names:
+            operation_start_time = clock()
+            dmarc_tool.domain_name = domain_name
+            dmarc_tool.parent_domain_name = domain_name
+            dmarc_tool.dmarc_policy = "quarantine"
+            dmarc_tool.dmarc_subdomain_policy = "reject"
+            dmarc_tool.dmarc_failure_reporting_option = "1"
+            dmarc_tool.dmarc_aggregate_email_address = "dmarc@reports.example"
+            dmarc_tool.dmarc_failure_email_address = "failures@" + domain_name
+            dmarc_tool.spf_servers = " mx include:_spf.provider.example"
+            dmarc_tool.dkim_selector = "selector1"
+            dmarc_tool.print_dmarc_output()
+            dmarc_tool.print_spf_output()
+            dmarc_tool.print_dkim_output()
+            latencies.append(clock() - operation_start_time)
+            output.seek(0)
+            output.truncate()
+    elapsed_time = clock() - start_time
+    return make_result("output", 1, latencies, 0, elapsed_time)
+
+
+def get_failed_results(results, expected_timeout_count, max_error_share):
+    '''
+    :param results: List of make_result() dictionaries.
+    :param expected_timeout_count: Number of operations that time out because their names are never answered.
+    :param max_error_share: Largest share of a workload's operations that may fail beyond those.
+    :return: List of the lookup results with more failures than allowed.
+    '''
+    failed_results = []
+    for result in results:
+        if result["lookup_timeout"] is None or not result["operations"]:
+            continue
+        unexpected_count = result["errors"] + max(0, result["timeouts"] - expected_timeout_count)
+        if unexpected_count > max_error_share * result["operations"]:
+            failed_results.append(result)
+    return failed_results
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main():
+    '''
+    Starts the local DNS server, runs the chosen workloads, and prints the results as JSON.
+    :return: None.
+    '''
+    parser = argparse.ArgumentParser(description="Benchmark lookups, parsing, and output against a local DNS server.")
+    parser.add_argument("--domains", type=int, default=default_domain_count,
+                        help="Number of synthetic domains. Default: " + str(default_domain_count) + ".")
+    parser.add_argument("--concurrency", default=default_concurrency_levels,
+                        help="Comma separated concurrency levels for the lookup workloads. Default: "
+                             + default_concurrency_levels + ".")
+    parser.add_argument("--workloads", default=default_workloads,
+                        help="Comma separated workloads to run. Default: " + default_workloads + ".")
+    parser.add_argument("--max-error-share", type=float, default=default_max_error_share,
+                        help="Share of a lookup workload's operations that may fail or time out, beyond the "
+                             "unanswered names, before the run fails. Default: " + str(default_max_error_share)
+                             + ".")
+    parser.add_argument("--output", metavar="FILE", help="Also write the JSON results to FILE.")
+    arguments = parser.parse_args()
+    concurrency_levels = [int(level) for level in arguments.concurrency.split(",")]
+    workloads = arguments.workloads.split(",")
+
+    server = LocalDnsServer()
+    domain_names = load_zones(server, arguments.domains)
+    expected_timeout_count = sum(1 for domain_name in domain_names if domain_name.endswith("-timeout." + zone_suffix))
+    server.start_in_thread()
+    resolver = dns.resolver.Resolver(configure=False)
+    resolver.nameservers = ["127.0.0.1"]
+    resolver.port = server.port
+    dns.resolver.default_resolver = resolver
+
+    results = []
+    try:
+        for concurrency in concurrency_levels:
+            if "handler" in workloads:
+                results.append(run_handler_workload(domain_names, concurrency))
+            if "auditor" in workloads:
+                results.append(run_auditor_workload(domain_names, concurrency, server.port))
+        if "parse" in workloads:
+            results.append(run_parse_workload(arguments.domains * 100))
+        if "output" in workloads:
+            results.append(run_output_workload(domain_names))
+    finally:
+        server.close()
+
+    report = json.dumps({
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "dnspython": dns.version.version,
+        "domains": arguments.domains,
+        "expected_timeouts": expected_timeout_count,
+        "results": results,
+    }, indent=2)
+    print(report)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(report + "\n")
+    failed_results = get_failed_results(results, expected_timeout_count, arguments.max_error_share)
+    for result in failed_results:
+        print("Too many failed lookups: " + result["workload"] + " at concurrency " + str(result["concurrency"])
+              + " had " + str(result["errors"]) + " errors and " + str(result["timeouts"]) + " timeouts, "
+              + str(expected_timeout_count) + " timeouts expected.", file=sys.stderr)
+    if failed_results:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,7 +19,21 @@
 # ****************************************************************************
 
 # Imports
+# Modules that load dnspython or asyncio are imported by the functions that use them, so commands that make
+# no DNS lookups, such as --generate, start quickly.
+import argparse
+import atexit
+import csv
+import os
+import sys
+from DmarcLinter import DmarcLinter
+from DmarcParser import DmarcParser
+from DnsCache import DnsCache
+from DomainListReader import DomainListReader
 from DomainRecordHandler import DomainRecordHandler
+from LookupMetrics import LookupMetrics
+from PublicSuffixList import PublicSuffixList
+from RecordGenerator import RecordGenerator
 from get_input import *
 
 # Declare global variables.
@@ -41,7 +55,12 @@ dmarc_aggregate_email_address = ""
 dmarc_failure_email_address = ""
 spf_servers = ""
 dkim_selector = "*"
+# Public key of a key pair made by the questions, or '' for the placeholder.
+dkim_public_key = ""
+# Directory key pairs made by the questions are saved in.
+dkim_key_directory = "dkim-keys"
 domain_record_handler = ""
+domain_prefetcher = None
 dmarc_record = ""
 
 
@@ -51,6 +70,63 @@ def main():
     Main function of the program.
     :return: None.
     '''
+    arguments = parse_arguments()
+    if arguments.cache_file:
+        DomainRecordHandler.dns_cache = DnsCache(path=arguments.cache_file)
+    # A scan's workers set up their own metrics.
+    if get_metrics_options(arguments) and not arguments.scan:
+        metrics = LookupMetrics.from_options(**get_metrics_options(arguments))
+        DomainRecordHandler.dns_cache.metrics = metrics
+        atexit.register(metrics.close)
+    if arguments.generate:
+        run_generate(arguments.generate, arguments.format, arguments.ttl, get_dkim_key_options(arguments))
+        return
+    if arguments.audit:
+        run_audit(arguments.audit, arguments.concurrency, get_query_engine_options(arguments),
+                  get_scheduler_options(arguments), get_domain_list_options(arguments))
+        return
+    if arguments.scan:
+        run_scan(arguments)
+        return
+    if arguments.check_report_auth:
+        run_report_authorization_check(arguments.check_report_auth, arguments.concurrency,
+                                       get_query_engine_options(arguments), get_scheduler_options(arguments),
+                                       get_domain_list_options(arguments))
+        return
+    if arguments.discover_dkim:
+        run_dkim_discovery(arguments.discover_dkim, arguments.selector_file, arguments.concurrency,
+                           get_query_engine_options(arguments), get_scheduler_options(arguments),
+                           get_domain_list_options(arguments))
+        return
+    if arguments.lint:
+        run_dmarc_lint(arguments.lint, arguments.lint_severity, arguments.concurrency,
+                       get_query_engine_options(arguments), get_scheduler_options(arguments),
+                       get_domain_list_options(arguments))
+        return
+    if arguments.effective_policy:
+        run_policy_discovery(arguments.effective_policy, arguments.policy_method, arguments.concurrency,
+                             get_query_engine_options(arguments), get_scheduler_options(arguments),
+                             get_domain_list_options(arguments))
+        return
+    if arguments.monitor:
+        run_monitor(arguments.monitor, arguments.dkim_selector or [], arguments.monitor_rate,
+                    get_domain_list_options(arguments))
+        return
+    if arguments.spf:
+        if arguments.check_ip or arguments.check_ips:
+            run_spf_ip_check(arguments.spf, arguments.check_ip or [], arguments.check_ips)
+        else:
+            run_spf_check(arguments.spf, arguments.flatten)
+        return
+    if arguments.read_reports:
+        run_read_reports(arguments.read_reports)
+        return
+    if arguments.read_failure_reports:
+        run_read_failure_reports(arguments.read_failure_reports, arguments.failure_checkpoint, arguments.workers)
+        return
+    if arguments.import_reports or arguments.top_failing:
+        run_report_store(arguments)
+        return
     display_welcome_message()
     ask_dmarc_questions()
     ask_spf_questions()
@@ -62,6 +138,652 @@ def main():
     print("")
 
 
+# Read the command line arguments.
+def parse_arguments():
+    '''
+    Reads the command line arguments. With no arguments the interactive questions are asked.
+    :return: argparse.Namespace of the arguments provided.
+    '''
+    parser = argparse.ArgumentParser(description="Assist in implementing DMARC, SPF, and DKIM.")
+    parser.add_argument("--generate", metavar="SPEC_FILE",
+                        help="Print the DMARC, SPF, and DKIM records of every domain in SPEC_FILE (.yaml, .json, "
+                             ".jsonl, or .csv) without asking questions or looking anything up.")
+    parser.add_argument("--format", choices=["text", "zone", "jsonl", "csv"], default="text",
+                        help="How --generate writes records: text (as after the questions), zone (BIND zone file "
+                             "lines), jsonl, or csv. Default: text.")
+    parser.add_argument("--ttl", type=int, default=3600,
+                        help="TTL of the records --generate writes in the zone, jsonl, and csv formats. "
+                             "Default: 3600.")
+    parser.add_argument("--dkim-key-dir", metavar="DIRECTORY",
+                        help="With --generate, make a DKIM key pair for every domain used for email, write the "
+                             "private keys under DIRECTORY, and put the public keys in the DKIM records.")
+    parser.add_argument("--dkim-key-type", choices=["rsa", "ed25519"], default="rsa",
+                        help="Type of the keys --dkim-key-dir makes. Default: rsa.")
+    parser.add_argument("--dkim-key-size", type=int, choices=[2048, 3072, 4096], default=2048,
+                        help="Size in bits of the RSA keys --dkim-key-dir makes. Default: 2048.")
+    parser.add_argument("--audit", metavar="DOMAIN_FILE",
+                        help="Audit every domain listed in DOMAIN_FILE, one per line, without asking questions.")
+    parser.add_argument("--concurrency", type=int, default=200,
+                        help="Maximum number of DNS queries in flight during an audit. Default: 200.")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Look up domains listed more than once in a DOMAIN_FILE every time. By default "
+                             "repeats are dropped.")
+    parser.add_argument("--bloom-filter", type=int, default=0, metavar="CAPACITY",
+                        help="Find repeated domains with a Bloom filter sized for CAPACITY unique domains, which "
+                             "needs about 2 bytes per domain instead of about 20, but drops 0.1%% of unique "
+                             "domains as if they were repeats.")
+    parser.add_argument("--nameserver", action="append", metavar="ADDRESS",
+                        help="Send the queries of bulk lookups to this resolver. Can be given more than once. "
+                             "Default: the system resolvers.")
+    parser.add_argument("--transport", choices=["udp", "tcp", "tls"], default="udp",
+                        help="How bulk lookups reach the resolvers: udp (TCP when truncated), tcp, or tls "
+                             "(DNS over TLS). Default: udp.")
+    parser.add_argument("--tls-server-name", metavar="NAME",
+                        help="With --transport tls, check the resolver's certificate against NAME.")
+    parser.add_argument("--adaptive-rate", action="store_true",
+                        help="Limit how many queries of bulk lookups go to each set of authoritative nameservers "
+                             "at once, slowing down for servers that answer slowly or fail, and retry failed "
+                             "lookups with backoff before reporting them as unknown.")
+    parser.add_argument("--lookup-retries", type=int, default=3, metavar="COUNT",
+                        help="With --adaptive-rate, number of times a lookup that timed out or failed is sent "
+                             "again. Default: 3.")
+    parser.add_argument("--check-report-auth", metavar="DOMAIN_FILE",
+                        help="List the domains in DOMAIN_FILE that send rua or ruf reports to another domain "
+                             "that has not published the '_report._dmarc' record authorizing them.")
+    parser.add_argument("--discover-dkim", metavar="DOMAIN_FILE",
+                        help="Find the DKIM keys of every domain in DOMAIN_FILE by trying common selectors, and "
+                             "write each key found, with its type and size, as CSV.")
+    parser.add_argument("--selector-file", metavar="FILE",
+                        help="With --discover-dkim, try the selectors listed in FILE, one per line, instead of "
+                             "the built in list.")
+    parser.add_argument("--lint", metavar="DOMAIN_FILE",
+                        help="Check the DMARC record of every domain in DOMAIN_FILE against RFC 7489 and write "
+                             "each problem found, with its code and severity, as CSV.")
+    parser.add_argument("--lint-severity", choices=["info", "warning", "error"], default="info",
+                        help="Lowest severity --lint reports. Default: info.")
+    parser.add_argument("--effective-policy", metavar="DOMAIN_FILE",
+                        help="Find the DMARC policy that applies to every domain in DOMAIN_FILE, including "
+                             "subdomains without a record of their own, and write it as CSV.")
+    parser.add_argument("--policy-method", choices=["rfc7489", "tree-walk"], default="rfc7489",
+                        help="With --effective-policy, fall back to the organizational domain's record "
+                             "(rfc7489) or try every parent domain in turn (tree-walk, as in DMARCbis). "
+                             "Default: rfc7489.")
+    parser.add_argument("--scan", metavar="DOMAIN_FILE",
+                        help="Audit a very large DOMAIN_FILE across several processes, saving progress so an "
+                             "interrupted scan can be resumed by running the same command again.")
+    parser.add_argument("--output-dir", default="scan-output",
+                        help="Directory for scan shard files, checkpoint, and results. Default: scan-output.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes for --scan, --read-failure-reports, and --dkim-key-dir. "
+                             "Default: number of CPUs.")
+    parser.add_argument("--shard-size", type=int, default=10000,
+                        help="Number of domains in each scan shard. Default: 10000.")
+    parser.add_argument("--monitor", metavar="DOMAIN_FILE",
+                        help="Keep watching the DMARC and SPF records of every domain in DOMAIN_FILE, checking "
+                             "each again when its TTL runs out, and write a JSON line for each change found.")
+    parser.add_argument("--monitor-rate", type=float, default=20.0,
+                        help="Maximum number of records --monitor checks per second. Default: 20.")
+    parser.add_argument("--dkim-selector", action="append", metavar="SELECTOR",
+                        help="With --monitor, also watch the DKIM key of SELECTOR. Can be given more than once.")
+    parser.add_argument("--spf", metavar="DOMAIN",
+                        help="Resolve the SPF record of DOMAIN and count the DNS lookups it needs.")
+    parser.add_argument("--flatten", action="store_true",
+                        help="With --spf, also print a flattened record that needs fewer lookups.")
+    parser.add_argument("--check-ip", action="append", metavar="IP",
+                        help="With --spf, write the SPF result of a sending IP as CSV instead. Can be given more "
+                             "than once.")
+    parser.add_argument("--check-ips", metavar="IP_FILE", type=argparse.FileType("r"),
+                        help="With --spf, write the SPF result of every IP in IP_FILE as CSV instead. IP_FILE has "
+                             "one IP per line, or is CSV with a source_ip column, as written by --read-reports.")
+    parser.add_argument("--read-reports", metavar="REPORT_FILE", nargs="+",
+                        help="Write the records of DMARC aggregate reports (.xml, .xml.gz, or .zip) as CSV.")
+    parser.add_argument("--read-failure-reports", metavar="MAILBOX", nargs="+",
+                        help="Write the DMARC failure reports found in mbox files or Maildir directories as CSV. "
+                             "Only mail added since the last run is read.")
+    parser.add_argument("--failure-checkpoint", default="dmarc-failure-reports.db",
+                        help="File recording which failure reports have been read. "
+                             "Default: dmarc-failure-reports.db.")
+    parser.add_argument("--import-reports", metavar="REPORT_FILE", nargs="+",
+                        help="Add DMARC aggregate reports to the report store.")
+    parser.add_argument("--top-failing", metavar="DOMAIN",
+                        help="List the source IPs with the most messages failing DMARC for DOMAIN.")
+    parser.add_argument("--days", type=int, default=7,
+                        help="Number of days, including today, covered by --top-failing. Default: 7.")
+    parser.add_argument("--include-subdomains", action="store_true",
+                        help="With --top-failing, include the subdomains of DOMAIN.")
+    parser.add_argument("--report-store", default="dmarc-reports.db",
+                        help="SQLite file holding imported reports. Default: dmarc-reports.db.")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="Write DNS lookup counts and latencies to FILE in Prometheus text format.")
+    parser.add_argument("--metrics-jsonl", metavar="FILE",
+                        help="Append one JSON line per DNS lookup to FILE.")
+    parser.add_argument("--cache-file", metavar="CACHE_FILE",
+                        help="Keep DNS answers in CACHE_FILE so later runs can reuse them until they expire.")
+    return parser.parse_args()
+
+
+# Gather the resolver settings used by bulk lookups.
+def get_query_engine_options(arguments):
+    '''
+    :param arguments: argparse.Namespace with the nameserver, transport, and tls_server_name arguments.
+    :return: Dictionary of QueryEngine arguments.
+    '''
+    return {
+        "nameservers": arguments.nameserver,
+        "transport": arguments.transport,
+        "tls_server_name": arguments.tls_server_name,
+    }
+
+
+# Gather the per-nameserver rate control settings used by bulk lookups.
+def get_scheduler_options(arguments):
+    '''
+    :param arguments: argparse.Namespace with the adaptive_rate, lookup_retries, and concurrency arguments.
+    :return: Dictionary of NameserverScheduler arguments, or None if --adaptive-rate was not given.
+    '''
+    if not arguments.adaptive_rate:
+        return None
+    return {
+        "max_limit": arguments.concurrency,
+        "retries": arguments.lookup_retries,
+    }
+
+
+# Wrap the query engine of a bulk lookup in a NameserverScheduler when asked to.
+def get_bulk_resolver(query_engine, scheduler_options):
+    '''
+    :param query_engine: QueryEngine.
+    :param scheduler_options: Dictionary of NameserverScheduler arguments, or None.
+    :return: NameserverScheduler sending its queries with the engine, or the engine itself if
+        scheduler_options is None.
+    '''
+    if scheduler_options is None:
+        return query_engine
+    from NameserverScheduler import NameserverScheduler
+
+    return NameserverScheduler(query_engine, **scheduler_options)
+
+
+# Gather the domain list settings.
+def get_domain_list_options(arguments):
+    '''
+    :param arguments: argparse.Namespace with the keep_duplicates and bloom_filter arguments.
+    :return: Dictionary of DomainListReader arguments.
+    '''
+    return {"dedupe": not arguments.keep_duplicates, "bloom_filter_capacity": arguments.bloom_filter}
+
+
+# Gather the lookup metrics settings.
+def get_metrics_options(arguments):
+    '''
+    :param arguments: argparse.Namespace with the metrics_file and metrics_jsonl arguments.
+    :return: Dictionary of LookupMetrics.from_options() arguments, or None if no metrics were asked for.
+    '''
+    if not arguments.metrics_file and not arguments.metrics_jsonl:
+        return None
+    return {"prometheus_path": arguments.metrics_file, "json_lines_path": arguments.metrics_jsonl}
+
+
+# Gather the DKIM key generation settings.
+def get_dkim_key_options(arguments):
+    '''
+    :param arguments: argparse.Namespace with the dkim_key_dir, dkim_key_type, dkim_key_size, and workers
+        arguments.
+    :return: Dictionary of DkimKeyGenerator arguments, or None if no keys were asked for.
+    '''
+    if not arguments.dkim_key_dir:
+        return None
+    return {
+        "key_directory": arguments.dkim_key_dir,
+        "key_type": arguments.dkim_key_type,
+        "key_size": arguments.dkim_key_size,
+        "workers": arguments.workers,
+    }
+
+
+# Generate the records of many domains from a spec file.
+def run_generate(spec_file_name, format_name, ttl, dkim_key_options):
+    '''
+    Writes the records of every domain in a spec file to standard output, each domain as soon as it is
+    read.
+    :param spec_file_name: Path of the spec file. See RecordGenerator.read_spec() for the formats.
+    :param format_name: Output format, 'text', 'zone', 'jsonl', or 'csv'.
+    :param ttl: TTL of the records in the formats that include one.
+    :param dkim_key_options: Optional dictionary of DkimKeyGenerator arguments. Without it the DKIM records
+        have a placeholder key.
+    :return: None.
+    '''
+    from RecordWriter import RecordWriter
+
+    key_generator = None
+    record_writer = RecordWriter.create(format_name, sys.stdout, ttl)
+    try:
+        if dkim_key_options is not None:
+            from DkimKeyGenerator import DkimKeyGenerator
+            key_generator = DkimKeyGenerator(**dkim_key_options)
+        record_writer.write_records(
+            RecordGenerator.generate_records(RecordGenerator.read_spec(spec_file_name), key_generator)
+        )
+    except ValueError as error:
+        record_writer.close()
+        sys.exit("Error: " + str(error))
+    record_writer.close()
+    if key_generator is not None:
+        print(key_generator.get_summary(), file=sys.stderr)
+
+
+# Audit a list of domains without asking questions.
+def run_audit(domain_file_name, concurrency, query_engine_options, scheduler_options,
+              domain_list_options):
+    '''
+    Looks up the DMARC, SPF, and existence data for every domain in a file and writes one CSV row per
+    domain to standard output as each lookup finishes.
+    :param domain_file_name: File with one domain name per line, read by DomainListReader.
+    :param concurrency: Maximum number of DNS queries in flight.
+    :param query_engine_options: Dictionary of QueryEngine arguments.
+    :param scheduler_options: Dictionary of NameserverScheduler arguments, or None to send queries without one.
+    :param domain_list_options: Dictionary of DomainListReader arguments.
+    :return: None.
+    '''
+    import asyncio
+    from AsyncDomainAuditor import AsyncDomainAuditor, DomainAuditResult
+    from QueryEngine import QueryEngine
+
+    domain_reader = DomainListReader(domain_file_name, **domain_list_options)
+    output = csv.writer(sys.stdout)
+    output.writerow(DomainAuditResult.fields)
+
+    async def audit():
+        query_engine = QueryEngine(**query_engine_options)
+        resolver = get_bulk_resolver(query_engine, scheduler_options)
+        auditor = AsyncDomainAuditor(max_in_flight=concurrency, resolver=resolver)
+        try:
+            async for result in auditor.audit_domains(domain_reader):
+                output.writerow(result.to_row())
+                sys.stdout.flush()
+        finally:
+            query_engine.close()
+            if resolver is not query_engine:
+                print(resolver.get_summary(), file=sys.stderr)
+
+    asyncio.run(audit())
+    print(domain_reader.get_summary(), file=sys.stderr)
+
+
+# Check the external report authorization records of a list of domains.
+def run_report_authorization_check(domain_file_name, concurrency, query_engine_options, scheduler_options,
+                                   domain_list_options):
+    '''
+    Writes one CSV row to standard output for every rua or ruf destination whose authorization record is
+    missing or could not be looked up. Receivers drop the reports of a missing one without telling anyone.
+    :param domain_file_name: File with one domain name per line.
+    :param concurrency: Maximum number of DNS queries in flight.
+    :param query_engine_options: Dictionary of QueryEngine arguments.
+    :param scheduler_options: Dictionary of NameserverScheduler arguments, or None to send queries without one.
+    :param domain_list_options: Dictionary of DomainListReader arguments.
+    :return: None.
+    '''
+    import asyncio
+    from AsyncDomainAuditor import AsyncDomainAuditor
+    from QueryEngine import QueryEngine
+    from ReportAuthorizationChecker import ReportAuthorization, ReportAuthorizationChecker
+
+    domain_reader = DomainListReader(domain_file_name, **domain_list_options)
+    output = csv.writer(sys.stdout)
+    output.writerow(ReportAuthorization.fields)
+
+    async def check():
+        query_engine = QueryEngine(**query_engine_options)
+        resolver = get_bulk_resolver(query_engine, scheduler_options)
+        auditor = AsyncDomainAuditor(max_in_flight=concurrency, resolver=resolver)
+        checker = ReportAuthorizationChecker(max_in_flight=concurrency, auditor=auditor)
+        try:
+            async for authorizations in checker.check_domains(domain_reader):
+                for authorization in authorizations:
+                    if "authorized" != authorization.status:
+                        output.writerow(authorization.to_row())
+                sys.stdout.flush()
+        finally:
+            query_engine.close()
+            if resolver is not query_engine:
+                print(resolver.get_summary(), file=sys.stderr)
+
+    asyncio.run(check())
+    print(domain_reader.get_summary(), file=sys.stderr)
+
+
+# Find the DKIM keys of a list of domains.
+def run_dkim_discovery(domain_file_name, selector_file_name, concurrency, query_engine_options, scheduler_options,
+                       domain_list_options):
+    '''
+    Tries common DKIM selectors on every domain in a file and writes one CSV row per key found to standard
+    output, or one row per domain where none was found.
+    :param domain_file_name: File with one domain name per line.
+    :param selector_file_name: Optional file with one selector per line.
+    :param concurrency: Maximum number of DNS queries in flight.
+    :param query_engine_options: Dictionary of QueryEngine arguments.
+    :param scheduler_options: Dictionary of NameserverScheduler arguments, or None to send queries without one.
+    :param domain_list_options: Dictionary of DomainListReader arguments.
+    :return: None.
+    '''
+    import asyncio
+    from AsyncDomainAuditor import AsyncDomainAuditor
+    from DkimSelectorDiscovery import DkimKeyInfo, DkimSelectorDiscovery
+    from QueryEngine import QueryEngine
+
+    selectors = None
+    if selector_file_name:
+        with open(selector_file_name) as selector_file:
+            selectors = list(read_domain_names(selector_file))
+    domain_reader = DomainListReader(domain_file_name, **domain_list_options)
+    output = csv.writer(sys.stdout)
+    output.writerow(DkimKeyInfo.fields)
+
+    async def discover():
+        query_engine = QueryEngine(**query_engine_options)
+        resolver = get_bulk_resolver(query_engine, scheduler_options)
+        auditor = AsyncDomainAuditor(max_in_flight=concurrency, resolver=resolver)
+        discovery = DkimSelectorDiscovery(selectors, max_in_flight=concurrency, auditor=auditor)
+        try:
+            async for key_infos in discovery.discover_domains(domain_reader):
+                output.writerows(key_info.to_row() for key_info in key_infos)
+                sys.stdout.flush()
+        finally:
+            query_engine.close()
+            if resolver is not query_engine:
+                print(resolver.get_summary(), file=sys.stderr)
+        print(str(discovery.probe_count) + " selector lookups made, " + str(discovery.skipped_probe_count) +
+              " skipped because '_domainkey' does not exist.", file=sys.stderr)
+
+    asyncio.run(discover())
+    print(domain_reader.get_summary(), file=sys.stderr)
+
+
+# Check the DMARC records of many domains for problems.
+def run_dmarc_lint(domain_file_name, min_severity, concurrency, query_engine_options, scheduler_options,
+                   domain_list_options):
+    '''
+    Looks up the '_dmarc' records of every domain in a file and writes one CSV row per problem found to
+    standard output.
+    :param domain_file_name: File with one domain name per line.
+    :param min_severity: Lowest severity reported.
+    :param concurrency: Maximum number of DNS queries in flight.
+    :param query_engine_options: Dictionary of QueryEngine arguments.
+    :param scheduler_options: Dictionary of NameserverScheduler arguments, or None to send queries without one.
+    :param domain_list_options: Dictionary of DomainListReader arguments.
+    :return: None.
+    '''
+    import asyncio
+    from AsyncDomainAuditor import AsyncDomainAuditor
+    from DmarcLinter import DmarcLintFinding
+    from QueryEngine import QueryEngine
+
+    linter = DmarcLinter(min_severity)
+    domain_reader = DomainListReader(domain_file_name, **domain_list_options)
+    output = csv.writer(sys.stdout)
+    output.writerow(DmarcLintFinding.fields)
+    failed_domain_count = 0
+
+    async def lint():
+        nonlocal failed_domain_count
+        query_engine = QueryEngine(**query_engine_options)
+        resolver = get_bulk_resolver(query_engine, scheduler_options)
+        auditor = AsyncDomainAuditor(max_in_flight=concurrency, resolver=resolver)
+        try:
+            async for result in auditor.audit_domains(domain_reader):
+                if result.dmarc_txt_records is None:
+                    failed_domain_count += 1
+                    continue
+                findings = linter.lint_txt_records(result.domain_name, result.dmarc_txt_records)
+                output.writerows(finding.to_row() for finding in findings)
+        finally:
+            query_engine.close()
+            if resolver is not query_engine:
+                print(resolver.get_summary(), file=sys.stderr)
+
+    asyncio.run(lint())
+    sys.stdout.flush()
+    print(domain_reader.get_summary(), file=sys.stderr)
+    print(str(linter.record_count) + " DMARC records checked, " + str(linter.finding_count) + " problems found.",
+          file=sys.stderr)
+    if failed_domain_count:
+        print(str(failed_domain_count) + " domains were skipped because their '_dmarc' lookup failed.",
+              file=sys.stderr)
+
+
+# Find the DMARC policy that applies to each of a list of domains.
+def run_policy_discovery(domain_file_name, method, concurrency, query_engine_options, scheduler_options,
+                         domain_list_options):
+    '''
+    Writes one CSV row per domain in a file to standard output, giving the DMARC policy receivers apply to
+    it and the record that policy comes from.
+    :param domain_file_name: File with one domain name per line.
+    :param method: 'rfc7489' or 'tree-walk'.
+    :param concurrency: Maximum number of DNS queries in flight.
+    :param query_engine_options: Dictionary of QueryEngine arguments.
+    :param scheduler_options: Dictionary of NameserverScheduler arguments, or None to send queries without one.
+    :param domain_list_options: Dictionary of DomainListReader arguments.
+    :return: None.
+    '''
+    import asyncio
+    from AsyncDomainAuditor import AsyncDomainAuditor
+    from DmarcPolicyDiscovery import DmarcPolicyDiscovery, DmarcPolicyResult
+    from QueryEngine import QueryEngine
+
+    domain_reader = DomainListReader(domain_file_name, **domain_list_options)
+    output = csv.writer(sys.stdout)
+    output.writerow(DmarcPolicyResult.fields)
+
+    async def discover():
+        query_engine = QueryEngine(**query_engine_options)
+        resolver = get_bulk_resolver(query_engine, scheduler_options)
+        auditor = AsyncDomainAuditor(max_in_flight=concurrency, resolver=resolver)
+        discovery = DmarcPolicyDiscovery(method, max_in_flight=concurrency, auditor=auditor)
+        try:
+            async for result in discovery.discover_domains(domain_reader):
+                output.writerow(result.to_row())
+                sys.stdout.flush()
+        finally:
+            query_engine.close()
+            if resolver is not query_engine:
+                print(resolver.get_summary(), file=sys.stderr)
+        print(discovery.get_summary(), file=sys.stderr)
+
+    asyncio.run(discover())
+    print(domain_reader.get_summary(), file=sys.stderr)
+
+
+# Audit a very large list of domains using several processes.
+def run_scan(arguments):
+    '''
+    Runs a sharded, resumable scan of the domains in a file.
+    :param arguments: argparse.Namespace with the scan, output_dir, workers, shard_size, concurrency, and
+        cache_file arguments.
+    :return: None.
+    '''
+    from ShardedScanner import ShardedScanner
+
+    scanner = ShardedScanner(arguments.output_dir, workers=arguments.workers, shard_size=arguments.shard_size,
+                             max_in_flight=arguments.concurrency, cache_file_name=arguments.cache_file,
+                             query_engine_options=get_query_engine_options(arguments),
+                             scheduler_options=get_scheduler_options(arguments),
+                             metrics_options=get_metrics_options(arguments))
+    domain_list_options = get_domain_list_options(arguments)
+    domain_reader = DomainListReader(arguments.scan, **domain_list_options)
+    results_path = scanner.scan(arguments.scan, domain_reader, domain_list_options)
+    print(domain_reader.get_summary(), file=sys.stderr)
+    print("Results written to '" + results_path + "'.")
+
+
+# Watch a list of domains for record changes.
+def run_monitor(domain_file_name, dkim_selectors, max_queries_per_second, domain_list_options):
+    '''
+    Watches the records of every domain in a file until interrupted, writing one JSON line per change to
+    standard output.
+    :param domain_file_name: File with one domain name per line.
+    :param dkim_selectors: List of DKIM selectors to watch on every domain.
+    :param max_queries_per_second: Maximum number of records checked per second.
+    :param domain_list_options: Dictionary of DomainListReader arguments.
+    :return: None.
+    '''
+    import json
+    from DomainMonitor import DomainMonitor
+
+    def write_event(event):
+        print(json.dumps(event.to_dictionary()), flush=True)
+
+    monitor = DomainMonitor(write_event, dkim_selectors=dkim_selectors,
+                            max_queries_per_second=max_queries_per_second)
+    for domain_name in DomainListReader(domain_file_name, **domain_list_options):
+        monitor.add_domain(domain_name)
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        monitor.stop()
+
+
+# Check the SPF record of a domain.
+def run_spf_check(spf_domain_name, flatten):
+    '''
+    Resolves the SPF record of a domain and prints its lookup counts and problems.
+    :param spf_domain_name: Domain to check.
+    :param flatten: If True, also print the flattened record.
+    :return: None.
+    '''
+    from SpfResolver import SpfResolver
+
+    spf_node = SpfResolver().resolve(spf_domain_name)
+    print("SPF record:   " + spf_node.record)
+    print("DNS lookups:  " + str(spf_node.lookup_count) + " (limit " + str(SpfResolver.lookup_limit) + ")")
+    print("Void lookups: " + str(spf_node.void_lookup_count) + " (limit " + str(SpfResolver.void_lookup_limit) + ")")
+    for problem in SpfResolver.get_problems(spf_node):
+        print("WARNING: " + problem)
+    if flatten and "" != spf_node.record:
+        print("Flattened:    " + SpfResolver.flatten(spf_node))
+        if spf_node.has_dynamic_terms:
+            print("Note: ptr, exists, and macro terms were kept as they are and still need lookups.")
+
+
+# Find the SPF result of many sending IPs for a domain.
+def run_spf_ip_check(spf_domain_name, ip_addresses, ip_file):
+    '''
+    Compiles the SPF record of a domain and writes one CSV row with the check_host() result of each IP.
+    :param spf_domain_name: Domain whose SPF record is checked.
+    :param ip_addresses: List of IP addresses.
+    :param ip_file: Optional open file of more IP addresses, read by read_ip_addresses().
+    :return: None.
+    '''
+    import itertools
+    from SpfPolicy import SpfPolicy
+    from SpfResolver import SpfResolver
+
+    spf_policy = SpfPolicy(SpfResolver().resolve(spf_domain_name))
+    if ip_file is not None:
+        ip_addresses = itertools.chain(ip_addresses, read_ip_addresses(ip_file))
+    output = csv.writer(sys.stdout)
+    output.writerow(["ip_address", "result"])
+    output.writerows(spf_policy.check_hosts(ip_addresses))
+    print("Compiled the SPF record of '" + spf_policy.domain_name + "' into " + str(spf_policy.get_prefix_count()) +
+          " prefixes.", file=sys.stderr)
+    if spf_policy.node.has_dynamic_terms:
+        print("Note: IPs reaching a ptr, exists, or macro term get 'unknown', since those depend on the message.",
+              file=sys.stderr)
+
+
+# Read DMARC aggregate reports.
+def run_read_reports(report_file_names):
+    '''
+    Writes one CSV row to standard output for every record in the aggregate reports given.
+    :param report_file_names: List of report file names.
+    :return: None.
+    '''
+    from AggregateReportParser import AggregateReportParser, AggregateReportRow
+
+    output = csv.writer(sys.stdout)
+    output.writerow(AggregateReportRow.fields)
+    for report_file_name in report_file_names:
+        for row in AggregateReportParser.read_file(report_file_name):
+            output.writerow(row.to_row())
+
+
+# Read DMARC failure reports.
+def run_read_failure_reports(mailbox_paths, checkpoint_path, workers):
+    '''
+    Writes one CSV row to standard output for every new failure report in the mailboxes given.
+    :param mailbox_paths: List of mbox file and Maildir directory paths.
+    :param checkpoint_path: File recording what has already been read.
+    :param workers: Number of worker processes, or None for the number of CPUs.
+    :return: None.
+    '''
+    from FailureReportIngester import FailureReport, FailureReportIngester
+
+    ingester = FailureReportIngester(checkpoint_path, workers=workers)
+    try:
+        output = csv.writer(sys.stdout)
+        output.writerow(FailureReport.fields)
+        for failure_report in ingester.ingest(mailbox_paths):
+            output.writerow(failure_report.to_row())
+    finally:
+        ingester.close()
+    print(str(ingester.duplicate_count) + " duplicate reports were skipped.", file=sys.stderr)
+
+
+# Import reports into, or query, the report store.
+def run_report_store(arguments):
+    '''
+    Imports aggregate reports into the report store and/or prints the top failing source IPs of a domain.
+    :param arguments: argparse.Namespace with the report_store, import_reports, top_failing, days, and
+        include_subdomains arguments.
+    :return: None.
+    '''
+    from ReportStore import ReportStore
+
+    report_store = ReportStore(arguments.report_store)
+    try:
+        for report_file_name in arguments.import_reports or []:
+            row_count = report_store.import_report_file(report_file_name)
+            print("Imported " + str(row_count) + " rows from '" + report_file_name + "'.")
+        if arguments.top_failing:
+            print("Top failing source IPs for '" + arguments.top_failing + "' in the last " +
+                  str(arguments.days) + " days:")
+            print("Source IP                                Failing     Total")
+            for source_ip, failing_count, message_count in report_store.get_top_failing_sources(
+                    arguments.top_failing, arguments.days, include_subdomains=arguments.include_subdomains):
+                print(source_ip.ljust(40) + str(failing_count).rjust(8) + str(message_count).rjust(10))
+    finally:
+        report_store.close()
+
+
+def read_domain_names(domain_file):
+    '''
+    Yields the domain names in a file.
+    :param domain_file: Open text file with one domain name per line.
+    :return: Generator of domain names.
+    '''
+    for line in domain_file:
+        line = line.strip()
+        if "" != line and not line.startswith("#"):
+            yield line
+
+
+def read_ip_addresses(ip_file):
+    '''
+    Yields the IP addresses in a file.
+    :param ip_file: Open text file with one IP address per line, or CSV with a source_ip column.
+    :return: Generator of IP addresses.
+    '''
+    first_line = ip_file.readline()
+    header = next(csv.reader([first_line]), [])
+    if "source_ip" not in header:
+        yield from read_domain_names([first_line])
+        yield from read_domain_names(ip_file)
+        return
+    column = header.index("source_ip")
+    for row in csv.reader(ip_file):
+        if len(row) > column and "" != row[column]:
+            yield row[column]
+
+
 # Display the welcome message.
 def display_welcome_message():
     '''
@@ -99,30 +821,56 @@ def ask_dmarc_questions():
     global dmarc_aggregate_email_address
     global dmarc_failure_email_address
     global domain_record_handler
+    global domain_prefetcher
     global dmarc_record
+    from DomainPrefetcher import DomainPrefetcher
 
-    # Get the domain name.
+    # Get the domain name. Every lookup needed by later questions is started in the background as soon
+    # as the name is entered.
     domain_name = ""
     while domain_name == "":
         print("")
         domain_name = input("Domain name: ")
         clear_screen()
-        domain_record_handler = DomainRecordHandler(domain_name)
-        if not DomainRecordHandler.get_domain_exists(domain_name):
+        if "" == domain_name:
+            continue
+        domain_prefetcher = DomainPrefetcher(domain_name)
+        domain_prefetcher.start()
+        domain_exists = domain_prefetcher.get_domain_exists(DomainPrefetcher.existence_wait)
+        if domain_exists is False:
             print("Unable to verify that this domain currently exists.")
             print("")
         user_input = ask_yes_no_question(["Is '" + domain_name + "' the correct domain?"])
         if "n" == user_input:
+            domain_prefetcher.cancel()
             domain_name = ""
 
     set_subdomain()
 
     # Check if domain is used for email.
     clear_screen()
+    # If the existence check was still running when the domain was confirmed, report it now.
+    if domain_exists is None and not domain_prefetcher.get_domain_exists():
+        print("Unable to verify that this domain currently exists.")
+        print("")
     user_input = ask_yes_no_question(["Is '" + domain_name + "' used to send email?"])
     if "n" == user_input:
         domain_is_used_for_email = False
 
+    # The '_dmarc' lookup has normally finished by now, so this reads it from the cache.
+    domain_prefetcher.resolve("_dmarc." + domain_name, "TXT")
+    domain_record_handler = DomainRecordHandler(domain_name)
+    # A subdomain without a record of its own gets the policy of its organizational domain's record. The
+    # prefetcher has normally looked that record up too.
+    dmarc_policy_result = get_effective_dmarc_policy(domain_name)
+    is_policy_inherited = (
+        "found" == dmarc_policy_result.status and dmarc_policy_result.record_domain != dmarc_policy_result.domain_name
+    )
+    # Problems with the current record are shown along with the policy question. A missing record is expected.
+    dmarc_findings = DmarcLinter("warning", ["DMARC001"]).lint_txt_records(
+        domain_name, domain_record_handler.dmarc_txt_records
+    )
+
     # If domain is used for email then ask these questions.
     if domain_is_used_for_email:
 
@@ -147,6 +895,19 @@ def ask_dmarc_questions():
             if "" != domain_record_handler.dmarc_record.p:
                 print("")
                 print("Note: Current domain policy is set to '" + domain_record_handler.dmarc_record.p + "'.")
+            elif domain_record_handler.dmarc_lookup_error is not None:
+                print("")
+                print("Note: The current DMARC record could not be looked up, so it is not known if one exists.")
+            elif is_policy_inherited:
+                print("")
+                print("Note: This domain has no DMARC record of its own. The '" + dmarc_policy_result.policy + "'")
+                print("    policy of '" + dmarc_policy_result.record_domain + "' (its " +
+                      dmarc_policy_result.policy_tag + " tag) currently applies.")
+            if dmarc_findings:
+                print("")
+                print("Problems found in the current DMARC record:")
+                for dmarc_finding in dmarc_findings:
+                    print("    " + dmarc_finding.severity.upper() + ": " + dmarc_finding.message)
             print("")
             user_input = input("Policy selection: ")
             dmarc_policy = dmarc_policies.get(user_input, "")
@@ -169,9 +930,9 @@ def ask_dmarc_questions():
                 print("'m' for monitor")
                 print("'q' for quarantine")
                 print("'r' for reject")
-                if "" != domain_record_handler.dmarc_record.sp:
+                if "" != dmarc_policy_result.subdomain_policy:
                     print("")
-                    print("Note: Current subdomain policy is set to '" + domain_record_handler.dmarc_record.sp + "'.")
+                    print("Note: Current subdomain policy is '" + dmarc_policy_result.subdomain_policy + "'.")
                 print("")
                 user_input = input("Policy selection: ")
                 dmarc_subdomain_policy = dmarc_policies.get(user_input, "")
@@ -207,8 +968,8 @@ def ask_dmarc_questions():
             question.append("Note: Currently the domain is configured for 'no'.")
         user_input = ask_yes_no_question(question)
         if "y" == user_input:
-            dmarc_dkim_alignment = "; adkim=s"
-            dmarc_spf_alignment = "; aspf=s"
+            dmarc_dkim_alignment = "s"
+            dmarc_spf_alignment = "s"
 
     # Get aggregate reporting email address if reports are wanted.
     clear_screen()
@@ -217,7 +978,7 @@ def ask_dmarc_questions():
         for email_address in domain_record_handler.dmarc_record.rua:
             if "" != email_addresses:
                 email_addresses += ", "
-            email_addresses = email_addresses + (email_address.split(":")[1]).strip()
+            email_addresses = email_addresses + get_report_address(email_address)
         print("Note: Currently aggregate reports are sent to '"+email_addresses+"'.")
         print("")
     question = [
@@ -266,7 +1027,7 @@ def ask_dmarc_questions():
         for email_address in domain_record_handler.dmarc_record.ruf:
             if "" != email_addresses:
                 email_addresses += ", "
-            email_addresses = email_addresses + (email_address.split(":")[1]).strip()
+            email_addresses = email_addresses + get_report_address(email_address)
         print("Note: Currently failure reports are sent to '" + email_addresses + "'.")
         print("")
     question = [
@@ -325,7 +1086,7 @@ def ask_dmarc_questions():
         ]
         user_input = ask_yes_no_question(question)
         if "y" == user_input:
-            dmarc_failure_reporting_option = "; fo=1"
+            dmarc_failure_reporting_option = "1"
 
 
 # Ask questions needed to configure SPF and have not been previously asked.
@@ -340,7 +1101,12 @@ def ask_spf_questions():
     if domain_is_used_for_email:
         is_not_done = True
         clear_screen()
+        current_spf_record = domain_prefetcher.get_spf_record()
+        mx_hosts = domain_prefetcher.get_mx_hosts()
         while is_not_done:
+            if "" != current_spf_record:
+                print("Note: Current SPF record is '" + current_spf_record + "'.")
+                print("")
             print("Add servers which may send email.")
             print("")
             print("Select:")
@@ -350,6 +1116,8 @@ def ask_spf_questions():
             print("2. Add by host name. Example: 'host.domain.com'.")
             print("3. Add for 3rd party providers. Example: '3rdPartyDomain.com'.")
             print("4. Add email servers with MX entries for your domain.")
+            if mx_hosts:
+                print("    Current MX entries: " + ", ".join(mx_hosts) + ".")
             print("5. Done adding. Exit.")
             print("")
             user_input = input("Selection: ")
@@ -367,15 +1135,11 @@ def ask_spf_questions():
                     print("")
                 elif "2" == user_input:
                     server_input = input("Enter the host name: ")
-                    period_count = server_input.count(".")
-                    # Check that there are at least two periods in the host name.
-                    if period_count > 1:
+                    organizational_domain = PublicSuffixList.get_default().get_organizational_domain(server_input)
+                    # Check that there is a host name in front of the organizational domain.
+                    if organizational_domain != server_input.lower().rstrip("."):
                         # Check that the host name matches.
-                        temp_domain = server_input[::-1]
-                        first_period_position = temp_domain.find(".")
-                        second_period_position = temp_domain.find(".", first_period_position + 1)
-                        temp_domain = temp_domain[:second_period_position][::-1]
-                        if temp_domain == parent_domain_name:
+                        if organizational_domain == parent_domain_name:
                             spf_servers = spf_servers + " a:" + server_input
                             clear_screen()
                             print("'" + server_input + "' has been added.")
@@ -395,11 +1159,13 @@ def ask_spf_questions():
                     spf_servers = spf_servers + " include:" + server_input
                     clear_screen()
                     print("'" + server_input + "' has been added.")
+                    print_spf_lookup_count()
                     print("")
                 elif "4" == user_input:
                     spf_servers = spf_servers + " mx"
                     clear_screen()
                     print("Servers with MX entries have been added.")
+                    print_spf_lookup_count()
                     print("")
                 elif "5" == user_input:
                     clear_screen()
@@ -411,6 +1177,21 @@ def ask_spf_questions():
                     print("")
 
 
+def print_spf_lookup_count():
+    '''
+    Resolves the SPF record built so far and prints how many of the allowed DNS lookups it needs, along
+    with any problems found.
+    :return: None.
+    '''
+    from SpfResolver import SpfResolver
+
+    spf_node = SpfResolver().resolve_record(domain_name, "v=spf1" + spf_servers + " ~all")
+    print("Note: This SPF record needs " + str(spf_node.lookup_count) + " of the " +
+          str(SpfResolver.lookup_limit) + " DNS lookups allowed.")
+    for problem in SpfResolver.get_problems(spf_node):
+        print("WARNING: " + problem)
+
+
 # Ask questions needed to configure DKIM and have not been previously asked.
 def ask_dkim_questions():
     '''
@@ -419,62 +1200,95 @@ def ask_dkim_questions():
     '''
 
     global dkim_selector
+    global dkim_public_key
 
     if domain_is_used_for_email:
 
         clear_screen()
         print("If DKIM has been configured on your server, what is the name of your selector?")
         print("")
+        found_dkim_selectors = domain_prefetcher.get_found_dkim_selectors()
+        if found_dkim_selectors:
+            print("Note: DKIM keys were found for these selectors: " + ", ".join(found_dkim_selectors) + ".")
+            print("")
         dkim_selector = input("Name: ")
         # If no input was provided set selector to 'selector' to allow for an example to be provided.
         if "" == dkim_selector:
             dkim_selector = "selector"
 
+        clear_screen()
+        question = [
+            "This tool can make a 2048 bit RSA key pair for the selector '" + dkim_selector + "'.",
+            "The private key would be saved in '" + os.path.join(dkim_key_directory, domain_name) + "'",
+            "for your mail server, and the public key put in the DKIM record below.",
+            "",
+            "Would you like to make a key pair?"
+        ]
+        if "y" == ask_yes_no_question(question):
+            from DkimKeyGenerator import DkimKeyGenerator
+            try:
+                dkim_key = DkimKeyGenerator(dkim_key_directory).generate_key(domain_name, dkim_selector)
+            except (OSError, ValueError) as error:
+                print("The key pair could not be made: " + str(error))
+            else:
+                dkim_public_key = dkim_key.public_key
+                print("Private key saved as '" + dkim_key.private_key_path + "'.")
+            input("Press Enter to continue.")
+
 
 # Check to see if the domain provided is a subdomain. If so, set
 # "subdomain_name" to a period followed by what is in "domain_name", but
-# without the parent domain portion.
+# without the organizational domain portion.
 # The proceeding period is needed for the DNS host names.
-# Example: "mail.domain.xyz" becomes ".mail"
+# Example: "mail.domain.co.uk" becomes ".mail"
 def set_subdomain():
     '''
     Sets the value for the global variables subdomain_name and/or parent_domain_name.
+    The parent domain is the organizational domain found with the Public Suffix List, so
+    'mail.domain.co.uk' has a parent domain of 'domain.co.uk'.
     :return: None.
     '''
     global subdomain_name
     global parent_domain_name
-    period_count = domain_name.count('.')
-    # If there is more than one period then it is a subdomain.
-    if period_count > 1:
-        # Reverse the domain_name string. This places the parent domain at
-        # the beginning and makes it easier to remove.
-        temp_domain = domain_name[::-1]
-        first_period_position = temp_domain.find(".")
-        second_period_position = temp_domain.find(".", first_period_position + 1)
-        # Set the parent domain name.
-        parent_domain_name = temp_domain[:second_period_position][::-1]
-        # Get all characters from the second period's position on.
-        temp_domain = temp_domain[second_period_position + 1:]
-        # Reverse the string again to get the characters back in the correct
-        # order.
-        subdomain_name = "." + temp_domain[::-1]
-    else:
-        parent_domain_name = domain_name
+    parent_domain_name, subdomain_name = RecordGenerator.split_domain_name(domain_name)
+
+
+# Find the DMARC policy currently applied to the domain being configured.
+def get_effective_dmarc_policy(domain_name):
+    '''
+    :param domain_name: Domain name.
+    :return: DmarcPolicyResult found as described in RFC 7489. Answers already in the shared cache are not
+        looked up again.
+    '''
+    import asyncio
+    from DmarcPolicyDiscovery import DmarcPolicyDiscovery
+
+    return asyncio.run(DmarcPolicyDiscovery().discover(domain_name))
+
+
+def get_report_address(report_uri):
+    '''
+    Takes a rua or ruf entry and returns what to show for it.
+    :param report_uri: Report URI, for example 'mailto:reports@domain.com!10m'.
+    :return: The email address of a mailto URI, or the entry as it is for anything else, such as an address
+        missing 'mailto:'.
+    '''
+    scheme, address, _ = DmarcParser.split_report_uri(report_uri)
+    if "mailto" == scheme:
+        return address
+    return report_uri.strip()
 
 
 def get_root_domain_from_email(email_address):
     '''
     Takes an email address and returns the root domain for the email account.
     :param email_address: Email address to find the root domain for.
-    :return: Root domain of the email address provided.
+    :return: Organizational domain of the email address provided, for example 'domain.co.uk' for
+        'reports@mail.domain.co.uk'.
     '''
 
     at_position = email_address.find("@")
-    root_domain = email_address[at_position + 1::]
-    while root_domain.count('.') > 1:
-        period_position = root_domain.find(".")
-        root_domain = root_domain[period_position + 1::]
-    return root_domain
+    return PublicSuffixList.get_default().get_organizational_domain(email_address[at_position + 1::])
 
 
 def print_dmarc_output():
@@ -482,53 +1296,12 @@ def print_dmarc_output():
     Prints the information needed for DNS records needed for DMARC.
     :return: None.
     '''
-
-    # Print DMARC TXT record information.
-    print("DMARC DNS RECORD (" + parent_domain_name + ")")
-    print("Record type: TXT")
-    print("Host name:   _dmarc" + subdomain_name)
-    if domain_is_used_for_email:
-        print("Value:       v=DMARC1; p=" + dmarc_policy, end='')
-        if "" != dmarc_subdomain_policy:
-            print("; sp=" + dmarc_subdomain_policy, end='')
-        print(dmarc_failure_reporting_option, end='')
-        print(dmarc_dkim_alignment, end='')
-        print(dmarc_spf_alignment, end='')
-    else:
-        print("Value:       v=DMARC1; p=reject; sp=reject", end='')
-        print(dmarc_failure_reporting_option, end='')
-    if "" != dmarc_aggregate_email_address:
-        print("; rua=mailto:" + dmarc_aggregate_email_address, end='')
-    if "" != dmarc_failure_email_address:
-        print("; ruf=mailto:" + dmarc_failure_email_address, end='')
-    print("")
-
-    # Get domain for where emails are going.
-    at_position = dmarc_aggregate_email_address.find("@")
-    aggregate_email_domain = dmarc_aggregate_email_address[at_position + 1:]
-    # If aggregate report emails are going to a different domain then print DNS record for that domain.
-    if aggregate_email_domain != domain_name and "" != aggregate_email_domain:
-        print("")
-        print("DMARC DNS RECORD (" + aggregate_email_domain + ")")
-        print("Record type: TXT")
-        print("Host name:   " + domain_name + "._report._dmarc." + aggregate_email_domain)
-        print("Value:       v=DMARC1")
-
-    # Get domain for where emails are going.
-    at_position = dmarc_failure_email_address.find("@")
-    failure_email_domain = dmarc_failure_email_address[at_position + 1:]
-    # If failure report emails are going to a different domain then print DNS record for that domain.
-
-    if (
-            failure_email_domain != domain_name and
-            failure_email_domain != aggregate_email_domain and
-            "" != failure_email_domain
-    ):
-        print("")
-        print("DMARC DNS RECORD (" + failure_email_domain + ")")
-        print("Record type: TXT")
-        print("Host name:   " + domain_name + "._report._dmarc." + failure_email_domain)
-        print("Value:       v=DMARC1")
+    records = RecordGenerator.get_dmarc_records(
+        domain_name, parent_domain_name, subdomain_name, domain_is_used_for_email, dmarc_policy,
+        dmarc_subdomain_policy, dmarc_failure_reporting_option, dmarc_dkim_alignment, dmarc_spf_alignment,
+        dmarc_aggregate_email_address, dmarc_failure_email_address
+    )
+    print("\n\n".join(record.to_text() for record in records))
 
 
 def print_spf_output():
@@ -536,17 +1309,8 @@ def print_spf_output():
     Prints the information needed for DNS records for SPF.
     :return: None.
     '''
-
-    # Print SPF TXT record information.
     print("")
-    print("SPF DNS RECORD (" + parent_domain_name + ")")
-    print("Record type: TXT")
-    if "" == subdomain_name:
-        print("Host name:   @")
-    else:
-        print("Host name:   " + subdomain_name[1:])
-    print("Value:       v=spf1", end='')
-    print(spf_servers + " ~all")
+    print(RecordGenerator.get_spf_record(parent_domain_name, subdomain_name, spf_servers).to_text())
 
 
 def print_dkim_output():
@@ -554,19 +1318,10 @@ def print_dkim_output():
     Prints the information needed for DNS records for DKIM.
     :return: None.
     '''
-
-    # Print DKIM TXT record information.
-    print("")
-    print("DKIM DNS RECORD (" + parent_domain_name + ")")
-    print("Record type: TXT")
-    if "" == subdomain_name:
-        print("Host name:   " + dkim_selector + "._domainkey")
-    else:
-        print("Host name:   " + dkim_selector + "._domainkey" + subdomain_name)
-    print("Value:       v=DKIM1; k=rsa; p=", end='')
-    if domain_is_used_for_email:
-        print("ReplaceThisTextWithYourPublicKey", end='')
     print("")
+    print(RecordGenerator.get_dkim_record(
+        parent_domain_name, subdomain_name, dkim_selector, domain_is_used_for_email, dkim_public_key
+    ).to_text())
 
 
 if __name__ == "__main__":
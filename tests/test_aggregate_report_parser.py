@@ -0,0 +1,72 @@
+import gzip
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from AggregateReportParser import AggregateReportParser
+
+report_xml = b'''<?xml version="1.0" encoding="UTF-8"?>
+<feedback xmlns="urn:ietf:params:xml:ns:dmarc-2.0">
+  <report_metadata>
+    <org_name>receiver.test</org_name>
+    <report_id>r1</report_id>
+    <date_range><begin>1700000000</begin><end>1700086400</end></date_range>
+  </report_metadata>
+  <policy_published><domain>Example.COM</domain><p>reject</p></policy_published>
+  <record>
+    <row>
+      <source_ip>192.0.2.1</source_ip>
+      <count>12</count>
+      <policy_evaluated><disposition>none</disposition><dkim>pass</dkim><spf>fail</spf></policy_evaluated>
+    </row>
+    <identifiers><header_from>Example.com</header_from></identifiers>
+    <auth_results>
+      <dkim><domain>example.com</domain><result>pass</result></dkim>
+      <dkim><domain>other.test</domain><result>fail</result></dkim>
+      <spf><domain>bounce.example.com</domain><result>fail</result></spf>
+    </auth_results>
+  </record>
+  <record>
+    <row><source_ip>2001:db8::1</source_ip><count>x</count></row>
+  </record>
+</feedback>
+'''
+
+
+class AggregateReportParserTest(unittest.TestCase):
+
+    def test_rows(self):
+        rows = [row.to_row() for row in AggregateReportParser.read_report(io.BytesIO(report_xml))]
+        self.assertEqual([
+            ["receiver.test", "r1", 1700000000, 1700086400, "example.com", "reject", "192.0.2.1", 12, "none", "pass",
+             "fail", "example.com", "example.com", "pass", "bounce.example.com", "fail"],
+            ["receiver.test", "r1", 1700000000, 1700086400, "example.com", "reject", "2001:db8::1", 0, "", "", "",
+             "", "", "", "", ""],
+        ], rows)
+
+    def test_rows_are_read_in_blocks(self):
+        read_size = AggregateReportParser.read_size
+        AggregateReportParser.read_size = 7
+        try:
+            rows = list(AggregateReportParser.read_report(io.BytesIO(report_xml)))
+        finally:
+            AggregateReportParser.read_size = read_size
+        self.assertEqual(["192.0.2.1", "2001:db8::1"], [row.source_ip for row in rows])
+
+    def test_compressed_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            gzip_name = os.path.join(directory, "report.xml.gz")
+            with gzip.open(gzip_name, "wb") as gzip_file:
+                gzip_file.write(report_xml)
+            zip_name = os.path.join(directory, "report.ZIP")
+            with zipfile.ZipFile(zip_name, "w") as archive:
+                archive.writestr("a.xml", report_xml)
+                archive.writestr("readme.txt", b"not a report")
+                archive.writestr("b.xml", report_xml)
+            self.assertEqual(2, len(list(AggregateReportParser.read_file(gzip_name))))
+            self.assertEqual(4, len(list(AggregateReportParser.read_file(zip_name))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import unittest
+from AsyncDomainAuditor import AsyncDomainAuditor
+
+
+async def collect(results):
+    return [result async for result in results]
+
+
+async def double(item):
+    await asyncio.sleep(0)
+    if 3 == item:
+        raise ValueError("bad item")
+    return item * 2
+
+
+def get_error_result(item, error):
+    return "error " + str(item) + ": " + str(error)
+
+
+class RunWorkersTest(unittest.TestCase):
+
+    def run_workers(self, items, worker_count=2):
+        results = AsyncDomainAuditor.run_workers(items, worker_count, double, get_error_result)
+        return asyncio.run(asyncio.wait_for(collect(results), 5))
+
+    def test_every_item_gives_a_result(self):
+        self.assertEqual([0, 2, 4, 8, "error 3: bad item"], sorted(self.run_workers(range(5)), key=str))
+
+    def test_items_are_pulled_as_workers_become_free(self):
+        pulled = []
+
+        def items():
+            for item in range(100):
+                pulled.append(item)
+                yield item
+
+        async def take_one():
+            results = AsyncDomainAuditor.run_workers(items(), 2, double, get_error_result)
+            async for _ in results:
+                break
+            await results.aclose()
+
+        asyncio.run(take_one())
+        self.assertLess(len(pulled), 10)
+
+    def test_iterable_error_reaches_the_consumer(self):
+        seen = []
+
+        def items():
+            yield 1
+            yield 2
+            raise OSError("read failed")
+
+        async def consume():
+            async for result in AsyncDomainAuditor.run_workers(items(), 4, double, get_error_result):
+                seen.append(result)
+
+        with self.assertRaises(OSError):
+            asyncio.run(asyncio.wait_for(consume(), 5))
+        self.assertEqual([2, 4], sorted(seen))
+
+    def test_none_is_an_item_like_any_other(self):
+        async def identity(item):
+            return item
+
+        results = AsyncDomainAuditor.run_workers([None, 1], 2, identity, get_error_result)
+        self.assertEqual([1, None], sorted(asyncio.run(collect(results)), key=str))
+
+
+if __name__ == "__main__":
+    unittest.main()
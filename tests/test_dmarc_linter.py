@@ -0,0 +1,49 @@
+import unittest
+from DmarcLinter import DmarcLinter
+
+
+def get_codes(findings):
+    return sorted((finding.code, finding.tag) for finding in findings)
+
+
+class DmarcLinterTest(unittest.TestCase):
+
+    def test_good_record_has_no_findings(self):
+        linter = DmarcLinter(min_severity="warning")
+        self.assertEqual([], linter.lint_txt_records("example.com", [
+            "v=DMARC1; p=quarantine; sp=reject; adkim=s; pct=100; rua=mailto:d@example.com!10m", "other text"]))
+
+    def test_published_records(self):
+        linter = DmarcLinter()
+        self.assertEqual([("DMARC001", "")], get_codes(linter.lint_txt_records("example.com", [])))
+        self.assertEqual([("DMARC002", "")], get_codes(linter.lint_txt_records("example.com", ["p=none; v=DMARC1"])))
+        self.assertEqual([("DMARC003", "")], get_codes(linter.lint_txt_records(
+            "example.com", ["v=DMARC1; p=none", "v=DMARC1; p=reject"])))
+
+    def test_record_and_tag_findings(self):
+        findings = DmarcLinter().lint_record("example.com", "v=DMARC1; sp=none; p=reject; p=none; pct=50; adkim=x; "
+                                                            "rua=d@example.com,mailto:d@example.com!10x,; fo=1; ext=1")
+        self.assertEqual([
+            ("DMARC011", ""), ("DMARC012", ""), ("DMARC013", ""), ("DMARC015", ""), ("DMARC016", ""),
+            ("DMARC023", "adkim"), ("DMARC026", "pct"), ("DMARC030", "rua"), ("DMARC033", "rua"),
+        ], get_codes(findings))
+        self.assertEqual({"example.com"}, {finding.domain_name for finding in findings})
+
+    def test_tag_findings_are_cached(self):
+        linter = DmarcLinter(disabled_codes=["DMARC014"])
+        for _ in range(3):
+            self.assertEqual([("DMARC020", "p")], get_codes(linter.lint_record("example.com", "v=DMARC1; p=block")))
+        self.assertEqual({"block": linter.tag_caches["p"]["block"]}, linter.tag_caches["p"])
+        self.assertEqual((3, 3), (linter.record_count, linter.finding_count))
+
+    def test_options(self):
+        with self.assertRaises(ValueError):
+            DmarcLinter(min_severity="fatal")
+        with self.assertRaises(ValueError):
+            DmarcLinter(disabled_codes=["DMARC999"])
+        with self.assertRaises(ValueError):
+            DmarcLinter.register("DMARC001", "warning", "txt", "Registered twice.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from DmarcParser import DmarcParser
+
+
+class DmarcParserTest(unittest.TestCase):
+
+    def test_join_txt_strings(self):
+        join_txt_strings = DmarcParser.join_txt_strings
+        self.assertEqual("v=DMARC1; p=none", join_txt_strings('"v=DMARC1; " "p=none"'))
+        self.assertEqual("v=DMARC1; p=none", join_txt_strings([b"v=DMARC1; ", "p=none"]))
+        self.assertEqual("v=DMARC1; p=none", join_txt_strings(b"v=DMARC1; p=none"))
+        self.assertEqual("v=DMARC1; p=none", join_txt_strings("v=DMARC1; p=none"))
+        # Escaped quotes and backslashes stay inside their string, and decimal escapes are UTF-8 bytes.
+        self.assertEqual('a";b\\c é', join_txt_strings('"a\\";" "b\\\\c \\195\\169"'))
+
+    def test_parse(self):
+        result = DmarcParser.parse('"v=DMARC1; p=reject; fo=0:d ; rua=mailto:a@example.com, mailto:b@example.net!10m;'
+                                   ' " "np=quarantine; psd=n; p=none; ext=1; junk;"')
+        dmarc_record = result.dmarc_record
+        self.assertEqual(("reject", "quarantine", "n"), (dmarc_record.p, dmarc_record.np, dmarc_record.psd))
+        self.assertEqual(["0", "d"], dmarc_record.fo)
+        self.assertEqual(["mailto:a@example.com", "mailto:b@example.net!10m"], dmarc_record.rua)
+        self.assertEqual("", dmarc_record.sp)
+        self.assertEqual(["p"], result.duplicate_tags)
+        self.assertEqual(["ext", "junk"], result.unknown_tags)
+        self.assertEqual(["v", "p", "fo", "rua", "np", "psd"], list(result.tag_names))
+
+    def test_split_report_uri(self):
+        split_report_uri = DmarcParser.split_report_uri
+        self.assertEqual(("mailto", "r@example.com", "10m"), split_report_uri(" MAILTO:r@example.com!10m "))
+        self.assertEqual(("https", "//example.com/reports", ""), split_report_uri("https://example.com/reports"))
+        self.assertEqual(("", "r@example.com", ""), split_report_uri("r@example.com"))
+        self.assertEqual(("", "1:2", ""), split_report_uri("1:2"))
+
+    def test_is_dmarc_record(self):
+        self.assertTrue(DmarcParser.is_dmarc_record("v = DMARC1; p=none"))
+        self.assertTrue(DmarcParser.is_dmarc_record("v=DMARC1"))
+        self.assertFalse(DmarcParser.is_dmarc_record("v=DMARC10; p=none"))
+        self.assertFalse(DmarcParser.is_dmarc_record("p=none; v=DMARC1"))
+        self.assertFalse(DmarcParser.is_dmarc_record("v=spf1 -all"))
+
+
+if __name__ == "__main__":
+    unittest.main()
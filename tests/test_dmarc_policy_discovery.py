@@ -0,0 +1,154 @@
+import asyncio
+import unittest
+import dns.exception
+from AsyncDomainAuditor import AsyncDomainAuditor
+from DmarcPolicyDiscovery import DmarcPolicyDiscovery
+from DnsCache import DnsCache
+
+
+class TimingOutResolver:
+    '''
+    Resolver for names the tests leave out of the cache, which are taken to be lookups that failed.
+    '''
+
+    async def resolve(self, name, rdtype):
+        raise dns.exception.Timeout()
+
+
+def make_discovery(answers, method="rfc7489"):
+    '''
+    :param answers: Dictionary of name -> list of TXT values, or None for a name that does not exist.
+    :param method: 'rfc7489' or 'tree-walk'.
+    :return: DmarcPolicyDiscovery whose lookups are answered from the dictionary.
+    '''
+    dns_cache = DnsCache()
+    for name, txt_values in answers.items():
+        if txt_values is None:
+            dns_cache.put(name, "TXT", "NXDOMAIN", [], 300)
+        else:
+            dns_cache.put(name, "TXT", "NOERROR", ['"' + txt_value + '"' for txt_value in txt_values], 300)
+    auditor = AsyncDomainAuditor(max_in_flight=10, resolver=TimingOutResolver(), dns_cache=dns_cache)
+    return DmarcPolicyDiscovery(method=method, max_in_flight=10, auditor=auditor)
+
+
+def discover(discovery, domain_name):
+    result = asyncio.run(discovery.discover(domain_name))
+    return result.status, result.policy, result.policy_tag, result.subdomain_policy, result.record_domain
+
+
+class DmarcPolicyDiscoveryTest(unittest.TestCase):
+
+    example_answers = {
+        "_dmarc.example.com": ["v=DMARC1; p=reject; sp=quarantine; np=reject"],
+        "_dmarc.own.example.com": ["v=DMARC1; p=none"],
+        "_dmarc.mail.example.com": None,
+        "mail.example.com": [],
+        "_dmarc.b.example.com": ["v=DMARC1; p=none; sp=none"],
+        "_dmarc.a.b.example.com": None,
+        "_dmarc.ghost.example.com": None,
+        "ghost.example.com": None,
+        "_dmarc.com": None,
+    }
+
+    def test_own_record(self):
+        discovery = make_discovery(self.example_answers)
+        self.assertEqual(("found", "none", "p", "quarantine", "own.example.com"),
+                         discover(discovery, "Own.Example.com."))
+        discovery = make_discovery(self.example_answers, "tree-walk")
+        self.assertEqual(("found", "none", "p", "none", "own.example.com"), discover(discovery, "own.example.com"))
+
+    def test_subdomain_falls_back_to_organizational_domain(self):
+        discovery = make_discovery(self.example_answers)
+        self.assertEqual(("found", "quarantine", "sp", "quarantine", "example.com"),
+                         discover(discovery, "mail.example.com"))
+        # RFC 7489 goes straight to the organizational domain, skipping b.example.com.
+        self.assertEqual(("found", "quarantine", "sp", "quarantine", "example.com"),
+                         discover(discovery, "a.b.example.com"))
+
+    def test_tree_walk_finds_the_closest_record(self):
+        discovery = make_discovery(self.example_answers, "tree-walk")
+        self.assertEqual(("found", "none", "sp", "none", "b.example.com"), discover(discovery, "a.b.example.com"))
+        self.assertEqual(("found", "quarantine", "sp", "quarantine", "example.com"),
+                         discover(discovery, "mail.example.com"))
+
+    def test_np_applies_to_names_that_do_not_exist(self):
+        discovery = make_discovery(self.example_answers, "tree-walk")
+        self.assertEqual(("found", "reject", "np", "quarantine", "example.com"),
+                         discover(discovery, "ghost.example.com"))
+        discovery = make_discovery(dict(self.example_answers, **{"ghost.example.com": []}), "tree-walk")
+        self.assertEqual(("found", "quarantine", "sp", "quarantine", "example.com"),
+                         discover(discovery, "ghost.example.com"))
+        # RFC 7489 has no np tag.
+        discovery = make_discovery(self.example_answers)
+        self.assertEqual("sp", discover(discovery, "ghost.example.com")[2])
+
+    def test_public_suffix_domain_record(self):
+        answers = {
+            "_dmarc.example.co.uk": None,
+            "_dmarc.co.uk": ["v=DMARC1; p=quarantine; psd=y"],
+        }
+        self.assertEqual("none", discover(make_discovery(answers), "example.co.uk")[0])
+        self.assertEqual(("found", "quarantine", "p", "quarantine", "co.uk"),
+                         discover(make_discovery(answers, "tree-walk"), "example.co.uk"))
+
+    def test_records_that_give_no_policy(self):
+        answers = {
+            "_dmarc.two.example": ["v=DMARC1; p=reject", "v=DMARC1; p=none"],
+            "_dmarc.bad.example": ["v=DMARC1; p=block"],
+            "_dmarc.bad-with-rua.example": ["v=DMARC1; p=block; rua=mailto:r@bad-with-rua.example"],
+            "_dmarc.none.example": ["v=spf1 -all"],
+            "_dmarc.example": None,
+        }
+        discovery = make_discovery(answers)
+        self.assertEqual("none", discover(discovery, "two.example")[0])
+        self.assertEqual("none", discover(discovery, "bad.example")[0])
+        self.assertEqual(("found", "none", "p"), discover(discovery, "bad-with-rua.example")[:3])
+        self.assertEqual(("none", "", "", "", ""), discover(discovery, "none.example"))
+
+    def test_failed_lookup_is_unknown(self):
+        discovery = make_discovery({"_dmarc.mail.example.org": None})
+        self.assertEqual(("unknown", "", "", "", "example.org"), discover(discovery, "mail.example.org"))
+
+    def test_parent_lookups_are_shared(self):
+        answers = dict(self.example_answers)
+        domain_names = ["host" + str(number) + ".example.com" for number in range(20)]
+        for domain_name in domain_names:
+            answers["_dmarc." + domain_name] = None
+        discovery = make_discovery(answers)
+
+        async def discover_all():
+            return [result async for result in discovery.discover_domains(domain_names)]
+
+        results = asyncio.run(discover_all())
+        self.assertEqual(sorted(domain_names), sorted(result.domain_name for result in results))
+        self.assertEqual({"quarantine"}, {result.policy for result in results})
+        self.assertEqual(21, discovery.lookup_count)
+        self.assertEqual(19, discovery.shared_hit_count)
+
+    def test_shared_lookup_that_raises_is_not_kept(self):
+        discovery = make_discovery({})
+        calls = []
+
+        async def lookup_dmarc_records(domain_name):
+            calls.append(domain_name)
+            if 1 == len(calls):
+                raise ValueError("lookup failed")
+            return "NOERROR", ["v=DMARC1; p=reject"]
+
+        discovery.lookup_dmarc_records = lookup_dmarc_records
+
+        async def lookup_twice():
+            with self.assertRaises(ValueError):
+                await discovery.lookup_shared_dmarc_records("example.com")
+            return await discovery.lookup_shared_dmarc_records("example.com")
+
+        self.assertEqual(("NOERROR", ["v=DMARC1; p=reject"]), asyncio.run(lookup_twice()))
+        self.assertEqual(2, len(calls))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            DmarcPolicyDiscovery(method="dns")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from DmarcParser import DmarcParser
+from DmarcRecord import DmarcRecord
+from DmarcRecordBatch import DmarcRecordBatch
+
+txt_values = [
+    "v=DMARC1; p=reject; np=reject; psd=y; rua=mailto:a@example.com,mailto:b@example.net",
+    "v=DMARC1; p=none; sp=quarantine; np=none; psd=n; adkim=s; aspf=r; pct=50; ri=3600; fo=0:d:s; rf=afrf",
+    "v=DMARC1; p=quarantine; psd=u; pct=050; ruf=mailto:f@example.com",
+    "v=DMARC1; p=none; np=Quarantine; psd=maybe",
+    "v=DMARC1",
+]
+
+
+def get_values(dmarc_record):
+    return [getattr(dmarc_record, tag_name) for tag_name in DmarcRecord.__slots__]
+
+
+class DmarcRecordBatchTest(unittest.TestCase):
+
+    def test_every_tag_survives_the_round_trip(self):
+        dmarc_records = [DmarcParser.parse(txt_value).dmarc_record for txt_value in txt_values]
+        batch = DmarcRecordBatch.from_records(dmarc_records)
+        self.assertEqual(len(dmarc_records), len(batch))
+        for dmarc_record, view in zip(dmarc_records, batch):
+            self.assertEqual(get_values(dmarc_record), get_values(view))
+            self.assertEqual(get_values(dmarc_record), get_values(view.to_record()))
+
+    def test_np_and_psd_are_kept(self):
+        batch = DmarcRecordBatch.from_records(DmarcParser.parse(txt_value).dmarc_record for txt_value in txt_values)
+        self.assertEqual(["reject", "none", "", "Quarantine", ""], [view.np for view in batch])
+        self.assertEqual(["y", "n", "u", "maybe", ""], [view.psd for view in batch])
+
+    def test_indexing(self):
+        batch = DmarcRecordBatch.from_records(DmarcParser.parse(txt_value).dmarc_record for txt_value in txt_values)
+        self.assertEqual("quarantine", batch[2].p)
+        self.assertEqual("", batch[-1].p)
+        with self.assertRaises(IndexError):
+            batch[len(txt_values)]
+        with self.assertRaises(IndexError):
+            batch[-len(txt_values) - 1]
+
+    def test_uris_are_stored_once(self):
+        batch = DmarcRecordBatch()
+        for _ in range(3):
+            batch.append(DmarcRecord(rua=["mailto:a@example.com"], ruf=["mailto:a@example.com"]))
+        self.assertEqual(["mailto:a@example.com"], batch.uri_table.values)
+        self.assertEqual(["mailto:a@example.com"], batch[1].ruf)
+
+    def test_codes_widen_for_many_distinct_values(self):
+        dmarc_records = [DmarcRecord(p="policy" + str(number)) for number in range(300)]
+        batch = DmarcRecordBatch.from_records(dmarc_records)
+        self.assertEqual("H", batch.p.codes.typecode)
+        self.assertEqual([dmarc_record.p for dmarc_record in dmarc_records], [view.p for view in batch])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from DnsCache import DnsCache
+
+
+class DnsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_get_and_expiry(self):
+        dns_cache = DnsCache()
+        dns_cache.put("Example.COM.", "txt", "NOERROR", ['"v=spf1 -all"'], 300)
+        dns_cache.put("gone.example.com", "TXT", "NXDOMAIN", [], 0)
+        entry = dns_cache.get("example.com", "TXT")
+        self.assertEqual("NOERROR", entry.rcode)
+        self.assertEqual(['"v=spf1 -all"'], entry.records)
+        self.assertIsNone(dns_cache.get("gone.example.com", "TXT"))
+        self.assertIsNone(dns_cache.get("example.com", "MX"))
+        self.assertEqual((1, 2), (dns_cache.hits, dns_cache.misses))
+
+    def test_ttl_is_capped(self):
+        dns_cache = DnsCache()
+        entry = dns_cache.put("example.com", "TXT", "NOERROR", [], 10 * DnsCache.max_ttl)
+        self.assertLessEqual(entry.expires, time.time() + DnsCache.max_ttl)
+
+    def test_least_recently_used_is_evicted(self):
+        dns_cache = DnsCache(max_entries=2)
+        dns_cache.put("a.test", "A", "NOERROR", ["192.0.2.1"], 300)
+        dns_cache.put("b.test", "A", "NOERROR", ["192.0.2.2"], 300)
+        dns_cache.get("a.test", "A")
+        dns_cache.put("c.test", "A", "NOERROR", ["192.0.2.3"], 300)
+        self.assertIsNotNone(dns_cache.get("a.test", "A"))
+        self.assertIsNone(dns_cache.get("b.test", "A"))
+
+    def test_disk_store_survives_restart(self):
+        dns_cache = DnsCache(path=self.path)
+        dns_cache.put("example.com", "TXT", "NOERROR", ['"a" "b"'], 300)
+        dns_cache.put("old.example.com", "TXT", "NOERROR", [], 0)
+        dns_cache.close()
+        dns_cache = DnsCache(path=self.path)
+        self.assertEqual(['"a" "b"'], dns_cache.get("example.com", "TXT").records)
+        self.assertIsNone(dns_cache.get("old.example.com", "TXT"))
+        dns_cache.close()
+
+    def test_writes_do_not_hold_the_store_locked(self):
+        dns_cache = DnsCache(path=self.path)
+        dns_cache.put("example.com", "TXT", "NOERROR", [], 300)
+        # Another process writing to the store must not have to wait for this one's batch to fill.
+        other_store = sqlite3.connect(self.path, timeout=0)
+        with other_store:
+            other_store.execute("INSERT INTO dns_answers VALUES ('other.test', 'TXT', 'NOERROR', '[]', ?)",
+                                (time.time() + 300,))
+        other_store.close()
+        dns_cache.close()
+        self.assertEqual(0, dns_cache.failed_disk_writes)
+        dns_cache = DnsCache(path=self.path)
+        self.assertIsNotNone(dns_cache.get("example.com", "TXT"))
+        self.assertIsNotNone(dns_cache.get("other.test", "TXT"))
+        dns_cache.close()
+
+    def test_expired_entries_are_removed_as_new_ones_are_written(self):
+        dns_cache = DnsCache(path=self.path)
+        for number in range(10):
+            dns_cache.put("old" + str(number) + ".test", "TXT", "NOERROR", [], 0)
+        dns_cache.close()
+        dns_cache = DnsCache(path=self.path)
+        for number in range(10):
+            dns_cache.put("new" + str(number) + ".test", "TXT", "NOERROR", [], 300)
+        dns_cache.close()
+        store = sqlite3.connect(self.path)
+        self.assertEqual(0, store.execute("SELECT COUNT(*) FROM dns_answers WHERE name LIKE 'old%'").fetchone()[0])
+        store.close()
+
+    def test_shared_store_is_read_and_merged(self):
+        shared_cache = DnsCache(path=self.path)
+        shared_cache.put("shared.test", "TXT", "NOERROR", ['"shared"'], 300)
+        shared_cache.close()
+        worker_path = self.path + "-worker"
+        worker_cache = DnsCache(path=worker_path, shared_path=self.path)
+        self.assertEqual(['"shared"'], worker_cache.get("shared.test", "TXT").records)
+        worker_cache.put("worker.test", "TXT", "NOERROR", ['"worker"'], 300)
+        worker_cache.put("expired.test", "TXT", "NOERROR", [], 0)
+        worker_cache.close()
+        shared_cache = DnsCache(path=self.path)
+        self.assertIsNone(shared_cache.get("worker.test", "TXT"))
+        shared_cache.merge_disk_store(worker_path)
+        shared_cache.clear()
+        self.assertEqual(['"worker"'], shared_cache.get("worker.test", "TXT").records)
+        shared_cache.close()
+        store = sqlite3.connect(self.path)
+        self.assertEqual(2, store.execute("SELECT COUNT(*) FROM dns_answers").fetchone()[0])
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from DomainListReader import DomainBloomFilter, DomainHashSet, DomainListReader
+
+
+class DomainListReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "domains.txt")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read(self, content, **options):
+        with open(self.path, "wb") as domain_file:
+            domain_file.write(content)
+        domain_reader = DomainListReader(self.path, **options)
+        return domain_reader, list(domain_reader)
+
+    def test_plain_list(self):
+        domain_reader, names = self.read(b"example.com\nexample.net.\nexample.org")
+        self.assertEqual(["example.com", "example.net", "example.org"], names)
+        self.assertEqual((3, 3, 0, 0), (domain_reader.line_count, domain_reader.unique_count,
+                                        domain_reader.duplicate_count, domain_reader.invalid_count))
+
+    def test_names_are_normalized(self):
+        _, names = self.read(
+            b"# comment\n\n  Example.COM.  extra fields\r\n*.wild.example.net\nb\xc3\xbccher.example\n"
+            b"example.com\tmore\n"
+        )
+        self.assertEqual(["example.com", "wild.example.net", "xn--bcher-kva.example"], names)
+
+    def test_invalid_names_are_skipped(self):
+        domain_reader, names = self.read(
+            b"good.example\nbad..example\n.leading.example\n" + b"a" * 64 + b".example\n" + b"\xff\xfe\n"
+        )
+        self.assertEqual(["good.example"], names)
+        self.assertEqual(4, domain_reader.invalid_count)
+
+    def test_repeats(self):
+        content = b"a.example\nb.example\nA.example.\na.example\n"
+        domain_reader, names = self.read(content)
+        self.assertEqual(["a.example", "b.example"], names)
+        self.assertEqual(2, domain_reader.duplicate_count)
+        _, names = self.read(content, dedupe=False)
+        self.assertEqual(["a.example", "b.example", "a.example", "a.example"], names)
+        _, names = self.read(content, bloom_filter_capacity=100)
+        self.assertEqual(["a.example", "b.example"], names)
+
+    def test_lines_across_chunks(self):
+        names = ["domain" + str(number) + ".example" for number in range(2000)]
+        original_chunk_size = DomainListReader.chunk_size
+        DomainListReader.chunk_size = 1000
+        try:
+            _, read_names = self.read(("\n".join(names) + "\n").encode("ascii"))
+        finally:
+            DomainListReader.chunk_size = original_chunk_size
+        self.assertEqual(names, read_names)
+
+    def test_batches_and_empty_file(self):
+        self.read(b"a.example\nb.example\nc.example\n")
+        domain_reader = DomainListReader(self.path)
+        self.assertEqual([["a.example", "b.example"], ["c.example"]], list(domain_reader.read_batches(2)))
+        domain_reader, names = self.read(b"")
+        self.assertEqual([], names)
+        self.assertIn("Read 0 lines", domain_reader.get_summary())
+
+
+class DomainSetTest(unittest.TestCase):
+
+    def test_hash_set_grows(self):
+        hash_set = DomainHashSet(initial_size=4)
+        self.assertTrue(all(hash_set.add(str(number).encode("ascii")) for number in range(1000)))
+        self.assertFalse(any(hash_set.add(str(number).encode("ascii")) for number in range(1000)))
+        self.assertEqual(1000, hash_set.count)
+
+    def test_bloom_filter(self):
+        bloom_filter = DomainBloomFilter(1000, 0.001)
+        new_count = sum(bloom_filter.add(str(number).encode("ascii")) for number in range(1000))
+        self.assertGreaterEqual(new_count, 990)
+        self.assertFalse(any(bloom_filter.add(str(number).encode("ascii")) for number in range(1000)))
+        with self.assertRaises(ValueError):
+            DomainBloomFilter(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
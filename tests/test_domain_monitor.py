@@ -0,0 +1,64 @@
+import unittest
+from contextlib import redirect_stderr
+from io import StringIO
+from DnsCache import DnsCache
+from DomainMonitor import DomainMonitor
+from DomainRecordHandler import DomainRecordHandler
+
+
+class DomainMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dns_cache = DomainRecordHandler.dns_cache
+        DomainRecordHandler.dns_cache = DnsCache()
+
+    def tearDown(self):
+        DomainRecordHandler.dns_cache = self.dns_cache
+
+    @staticmethod
+    def put_dmarc_record(dmarc_record):
+        DomainRecordHandler.dns_cache.put("_dmarc.example.com", "TXT", "NOERROR", ['"' + dmarc_record + '"'], 300)
+
+    def test_change_is_reported(self):
+        events = []
+        monitor = DomainMonitor(events.append)
+        self.put_dmarc_record("v=DMARC1; p=reject; rua=mailto:d@example.com")
+        self.assertEqual([], monitor.check("example.com", "dmarc"))
+        self.put_dmarc_record("v=DMARC1; p=none")
+        monitor.check("example.com", "dmarc")
+        self.assertEqual([("policy_downgraded", "reject", "none"), ("subdomain_policy_downgraded", "reject", "none"),
+                          ("rua_removed", "mailto:d@example.com", "")],
+                         [(event.change, event.old_value, event.new_value) for event in events])
+        self.assertEqual((2, 3), (monitor.check_count, monitor.event_count))
+        self.assertEqual(2, len(monitor.schedule))
+
+    def check_failure_is_rescheduled(self, monitor, domain_name):
+        with redirect_stderr(StringIO()) as error_output:
+            self.assertEqual([], monitor.check(domain_name, "dmarc"))
+        self.assertEqual(1, monitor.failed_check_count)
+        self.assertIn(domain_name, error_output.getvalue())
+        self.assertEqual([(domain_name, "dmarc")], [(name, record) for _, name, record in monitor.schedule])
+
+    def test_name_too_long_is_rescheduled(self):
+        self.check_failure_is_rescheduled(DomainMonitor(print), "a" * 60 + "." + "b" * 60 + "." + "c" * 60 + "."
+                                          + "d" * 60 + ".example")
+
+    def test_event_handler_error_is_rescheduled(self):
+        def on_event(event):
+            raise OSError("Broken pipe")
+
+        monitor = DomainMonitor(on_event)
+        self.put_dmarc_record("v=DMARC1; p=reject")
+        monitor.check("example.com", "dmarc")
+        monitor.schedule.clear()
+        self.put_dmarc_record("v=DMARC1; p=none")
+        self.check_failure_is_rescheduled(monitor, "example.com")
+
+    def test_spf_changes(self):
+        self.assertEqual([("spf_all_weakened", "v=spf1 -all", "v=spf1 ~all")],
+                         DomainMonitor.get_spf_changes("v=spf1 -all", "v=spf1 ~all"))
+        self.assertEqual([("spf_removed", "v=spf1 -all", "")], DomainMonitor.get_spf_changes("v=spf1 -all", ""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from FailureReportIngester import FailureReportIngester
+
+report_template = """From reporter@receiver.example Mon Jan  1 00:00:00 2024
+From: reporter@receiver.example
+To: ruf@example.com
+Subject: Failure report
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=feedback-report; boundary="part"
+
+--part
+Content-Type: text/plain
+
+A message failed DMARC.
+
+--part
+Content-Type: message/feedback-report
+
+Feedback-Type: auth-failure
+User-Agent: test
+Version: 1
+Auth-Failure: dmarc
+Source-IP: 192.0.2.{number}
+Reported-Domain: example.com
+
+--part
+Content-Type: text/rfc822-headers
+
+From: sender@example.com
+Subject: Message {number}
+Message-ID: <{number}@example.com>
+
+--part--
+
+"""
+
+
+class FailureReportIngesterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.mbox_path = os.path.join(self.directory.name, "ruf.mbox")
+        self.checkpoint_path = os.path.join(self.directory.name, "checkpoint.db")
+        with open(self.mbox_path, "w") as mbox_file:
+            for number in range(1, 4):
+                mbox_file.write(report_template.format(number=number))
+        self.batch_size = FailureReportIngester.batch_size
+        # One report per batch, so each is committed on its own.
+        FailureReportIngester.batch_size = 1
+
+    def tearDown(self):
+        FailureReportIngester.batch_size = self.batch_size
+        self.directory.cleanup()
+
+    def read_source_ips(self, limit=None):
+        ingester = FailureReportIngester(self.checkpoint_path, workers=1)
+        source_ips = []
+        try:
+            failure_reports = ingester.ingest([self.mbox_path])
+            for failure_report in failure_reports:
+                source_ips.append(failure_report.source_ip)
+                if limit == len(source_ips):
+                    failure_reports.close()
+                    break
+        finally:
+            ingester.close()
+        return source_ips
+
+    def test_reports_are_read_once(self):
+        self.assertEqual(["192.0.2.1", "192.0.2.2", "192.0.2.3"], self.read_source_ips())
+        self.assertEqual([], self.read_source_ips())
+
+    def test_report_being_handled_when_the_consumer_stops_is_read_again(self):
+        self.assertEqual(["192.0.2.1", "192.0.2.2"], self.read_source_ips(limit=2))
+        # The first report was committed when the second was asked for. The second was not finished.
+        self.assertEqual(["192.0.2.2", "192.0.2.3"], self.read_source_ips())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import threading
+import unittest
+from DnsCache import DnsCache
+from LookupMetrics import LookupEvent, LookupHistogram, LookupMetrics, PrometheusFileSink
+
+
+class FailingSink:
+
+    def record(self, event):
+        raise OSError("No space left on device")
+
+    def close(self):
+        pass
+
+
+class LookupMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "dns.prom")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_prometheus_file_is_written_safely_from_many_threads(self):
+        sink = PrometheusFileSink(self.path, write_interval=0.0)
+        errors = []
+
+        def record_many():
+            try:
+                for _ in range(200):
+                    sink.record(LookupEvent("example.com", "TXT", "NOERROR", 0.01, 0, False, 100))
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=record_many) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        sink.close()
+        self.assertEqual([], errors)
+        with open(self.path) as metrics_file:
+            self.assertIn('dmarc_tool_dns_lookups_total{rdtype="TXT",rcode="NOERROR",cache="miss"} 3200',
+                          metrics_file.read())
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_failing_sink_does_not_fail_the_lookup(self):
+        histogram = LookupHistogram()
+        dns_cache = DnsCache()
+        dns_cache.metrics = LookupMetrics([FailingSink(), histogram])
+        dns_cache.put("example.com", "TXT", "NOERROR", ['"v=spf1 -all"'], 300)
+        self.assertEqual("NOERROR", dns_cache.get("example.com", "TXT").rcode)
+        self.assertEqual(1, dns_cache.metrics.failed_sink_records)
+        # The sinks after the failing one still see the lookup.
+        self.assertEqual(1, histogram.get_lookup_count(cache_hit=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import time
+import unittest
+import dns.exception
+import dns.resolver
+from DnsCache import DnsCache
+from NameserverScheduler import NameserverGroup, NameserverScheduler
+
+
+class ScriptedResolver:
+    '''
+    Resolver answering each name with the outcomes listed for it in turn, an exception class to raise or any
+    other value to return. Names without outcomes are answered at once with their own name.
+    '''
+
+    def __init__(self, outcomes=None, delay=0.0):
+        self.outcomes = outcomes or {}
+        self.delay = delay
+        self.running_count = 0
+        self.most_running = 0
+        self.queries = []
+
+    async def resolve(self, name, rdtype):
+        self.queries.append((name, rdtype))
+        self.running_count += 1
+        self.most_running = max(self.most_running, self.running_count)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running_count -= 1
+        outcomes = self.outcomes.get(name)
+        if not outcomes:
+            return name
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, type) and issubclass(outcome, Exception):
+            raise outcome()
+        return outcome
+
+
+def make_scheduler(resolver, **options):
+    dns_cache = DnsCache()
+    dns_cache.put("example.com", "NS", "NOERROR", ["NS2.provider.test.", "ns1.provider.test."], 300)
+    dns_cache.put("example.net", "NS", "NOERROR", ["ns1.provider.test.", "ns2.provider.test."], 300)
+    dns_cache.put("example.org", "NS", "NOERROR", ["ns.other.test."], 300)
+    dns_cache.put("parked.org", "NS", "NOERROR", [], 300)
+    return NameserverScheduler(resolver, backoff_time=0.0, dns_cache=dns_cache, **options)
+
+
+class NameserverSchedulerTest(unittest.TestCase):
+
+    def test_domains_on_the_same_nameservers_share_a_group(self):
+        scheduler = make_scheduler(ScriptedResolver())
+
+        async def get_keys(names):
+            return [(await scheduler.get_group(name)).nameservers for name in names]
+
+        provider_key = ("ns1.provider.test", "ns2.provider.test")
+        self.assertEqual([provider_key, provider_key, provider_key, ("ns.other.test",), ("parked.org",)],
+                         asyncio.run(get_keys(["_dmarc.example.com", "a.b.example.net", "example.com",
+                                               "example.org", "_dmarc.parked.org"])))
+        self.assertEqual(3, scheduler.group_count)
+
+    def test_failed_queries_are_retried(self):
+        resolver = ScriptedResolver({
+            "example.com": [dns.exception.Timeout, dns.resolver.NoNameservers, "answer"],
+            "example.net": [dns.exception.Timeout] * 4,
+            "example.org": [dns.resolver.NXDOMAIN, "answer"],
+        })
+        scheduler = make_scheduler(resolver)
+        self.assertEqual("answer", asyncio.run(scheduler.resolve("example.com", "TXT")))
+        with self.assertRaises(dns.exception.Timeout):
+            asyncio.run(scheduler.resolve("example.net", "TXT"))
+        with self.assertRaises(dns.resolver.NXDOMAIN):
+            asyncio.run(scheduler.resolve("example.org", "TXT"))
+        self.assertEqual((3, 5, 1), (scheduler.query_count, scheduler.retry_count, scheduler.failure_count))
+        self.assertEqual(8, len(resolver.queries))
+
+    def test_group_limit_bounds_running_queries(self):
+        resolver = ScriptedResolver(delay=0.01)
+        scheduler = make_scheduler(resolver, initial_limit=3, max_limit=3)
+
+        async def resolve_all():
+            return await asyncio.gather(*[scheduler.resolve("host" + str(number) + ".example.com", "TXT")
+                                          for number in range(20)])
+
+        self.assertEqual(20, len(asyncio.run(resolve_all())))
+        self.assertEqual(3, resolver.most_running)
+
+    def test_limit_follows_failures_and_successes(self):
+        scheduler = make_scheduler(ScriptedResolver(), min_decrease_interval=0.0)
+        group = NameserverGroup(("ns1.provider.test",), 8)
+        # The limit doubles before the first cut.
+        for _ in range(8):
+            group.record(0.01, False, scheduler)
+        self.assertEqual(16.0, group.limit)
+        group.record(0.01, True, scheduler)
+        self.assertEqual((8.0, 1), (group.limit, group.decrease_count))
+        # Once the error rate has fallen, the limit grows by one per limit's worth of queries.
+        for _ in range(50):
+            group.record(0.01, False, scheduler)
+        self.assertGreater(group.limit, 8.0)
+        self.assertLess(group.limit, 14.0)
+        # A slow down also cuts the limit, but only once per smoothed query time.
+        limit = group.limit
+        group.record(20.0, False, scheduler)
+        self.assertEqual(limit, group.limit)
+        group.last_decrease = time.monotonic() - 60
+        group.record(20.0, False, scheduler)
+        self.assertEqual(limit / 2, group.limit)
+
+
+if __name__ == "__main__":
+    unittest.main()
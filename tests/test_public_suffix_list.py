@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+from PublicSuffixList import PublicSuffixList
+
+rules = """// ===BEGIN ICANN DOMAINS===
+com
+uk
+co.uk
+*.ck
+!www.ck
+jp
+*.kawasaki.jp
+!city.kawasaki.jp
+cn
+公司.cn
+// ===END ICANN DOMAINS===
+// ===BEGIN PRIVATE DOMAINS===
+github.io
+// ===END PRIVATE DOMAINS===
+"""
+
+
+class PublicSuffixListTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.list_path = os.path.join(self.directory.name, "public_suffix_list.dat")
+        with open(self.list_path, "w", encoding="utf-8") as list_file:
+            list_file.write(rules)
+        self.public_suffix_list = PublicSuffixList(self.list_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_public_suffix(self):
+        for domain_name, public_suffix in (
+            ("mail.example.co.uk", "co.uk"),
+            ("example.uk", "uk"),
+            ("Mail.Example.COM.", "com"),
+            ("a.b.example.ck", "example.ck"),
+            ("www.ck", "ck"),
+            ("a.city.kawasaki.jp", "kawasaki.jp"),
+            ("a.town.kawasaki.jp", "town.kawasaki.jp"),
+            ("example.unlisted", "unlisted"),
+        ):
+            self.assertEqual(public_suffix, self.public_suffix_list.get_public_suffix(domain_name), domain_name)
+
+    def test_organizational_domain(self):
+        for domain_name, organizational_domain in (
+            ("mail.example.co.uk", "example.co.uk"),
+            ("example.co.uk", "example.co.uk"),
+            ("co.uk", "co.uk"),
+            ("a.b.example.ck", "b.example.ck"),
+            ("a.www.ck", "www.ck"),
+            ("a.city.kawasaki.jp", "city.kawasaki.jp"),
+            ("mail.example.github.io", "example.github.io"),
+            ("mail.example.xn--55qx5d.cn", "example.xn--55qx5d.cn"),
+            ("mail.example.公司.cn", "example.公司.cn"),
+        ):
+            self.assertEqual(organizational_domain,
+                             self.public_suffix_list.get_organizational_domain(domain_name), domain_name)
+
+    def test_bulk_lookup_matches_single_lookups(self):
+        domain_names = ["a.example.co.uk", "github.io", "x.y.example.ck", "example.com."]
+        self.assertEqual(
+            [self.public_suffix_list.get_organizational_domain(domain_name) for domain_name in domain_names],
+            list(self.public_suffix_list.get_organizational_domains(domain_names))
+        )
+
+    def test_private_rules_can_be_left_out(self):
+        icann_list = PublicSuffixList(self.list_path, include_private=False)
+        self.assertEqual("github.io", icann_list.get_organizational_domain("mail.example.github.io"))
+
+    def test_compiled_trie_is_cached(self):
+        self.assertTrue(os.path.exists(self.list_path + ".trie"))
+        self.assertEqual(self.public_suffix_list.trie, PublicSuffixList(self.list_path).trie)
+        with open(self.list_path, "a", encoding="utf-8") as list_file:
+            list_file.write("example.com\n")
+        self.assertEqual("example.com", PublicSuffixList(self.list_path).get_public_suffix("a.example.com"))
+
+    def test_bundled_list(self):
+        public_suffix_list = PublicSuffixList.get_default()
+        self.assertEqual("example.co.uk", public_suffix_list.get_organizational_domain("mail.example.co.uk"))
+        self.assertEqual("example.com", public_suffix_list.get_organizational_domain("a.b.example.com"))
+
+
+if __name__ == "__main__":
+    unittest.main()
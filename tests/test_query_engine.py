@@ -0,0 +1,120 @@
+import asyncio
+import unittest
+import dns.exception
+import dns.resolver
+from LocalDnsServer import LocalDnsServer
+from QueryEngine import QueryEngine
+
+name_count = 3000
+
+
+class QueryEngineTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalDnsServer()
+        for number in range(name_count):
+            cls.server.add_record("d" + str(number) + ".example", "A", ["192.0.2." + str(number % 250 + 1)])
+        cls.server.add_record("big.example", "TXT", ['"' + str(number) * 250 + '"' for number in range(10)])
+        cls.server.drop_queries("dropped.example")
+        cls.server.start_in_thread()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+    def resolve_all(self, transport, names, concurrency):
+        '''
+        :return: Tuple of the number of answers and the list of errors.
+        '''
+        async def run():
+            query_engine = QueryEngine(["127.0.0.1"], transport=transport, port=self.server.port, timeout=2.0,
+                                       retries=0)
+            pending_names = iter(names)
+            answers = []
+            errors = []
+
+            async def worker():
+                for name in pending_names:
+                    try:
+                        answers.append(await query_engine.resolve(name, "A"))
+                    except dns.exception.DNSException as error:
+                        errors.append(error)
+
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+            query_engine.close()
+            return len(answers), errors
+
+        return asyncio.run(run())
+
+    def check_no_query_lost(self, transport):
+        names = ["d" + str(number) + ".example" for number in range(name_count)]
+        query_count = self.server.query_count
+        self.assertEqual((name_count, []), self.resolve_all(transport, names, 512))
+        self.assertEqual(name_count, self.server.query_count - query_count)
+
+    def test_no_udp_query_lost_under_concurrency(self):
+        self.check_no_query_lost("udp")
+
+    def test_no_pipelined_tcp_query_lost_under_concurrency(self):
+        self.check_no_query_lost("tcp")
+
+    def test_truncated_answer_is_asked_again_over_tcp(self):
+        async def run():
+            query_engine = QueryEngine(["127.0.0.1"], port=self.server.port, timeout=5.0)
+            answer = await query_engine.resolve("big.example", "TXT")
+            query_engine.close()
+            return answer, query_engine.truncated_count
+
+        answer, truncated_count = asyncio.run(run())
+        self.assertEqual(10, len(answer.rrset))
+        self.assertEqual(1, truncated_count)
+
+    def test_missing_name_raises_nxdomain(self):
+        async def run():
+            query_engine = QueryEngine(["127.0.0.1"], port=self.server.port, timeout=5.0)
+            try:
+                await query_engine.resolve("missing.example", "A")
+            finally:
+                query_engine.close()
+
+        with self.assertRaises(dns.resolver.NXDOMAIN):
+            asyncio.run(run())
+
+    def test_unanswered_query_times_out_after_retries(self):
+        query_engine = QueryEngine(["127.0.0.1"], port=self.server.port, timeout=0.1, retries=2)
+
+        async def run():
+            try:
+                await query_engine.resolve("dropped.example", "A")
+            finally:
+                query_engine.close()
+
+        with self.assertRaises(dns.exception.Timeout):
+            asyncio.run(run())
+        self.assertEqual(2, query_engine.retry_count)
+
+
+class LocalDnsServerTest(unittest.TestCase):
+
+    def test_stop_cancels_slow_answers(self):
+        async def run():
+            server = LocalDnsServer()
+            server.add_record("slow.example", "A", ["192.0.2.1"])
+            server.set_delay("slow.example", 30)
+            await server.start()
+            query_engine = QueryEngine(["127.0.0.1"], port=server.port, timeout=0.1, retries=0)
+            try:
+                await query_engine.resolve("slow.example", "A")
+            except dns.exception.Timeout:
+                pass
+            query_engine.close()
+            waiting_answers = len(server.answer_tasks)
+            await server.stop()
+            return waiting_answers, len(server.answer_tasks)
+
+        self.assertEqual((1, 0), asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    unittest.main()
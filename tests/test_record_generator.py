@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import unittest
+from RecordGenerator import RecordGenerator
+
+
+def get_records(domain_settings):
+    return [(record.kind, record.zone_name, record.host_name, record.value)
+            for record in RecordGenerator.generate_records(domain_settings)]
+
+
+class RecordGeneratorTest(unittest.TestCase):
+
+    def test_domain_records(self):
+        self.assertEqual([
+            ("DMARC", "example.co.uk", "_dmarc.mail",
+             "v=DMARC1; p=quarantine; sp=reject; adkim=s; rua=mailto:d@reports.test; ruf=mailto:f@example.co.uk"),
+            ("DMARC", "reports.test", "mail.example.co.uk._report._dmarc.reports.test", "v=DMARC1"),
+            ("DMARC", "example.co.uk", "mail.example.co.uk._report._dmarc.example.co.uk", "v=DMARC1"),
+            ("SPF", "example.co.uk", "mail", "v=spf1 mx include:_spf.provider.test ~all"),
+            ("DKIM", "example.co.uk", "s1._domainkey.mail", "v=DKIM1; k=rsa; p=ReplaceThisTextWithYourPublicKey"),
+        ], get_records([{
+            "domain": "mail.example.co.uk", "policy": "quarantine", "subdomain_policy": "reject",
+            "dkim_alignment": "s", "rua": "MAILTO:d@reports.test", "ruf": "f@example.co.uk",
+            "spf": ["mx", "include:_spf.provider.test"], "dkim_selector": "s1",
+        }]))
+
+    def test_domain_not_used_for_email(self):
+        self.assertEqual([
+            ("DMARC", "example.com", "_dmarc", "v=DMARC1; p=reject; sp=reject"),
+            ("SPF", "example.com", "@", "v=spf1 ~all"),
+            ("DKIM", "example.com", "*._domainkey", "v=DKIM1; k=rsa; p="),
+        ], get_records([{"domain": "example.com", "used_for_email": "no", "spf": "mx"}]))
+
+    def test_settings_that_are_not_allowed(self):
+        for settings in ({"policy": "none"}, {"domain": "example.com", "policy": "block"},
+                         {"domain": "example.com", "spf_alignment": "x"}, {"domain": "example.com", "owner": "me"}):
+            with self.assertRaises(ValueError):
+                RecordGenerator.normalize_settings(settings)
+
+    def test_read_spec(self):
+        with tempfile.TemporaryDirectory() as directory:
+            csv_name = os.path.join(directory, "domains.csv")
+            with open(csv_name, "w", newline="") as spec_file:
+                spec_file.write("domain,policy,rua\nexample.com,reject,\nexample.net,,d@example.net\n")
+            self.assertEqual([{"domain": "example.com", "policy": "reject"},
+                              {"domain": "example.net", "rua": "d@example.net"}],
+                             list(RecordGenerator.read_spec(csv_name)))
+            json_name = os.path.join(directory, "domains.json")
+            with open(json_name, "w") as spec_file:
+                json.dump({"defaults": {"policy": "reject"},
+                           "domains": ["example.com", {"domain": "example.net", "policy": "none"}]}, spec_file)
+            self.assertEqual([{"policy": "reject", "domain": "example.com"},
+                              {"policy": "none", "domain": "example.net"}],
+                             list(RecordGenerator.read_spec(json_name)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+import unittest
+from RecordGenerator import GeneratedRecord
+from RecordWriter import RecordWriter
+
+
+class RecordWriterTest(unittest.TestCase):
+
+    dmarc_record = GeneratedRecord("DMARC", "example.com", "_dmarc", "v=DMARC1; p=reject")
+
+    def write(self, format_name, records):
+        output_file = io.StringIO()
+        writer = RecordWriter.create(format_name, output_file, 300)
+        self.assertEqual(len(records), writer.write_records(records))
+        writer.close()
+        return output_file.getvalue()
+
+    def test_zone_file_lines(self):
+        long_record = GeneratedRecord("DKIM", "example.com", "sel._domainkey", "p=" + "A" * 300 + '"\\é')
+        self.assertEqual(
+            '_dmarc.example.com.\t300\tIN\tTXT\t"v=DMARC1; p=reject"\n'
+            'sel._domainkey.example.com.\t300\tIN\tTXT\t"p=' + "A" * 253 + '" "' + "A" * 47 + '\\"\\\\\\195\\169"\n',
+            self.write("zone", [self.dmarc_record, long_record]))
+
+    def test_jsonl_and_csv_rows(self):
+        expected = ["DMARC", "example.com", "_dmarc.example.com.", "TXT", 300, "v=DMARC1; p=reject",
+                    '"v=DMARC1; p=reject"']
+        self.assertEqual(dict(zip(RecordWriter.fields, expected)),
+                         json.loads(self.write("jsonl", [self.dmarc_record])))
+        rows = list(csv.reader(io.StringIO(self.write("csv", [self.dmarc_record]))))
+        self.assertEqual([RecordWriter.fields, [str(value) for value in expected]], rows)
+
+    def test_owner_name_written_in_full(self):
+        record = GeneratedRecord("REPORT", "reports.test", "example.com._report._dmarc.reports.test", "v=DMARC1")
+        self.assertEqual("example.com._report._dmarc.reports.test.", RecordWriter.get_owner_name(record))
+
+    def test_format_must_write_records(self):
+        with self.assertRaises(ValueError):
+            RecordWriter.create("yaml", io.StringIO())
+
+        class IncompleteRecordWriter(RecordWriter):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteRecordWriter(io.StringIO())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import asyncio
+import unittest
+import dns.exception
+from AsyncDomainAuditor import AsyncDomainAuditor
+from DnsCache import DnsCache
+from ReportAuthorizationChecker import ReportAuthorizationChecker
+
+
+class TimeoutResolver:
+
+    async def resolve(self, name, rdtype):
+        raise dns.exception.Timeout()
+
+
+def make_checker(max_in_flight=10):
+    dns_cache = DnsCache()
+    auditor = AsyncDomainAuditor(max_in_flight=max_in_flight, resolver=TimeoutResolver(), dns_cache=dns_cache)
+    return ReportAuthorizationChecker(auditor=auditor), dns_cache
+
+
+def add_domain(dns_cache, domain_name, dmarc_record):
+    dns_cache.put(domain_name, "TXT", "NOERROR", ['"v=spf1 -all"'], 300)
+    dns_cache.put("_dmarc." + domain_name, "TXT", "NOERROR", ['"' + dmarc_record + '"'], 300)
+
+
+async def check_all(checker, domain_names):
+    authorizations = []
+    async for domain_authorizations in checker.check_domains(domain_names):
+        authorizations.extend(domain_authorizations)
+    return sorted((authorization.domain_name, authorization.tag, authorization.status)
+                  for authorization in authorizations)
+
+
+class ReportAuthorizationCheckerTest(unittest.TestCase):
+
+    def test_report_domain(self):
+        get_report_domain = ReportAuthorizationChecker.get_report_domain
+        self.assertEqual("example.net", get_report_domain(" mailto:Reports@Example.NET.!10m"))
+        self.assertEqual("", get_report_domain("https://example.net/reports"))
+        self.assertEqual("", get_report_domain("reports@example.net"))
+
+    def test_statuses(self):
+        checker, dns_cache = make_checker()
+        add_domain(dns_cache, "a.example", "v=DMARC1; p=none; rua=mailto:r@reports.test,mailto:d@a.example; "
+                                           "ruf=mailto:f@failures.test")
+        dns_cache.put("a.example._report._dmarc.reports.test", "TXT", "NOERROR", ['"v=DMARC1"'], 300)
+        dns_cache.put("a.example._report._dmarc.failures.test", "TXT", "NXDOMAIN", [], 300)
+        self.assertEqual([("a.example", "rua", "authorized"), ("a.example", "ruf", "missing")],
+                         asyncio.run(check_all(checker, ["a.example"])))
+
+    def test_failed_lookup_is_not_kept(self):
+        checker, dns_cache = make_checker()
+        add_domain(dns_cache, "a.example", "v=DMARC1; p=none; rua=mailto:r@reports.test")
+        self.assertEqual([("a.example", "rua", "unknown")], asyncio.run(check_all(checker, ["a.example"])))
+        self.assertEqual({}, dict(checker.lookups))
+        dns_cache.put("a.example._report._dmarc.reports.test", "TXT", "NOERROR", ['"v=DMARC1"'], 300)
+        self.assertEqual([("a.example", "rua", "authorized")], asyncio.run(check_all(checker, ["a.example"])))
+
+    def test_lookup_that_raises_is_not_kept(self):
+        checker, _ = make_checker()
+        calls = []
+
+        async def lookup_authorization(authorization_name):
+            calls.append(authorization_name)
+            if 1 == len(calls):
+                raise ValueError("lookup failed")
+            return "authorized"
+
+        checker.lookup_authorization = lookup_authorization
+
+        async def get_status_twice():
+            with self.assertRaises(ValueError):
+                await checker.get_status("a.example._report._dmarc.reports.test")
+            return await checker.get_status("a.example._report._dmarc.reports.test")
+
+        self.assertEqual("authorized", asyncio.run(get_status_twice()))
+        self.assertEqual(2, len(calls))
+
+    def test_running_checks_are_bounded(self):
+        checker, dns_cache = make_checker(max_in_flight=4)
+        domain_names = ["d" + str(number) + ".example" for number in range(50)]
+        for domain_name in domain_names:
+            add_domain(dns_cache, domain_name, "v=DMARC1; p=none; rua=mailto:r@reports.test")
+            dns_cache.put(domain_name + "._report._dmarc.reports.test", "TXT", "NOERROR", ['"v=DMARC1"'], 300)
+        check_domain = checker.check_domain
+        running_count = 0
+        most_running = 0
+
+        async def counted_check_domain(audit_result):
+            nonlocal running_count, most_running
+            running_count += 1
+            most_running = max(most_running, running_count)
+            try:
+                await asyncio.sleep(0.001)
+                return await check_domain(audit_result)
+            finally:
+                running_count -= 1
+
+        checker.check_domain = counted_check_domain
+        self.assertEqual(50, len(asyncio.run(check_all(checker, domain_names))))
+        self.assertLessEqual(most_running, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
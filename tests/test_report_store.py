@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+from AggregateReportParser import AggregateReportRow
+from ReportStore import ReportStore
+
+
+def make_rows(report_id, row_count, fail_at=None):
+    '''
+    :param fail_at: Optional number of the row at which reading fails, the way a truncated file does.
+    :return: Generator of AggregateReportRow objects of one report.
+    '''
+    for number in range(row_count):
+        if number == fail_at:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        row = AggregateReportRow()
+        row.org_name = "google.com"
+        row.report_id = report_id
+        row.begin_date = 1700000000
+        row.end_date = 1700086400
+        row.header_from = "mail.example.com"
+        row.source_ip = "192.0.2." + str(number % 3)
+        row.count = number + 1
+        row.disposition = "quarantine" if number % 2 else "none"
+        row.dkim = "fail"
+        row.spf = "pass" if number % 2 else "fail"
+        yield row
+
+
+class ReportStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_store(self, file_name):
+        report_store = ReportStore(os.path.join(self.directory.name, file_name), batch_size=2)
+        self.addCleanup(report_store.close)
+        return report_store
+
+    @staticmethod
+    def get_contents(report_store):
+        connection = report_store.connection
+        return [
+            connection.execute("SELECT * FROM " + table + " ORDER BY 1, 2, 3").fetchall()
+            for table in ("reports", "report_rows", "daily_domain_rollups", "daily_source_rollups")
+        ]
+
+    def test_rollups(self):
+        report_store = self.open_store("reports.db")
+        self.assertEqual(4, report_store.import_rows(make_rows("1", 4)))
+        self.assertEqual(0, report_store.import_rows(make_rows("1", 4)))
+        self.assertEqual([("2023-11-14", 10, 4, 0, 6, 6, 0)],
+                         report_store.get_daily_summary("mail.example.com", days=100000))
+        self.assertEqual([("2023-11-14", 10, 4, 0, 6, 6, 0)],
+                         report_store.get_daily_summary("example.com", days=100000, include_subdomains=True))
+        self.assertEqual([("192.0.2.2", 3, 3), ("192.0.2.0", 1, 5)],
+                         report_store.get_top_failing_sources("mail.example.com", days=100000))
+
+    def test_report_that_fails_partway_is_imported_again(self):
+        complete_store = self.open_store("complete.db")
+        complete_store.import_rows(make_rows("1", 2))
+        complete_store.import_rows(make_rows("2", 7))
+        report_store = self.open_store("reports.db")
+        report_store.import_rows(make_rows("1", 2))
+        with self.assertRaises(EOFError):
+            report_store.import_rows(make_rows("2", 7, fail_at=5))
+        self.assertEqual(1, len(self.get_contents(report_store)[0]))
+        self.assertEqual(7, report_store.import_rows(make_rows("2", 7)))
+        self.assertEqual(self.get_contents(complete_store), self.get_contents(report_store))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import time
+import unittest
+import dns.exception
+from DnsCache import DnsCache
+from SpfPolicy import SpfPolicy
+from SpfResolver import SpfResolver
+
+
+class TimingOutDnsCache(DnsCache):
+    '''
+    Cache whose lookups of names not put in it fail, as when the authoritative servers do not answer.
+    '''
+
+    def query(self, name, rdtype, resolver=None):
+        raise dns.exception.Timeout()
+
+
+def make_policy(records, domain_name="example.com", dns_cache=None):
+    '''
+    :param records: Dictionary of name -> TXT record value. Other queries fail.
+    :return: SpfPolicy of the domain.
+    '''
+    if dns_cache is None:
+        dns_cache = TimingOutDnsCache()
+    for name, txt_value in records.items():
+        dns_cache.put(name, "TXT", "NOERROR", ['"' + txt_value + '"'], 300)
+    return SpfPolicy(SpfResolver(dns_cache).resolve(domain_name))
+
+
+class SpfPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        SpfResolver.shared_nodes.clear()
+        SpfPolicy.shared_tries.clear()
+
+    def test_first_match_wins(self):
+        policy = make_policy({"example.com": "v=spf1 -ip4:192.0.2.1 ip4:192.0.2.0/24 ~ip6:2001:db8::/32 -all"})
+        self.assertEqual("fail", policy.check_host("192.0.2.1"))
+        self.assertEqual("pass", policy.check_host("192.0.2.2"))
+        self.assertEqual("softfail", policy.check_host("2001:db8::1"))
+        self.assertEqual("fail", policy.check_host("198.51.100.1"))
+        # IPv4-mapped IPv6 addresses are checked as IPv4.
+        self.assertEqual("pass", policy.check_host("::ffff:192.0.2.2"))
+
+    def test_no_match_without_all_is_neutral(self):
+        self.assertEqual("neutral", make_policy({"example.com": "v=spf1 ip4:192.0.2.0/24"}).check_host("198.51.100.1"))
+
+    def test_missing_record(self):
+        dns_cache = TimingOutDnsCache()
+        dns_cache.put("example.com", "TXT", "NOERROR", [], 300)
+        self.assertEqual("none", make_policy({}, dns_cache=dns_cache).check_host("192.0.2.1"))
+        self.assertEqual("temperror", make_policy({}, "failed.example").check_host("192.0.2.1"))
+
+    def test_include_results(self):
+        dns_cache = TimingOutDnsCache()
+        dns_cache.put("empty.provider.test", "TXT", "NOERROR", [], 300)
+        policy = make_policy({
+            "example.com": "v=spf1 include:_spf.provider.test include:empty.provider.test -all",
+            "_spf.provider.test": "v=spf1 ip4:192.0.2.0/24 -ip4:198.51.100.0/24 ~all",
+        }, dns_cache=dns_cache)
+        self.assertEqual("pass", policy.check_host("192.0.2.1"))
+        # Only a pass in the included record matches the include. Anything else moves on to the next term,
+        # and an include target without a record is a permerror.
+        self.assertEqual("permerror", policy.check_host("198.51.100.1"))
+        policy = make_policy({"example.org": "v=spf1 include:_spf.failed.test -all"}, "example.org")
+        self.assertEqual("temperror", policy.check_host("192.0.2.1"))
+
+    def test_redirect_is_ignored_with_all(self):
+        records = {
+            "example.com": "v=spf1 ip4:192.0.2.1 redirect=_spf.provider.test",
+            "example.net": "v=spf1 ip4:192.0.2.1 redirect=_spf.provider.test -all",
+            "_spf.provider.test": "v=spf1 ip4:198.51.100.0/24 ~all",
+        }
+        self.assertEqual("pass", make_policy(records).check_host("198.51.100.1"))
+        self.assertEqual("fail", make_policy(records, "example.net").check_host("198.51.100.1"))
+
+    def test_terms_evaluated_per_message(self):
+        policy = make_policy({"example.com": "v=spf1 ip4:192.0.2.0/24 exists:%{i}.bl.example -all"})
+        self.assertEqual("pass", policy.check_host("192.0.2.1"))
+        self.assertEqual("unknown", policy.check_host("198.51.100.1"))
+
+    def test_check_hosts(self):
+        policy = make_policy({"example.com": "v=spf1 ip4:192.0.2.0/24 -all"})
+        self.assertEqual([("192.0.2.1", "pass"), ("192.0.2.1", "pass"), ("mail", "invalid"), ("::1", "fail")],
+                         list(policy.check_hosts(["192.0.2.1", "192.0.2.1", "mail", "::1"])))
+
+    def test_shared_tries_follow_the_resolved_node(self):
+        dns_cache = DnsCache()
+        records = {
+            "example.com": "v=spf1 include:_spf.provider.test -all",
+            "example.net": "v=spf1 include:_spf.provider.test -all",
+            "_spf.provider.test": "v=spf1 ip4:192.0.2.0/24 -all",
+        }
+        self.assertEqual("pass", make_policy(records, dns_cache=dns_cache).check_host("192.0.2.1"))
+        # The provider changes its record once the old answer has expired.
+        SpfResolver.shared_nodes["_spf.provider.test"].expires = time.time() - 1
+        records["_spf.provider.test"] = "v=spf1 ip4:198.51.100.0/24 -all"
+        policy = make_policy(records, "example.net", dns_cache=dns_cache)
+        self.assertEqual("fail", policy.check_host("192.0.2.1"))
+        self.assertEqual("pass", policy.check_host("198.51.100.1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+import time
+import unittest
+import dns.exception
+from DnsCache import DnsCache
+from SpfPolicy import SpfPolicy
+from SpfResolver import SpfResolver
+
+
+def make_resolver(records):
+    '''
+    :param records: Dictionary of (name, rdtype) -> list of records in presentation format. Every other query
+        is answered as a name with no records.
+    :return: SpfResolver whose cache answers every query, so nothing is sent to DNS.
+    '''
+    dns_cache = DnsCache()
+    names = {name for name, _ in records}
+    for name in names:
+        for rdtype in ("TXT", "A", "AAAA", "MX"):
+            dns_cache.put(name, rdtype, "NOERROR", records.get((name, rdtype), []), 300)
+    return SpfResolver(dns_cache)
+
+
+class TimingOutDnsCache(DnsCache):
+    '''
+    Cache whose lookups of names not put in it fail, as when the authoritative servers do not answer.
+    '''
+
+    def query(self, name, rdtype, resolver=None):
+        raise dns.exception.Timeout()
+
+
+class SpfResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        SpfResolver.shared_nodes.clear()
+        SpfPolicy.shared_tries.clear()
+
+    def assert_same_results(self, node, ip_addresses):
+        '''
+        Checks that the flattened record of a node gives every address the same result as the record itself.
+        '''
+        flattened = SpfResolver.flatten(node)
+        flattened_node = make_resolver({}).resolve_record(node.domain_name, flattened)
+        policy = SpfPolicy(node)
+        flattened_policy = SpfPolicy(flattened_node)
+        for ip_address in ip_addresses:
+            self.assertEqual(policy.check_host(ip_address), flattened_policy.check_host(ip_address),
+                             ip_address + " with '" + flattened + "'")
+        return flattened
+
+    def test_cidr_after_mechanism_name(self):
+        resolver = make_resolver({
+            ("example.com", "A"): ["192.0.2.10"],
+            ("example.com", "AAAA"): ["2001:db8::1"],
+            ("example.com", "MX"): ["10 mail.example.com."],
+            ("mail.example.com", "A"): ["198.51.100.7"],
+        })
+        node = resolver.resolve_record("example.com", "v=spf1 a/24 mx/16 a//64 -all")
+        self.assertEqual([], node.errors)
+        self.assertFalse(node.is_invalid)
+        self.assertEqual(3, node.lookup_count)
+        self.assertEqual(["a", "mx", "a", "all"], [mechanism.name for mechanism in node.mechanisms])
+        self.assertEqual(["192.0.2.0/24", "2001:db8::1/128"], [str(network) for network in node.mechanisms[0].networks])
+        self.assertEqual(["198.51.0.0/16"], [str(network) for network in node.mechanisms[1].networks])
+        self.assertEqual(["192.0.2.10/32", "2001:db8::/64"], [str(network) for network in node.mechanisms[2].networks])
+        policy = SpfPolicy(node)
+        self.assertEqual("pass", policy.check_host("192.0.2.200"))
+        self.assertEqual("pass", policy.check_host("198.51.3.4"))
+        self.assertEqual("pass", policy.check_host("2001:db8::ffff"))
+        self.assertEqual("fail", policy.check_host("203.0.113.1"))
+
+    def test_cidr_after_domain(self):
+        resolver = make_resolver({("mail.example.net", "A"): ["192.0.2.10"]})
+        node = resolver.resolve_record("example.com", "v=spf1 a:mail.example.net/28//48 -all")
+        self.assertEqual(["192.0.2.0/28"], [str(network) for network in node.mechanisms[0].networks])
+
+    def test_invalid_cidr(self):
+        node = make_resolver({}).resolve_record("example.com", "v=spf1 a/33 -all")
+        self.assertTrue(node.is_invalid)
+        self.assertEqual("permerror", SpfPolicy(node).check_host("192.0.2.1"))
+
+    def test_unknown_mechanism(self):
+        node = make_resolver({}).resolve_record("example.com", "v=spf1 ip5:192.0.2.1 -all")
+        self.assertTrue(node.is_invalid)
+
+    def test_flatten_include_of_pass_terms(self):
+        resolver = make_resolver({
+            ("_spf.provider.test", "TXT"): ['"v=spf1 ip4:192.0.2.0/24 include:_spf2.provider.test ~all"'],
+            ("_spf2.provider.test", "TXT"): ['"v=spf1 ip6:2001:db8::/32 -all"'],
+        })
+        node = resolver.resolve_record("example.com", "v=spf1 include:_spf.provider.test -ip4:203.0.113.5 ~all")
+        flattened = self.assert_same_results(node, ["192.0.2.1", "203.0.113.5", "203.0.113.6", "2001:db8::1", "::1"])
+        self.assertEqual("v=spf1 ip4:192.0.2.0/24 ip6:2001:db8::/32 -ip4:203.0.113.5 ~all", flattened)
+
+    def test_flatten_keeps_include_with_fail_terms(self):
+        resolver = make_resolver({
+            ("_spf.provider.test", "TXT"): ['"v=spf1 -ip4:192.0.2.66 ip4:192.0.2.0/24 ~all"'],
+        })
+        node = resolver.resolve_record("example.com", "v=spf1 include:_spf.provider.test ip4:192.0.2.66 -all")
+        flattened = self.assert_same_results(node, ["192.0.2.66", "192.0.2.1", "198.51.100.1"])
+        self.assertEqual("v=spf1 include:_spf.provider.test ip4:192.0.2.66 -all", flattened)
+
+    def test_flatten_keeps_include_with_pass_all(self):
+        resolver = make_resolver({("_spf.provider.test", "TXT"): ['"v=spf1 +all"']})
+        node = resolver.resolve_record("example.com", "v=spf1 include:_spf.provider.test -all")
+        flattened = self.assert_same_results(node, ["192.0.2.1", "2001:db8::1"])
+        self.assertEqual("v=spf1 include:_spf.provider.test -all", flattened)
+
+    def test_flatten_keeps_qualifiers_and_order(self):
+        resolver = make_resolver({
+            ("example.com", "A"): ["192.0.2.10"],
+            ("_spf.provider.test", "TXT"): ['"v=spf1 ip4:192.0.2.0/24 -all"'],
+        })
+        node = resolver.resolve_record("example.com", "v=spf1 -a ~include:_spf.provider.test ?ip4:198.51.100.0/24")
+        flattened = self.assert_same_results(node, ["192.0.2.10", "192.0.2.11", "198.51.100.1", "203.0.113.1"])
+        self.assertEqual("v=spf1 -ip4:192.0.2.10 ~ip4:192.0.2.0/24 ?ip4:198.51.100.0/24", flattened)
+
+    def test_flatten_redirect(self):
+        resolver = make_resolver({
+            ("_spf.provider.test", "TXT"): ['"v=spf1 ip4:192.0.2.0/24 ~all"'],
+            ("missing.provider.test", "TXT"): [],
+        })
+        node = resolver.resolve_record("example.com", "v=spf1 -ip4:192.0.2.1 redirect=_spf.provider.test")
+        flattened = self.assert_same_results(node, ["192.0.2.1", "192.0.2.2", "198.51.100.1"])
+        self.assertEqual("v=spf1 -ip4:192.0.2.1 ip4:192.0.2.0/24 ~all", flattened)
+        node = resolver.resolve_record("example.org", "v=spf1 ip4:192.0.2.1 redirect=missing.provider.test")
+        flattened = self.assert_same_results(node, ["192.0.2.1", "198.51.100.1"])
+        self.assertEqual("v=spf1 ip4:192.0.2.1 redirect=missing.provider.test", flattened)
+
+    def test_lookup_count(self):
+        records = {("example.com", "A"): ["192.0.2.1"]}
+        for number in range(11):
+            records[("_spf" + str(number) + ".provider.test", "TXT")] = [
+                '"v=spf1 ip4:192.0.2.' + str(number) + ' -all"'
+            ]
+        resolver = make_resolver(records)
+        includes = " ".join("include:_spf" + str(number) + ".provider.test" for number in range(11))
+        node = resolver.resolve_record("example.com", "v=spf1 " + includes + " -all")
+        self.assertEqual(11, node.lookup_count)
+        self.assertEqual(1, len(SpfResolver.get_problems(node)))
+        self.assertEqual("pass", SpfPolicy(node).check_host("192.0.2.9"))
+        self.assertEqual("permerror", SpfPolicy(node).check_host("192.0.2.10"))
+        flattened_node = resolver.resolve_record("example.com", SpfResolver.flatten(node))
+        self.assertEqual(0, flattened_node.lookup_count)
+        self.assertEqual("pass", SpfPolicy(flattened_node).check_host("192.0.2.10"))
+
+    def test_tree_with_failed_lookup_is_not_kept(self):
+        dns_cache = TimingOutDnsCache()
+        dns_cache.put("example.com", "TXT", "NOERROR", ['"v=spf1 include:_spf.provider.test -all"'], 300)
+        resolver = SpfResolver(dns_cache)
+        node = resolver.resolve("example.com")
+        self.assertEqual(0.0, node.expires)
+        self.assertEqual({}, dict(SpfResolver.shared_nodes))
+        dns_cache.put("_spf.provider.test", "TXT", "NOERROR", ['"v=spf1 ip4:192.0.2.0/24 -all"'], 300)
+        node = resolver.resolve("example.com")
+        self.assertEqual([], node.errors)
+        self.assertEqual(["_spf.provider.test", "example.com"], list(SpfResolver.shared_nodes))
+
+    def test_kept_node_expires_with_its_first_answer(self):
+        dns_cache = DnsCache()
+        dns_cache.put("example.com", "TXT", "NOERROR", ['"v=spf1 include:_spf.provider.test -all"'], 300)
+        dns_cache.put("_spf.provider.test", "TXT", "NOERROR", ['"v=spf1 ip4:192.0.2.0/24 -all"'], 60)
+        resolver = SpfResolver(dns_cache)
+        node = resolver.resolve("example.com")
+        self.assertLessEqual(node.expires, time.time() + 60)
+        self.assertIs(node, resolver.resolve("example.com"))
+        node.expires = time.time() - 1
+        self.assertIsNot(node, resolver.resolve("example.com"))
+
+    def test_shared_nodes_are_bounded(self):
+        records = {}
+        for number in range(5):
+            records[("d" + str(number) + ".example", "TXT")] = ['"v=spf1 -all"']
+        resolver = make_resolver(records)
+        max_shared_nodes = SpfResolver.max_shared_nodes
+        SpfResolver.max_shared_nodes = 2
+        try:
+            for number in range(5):
+                resolver.resolve("d" + str(number) + ".example")
+        finally:
+            SpfResolver.max_shared_nodes = max_shared_nodes
+        self.assertEqual(["d3.example", "d4.example"], list(SpfResolver.shared_nodes))
+
+
+if __name__ == "__main__":
+    unittest.main()